@@ -3,39 +3,206 @@ AI連携モジュール
 「構造（IDアンカー画像）」と「テキスト（JSON指示書）」をAIに渡し、最終的なMermaidコードを生成させる。
 """
 import os
+import io
 import json
+import math
 import base64
-import requests
-from dotenv import load_dotenv
+import random
+import time
+import functools
+import asyncio
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from PIL import Image
 
-# 環境変数を読み込み
-load_dotenv()
+import profiler
+from disk_cache import DiskCache, make_key
+from settings import DEFAULT_CONCURRENCY, DEFAULT_PROMPT_FORMAT, PROMPT_FORMATS
 
+# APIのエンドポイントとモデル（環境変数 GEMINI_API_BASE / GEMINI_MODEL で変更可能）
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+DEFAULT_MODEL = "gemini-2.0-flash"
 
-def generate_mermaid_code(json_path, image_path):
+# 1リクエストあたりのタイムアウト [秒]（応答の読み込み）
+DEFAULT_TIMEOUT = 60
+
+# 接続（TCP・TLSハンドシェイク）のタイムアウト [秒]
+CONNECT_TIMEOUT = 10
+
+# 一時的なエラー（429・5xx・接続失敗）の再試行
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0       # 初回の待ち時間の上限 [秒]（再試行ごとに2倍）
+BACKOFF_MAX = 30.0       # 待ち時間の上限 [秒]
+RETRY_AFTER_MAX = 120.0  # Retry-After で指定された待ち時間の上限 [秒]
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# スレッドごとのHTTPセッション（接続を使い回す）
+_session_local = threading.local()
+
+# 生成パラメータ（generationConfig）。空の場合はAPIの既定値を使う
+GENERATION_CONFIG = {}
+
+# AI応答キャッシュの既定の有効期限 [秒] とサイズ上限 [byte]
+DEFAULT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 画像のトークン数（Gemini: 両辺が384px以下なら1枚分、それ以上は768pxのタイルごとに1枚分）
+IMAGE_TOKENS = 258
+IMAGE_SMALL_EDGE = 384
+IMAGE_TILE_EDGE = 768
+
+
+def generate_mermaid_code(json_path, image_path, cache=None, refresh=False):
     """
     JSON指示書とIDアンカー画像からMermaidコードを生成する
 
     Args:
         json_path (str): instructions.jsonのパス
         image_path (str): anchor_image.pngのパス
+        cache (ResponseCache): AI応答のキャッシュ（Noneの場合は使わない）
+        refresh (bool): Trueの場合、キャッシュを読まずにAPIを呼び出す（結果は保存する）
 
     Returns:
         str: 生成されたMermaidコード（クリーンな形式）
     """
     # プロンプトと画像を準備
-    prompt_text, image_object = build_prompt(json_path, image_path)
+    prompt_text, image_bytes = _prepare_request(json_path, image_path)
+
+    return _generate(prompt_text, image_bytes, cache, refresh)
+
+
+def generate_mermaid_code_from_data(json_data, image, cache=None, refresh=False,
+                                    prompt_format=DEFAULT_PROMPT_FORMAT):
+    """
+    メモリ上のJSON指示書データとIDアンカー画像からMermaidコードを生成する
+
+    ファイルの読み書きもグローバルな状態の変更も行わないため、スレッドプールから並行して呼び出せる。
+
+    Args:
+        json_data (list): JSON指示書データ
+        image (bytes | PIL.Image): IDアンカー画像（エンコード済みのPNGデータ、または画像オブジェクト）
+        cache (ResponseCache): AI応答のキャッシュ（Noneの場合は使わない）
+        refresh (bool): Trueの場合、キャッシュを読まずにAPIを呼び出す（結果は保存する）
+        prompt_format (str): プロンプト中の図形データの形式（PROMPT_FORMATS のいずれか）
+
+    Returns:
+        str: 生成されたMermaidコード（クリーンな形式）
+    """
+    prompt_text, image_bytes = _prepare_data(json_data, image, prompt_format)
+    return _generate(prompt_text, image_bytes, cache, refresh)
+
+
+def _generate(prompt_text, image_bytes, cache=None, refresh=False):
+    """プロンプトと画像データからMermaidコードを生成する（キャッシュを参照・保存する）"""
+    if cache is not None and not refresh:
+        cached_code = _lookup(cache, prompt_text, image_bytes)
+        if cached_code is not None:
+            return cached_code
 
     # Gemini APIを使用してMermaidコードを生成
-    raw_response = _call_gemini_api(prompt_text, image_object)
+    started = time.perf_counter()
+    raw_response = _post_generate_content(_build_payload(prompt_text, image_bytes), DEFAULT_TIMEOUT)
 
     # Markdownコードブロックを除去してクリーンなMermaidコードを抽出
     clean_code = _extract_mermaid_code(raw_response)
 
+    if cache is not None:
+        cache.store(prompt_text, image_bytes, raw_response, clean_code, time.perf_counter() - started)
+
     return clean_code
 
 
+class ResponseCache:
+    """
+    AI応答のキャッシュ。
+
+    (プロンプト, 画像, モデル名, 生成パラメータ) のハッシュをキーに、生の応答と抽出済みの
+    Mermaidコードを DiskCache に保存する。ヒット時に省略できたAPI呼び出しの時間を集計する。
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_MAX_BYTES, max_age=DEFAULT_CACHE_MAX_AGE):
+        """
+        Args:
+            directory (str): キャッシュディレクトリ
+            max_bytes (int): キャッシュ全体のサイズ上限 [byte]
+            max_age (float): エントリの有効期限 [秒]（Noneの場合は無期限）
+        """
+        self._cache = DiskCache(directory, max_bytes=max_bytes, max_age=max_age)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def key(prompt_text, image_bytes):
+        """キャッシュキーを作成する（モデル・生成パラメータが変われば別のキーになる）"""
+        model = model_name()
+        config = json.dumps(GENERATION_CONFIG, sort_keys=True)
+        return make_key('ai', model, config, prompt_text, image_bytes)
+
+    def lookup(self, prompt_text, image_bytes):
+        """
+        キャッシュされたMermaidコードを返す
+
+        Args:
+            prompt_text (str): プロンプトテキスト
+            image_bytes (bytes): PNGエンコードされた画像
+
+        Returns:
+            str: Mermaidコード（キャッシュにない場合はNone）
+        """
+        data = self._cache.get(self.key(prompt_text, image_bytes))
+        entry = json.loads(data) if data is not None else None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.latency_saved += entry["latency"]
+        return entry["mermaid"]
+
+    def store(self, prompt_text, image_bytes, raw_response, mermaid_code, latency):
+        """
+        応答を保存する
+
+        Args:
+            prompt_text (str): プロンプトテキスト
+            image_bytes (bytes): PNGエンコードされた画像
+            raw_response (str): APIからの生のレスポンス
+            mermaid_code (str): 抽出済みのMermaidコード
+            latency (float): API呼び出しにかかった時間 [秒]
+        """
+        entry = {
+            "model": model_name(),
+            "raw_response": raw_response,
+            "mermaid": mermaid_code,
+            "latency": latency
+        }
+        self._cache.set(
+            self.key(prompt_text, image_bytes),
+            json.dumps(entry, ensure_ascii=False).encode('utf-8')
+        )
+
+    def stats(self):
+        """
+        ヒット・ミスの回数と、省略できたAPI呼び出しの時間を返す
+
+        Returns:
+            dict: {hits, misses, hit_rate, latency_saved}
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "latency_saved": round(self.latency_saved, 3)
+            }
+
+
 def build_prompt(json_path, image_path):
     """
     AIへのプロンプトと画像オブジェクトを生成する
@@ -54,6 +221,38 @@ def build_prompt(json_path, image_path):
     # 画像を読み込み
     image_object = Image.open(image_path)
 
+    return build_prompt_text(json_data), image_object
+
+
+def build_prompt_text(json_data, prompt_format=DEFAULT_PROMPT_FORMAT):
+    """
+    JSON指示書データからAIへのプロンプトを生成する
+
+    Args:
+        json_data (list): JSON指示書データ
+        prompt_format (str): 図形データの形式（'json': 整形済みJSON, 'compact': 表）
+
+    Returns:
+        str: プロンプトテキスト
+    """
+    if prompt_format == 'json':
+        shape_data = f"""【情報2：図形の詳細データ（JSON）】
+```json
+{json.dumps(json_data, ensure_ascii=False, indent=2)}
+```
+
+* これは、画像内の各IDに対応する「正式なテキスト」と「図形の種類」のリストです。"""
+    elif prompt_format == 'compact':
+        shape_data = f"""【情報2：図形の詳細データ（表）】
+```
+{compact_shape_table(json_data)}
+```
+
+* これは、画像内の各IDに対応する「正式なテキスト」と「図形の種類」の表です（1行が1つの図形）。
+* `id` 列は画像の `node_XXX` の番号部分です（例: `7` は `node_007`）。Mermaidでは `node_XXX` の形式で出力してください。"""
+    else:
+        raise ValueError(f"Unknown prompt format: {prompt_format} (expected one of {', '.join(PROMPT_FORMATS)})")
+
     # プロンプトテンプレートを構築
     prompt_text = f"""あなたは、提供された画像とJSONデータからMermaidフローチャートを生成するシステムアーキテクトです。
 
@@ -66,18 +265,13 @@ def build_prompt(json_path, image_path):
 * 各図形には `node_XXX` というIDが振られています。
 * あなたのタスクは、この画像から「IDとIDのつながり（矢印）」と「矢印に付随する分岐ラベル（Yes/Noなど）」を正確に読み取ることです。
 
-【情報2：図形の詳細データ（JSON）】
-```json
-{json.dumps(json_data, ensure_ascii=False, indent=2)}
-```
-
-* これは、画像内の各IDに対応する「正式なテキスト」と「図形の種類」のリストです。
+{shape_data}
 
 【タスク】
 
 1. 【情報1】の画像の「ID間のつながり」を視覚的に解析してください。
-2. 【情報1】の画像の矢印の近くにある「分岐ラベル（"Yes", "No", "OK", "NG"など）」を読み取ってください。これらは【情報2】のJSONには含まれていません。
-3. 【情報2】のJSONを使い、各IDを「正式なテキスト」と「図形の種類」にマッピングしてください。
+2. 【情報1】の画像の矢印の近くにある「分岐ラベル（"Yes", "No", "OK", "NG"など）」を読み取ってください。これらは【情報2】には含まれていません。
+3. 【情報2】を使い、各IDを「正式なテキスト」と「図形の種類」にマッピングしてください。
 4. この情報を組み合わせて、完全なMermaid記法（`graph TD`）のコードを生成してください。
 
 【Mermaid生成ルール】
@@ -99,7 +293,227 @@ def build_prompt(json_path, image_path):
 生成したMermaidコードのみを、Markdownコードブロック（```mermaid ... ```）で出力してください。
 """
 
-    return prompt_text, image_object
+    return prompt_text
+
+
+def compact_shape_table(json_data):
+    """
+    JSON指示書データを、番号・図形の種類・テキストだけの表（`|` 区切り）にする
+
+    IDは node_XXX の番号部分だけにし、座標は画像が示すため含めない。
+    テキストは改行を含んでも1行に収まるよう、最後の列にJSONの文字列として書く（`|` は区切らない）。
+
+    Args:
+        json_data (list): JSON指示書データ
+
+    Returns:
+        str: 表（1行目は見出し）
+    """
+    rows = ["id|shape_type|text"]
+    for node in json_data:
+        short_id = node["id"].rsplit('_', 1)[-1].lstrip('0') or '0'
+        rows.append(f'{short_id}|{node["shape_type"]}|{json.dumps(node["text"], ensure_ascii=False)}')
+    return '\n'.join(rows)
+
+
+def estimate_tokens(text):
+    """
+    テキストのトークン数を概算する（トークナイザーを使わない、ローカルでの見積もり）
+
+    ASCII文字は約4文字で1トークン、日本語などそれ以外の文字は1文字で1トークンとする。
+
+    Args:
+        text (str): テキスト
+
+    Returns:
+        int: 推定トークン数
+    """
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def estimate_image_tokens(image_bytes):
+    """
+    エンコード済み画像のトークン数を概算する
+
+    Args:
+        image_bytes (bytes): エンコード済みの画像
+
+    Returns:
+        int: 推定トークン数
+    """
+    # ヘッダーだけを読み、画素はデコードしない
+    width, height = Image.open(io.BytesIO(image_bytes)).size
+    if width <= IMAGE_SMALL_EDGE and height <= IMAGE_SMALL_EDGE:
+        return IMAGE_TOKENS
+    return math.ceil(width / IMAGE_TILE_EDGE) * math.ceil(height / IMAGE_TILE_EDGE) * IMAGE_TOKENS
+
+
+def estimate_request_tokens(json_data, image_bytes, prompt_format=DEFAULT_PROMPT_FORMAT):
+    """
+    1リクエストの入力トークン数を概算する
+
+    Args:
+        json_data (list): JSON指示書データ
+        image_bytes (bytes): エンコード済みの画像
+        prompt_format (str): プロンプト中の図形データの形式
+
+    Returns:
+        dict: {prompt, image, total} の推定トークン数
+    """
+    prompt_tokens = estimate_tokens(build_prompt_text(json_data, prompt_format))
+    image_tokens = estimate_image_tokens(image_bytes)
+    return {"prompt": prompt_tokens, "image": image_tokens, "total": prompt_tokens + image_tokens}
+
+
+async def generate_mermaid_code_async(json_path, image_path, timeout=DEFAULT_TIMEOUT,
+                                     limiter=None, executor=None, cache=None, refresh=False):
+    """
+    generate_mermaid_code の非同期版
+
+    HTTP通信はスレッドで実行し、イベントループを止めない。タイムアウトやキャンセル時は
+    結果を待たずに戻る（送信済みのリクエストはHTTPのタイムアウトで終了する）。
+    一時的なエラーは _post_generate_content と同じ規則で再試行する。
+
+    Args:
+        json_path (str): instructions.jsonのパス
+        image_path (str): anchor_image.pngのパス
+        timeout (float): 1回の送信あたりのタイムアウト [秒]
+        limiter (asyncio.Semaphore): 同時実行数を制限するセマフォ（Noneの場合は制限しない）
+        executor (concurrent.futures.Executor): HTTP通信を実行するスレッドプール
+            （Noneの場合はイベントループの既定のもの）
+        cache (ResponseCache): AI応答のキャッシュ（Noneの場合は使わない）
+        refresh (bool): Trueの場合、キャッシュを読まずにAPIを呼び出す（結果は保存する）
+
+    Returns:
+        str: 生成されたMermaidコード（クリーンな形式）
+    """
+    return await _generate_async(
+        functools.partial(_prepare_request, json_path, image_path),
+        timeout, limiter, executor, cache, refresh
+    )
+
+
+async def generate_mermaid_code_from_data_async(json_data, image, timeout=DEFAULT_TIMEOUT,
+                                               limiter=None, executor=None, cache=None, refresh=False,
+                                               prompt_format=DEFAULT_PROMPT_FORMAT):
+    """
+    generate_mermaid_code_from_data の非同期版
+
+    Args:
+        json_data (list): JSON指示書データ
+        image (bytes | PIL.Image): IDアンカー画像（エンコード済みのPNGデータ、または画像オブジェクト）
+        timeout (float): 1回の送信あたりのタイムアウト [秒]
+        limiter (asyncio.Semaphore): 同時実行数を制限するセマフォ（Noneの場合は制限しない）
+        executor (concurrent.futures.Executor): HTTP通信を実行するスレッドプール
+        cache (ResponseCache): AI応答のキャッシュ（Noneの場合は使わない）
+        refresh (bool): Trueの場合、キャッシュを読まずにAPIを呼び出す（結果は保存する）
+        prompt_format (str): プロンプト中の図形データの形式（PROMPT_FORMATS のいずれか）
+
+    Returns:
+        str: 生成されたMermaidコード（クリーンな形式）
+    """
+    def prepare():
+        return _prepare_data(json_data, image, prompt_format)
+
+    return await _generate_async(prepare, timeout, limiter, executor, cache, refresh)
+
+
+async def _generate_async(prepare, timeout, limiter, executor, cache, refresh):
+    """
+    非同期版の共通処理
+
+    Args:
+        prepare (callable): (prompt_text, image_bytes) を返す関数（スレッドで実行する）
+        その他の引数は generate_mermaid_code_async と同じ
+    """
+    loop = asyncio.get_running_loop()
+
+    async with limiter or contextlib.nullcontext():
+        # ファイル読み込みとエンコード、キャッシュの参照もスレッドで行う
+        prompt_text, image_bytes = await loop.run_in_executor(executor, prepare)
+        if cache is not None and not refresh:
+            cached_code = await loop.run_in_executor(executor, _lookup, cache, prompt_text, image_bytes)
+            if cached_code is not None:
+                return cached_code
+
+        payload = _build_payload(prompt_text, image_bytes)
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                raw_response = await asyncio.wait_for(
+                    loop.run_in_executor(executor, _send_generate_content, payload, timeout),
+                    timeout
+                )
+                break
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Gemini API request timed out after {timeout} seconds")
+            except _TransientAPIError as e:
+                if attempt >= MAX_RETRIES:
+                    raise RuntimeError(f"Gemini API request failed: {e}")
+                # 待っている間はスレッドを占有しない
+                await asyncio.sleep(_backoff_delay(attempt, e.retry_after))
+                attempt += 1
+
+        clean_code = _extract_mermaid_code(raw_response)
+        if cache is not None:
+            await loop.run_in_executor(
+                executor, cache.store, prompt_text, image_bytes, raw_response, clean_code,
+                time.perf_counter() - started
+            )
+
+    return clean_code
+
+
+async def generate_mermaid_codes_async(pairs, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                                       cache=None, refresh=False):
+    """
+    複数の (JSON指示書, IDアンカー画像) からMermaidコードを並行して生成する
+
+    同時に送信するリクエストは concurrency 件までに制限する。失敗したリクエストは
+    例外オブジェクトとして結果に入り、他のリクエストは続行する。
+    この関数（タスク）をキャンセルすると、実行中・待機中のリクエストもすべてキャンセルされる。
+
+    Args:
+        pairs (list): (json_path, image_path) のリスト
+        concurrency (int): 同時に送信するリクエスト数の上限
+        timeout (float): 1リクエストあたりのタイムアウト [秒]
+        cache (ResponseCache): AI応答のキャッシュ（Noneの場合は使わない）
+        refresh (bool): Trueの場合、キャッシュを読まずにAPIを呼び出す
+
+    Returns:
+        list: 入力と同じ順序の、Mermaidコードまたは例外のリスト
+    """
+    limiter = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        return await asyncio.gather(
+            *(generate_mermaid_code_async(json_path, image_path, timeout, limiter, executor,
+                                          cache, refresh)
+              for json_path, image_path in pairs),
+            return_exceptions=True
+        )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def generate_mermaid_codes(pairs, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                           cache=None, refresh=False):
+    """
+    generate_mermaid_codes_async の同期版（イベントループの外から呼び出す場合）
+
+    Args:
+        pairs (list): (json_path, image_path) のリスト
+        concurrency (int): 同時に送信するリクエスト数の上限
+        timeout (float): 1リクエストあたりのタイムアウト [秒]
+        cache (ResponseCache): AI応答のキャッシュ（Noneの場合は使わない）
+        refresh (bool): Trueの場合、キャッシュを読まずにAPIを呼び出す
+
+    Returns:
+        list: 入力と同じ順序の、Mermaidコードまたは例外のリスト
+    """
+    return asyncio.run(generate_mermaid_codes_async(pairs, concurrency, timeout, cache, refresh))
 
 
 def _call_gemini_api(prompt_text, image_object):
@@ -113,48 +527,205 @@ def _call_gemini_api(prompt_text, image_object):
     Returns:
         str: APIからの生のレスポンス
     """
-    # APIキーを取得
-    api_key = os.environ.get('GOOGLE_API_KEY')
-    if not api_key:
-        raise ValueError(
-            "GOOGLE_API_KEY not found in environment variables. "
-            "Please create a .env file with your API key."
-        )
+    payload = _build_payload(prompt_text, _encode_image_png(image_object))
+    return _post_generate_content(payload, DEFAULT_TIMEOUT)
 
-    # 画像をbase64エンコード
-    import io
+
+def _prepare_request(json_path, image_path):
+    """JSON指示書とIDアンカー画像から、プロンプトとPNGエンコードされた画像を作成する"""
+    prompt_text, image_object = build_prompt(json_path, image_path)
+    return prompt_text, _encode_image_png(image_object)
+
+
+def _prepare_data(json_data, image, prompt_format):
+    """メモリ上のJSON指示書データとIDアンカー画像から、プロンプトとエンコードされた画像を作成する"""
+    with profiler.span("ai.prompt", category="ai", format=prompt_format) as span:
+        prompt_text = build_prompt_text(json_data, prompt_format)
+        image_bytes = _image_bytes(image)
+        span.update(prompt_chars=len(prompt_text), image_bytes=len(image_bytes))
+    return prompt_text, image_bytes
+
+
+def _lookup(cache, prompt_text, image_bytes):
+    """AI応答のキャッシュを参照する"""
+    with profiler.span("ai.cache", category="ai") as span:
+        cached_code = cache.lookup(prompt_text, image_bytes)
+        span["hits"] = int(cached_code is not None)
+    return cached_code
+
+
+def _image_bytes(image):
+    """画像オブジェクトであればPNGにエンコードし、エンコード済みのデータはそのまま返す"""
+    if isinstance(image, Image.Image):
+        return _encode_image_png(image)
+    return image
+
+
+def _encode_image_png(image_object):
+    """
+    画像をPNG形式のバイト列にエンコードする
+
+    Args:
+        image_object (PIL.Image): 画像オブジェクト
+
+    Returns:
+        bytes: PNGデータ
+    """
     buffered = io.BytesIO()
     image_object.save(buffered, format="PNG")
-    img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+    return buffered.getvalue()
+
 
-    # REST APIエンドポイント
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
+def _build_payload(prompt_text, image_bytes):
+    """
+    generateContent のリクエストボディを作成する
+
+    Args:
+        prompt_text (str): プロンプトテキスト
+        image_bytes (bytes): エンコード済みの画像（PNG・JPEG・WebP）
+
+    Returns:
+        dict: リクエストボディ
+    """
+    # 画像をbase64エンコード
+    img_base64 = base64.b64encode(image_bytes).decode('utf-8')
 
-    # リクエストボディ
     payload = {
         "contents": [{
             "parts": [
                 {"text": prompt_text},
                 {
                     "inline_data": {
-                        "mime_type": "image/png",
+                        "mime_type": _image_mime_type(image_bytes),
                         "data": img_base64
                     }
                 }
             ]
         }]
     }
+    if GENERATION_CONFIG:
+        payload["generationConfig"] = GENERATION_CONFIG
+
+    return payload
+
+
+def _image_mime_type(image_bytes):
+    """エンコード済み画像の先頭バイトからMIMEタイプを判定する"""
+    if image_bytes.startswith(b'\xff\xd8\xff'):
+        return "image/jpeg"
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return "image/webp"
+    return "image/png"
+
+
+def model_name():
+    """使用するモデル名（環境変数 GEMINI_MODEL、なければ既定のモデル）"""
+    return os.environ.get('GEMINI_MODEL', DEFAULT_MODEL)
+
+
+def _api_url(api_key):
+    """generateContent のエンドポイントURLを返す"""
+    api_base = os.environ.get('GEMINI_API_BASE', DEFAULT_API_BASE).rstrip('/')
+    model = model_name()
+    return f"{api_base}/models/{model}:generateContent?key={api_key}"
+
+
+def _post_generate_content(payload, timeout=DEFAULT_TIMEOUT):
+    """
+    generateContent にリクエストを送信し、生成されたテキストを返す
+
+    429・5xx・接続失敗は一時的なエラーとして、指数バックオフ（ジッター付き）で再試行する。
+    Retry-After ヘッダーがあればその時間だけ待つ。
+
+    Args:
+        payload (dict): リクエストボディ
+        timeout (float): 1回の送信あたりの読み込みタイムアウト [秒]
+
+    Returns:
+        str: APIからの生のレスポンス
+    """
+    attempt = 0
+    while True:
+        try:
+            return _send_generate_content(payload, timeout)
+        except _TransientAPIError as e:
+            if attempt >= MAX_RETRIES:
+                raise RuntimeError(f"Gemini API request failed: {e}")
+            time.sleep(_backoff_delay(attempt, e.retry_after))
+            attempt += 1
+
+
+class _TransientAPIError(Exception):
+    """再試行すれば成功する可能性があるエラー"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _send_generate_content(payload, timeout=DEFAULT_TIMEOUT):
+    """
+    generateContent にリクエストを1回送信する
+
+    Args:
+        payload (dict): リクエストボディ
+        timeout (float): 読み込みタイムアウト [秒]
+
+    Returns:
+        str: APIからの生のレスポンス
+
+    Raises:
+        _TransientAPIError: 再試行すべきエラー（429・5xx・接続失敗）
+    """
+    # APIキーを取得
+    load_environment()
+    api_key = os.environ.get('GOOGLE_API_KEY')
+    if not api_key:
+        raise ValueError(
+            "GOOGLE_API_KEY not found in environment variables. "
+            "Please create a .env file with your API key."
+        )
 
     headers = {
         "Content-Type": "application/json"
     }
 
-    # API呼び出し（60秒タイムアウト）
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
+    # API呼び出し（接続と読み込みでタイムアウトを分ける）
+    # 送信するバイト数を記録するため、ボディはここでシリアライズする
+    body = json.dumps(payload).encode('utf-8')
+    requests = _requests()
+    with profiler.span("ai.request", category="http", request_bytes=len(body)) as span:
+        try:
+            response = _get_session().post(
+                _api_url(api_key), headers=headers, data=body,
+                timeout=(min(CONNECT_TIMEOUT, timeout), timeout)
+            )
+        except requests.exceptions.ConnectTimeout as e:
+            raise _TransientAPIError(f"connection timed out: {e}")
+        except requests.exceptions.Timeout:
+            raise TimeoutError(f"Gemini API request timed out after {timeout} seconds")
+        except requests.exceptions.ConnectionError as e:
+            raise _TransientAPIError(f"connection failed: {e}")
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError(f"Gemini API request failed: {e}")
+
+        span.update(status=str(response.status_code), response_bytes=len(response.content))
+        if response.status_code in RETRYABLE_STATUS:
+            raise _TransientAPIError(
+                f"{response.status_code} {response.reason}",
+                _parse_retry_after(response.headers.get('Retry-After'))
+            )
+
+        try:
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError(f"Gemini API request failed: {e}")
 
         result = response.json()
+        usage = result.get('usageMetadata', {})
+        span.update(prompt_tokens=usage.get('promptTokenCount', 0),
+                    output_tokens=usage.get('candidatesTokenCount', 0),
+                    total_tokens=usage.get('totalTokenCount', 0))
 
         if 'candidates' in result and len(result['candidates']) > 0:
             text = result['candidates'][0]['content']['parts'][0]['text']
@@ -162,10 +733,93 @@ def _call_gemini_api(prompt_text, image_object):
         else:
             raise ValueError(f"Unexpected API response format: {json.dumps(result, indent=2)}")
 
-    except requests.exceptions.Timeout:
-        raise TimeoutError("Gemini API request timed out after 60 seconds")
-    except requests.exceptions.RequestException as e:
-        raise RuntimeError(f"Gemini API request failed: {e}")
+
+def _get_session():
+    """
+    このスレッド用のHTTPセッションを返す
+
+    セッションはKeep-Aliveで接続を使い回すため、TCP・TLSのハンドシェイクは
+    スレッド（ワーカー）ごとに最初の1回だけになる。requests.Session はスレッドセーフではないため、
+    スレッドごとに作成する。
+    """
+    session = getattr(_session_local, 'session', None)
+    if session is None:
+        requests = _requests()
+        session = requests.Session()
+        # 再試行は _post_generate_content で行うため、アダプターでは再試行しない
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session_local.session = session
+    return session
+
+
+def _requests():
+    """
+    requests を読み込んで返す
+
+    requests の読み込みには時間がかかるため、APIを呼び出すまで読み込まない
+    （解析・資材生成だけを実行する場合は読み込まれない）。
+    """
+    import requests
+    import requests.adapters
+    return requests
+
+
+@functools.cache
+def load_environment():
+    """
+    .env ファイルの環境変数を読み込む（最初の1回だけ）
+
+    import 時には読み込まず、APIキーを参照する直前に呼び出す。
+    既に設定されている環境変数は上書きしない。
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def _backoff_delay(attempt, retry_after=None):
+    """
+    再試行までの待ち時間を返す
+
+    Args:
+        attempt (int): 何回目の再試行か（0始まり）
+        retry_after (float): Retry-After で指定された待ち時間 [秒]
+
+    Returns:
+        float: 待ち時間 [秒]
+    """
+    if retry_after is not None:
+        # 指定された時間は必ず待ち、同時に再開しないよう少しずらす
+        return min(retry_after, RETRY_AFTER_MAX) + random.uniform(0, BACKOFF_BASE)
+
+    # 指数バックオフ（フルジッター）
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _parse_retry_after(value):
+    """
+    Retry-After ヘッダー（秒数またはHTTP日付）を秒数に変換する
+
+    Args:
+        value (str): ヘッダーの値
+
+    Returns:
+        float: 待ち時間 [秒]（ヘッダーがない・解釈できない場合はNone）
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
 
 
 def _extract_mermaid_code(raw_response):
@@ -2,16 +2,40 @@
 資材生成モジュール
 モジュール1のマッピング結果に基づき、AIへの入力となる「JSON指示書」と「IDアンカー画像」を生成する。
 """
+import functools
+import io
 import json
-import os
 from PIL import Image, ImageDraw, ImageFont
 import mss
 import mss.tools
 
+import headless_renderer
+import profiler
+from settings import DEFAULT_IMAGE_FORMAT, DEFAULT_MAX_EDGE, DEFAULT_RENDER, IMAGE_FORMATS, RENDER_MODES
+from shape_table import ShapeTable
+
+# シート座標[pt]から画像のピクセル座標への変換 (scale, origin_x, origin_y)
+# スクリーンショットは 1pt = 1px、原点は画面の左上とみなす
+IDENTITY_TRANSFORM = (1.0, 0.0, 0.0)
+
+# 中間ファイルとして保存する場合の拡張子
+IMAGE_EXTENSIONS = {"png": "png", "palette": "png", "gray": "png", "webp": "webp", "jpeg": "jpg"}
+
+# 図形の外接矩形の周囲に残す余白[px]
+CROP_MARGIN = 32
+
+# IDのフォントサイズ[px]（スクリーンショットの場合）と、枠に収めるために縮小する場合の下限
+ID_FONT_SIZE = 24
+MIN_ID_FONT_SIZE = 10
+
+# パレットPNGの色数と、非可逆形式の品質
+PALETTE_COLORS = 16
+LOSSY_QUALITY = 80
+
 
 def generate_assets(mapped_containers, excel_file, sheet_name, json_out_path, image_out_path):
     """
-    AIインプット資材を生成するメイン関数
+    AIインプット資材を生成し、ファイルに保存する
 
     Args:
         mapped_containers (list): マッピング済みのコンテナ図形リスト
@@ -23,57 +47,210 @@ def generate_assets(mapped_containers, excel_file, sheet_name, json_out_path, im
     Returns:
         tuple: (json_data, image_path)
     """
-    # JSON指示書を生成
-    json_data = generate_json_instructions(mapped_containers, json_out_path)
+    json_data, anchor_image, _ = build_assets(mapped_containers, excel_file, sheet_name)
+
+    save_json_instructions(json_data, json_out_path)
+    anchor_image.save(image_out_path)
+    print(f"✓ Anchor image saved: {image_out_path}")
+
+    return json_data, image_out_path
+
 
-    # スクリーンショットを取得
-    screenshot_path = _get_chart_screenshot(excel_file, sheet_name)
+def build_assets(mapped_containers, excel_file, sheet_name, render=DEFAULT_RENDER,
+                 dpi=headless_renderer.DEFAULT_DPI, log=print):
+    """
+    AIインプット資材をメモリ上で生成する（ファイルには書き出さない）
+
+    Args:
+        mapped_containers (list | ShapeTable): マッピング済みのコンテナ図形リスト
+        excel_file (str): Excelファイルのパス
+        sheet_name (str): シート名
+        render (str): 元画像の取得方法（RENDER_MODES のいずれか）
+        dpi (int): headless の場合の解像度
+        log (callable): 進捗の出力先
+
+    Returns:
+        tuple: (json_data, anchor_image, transform) JSON指示書データ、IDアンカー画像（PIL.Image）、
+            シート座標から画像のピクセル座標への変換
+    """
+    if render not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode: {render} (expected one of {', '.join(RENDER_MODES)})")
+
+    # JSON指示書を生成
+    with profiler.span("assets.json") as span:
+        json_data = build_json_instructions(mapped_containers)
+        span["nodes"] = len(json_data)
+
+    # 元画像を取得
+    with profiler.span("assets.render", mode=render) as span:
+        if render == "headless":
+            base_image, transform = headless_renderer.render_sheet(excel_file, sheet_name, dpi)
+        else:
+            base_image, transform = _capture_chart_screenshot(excel_file, sheet_name), IDENTITY_TRANSFORM
+            log(f"✓ Screenshot captured ({base_image.size[0]}x{base_image.size[1]})")
+            log(f"  Note: Please ensure Excel file '{excel_file}' (Sheet: '{sheet_name}') is visible on screen")
+        span["pixels"] = base_image.size[0] * base_image.size[1]
 
     # IDアンカー画像を生成
-    generate_anchor_image(screenshot_path, json_data, image_out_path)
+    with profiler.span("assets.anchor"):
+        anchor_image = draw_anchor_image(base_image, json_data, transform)
 
-    # 一時ファイルを削除
-    if os.path.exists(screenshot_path):
-        os.remove(screenshot_path)
+    return json_data, anchor_image, transform
 
-    return json_data, image_out_path
+
+def encode_anchor_image(anchor_image, instructions_json=None, image_format=DEFAULT_IMAGE_FORMAT,
+                        max_edge=DEFAULT_MAX_EDGE, margin=CROP_MARGIN, transform=IDENTITY_TRANSFORM):
+    """
+    IDアンカー画像をアップロード用にエンコードする
+
+    instructions_json を渡すと、全ノードの外接矩形（余白つき）に切り抜いてから
+    長辺が max_edge 以下になるよう縮小し、指定の形式で1回だけエンコードする。
+    image_format="png"、max_edge=None、instructions_json=None の場合は従来と同じフルサイズのPNGになる。
+
+    Args:
+        anchor_image (PIL.Image): IDアンカー画像
+        instructions_json (list): JSON指示書データ（Noneの場合は切り抜かない）
+        image_format (str): エンコード形式（IMAGE_FORMATS のいずれか）
+        max_edge (int): 長辺の最大ピクセル数（0またはNoneの場合は縮小しない）
+        margin (int): 切り抜き時に外接矩形の周囲に残す余白[px]
+        transform (tuple): シート座標から画像のピクセル座標への変換（build_assets の戻り値）
+
+    Returns:
+        bytes: エンコード済みの画像データ
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(
+            f"Unknown image format: {image_format} (expected one of {', '.join(IMAGE_FORMATS)})"
+        )
+
+    img = anchor_image
+    if instructions_json:
+        img = img.crop(_chart_bbox(instructions_json, img.size, margin, transform))
+
+    if max_edge and max(img.size) > max_edge:
+        scale = max_edge / max(img.size)
+        img = img.resize(
+            (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale))),
+            Image.LANCZOS
+        )
+
+    buffered = io.BytesIO()
+    if image_format == "png":
+        img.save(buffered, format="PNG")
+    elif image_format == "palette":
+        img.convert("RGB").quantize(colors=PALETTE_COLORS).save(buffered, format="PNG", optimize=True)
+    elif image_format == "gray":
+        img.convert("L").save(buffered, format="PNG", optimize=True)
+    elif image_format == "webp":
+        img.convert("RGB").save(buffered, format="WEBP", quality=LOSSY_QUALITY)
+    else:
+        img.convert("RGB").save(buffered, format="JPEG", quality=LOSSY_QUALITY, optimize=True)
+    return buffered.getvalue()
+
+
+def _chart_bbox(instructions_json, image_size, margin, transform=IDENTITY_TRANSFORM):
+    """
+    全ノードの外接矩形に余白を加え、画像の範囲内に収めた切り抜き範囲を返す
+
+    Returns:
+        tuple: (left, top, right, bottom)
+    """
+    boxes = [_node_box(node["position"], transform) for node in instructions_json]
+    left = min(box[0] for box in boxes) - margin
+    top = min(box[1] for box in boxes) - margin
+    right = max(box[2] for box in boxes) + margin
+    bottom = max(box[3] for box in boxes) + margin
+
+    width, height = image_size
+    left, top = max(0, int(left)), max(0, int(top))
+    right, bottom = min(width, int(right + 0.5)), min(height, int(bottom + 0.5))
+
+    # 図形が画像の外にある場合は切り抜かない
+    if right <= left or bottom <= top:
+        return 0, 0, width, height
+    return left, top, right, bottom
+
+
+def _node_box(position, transform):
+    """ノードの座標情報を画像のピクセル座標 (left, top, right, bottom) に変換する"""
+    scale, origin_x, origin_y = transform
+    left = (position["left"] - origin_x) * scale
+    top = (position["top"] - origin_y) * scale
+    return left, top, left + position["width"] * scale, top + position["height"] * scale
 
 
 def generate_json_instructions(mapped_containers, output_path):
     """
-    モジュール1の出力からJSON指示書を生成する
+    モジュール1の出力からJSON指示書を生成し、ファイルに保存する
 
     Args:
-        mapped_containers (list): マッピング済みのコンテナ図形リスト
+        mapped_containers (list | ShapeTable): マッピング済みのコンテナ図形リスト
         output_path (str): JSON出力パス
 
+    Returns:
+        list: JSONデータ（Pythonのリスト形式）
+    """
+    json_data = build_json_instructions(mapped_containers)
+    save_json_instructions(json_data, output_path)
+    return json_data
+
+
+def build_json_instructions(mapped_containers):
+    """
+    モジュール1の出力からJSON指示書のデータを生成する
+
+    Args:
+        mapped_containers (list | ShapeTable): マッピング済みのコンテナ図形リスト
+
     Returns:
         list: JSONデータ（Pythonのリスト形式）
     """
     json_data = []
 
-    for idx, container in enumerate(mapped_containers, 1):
+    if isinstance(mapped_containers, ShapeTable):
+        # テーブルの列から直接ノードを組み立てる
+        containers = (
+            (mapped_containers.texts[row], mapped_containers.shape_type(row),
+             mapped_containers.position(row))
+            for row in range(len(mapped_containers))
+        )
+    else:
+        containers = (
+            (container["text"], container["shape_type"], container["position"])
+            for container in mapped_containers
+        )
+
+    for idx, (text, shape_type, position) in enumerate(containers, 1):
         node_id = f"node_{idx:03d}"
 
         node_entry = {
             "id": node_id,
-            "text": container["text"],
-            "shape_type": container["shape_type"],
-            "position": container["position"]
+            "text": text,
+            "shape_type": shape_type,
+            "position": position
         }
 
         json_data.append(node_entry)
 
-    # JSONファイルとして保存
+    return json_data
+
+
+def save_json_instructions(json_data, output_path, log=print):
+    """
+    JSON指示書をファイルに保存する
+
+    Args:
+        json_data (list): JSON指示書データ
+        output_path (str): JSON出力パス
+        log (callable): 進捗の出力先
+    """
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(json_data, f, ensure_ascii=False, indent=2)
 
-    print(f"✓ JSON instructions saved: {output_path}")
-
-    return json_data
+    log(f"✓ JSON instructions saved: {output_path}")
 
 
-def _get_chart_screenshot(file_path, sheet_name):
+def _capture_chart_screenshot(file_path, sheet_name):
     """
     Excelファイルの指定シートのスクリーンショットを取得
 
@@ -86,86 +263,99 @@ def _get_chart_screenshot(file_path, sheet_name):
         sheet_name (str): シート名
 
     Returns:
-        str: 保存されたスクリーンショットのパス
+        PIL.Image: スクリーンショット
     """
-    # 一時保存パス
-    temp_path = "temp_screenshot.png"
-
     # mssを使用して画面全体のスクリーンショットを取得
     with mss.mss() as sct:
         # プライマリモニターの全画面をキャプチャ
         monitor = sct.monitors[1]  # 1 = プライマリモニター
         screenshot = sct.grab(monitor)
 
-        # PIL Imageに変換して保存
+        # PIL Imageに変換
         img = Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
-        img.save(temp_path)
 
-    print(f"✓ Screenshot captured: {temp_path}")
-    print(f"  Note: Please ensure Excel file '{file_path}' (Sheet: '{sheet_name}') is visible on screen")
-
-    return temp_path
+    return img
 
 
 def generate_anchor_image(original_image_path, instructions_json, output_path):
     """
-    元のスクリーンショットにID情報を重ねた「IDアンカー画像」を生成
+    元のスクリーンショットにID情報を重ねた「IDアンカー画像」を生成し、ファイルに保存する
 
     Args:
         original_image_path (str): 元画像のパス
         instructions_json (list): JSON指示書データ
         output_path (str): 出力画像のパス
     """
-    # 元画像を開く
-    img = Image.open(original_image_path)
+    img = draw_anchor_image(Image.open(original_image_path), instructions_json)
+
+    # 画像を保存
+    img.save(output_path)
+    print(f"✓ Anchor image saved: {output_path}")
+
+
+def draw_anchor_image(base_image, instructions_json, transform=IDENTITY_TRANSFORM):
+    """
+    元画像にID情報を重ねた「IDアンカー画像」をメモリ上で生成する
+
+    Args:
+        base_image (PIL.Image): 元画像（スクリーンショットまたはヘッドレス描画）
+        instructions_json (list): JSON指示書データ
+        transform (tuple): シート座標から元画像のピクセル座標への変換
+
+    Returns:
+        PIL.Image: IDアンカー画像
+    """
+    img = base_image
     draw = ImageDraw.Draw(img)
 
-    # フォント設定（システムフォントを使用）
-    try:
-        # macOSの場合
-        font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 24)
-    except:
-        try:
-            # その他のシステム
-            font = ImageFont.truetype("arial.ttf", 24)
-        except:
-            # デフォルトフォント
-            font = ImageFont.load_default()
+    # IDのフォントサイズは元画像の解像度に合わせる
+    font_size = round(ID_FONT_SIZE * transform[0])
+    font = _load_font(font_size)
 
     # 各シェイプに対してマスキングとID描画を実行
     for node in instructions_json:
-        pos = node["position"]
         node_id = node["id"]
 
-        # 座標を取得
-        left = pos["left"]
-        top = pos["top"]
-        width = pos["width"]
-        height = pos["height"]
-
-        # マスキング領域を定義
-        x1, y1 = left, top
-        x2, y2 = left + width, top + height
+        # マスキング領域をピクセル座標で定義
+        x1, y1, x2, y2 = _node_box(node["position"], transform)
+        width, height = x2 - x1, y2 - y1
 
         # 白色で塗りつぶし（マスキング）
         draw.rectangle([x1, y1, x2, y2], fill="white", outline="black", width=2)
 
         # IDテキストを中心に描画
-        # テキストのサイズを取得
-        bbox = draw.textbbox((0, 0), node_id, font=font)
+        # テキストのサイズを取得（枠に収まらない場合はフォントを縮小する）
+        node_font = font
+        bbox = draw.textbbox((0, 0), node_id, font=node_font)
+        if bbox[2] - bbox[0] > width * 0.9 and font_size > MIN_ID_FONT_SIZE:
+            node_font = _load_font(max(MIN_ID_FONT_SIZE, int(font_size * width * 0.9 / (bbox[2] - bbox[0]))))
+            bbox = draw.textbbox((0, 0), node_id, font=node_font)
         text_width = bbox[2] - bbox[0]
         text_height = bbox[3] - bbox[1]
 
         # 中心座標を計算
-        text_x = left + (width - text_width) / 2
-        text_y = top + (height - text_height) / 2
+        text_x = x1 + (width - text_width) / 2
+        text_y = y1 + (height - text_height) / 2
 
         # テキストを描画
-        draw.text((text_x, text_y), node_id, fill="black", font=font)
+        draw.text((text_x - bbox[0], text_y - bbox[1]), node_id, fill="black", font=node_font)
 
-    # 画像を保存
-    img.save(output_path)
-    print(f"✓ Anchor image saved: {output_path}")
+    return img
+
+
+@functools.lru_cache(maxsize=32)
+def _load_font(size):
+    """IDの描画に使うフォントを読み込む（システムフォントを使用）"""
+    try:
+        # macOSの場合
+        return ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", size)
+    except OSError:
+        try:
+            # その他のシステム
+            return ImageFont.truetype("arial.ttf", size)
+        except OSError:
+            # デフォルトフォント
+            return ImageFont.load_default(size)
 
 
 if __name__ == "__main__":
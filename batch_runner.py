@@ -0,0 +1,352 @@
+"""
+バッチ変換モジュール
+ディレクトリやglobパターンで指定された複数のExcelファイルから、図形を持つすべてのシートを探し、
+プロセスプールで並列に変換する。結果はシートごとの出力ファイルとサマリー（manifest.json）にまとめる。
+
+CPU負荷の高い解析・資材生成はプロセスプールで、AIへのリクエストはイベントループ上で並行して行う。
+資材ができたシートから順にリクエストを送るため、待ち時間は解析とAIの応答待ちで重なる。
+"""
+import asyncio
+import glob
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import ai_connector
+import asset_generator
+import excel_parser
+import headless_renderer
+import incremental
+import partitioner
+import pipeline
+import profiler
+from disk_cache import DiskCache
+from settings import DEFAULT_TOKEN_BUDGET
+
+
+# ファイル名に使えない文字
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+MANIFEST_NAME = "manifest.json"
+
+
+def discover_workbooks(inputs):
+    """
+    ファイル・ディレクトリ・globパターンから変換対象のExcelファイルを列挙する。
+
+    Args:
+        inputs (list): ファイルパス、ディレクトリ（配下の *.xlsx を再帰的に探す）、globパターンのリスト
+
+    Returns:
+        list: Excelファイルのパスのリスト（重複なし、入力順）
+    """
+    workbooks = []
+    seen = set()
+
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths = sorted(glob.glob(os.path.join(pattern, "**", "*.xlsx"), recursive=True))
+        elif os.path.isfile(pattern):
+            paths = [pattern]
+        else:
+            paths = sorted(glob.glob(pattern, recursive=True))
+
+        for path in paths:
+            # Excelが作成するロックファイル（~$xxx.xlsx）は除外する
+            if os.path.basename(path).startswith("~$") or not os.path.isfile(path):
+                continue
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                workbooks.append(path)
+
+    return workbooks
+
+
+def plan_jobs(sheets_by_workbook, output_dir):
+    """
+    シートごとの出力先・中間ファイルの保存先を決める。
+
+    並列に実行しても互いのファイルを上書きしないよう、ジョブごとに別のパスを割り当てる。
+
+    Args:
+        sheets_by_workbook (list): (Excelファイルのパス, シート名のリスト) のリスト
+        output_dir (str): 出力先ディレクトリ
+
+    Returns:
+        list: ジョブ {file, sheet, output, intermediate_dir} のリスト
+    """
+    jobs = []
+    used_dirs = set()
+
+    for file_path, sheet_names in sheets_by_workbook:
+        workbook_dir = _unique_name(
+            _safe_name(os.path.splitext(os.path.basename(file_path))[0]), used_dirs
+        )
+        used_sheets = set()
+
+        for sheet_name in sheet_names:
+            sheet_base = _unique_name(_safe_name(sheet_name), used_sheets)
+            jobs.append({
+                "file": file_path,
+                "sheet": sheet_name,
+                "output": os.path.join(output_dir, workbook_dir, f"{sheet_base}.md"),
+                "intermediate_dir": os.path.join(output_dir, workbook_dir, sheet_base)
+            })
+
+    return jobs
+
+
+def run_batch(inputs, output_dir, jobs=None, keep_intermediate=False, cache_dir=None,
+              ai_concurrency=ai_connector.DEFAULT_CONCURRENCY, refresh=False,
+              image_format=asset_generator.DEFAULT_IMAGE_FORMAT,
+              max_edge=asset_generator.DEFAULT_MAX_EDGE, render=asset_generator.DEFAULT_RENDER,
+              dpi=headless_renderer.DEFAULT_DPI, local_graph=True,
+              partition_nodes=partitioner.DEFAULT_PARTITION_NODES,
+              prompt_format=ai_connector.DEFAULT_PROMPT_FORMAT,
+              token_budget=DEFAULT_TOKEN_BUDGET, reuse_previous=True, profile=None, log=print):
+    """
+    複数のExcelファイルの図形を持つシートをすべて変換し、manifest.json を書き出す。
+
+    Args:
+        inputs (list): ファイルパス、ディレクトリ、globパターンのリスト
+        output_dir (str): 出力先ディレクトリ
+        jobs (int): 解析・資材生成を並列に実行するプロセス数
+            （Noneの場合はCPU数、1の場合はこのプロセス内で1件ずつ実行）
+        keep_intermediate (bool): Trueの場合、中間ファイルを削除しない
+        cache_dir (str): 解析結果・AI応答のキャッシュ保存先（Noneの場合は使わない）
+        ai_concurrency (int): AIへ同時に送信するリクエスト数の上限
+        refresh (bool): Trueの場合、AI応答のキャッシュを読まずにAPIを呼び出す
+        image_format (str): アップロードする画像の形式（asset_generator.IMAGE_FORMATS のいずれか）
+        max_edge (int): アップロードする画像の長辺の最大ピクセル数（0またはNoneの場合は縮小しない）
+        render (str): 元画像の取得方法（'screen' / 'headless'）。
+            'screen' は1つの画面を共有するため、並列に実行する場合は 'headless' を使う
+        dpi (int): headless の場合の解像度
+        local_graph (bool): Falseの場合、コネクタがすべて図形に接続されたシートでもAIを呼び出す
+        partition_nodes (int): 1リクエストあたりのノード数の上限（0の場合は分割しない）。
+            分割したシートの領域ごとのリクエストも ai_concurrency の上限に含まれる
+        prompt_format (str): プロンプト中の図形データの形式（ai_connector.PROMPT_FORMATS のいずれか）
+        token_budget (int): 1リクエストあたりの推定トークン数の上限（0の場合は制限しない）
+        reuse_previous (bool): Trueの場合、cache_dir に保存した前回の変換結果から変更部分だけを変換する
+        profile (profiler.Profiler): 各段階の計測の記録先（Noneの場合は計測しない）。
+            ワーカープロセスで計測したスパンも加える
+        log (callable): 進捗の出力先
+
+    Returns:
+        dict: manifest.json の内容
+    """
+    started = time.perf_counter()
+    workers = jobs or os.cpu_count() or 1
+    workbooks = discover_workbooks(inputs)
+    log(f"Found {len(workbooks)} workbook(s)")
+
+    # AIへのリクエストはこのプロセスから送るため、AI応答のキャッシュもここで持つ
+    ai_cache = ai_connector.ResponseCache(os.path.join(cache_dir, "ai")) if cache_dir else None
+    # 前回の変換結果は資材生成のワーカーで読み、変換後にこのプロセスで保存する
+    state_dir = os.path.join(cache_dir, "state") if cache_dir and reuse_previous else None
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        # シートの探索もプールで行う
+        discovered = list(executor.map(_discover_sheets, workbooks))
+
+        failures = [
+            {"file": path, "sheet": None, "status": "error", "error": error}
+            for path, _, error in discovered if error is not None
+        ]
+        planned = plan_jobs([(path, sheets) for path, sheets, _ in discovered], output_dir)
+        log(f"Converting {len(planned)} sheet(s) with {workers} worker(s)...")
+
+        with profiler.enabled(profile):
+            results = asyncio.run(_convert_all(
+                planned, executor, keep_intermediate, cache_dir, state_dir, ai_concurrency, ai_cache, refresh,
+                {"image_format": image_format, "max_edge": max_edge, "render": render, "dpi": dpi,
+                 "local_graph": local_graph, "partition_nodes": partition_nodes,
+                 "prompt_format": prompt_format, "token_budget": token_budget, "refresh": refresh}, log
+            ))
+    finally:
+        executor.shutdown()
+
+    results = failures + results
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    manifest = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "inputs": list(inputs),
+        "workers": workers,
+        "workbooks": len(workbooks),
+        "sheets": len(planned),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "local": sum(1 for result in results if result.get("local")),
+        "incremental": sum(1 for result in results if result.get("incremental") not in (None, "full")),
+        "tokens": sum(result.get("tokens", 0) for result in results),
+        "seconds": round(time.perf_counter() - started, 3),
+        "ai_cache": ai_cache.stats() if ai_cache is not None else None,
+        "results": results
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    log(f"✓ Manifest saved: {manifest_path}")
+
+    return manifest
+
+
+async def _convert_all(planned, executor, keep_intermediate, cache_dir, state_dir, ai_concurrency,
+                       ai_cache, refresh, asset_options, log):
+    """
+    全ジョブを変換する。資材生成は executor で、AIへのリクエストは最大 ai_concurrency 件ずつ並行して行う。
+
+    Returns:
+        list: ジョブと同じ順序の結果のリスト
+    """
+    loop = asyncio.get_running_loop()
+    ai_connector.load_environment()
+    use_ai = bool(os.environ.get('GOOGLE_API_KEY'))
+    limiter = asyncio.Semaphore(ai_concurrency)
+    ai_executor = ThreadPoolExecutor(max_workers=ai_concurrency)
+    state_cache = DiskCache(state_dir) if state_dir else None
+    results = [None] * len(planned)
+    completed = 0
+
+    async def convert(idx, job):
+        nonlocal completed
+        started = time.perf_counter()
+        result = await loop.run_in_executor(
+            executor, _prepare_job, job, cache_dir, state_dir, keep_intermediate, asset_options,
+            profiler.current() is not None
+        )
+        records = result.pop("profile", None)
+        if records:
+            profiler.current().extend(records)
+
+        if result["status"] == "ok":
+            # 資材はメモリ上で受け取り、そのままAIに渡す
+            assets = result.pop("assets")
+            try:
+                result["local"] = assets["local_mermaid"] is not None
+                if result["local"]:
+                    # すべてのつながりが接続情報から確定しているため、AIは呼び出さない
+                    mermaid_code = assets["local_mermaid"]
+                elif use_ai and assets["partitions"] is not None:
+                    with profiler.span("ai", category="ai", requests=len(assets["partitions"]),
+                                       file=job["file"], sheet=job["sheet"]):
+                        mermaid_code = await partitioner.generate_partitioned_async(
+                            assets["partitions"], limiter=limiter, executor=ai_executor,
+                            cache=ai_cache, refresh=refresh, prompt_format=assets["prompt_format"],
+                            base=assets["base"]
+                        )
+                elif use_ai:
+                    with profiler.span("ai", category="ai", requests=1, file=job["file"], sheet=job["sheet"]):
+                        mermaid_code = await ai_connector.generate_mermaid_code_from_data_async(
+                            assets["json_data"], assets["image_bytes"],
+                            limiter=limiter, executor=ai_executor, cache=ai_cache, refresh=refresh,
+                            prompt_format=assets["prompt_format"]
+                        )
+                else:
+                    mermaid_code = pipeline.generate_dummy_mermaid(assets["json_data"])
+                with profiler.span("write_markdown"):
+                    pipeline.write_markdown(job["output"], mermaid_code)
+                result["ai"] = use_ai and not result["local"]
+                if state_cache is not None and (result["ai"] or result["local"]):
+                    incremental.save_state(state_cache, job["file"], job["sheet"], assets["snapshot"],
+                                           mermaid_code, assets["source"], assets["state_settings"])
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = f"{type(e).__name__}: {e}"
+
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        results[idx] = result
+        completed += 1
+        mark = "✓" if result["status"] == "ok" else "✗"
+        log(f"[{completed}/{len(planned)}] {mark} {result['file']} / {result['sheet']} "
+            f"({result['seconds']:.2f}s)")
+
+    try:
+        await asyncio.gather(*(convert(idx, job) for idx, job in enumerate(planned)))
+    finally:
+        ai_executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
+def _discover_sheets(file_path):
+    """ワーカー: 図形を持つシートを探す。戻り値は (パス, シート名のリスト, エラー)"""
+    try:
+        return file_path, excel_parser.list_sheets_with_drawings(file_path), None
+    except Exception as e:
+        return file_path, [], f"{type(e).__name__}: {e}"
+
+
+def _prepare_job(job, cache_dir, state_dir, keep_intermediate, asset_options, profile=False):
+    """
+    ワーカー: 1シートの解析・資材生成を行い、結果を manifest 用の辞書で返す
+
+    asset_options は pipeline.prepare_assets に渡す画像の取得・エンコードの指定。
+    profile が True で、このプロセスに有効なプロファイラがない（プロセスプールのワーカー）場合は、
+    ここで計測したスパンを結果の profile に入れて返す
+    """
+    started = time.perf_counter()
+    result = {"file": job["file"], "sheet": job["sheet"], "output": job["output"]}
+    worker_profile = profiler.Profiler() if profile and profiler.current() is None else None
+
+    with (profiler.enabled(worker_profile),
+          profiler.span("prepare_job", category="sheet", file=job["file"], sheet=job["sheet"])):
+        try:
+            parse_cache = DiskCache(os.path.join(cache_dir, "parse")) if cache_dir else None
+            state_cache = DiskCache(state_dir) if state_dir else None
+            assets = pipeline.prepare_assets(
+                job["file"],
+                job["sheet"],
+                parse_cache=parse_cache,
+                compact=True,
+                intermediate_dir=job["intermediate_dir"] if keep_intermediate else None,
+                state_cache=state_cache,
+                **asset_options
+            )
+            result["status"] = "ok"
+            result["shapes"] = assets["shapes"]
+            if assets["partitions"] is not None:
+                result["partitions"] = len(assets["partitions"])
+                result["image_bytes"] = sum(len(partition["image_bytes"]) for partition in assets["partitions"])
+            else:
+                result["image_bytes"] = len(assets["image_bytes"]) if assets["image_bytes"] is not None else 0
+            result["tokens"] = assets["tokens"]["total"] if assets["tokens"] is not None else 0
+            result["incremental"] = assets["incremental"]
+            result["intermediate"] = assets["intermediate"]
+            result["assets"] = assets
+            if parse_cache is not None:
+                result["parse_cache_hit"] = parse_cache.hits > 0
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+
+    result["prepare_seconds"] = round(time.perf_counter() - started, 3)
+    if worker_profile is not None:
+        result["profile"] = worker_profile.records
+    return result
+
+
+def _safe_name(name):
+    """ファイル名に使えない文字を置き換える"""
+    safe = _UNSAFE_CHARS.sub("_", name).strip(" .")
+    return safe or "_"
+
+
+def _unique_name(name, used):
+    """同じディレクトリ内で名前が重複しないよう、必要なら連番を付ける"""
+    candidate = name
+    suffix = 2
+    while candidate.lower() in used:
+        candidate = f"{name}_{suffix}"
+        suffix += 1
+    used.add(candidate.lower())
+    return candidate
@@ -0,0 +1,194 @@
+"""
+AIへ送る画像データのベンチマークスクリプト
+従来の方式（全画面のPNGをそのまま送信）と、切り抜き・縮小・減色した画像のリクエストサイズ・処理時間を比較する。
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+import ai_connector
+import asset_generator
+import excel_parser
+import synthetic_workbook
+
+
+# 4Kモニターの全画面スクリーンショットを想定
+SCREEN_SIZE = (3840, 2160)
+
+
+def fake_screenshot(json_data, size=SCREEN_SIZE):
+    """
+    Excelの画面に似たスクリーンショットを作る（リボン・セルの枠線・塗りつぶした図形）
+
+    Args:
+        json_data (list): JSON指示書データ
+        size (tuple): 画面サイズ
+
+    Returns:
+        PIL.Image: スクリーンショット
+    """
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+
+    # リボンとステータスバー
+    draw.rectangle([0, 0, size[0], 160], fill=(33, 115, 70))
+    draw.rectangle([0, 160, size[0], 300], fill=(243, 242, 241))
+    draw.rectangle([0, size[1] - 40, size[0], size[1]], fill=(243, 242, 241))
+
+    # セルの枠線と値（圧縮しにくい細かな文字を含める）
+    for x in range(0, size[0], 64):
+        draw.line([x, 300, x, size[1] - 40], fill=(218, 220, 224))
+    for y in range(300, size[1] - 40, 20):
+        draw.line([0, y, size[0], y], fill=(218, 220, 224))
+        for x in range(0, size[0], 64 * 3):
+            draw.text((x + 4, y + 4), f"{(x * 7 + y * 13) % 10000:>5}", fill=(32, 32, 32))
+
+    # 図形（アンカー画像ではマスクされる）
+    for node in json_data:
+        pos = node["position"]
+        draw.rectangle(
+            [pos["left"], pos["top"], pos["left"] + pos["width"], pos["top"] + pos["height"]],
+            fill=(68, 114, 196), outline=(47, 82, 143), width=2
+        )
+    return img
+
+
+def measure(anchor_image, json_data, image_format, max_edge, crop, repeat):
+    """
+    1つの設定でエンコードし、エンコード時間とリクエストサイズを計測する。
+
+    Returns:
+        tuple: (エンコード時間[秒], 画像サイズ[バイト], リクエストボディ[バイト], 画像データ)
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image_bytes = asset_generator.encode_anchor_image(
+            anchor_image, json_data if crop else None, image_format=image_format, max_edge=max_edge
+        )
+        timings.append(time.perf_counter() - start)
+
+    payload = ai_connector._build_payload(ai_connector.build_prompt_text(json_data), image_bytes)
+    body_size = len(json.dumps(payload).encode('utf-8'))
+    return min(timings), len(image_bytes), body_size, image_bytes
+
+
+def measure_live(json_data, image_bytes, repeat):
+    """実際にAPIを呼び出し、リクエスト全体の処理時間の中央値を返す"""
+    prompt_text = ai_connector.build_prompt_text(json_data)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ai_connector._generate(prompt_text, image_bytes)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark anchor image encodings sent to the AI"
+    )
+    parser.add_argument(
+        "--shapes",
+        type=int,
+        default=200,
+        help="Number of shapes in the synthetic flowchart (default: 200)"
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=asset_generator.IMAGE_FORMATS,
+        default=list(asset_generator.IMAGE_FORMATS),
+        help="Image formats to compare (default: all)"
+    )
+    parser.add_argument(
+        "--max-edges",
+        type=int,
+        nargs="+",
+        default=[0, 2400, asset_generator.DEFAULT_MAX_EDGE, 1024],
+        help="Max edge lengths to compare; 0 keeps the cropped size (default: 0 2400 1600 1024)"
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=20.0,
+        help="Upload bandwidth in Mbit/s used to estimate transfer time (default: 20)"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Repetitions per measurement (default: 3)"
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Also call the Gemini API and measure end-to-end latency (requires GOOGLE_API_KEY)"
+    )
+    parser.add_argument(
+        "--save-dir",
+        help="Save each encoded image here for visual inspection"
+    )
+    args = parser.parse_args()
+
+    if args.live and not os.environ.get('GOOGLE_API_KEY'):
+        parser.error("--live requires GOOGLE_API_KEY")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "bench.xlsx")
+        synthetic_workbook.write_workbook(
+            file_path, [("Sheet1", synthetic_workbook.grid_shapes(args.shapes))]
+        )
+        mapped = excel_parser.parse_excel_shapes(file_path, "Sheet1")
+
+    json_data = asset_generator.build_json_instructions(mapped)
+    anchor_image = asset_generator.draw_anchor_image(fake_screenshot(json_data), json_data)
+
+    # 従来の方式（切り抜き・縮小なしのPNG）を基準にする
+    configs = [("current", "png", None, False)]
+    for image_format in args.formats:
+        for max_edge in args.max_edges:
+            configs.append((f"{image_format}@{max_edge or 'full'}", image_format, max_edge, True))
+
+    header = f"{'config':>16} {'encode [ms]':>12} {'image [KiB]':>12} {'body [KiB]':>12} {'upload [s]':>11}"
+    if args.live:
+        header += f" {'latency [s]':>12}"
+
+    print(f"Benchmarking anchor image payloads ({len(json_data)} shapes, "
+          f"{anchor_image.size[0]}x{anchor_image.size[1]} screenshot)")
+    print("=" * len(header))
+    print(header)
+    print("-" * len(header))
+
+    baseline = None
+    for name, image_format, max_edge, crop in configs:
+        encode_time, image_size, body_size, image_bytes = measure(
+            anchor_image, json_data, image_format, max_edge, crop, args.repeat
+        )
+        upload = body_size * 8 / (args.bandwidth * 1000 * 1000)
+        line = (f"{name:>16} {encode_time * 1000:>12.1f} {image_size / 1024:>12.1f} "
+                f"{body_size / 1024:>12.1f} {upload:>11.2f}")
+        if args.live:
+            line += f" {measure_live(json_data, image_bytes, args.repeat):>12.2f}"
+        if baseline is None:
+            baseline = body_size
+        else:
+            line += f"  ({body_size / baseline:.1%} of current)"
+        print(line)
+
+        if args.save_dir:
+            os.makedirs(args.save_dir, exist_ok=True)
+            extension = asset_generator.IMAGE_EXTENSIONS[image_format]
+            with open(os.path.join(args.save_dir, f"{name.replace('@', '_')}.{extension}"), 'wb') as f:
+                f.write(image_bytes)
+
+    print("=" * len(header))
+
+
+if __name__ == "__main__":
+    main()
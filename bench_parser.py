@@ -0,0 +1,76 @@
+"""
+Excel解析モジュールのベンチマークスクリプト
+drawing XMLのツリー解析（従来方式）と逐次解析（streaming）の処理時間・ピークメモリを比較する。
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import excel_parser
+import synthetic_workbook
+
+
+def measure(file_path, streaming):
+    """
+    1回分の解析を実行し、処理時間とピークメモリを計測する。
+
+    Args:
+        file_path (str): Excelファイルのパス
+        streaming (bool): 逐次解析を使うかどうか
+
+    Returns:
+        tuple: (処理時間[秒], ピークメモリ[バイト], シェイプ数)
+    """
+    # 処理時間はtracemallocのオーバーヘッドを避けて別途計測する
+    start = time.perf_counter()
+    shapes = excel_parser._get_all_shapes_from_xml(file_path, streaming=streaming)
+    elapsed = time.perf_counter() - start
+    count = len(shapes)
+    del shapes
+
+    tracemalloc.start()
+    shapes = excel_parser._get_all_shapes_from_xml(file_path, streaming=streaming)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del shapes
+
+    return elapsed, peak, count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark tree vs streaming drawing parser"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[200, 1000, 3000],
+        help="Shape counts to benchmark (default: 200 1000 3000)"
+    )
+    args = parser.parse_args()
+
+    print("Benchmarking excel_parser._get_all_shapes_from_xml")
+    print("=" * 70)
+    print(f"{'shapes':>8} {'mode':>10} {'time [s]':>12} {'peak [MiB]':>12}")
+    print("-" * 70)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            file_path = os.path.join(temp_dir, f"bench_{size}.xlsx")
+            synthetic_workbook.write_workbook(
+                file_path, [("Sheet1", synthetic_workbook.grid_shapes(size))]
+            )
+
+            for streaming in (False, True):
+                elapsed, peak, count = measure(file_path, streaming)
+                mode = "streaming" if streaming else "tree"
+                print(f"{count:>8} {mode:>10} {elapsed:>12.3f} {peak / 1024 / 1024:>12.2f}")
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+プロンプトのトークン数のベンチマークスクリプト
+従来のJSON形式（整形済み・座標付き）と表形式（compact）のプロンプトの推定トークン数・サイズを比較する。
+"""
+import argparse
+import os
+import tempfile
+
+import ai_connector
+import asset_generator
+import excel_parser
+import synthetic_workbook
+from settings import DEFAULT_TOKEN_BUDGET
+
+
+def measure(json_data):
+    """
+    1シート分のプロンプトを各形式で作り、推定トークン数とサイズを計測する。
+
+    Returns:
+        dict: 形式ごとの (推定トークン数, UTF-8でのバイト数)
+    """
+    results = {}
+    for prompt_format in ai_connector.PROMPT_FORMATS:
+        prompt_text = ai_connector.build_prompt_text(json_data, prompt_format)
+        results[prompt_format] = (ai_connector.estimate_tokens(prompt_text), len(prompt_text.encode('utf-8')))
+    return results
+
+
+def synthetic_corpus(sizes, temp_dir):
+    """図形数ごとの合成ワークブックを作り、(名前, JSON指示書データ) を返す"""
+    corpus = []
+    for count in sizes:
+        file_path = os.path.join(temp_dir, f"grid_{count}.xlsx")
+        synthetic_workbook.write_workbook(file_path, [("Sheet1", synthetic_workbook.grid_shapes(count))])
+        mapped = excel_parser.parse_excel_shapes(file_path, "Sheet1")
+        corpus.append((f"synthetic {count}", asset_generator.build_json_instructions(mapped)))
+    return corpus
+
+
+def file_corpus(paths):
+    """Excelファイルの図形を持つすべてのシートについて、(名前, JSON指示書データ) を返す"""
+    corpus = []
+    for file_path in paths:
+        for sheet_name in excel_parser.list_sheets_with_drawings(file_path):
+            mapped = excel_parser.parse_excel_shapes(file_path, sheet_name)
+            name = f"{os.path.basename(file_path)}/{sheet_name}"
+            corpus.append((name, asset_generator.build_json_instructions(mapped)))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark prompt token counts of the JSON and compact shape encodings"
+    )
+    parser.add_argument(
+        "--shapes",
+        type=int,
+        nargs="+",
+        default=[20, 60, 200, 500],
+        help="Shape counts of the synthetic sheets (default: 20 60 200 500)"
+    )
+    parser.add_argument(
+        "--files",
+        nargs="+",
+        default=[],
+        help="Excel files to add to the corpus (every sheet with drawings)"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus = synthetic_corpus(args.shapes, temp_dir) + file_corpus(args.files)
+
+    header = (f"{'sheet':>24} {'nodes':>6} {'json [tok]':>11} {'compact [tok]':>14} "
+              f"{'json [KiB]':>11} {'compact [KiB]':>14} {'ratio':>7}")
+    print(f"Benchmarking prompt sizes ({len(corpus)} sheet(s), "
+          f"token budget {DEFAULT_TOKEN_BUDGET})")
+    print("=" * len(header))
+    print(header)
+    print("-" * len(header))
+
+    totals = {prompt_format: 0 for prompt_format in ai_connector.PROMPT_FORMATS}
+    for name, json_data in corpus:
+        results = measure(json_data)
+        for prompt_format, (tokens, _) in results.items():
+            totals[prompt_format] += tokens
+        json_tokens, json_bytes = results["json"]
+        compact_tokens, compact_bytes = results["compact"]
+        print(f"{name[-24:]:>24} {len(json_data):>6} {json_tokens:>11} {compact_tokens:>14} "
+              f"{json_bytes / 1024:>11.1f} {compact_bytes / 1024:>14.1f} {compact_tokens / json_tokens:>7.1%}")
+
+    print("-" * len(header))
+    print(f"{'total':>24} {'':>6} {totals['json']:>11} {totals['compact']:>14} {'':>11} {'':>14} "
+          f"{totals['compact'] / max(totals['json'], 1):>7.1%}")
+    print("=" * len(header))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+変換パイプラインの段階別ベンチマークスクリプト
+合成ワークブック（synthetic_workbook.flowchart_shapes）を図形数ごとに生成し、解析から
+プロンプトの組み立てまでの各段階の処理時間とピークメモリを計測する。
+結果はJSONに書き出し、--compare で以前の結果と比べて性能の劣化を検出する。
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import ai_connector
+import asset_generator
+import excel_parser
+import headless_renderer
+import synthetic_workbook
+
+
+# 結果のJSONの形式が変わったら更新する
+BENCH_VERSION = '1'
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# この図形数を超えるシートは描画・エンコードを計測しない（画像が数億ピクセルになるため）
+DEFAULT_RENDER_LIMIT = 5000
+
+# --compare で劣化とみなす、以前の結果に対する処理時間・ピークメモリの比
+DEFAULT_THRESHOLD = 1.25
+
+# これより短い処理時間は誤差が大きいため、劣化の判定に使わない [秒]
+MIN_COMPARE_SECONDS = 0.005
+
+SHEET_NAME = "Sheet1"
+
+
+def stages(file_path):
+    """
+    計測する段階の定義を返す。
+
+    準備は前の段階の結果から本体の引数を作る（計測に含めない）。
+    本体の結果は後の段階の準備で参照できるよう、名前をキーに保持する。
+
+    Returns:
+        list: (名前, 準備, 本体, 描画を伴うか) のリスト
+    """
+    return [
+        ("parse_xml", lambda results: (file_path, SHEET_NAME),
+         excel_parser._get_all_shapes_from_xml, False),
+        ("classify", lambda results: (results["parse_xml"],),
+         excel_parser._classify_shapes, False),
+        # _map_text_to_containers はコンテナのテキストを書き換えるため、毎回複製した図形を渡す
+        ("map_text", lambda results: copy.deepcopy(results["classify"]),
+         excel_parser._map_text_to_containers, False),
+        ("json_instructions", lambda results: (results["map_text"],),
+         asset_generator.build_json_instructions, False),
+        ("render_anchor", lambda results: (file_path, results["json_instructions"]),
+         _render_anchor, True),
+        ("encode_image", lambda results: (*results["render_anchor"], results["json_instructions"]),
+         _encode_anchor, True),
+        ("prompt_build", lambda results: (results["json_instructions"],),
+         ai_connector.build_prompt_text, False),
+    ]
+
+
+def run_stages(file_path, render_limit, node_count, repeat):
+    """
+    1つのワークブックについて各段階を計測する。
+
+    処理時間は repeat 回のうち最短のもの、ピークメモリは tracemalloc で別に1回計測する
+    （tracemalloc のオーバーヘッドを処理時間に含めないため）。
+
+    Returns:
+        list: 段階ごとの結果 {stage, seconds, peak_bytes, items}（描画を省略した段階は seconds が None）
+    """
+    results = {}
+    measured = []
+    for name, prepare, func, renders in stages(file_path):
+        if renders and node_count > render_limit:
+            measured.append({"stage": name, "seconds": None, "peak_bytes": None, "items": None})
+            continue
+
+        best = None
+        for _ in range(repeat):
+            args = prepare(results)
+            start = time.perf_counter()
+            value = func(*args)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        args = prepare(results)
+        tracemalloc.start()
+        value = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = value
+        measured.append({"stage": name, "seconds": round(best, 6), "peak_bytes": peak,
+                         "items": _item_count(value)})
+    return measured
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    以前の結果と比べ、処理時間・ピークメモリの比を求める。
+
+    Args:
+        current (dict): 今回の結果（main が書き出すJSONの形式）
+        baseline (dict): 以前の結果
+        threshold (float): 劣化とみなす比
+
+    Returns:
+        list: {nodes, stage, time_ratio, memory_ratio, regression} のリスト（両方で計測した段階のみ）
+    """
+    previous = {(entry["nodes"], entry["stage"]): entry for entry in baseline["results"]}
+    rows = []
+    for entry in current["results"]:
+        old = previous.get((entry["nodes"], entry["stage"]))
+        if old is None or entry["seconds"] is None or old["seconds"] is None:
+            continue
+        time_ratio = entry["seconds"] / old["seconds"] if old["seconds"] else None
+        memory_ratio = entry["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else None
+        rows.append({
+            "nodes": entry["nodes"],
+            "stage": entry["stage"],
+            "time_ratio": time_ratio,
+            "memory_ratio": memory_ratio,
+            "regression": (
+                (time_ratio is not None and time_ratio > threshold and entry["seconds"] >= MIN_COMPARE_SECONDS)
+                or (memory_ratio is not None and memory_ratio > threshold)
+            )
+        })
+    return rows
+
+
+def _render_anchor(file_path, json_data):
+    """ヘッドレス描画とIDの書き込み（asset_generator.build_assets の画像の部分）"""
+    base_image, transform = headless_renderer.render_sheet(file_path, SHEET_NAME)
+    return asset_generator.draw_anchor_image(base_image, json_data, transform), transform
+
+
+def _encode_anchor(anchor_image, transform, json_data):
+    """アップロード用の切り抜き・縮小・エンコード（既定の形式）"""
+    return asset_generator.encode_anchor_image(anchor_image, json_data, transform=transform)
+
+
+def _item_count(value):
+    """段階の結果の件数（シェイプ数・ノード数・バイト数など）"""
+    if isinstance(value, tuple):
+        return _item_count(value[0])
+    if hasattr(value, "__len__"):
+        return len(value)
+    return None
+
+
+def _commit():
+    """作業ツリーのgitのコミット（取得できなければ None）"""
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark each conversion stage on synthetic flowcharts and write JSON results"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help=f"Node counts of the synthetic sheets (default: {' '.join(map(str, DEFAULT_SIZES))})"
+    )
+    parser.add_argument("--branch-density", type=float, default=0.2,
+                        help="Share of nodes that branch (default: 0.2)")
+    parser.add_argument("--unbound-ratio", type=float, default=0.1,
+                        help="Share of connectors without stCxn / endCxn (default: 0.1)")
+    parser.add_argument("--overlay-ratio", type=float, default=0.2,
+                        help="Share of nodes whose text is an overlaid text box (default: 0.2)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage; the fastest is kept (default: 3)")
+    parser.add_argument(
+        "--render-limit",
+        type=int,
+        default=DEFAULT_RENDER_LIMIT,
+        help=f"Skip rendering and encoding above this node count (default: {DEFAULT_RENDER_LIMIT})"
+    )
+    parser.add_argument("--output", default="bench_stages.json", help="Results file (default: bench_stages.json)")
+    parser.add_argument("--compare", default=None, help="Previous results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Time / memory ratio reported as a regression with --compare (default: {DEFAULT_THRESHOLD})"
+    )
+    args = parser.parse_args()
+
+    report = {
+        "version": BENCH_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": {
+            "branch_density": args.branch_density,
+            "unbound_ratio": args.unbound_ratio,
+            "overlay_ratio": args.overlay_ratio,
+            "repeat": args.repeat,
+            "render_limit": args.render_limit
+        },
+        "results": []
+    }
+
+    header = f"{'nodes':>8} {'shapes':>8} {'stage':>18} {'time [s]':>10} {'peak [MiB]':>11}"
+    print("Benchmarking conversion stages")
+    print("=" * len(header))
+    print(header)
+    print("-" * len(header))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            shapes = synthetic_workbook.flowchart_shapes(
+                size, branch_density=args.branch_density, unbound_ratio=args.unbound_ratio,
+                overlay_ratio=args.overlay_ratio
+            )
+            file_path = os.path.join(temp_dir, f"flow_{size}.xlsx")
+            synthetic_workbook.write_workbook(file_path, [(SHEET_NAME, shapes)])
+
+            for entry in run_stages(file_path, args.render_limit, size, args.repeat):
+                entry = dict(entry, nodes=size, shapes=len(shapes))
+                report["results"].append(entry)
+                if entry["seconds"] is None:
+                    print(f"{size:>8} {len(shapes):>8} {entry['stage']:>18} {'skipped':>10} {'':>11}")
+                else:
+                    print(f"{size:>8} {len(shapes):>8} {entry['stage']:>18} {entry['seconds']:>10.4f} "
+                          f"{entry['peak_bytes'] / 1024 / 1024:>11.2f}")
+
+    print("=" * len(header))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✓ Results saved: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        print(f"\nCompared with {args.compare} (commit {baseline.get('commit')})")
+        print(f"{'nodes':>8} {'stage':>18} {'time':>8} {'memory':>8}")
+        for row in rows:
+            mark = "  ✗ regression" if row["regression"] else ""
+            time_ratio = f"{row['time_ratio']:.2f}x" if row["time_ratio"] is not None else "-"
+            memory_ratio = f"{row['memory_ratio']:.2f}x" if row["memory_ratio"] is not None else "-"
+            print(f"{row['nodes']:>8} {row['stage']:>18} {time_ratio:>8} {memory_ratio:>8}{mark}")
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+起動時間のベンチマークスクリプト
+main.py --stage parse（解析だけ）をサブプロセスで繰り返し起動して処理時間を計り、
+python -X importtime の出力から main.py が読み込んだモジュールごとの読み込み時間の内訳を表示する。
+解析だけの起動で読み込んではいけないモジュール（PIL・requests など）を読み込んだ場合や、
+読み込み時間が予算を超えた場合は終了コード 1 を返す（起動の劣化を検出する）。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic_workbook
+
+
+# main.py が読み込むモジュールの読み込み時間の合計の予算 [ms]（インタープリタ・site の起動は含めない）
+DEFAULT_BUDGET_MS = 80
+
+# 解析だけの起動で読み込んではいけないモジュール（資材生成・AI連携・バッチ・サーバーの段階で読み込む）
+FORBIDDEN_MODULES = (
+    "PIL", "mss", "requests", "dotenv", "asyncio",
+    "asset_generator", "headless_renderer", "ai_connector", "partitioner", "pipeline",
+    "batch_runner", "server"
+)
+
+SHEET_NAME = "Sheet1"
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def stage_command(file_path, sheet_name=SHEET_NAME, stage="parse"):
+    """計測する main.py のコマンド（キャッシュを使わず、毎回解析する）"""
+    return [sys.executable, MAIN_SCRIPT, "--stage", stage, "--file", file_path, "--sheet", sheet_name,
+            "--no-cache"]
+
+
+def parse_importtime(text):
+    """
+    python -X importtime の出力を解析する
+
+    Args:
+        text (str): 標準エラー出力
+
+    Returns:
+        list: 出力順の {module, depth, self_us, cumulative_us} のリスト
+            （入れ子のモジュールは、読み込んだモジュールより前に出力される）
+    """
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # 見出しの行
+            continue
+        name = fields[2].rstrip()
+        module = name.lstrip()
+        entries.append({
+            "module": module,
+            "depth": (len(name) - len(module) - 1) // 2,
+            "self_us": int(fields[0]),
+            "cumulative_us": int(fields[1])
+        })
+    return entries
+
+
+def script_imports(entries):
+    """
+    スクリプト（main.py）が直接読み込んだモジュールを返す
+
+    インタープリタの起動時のモジュールは site までに出力されるため、最後の site より後の
+    最上位のモジュールがスクリプトの読み込んだものになる。
+
+    Returns:
+        list: 最上位の {module, depth, self_us, cumulative_us} のリスト
+    """
+    start = 0
+    for index, entry in enumerate(entries):
+        if entry["module"] == "site" and entry["depth"] == 0:
+            start = index + 1
+    return [entry for entry in entries[start:] if entry["depth"] == 0]
+
+
+def measure(command, repeat=5):
+    """
+    コマンドの起動から終了までの時間と、モジュールの読み込み時間を計測する。
+
+    処理時間は -X importtime を付けずに repeat 回実行した中央値、内訳は -X importtime を付けた
+    1回の実行から求める。比較のため、何も読み込まないインタープリタの起動時間も計測する。
+
+    Args:
+        command (list): 計測するコマンド（先頭は Python インタープリタ）
+        repeat (int): 処理時間を計測する回数
+
+    Returns:
+        dict: {seconds, interpreter_seconds, import_ms, imports, modules}
+            （imports はスクリプトが直接読み込んだモジュール、modules は読み込んだすべてのモジュール名）
+    """
+    seconds = [_run(command) for _ in range(repeat)]
+    interpreter_seconds = [_run([command[0], "-c", "pass"]) for _ in range(repeat)]
+
+    traced = subprocess.run([command[0], "-X", "importtime", *command[1:]], capture_output=True, text=True)
+    if traced.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed: {traced.stderr.strip()[-2000:]}")
+    entries = parse_importtime(traced.stderr)
+    imports = script_imports(entries)
+    return {
+        "seconds": statistics.median(seconds),
+        "interpreter_seconds": statistics.median(interpreter_seconds),
+        "import_ms": sum(entry["cumulative_us"] for entry in imports) / 1000,
+        "imports": sorted(imports, key=lambda entry: entry["cumulative_us"], reverse=True),
+        "modules": sorted({entry["module"] for entry in entries})
+    }
+
+
+def check(result, budget_ms=DEFAULT_BUDGET_MS, forbidden=FORBIDDEN_MODULES):
+    """
+    計測結果が起動の予算を守っているかを調べる
+
+    Args:
+        result (dict): measure の結果
+        budget_ms (float): 読み込み時間の合計の予算 [ms]（0またはNoneの場合は調べない）
+        forbidden (tuple): 読み込んではいけないパッケージ・モジュール
+
+    Returns:
+        list: 違反の説明のリスト（守っていれば空）
+    """
+    problems = []
+    loaded = [module for module in result["modules"]
+              if any(module == name or module.startswith(name + ".") for name in forbidden)]
+    if loaded:
+        problems.append(f"imports modules reserved for later stages: {', '.join(loaded)}")
+    if budget_ms and result["import_ms"] > budget_ms:
+        problems.append(f"imports take {result['import_ms']:.1f} ms (budget {budget_ms} ms)")
+    return problems
+
+
+def _run(command):
+    """コマンドを実行し、経過時間 [秒] を返す"""
+    start = time.perf_counter()
+    completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed: {completed.stderr.strip()[-2000:]}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the cold start of a parse-only main.py run and show an import time breakdown"
+    )
+    parser.add_argument("--nodes", type=int, default=100,
+                        help="Node count of the synthetic flowchart (default: 100)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Timed runs; the median is reported (default: 5)")
+    parser.add_argument("--top", type=int, default=15,
+                        help="Number of imports shown in the breakdown (default: 15)")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=DEFAULT_BUDGET_MS,
+        help=f"Fail when the imports of main.py take longer than this (default: {DEFAULT_BUDGET_MS}, 0: no limit)"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "flow.xlsx")
+        synthetic_workbook.write_workbook(file_path, [(SHEET_NAME, synthetic_workbook.flowchart_shapes(args.nodes))])
+        result = measure(stage_command(file_path), args.repeat)
+
+    print("Benchmarking parse-only startup (main.py --stage parse)")
+    print("=" * 60)
+    print(f"Wall time (median of {args.repeat}): {result['seconds'] * 1000:.1f} ms "
+          f"(interpreter alone: {result['interpreter_seconds'] * 1000:.1f} ms)")
+    print(f"Imports by main.py: {result['import_ms']:.1f} ms")
+    print("-" * 60)
+    print(f"  {'module':<32} {'self [ms]':>10} {'cumulative [ms]':>16}")
+    for entry in result["imports"][:args.top]:
+        print(f"  {entry['module']:<32} {entry['self_us'] / 1000:>10.1f} {entry['cumulative_us'] / 1000:>16.1f}")
+    print("=" * 60)
+
+    problems = check(result, args.budget_ms)
+    for problem in problems:
+        print(f"✗ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✓ Parse-only startup is within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+ディスクキャッシュモジュール
+内容から計算したキーでバイト列をディレクトリに保存する、サイズ上限付きのLRUキャッシュ。
+複数プロセスから同時に読み書きしても壊れたエントリが見えないよう、書き込みは一時ファイルの
+アトミックな置き換えで行う。
+"""
+import hashlib
+import os
+import struct
+import tempfile
+import time
+
+
+# エントリの先頭に保存する作成時刻（UNIX時刻、倍精度）
+_HEADER = struct.Struct('>d')
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# hashlib.file_digest がない環境（Python 3.10）でファイルを読み込む単位 [byte]
+_DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def make_key(*parts):
+    """
+    キャッシュキーを作成する。
+
+    Args:
+        *parts: キーを構成する値（str / bytes / 数値など）
+
+    Returns:
+        str: SHA-256の16進文字列
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+        # 区切りが曖昧にならないよう長さを前置する
+        digest.update(struct.pack('>Q', len(data)))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def file_digest(file_path):
+    """
+    ファイル内容のSHA-256を計算する。
+
+    Args:
+        file_path (str): ファイルのパス
+
+    Returns:
+        str: SHA-256の16進文字列
+    """
+    with open(file_path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        # hashlib.file_digest は Python 3.11 以降のため、分割して読み込む
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(_DIGEST_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    ディレクトリ上のLRUキャッシュ。
+
+    エントリはキーの先頭2文字のサブディレクトリに1ファイルずつ保存する。
+    読み込み時に更新日時を更新し、合計サイズが上限を超えたら更新日時の古いものから削除する。
+    合計サイズは書き込むたびに足し合わせて見積もり、見積もりが上限を超えたときだけディレクトリを走査する。
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=None):
+        """
+        Args:
+            directory (str): キャッシュディレクトリ
+            max_bytes (int): キャッシュ全体のサイズ上限 [byte]
+            max_age (float): エントリの有効期限 [秒]（Noneの場合は無期限）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        # 合計サイズの見積もり [byte]（最初の書き込みで走査するまではNone）
+        self._total = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """
+        エントリを読み込む。
+
+        Args:
+            key (str): キャッシュキー
+
+        Returns:
+            bytes: 保存されたデータ（存在しない・期限切れの場合はNone）
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        if len(content) < _HEADER.size:
+            self.misses += 1
+            return None
+
+        created, = _HEADER.unpack_from(content)
+        if self.max_age is not None and time.time() - created > self.max_age:
+            self._remove(path)
+            if self._total is not None:
+                self._total -= len(content)
+            self.misses += 1
+            return None
+
+        # 最近使ったエントリとして更新日時を更新（LRU）
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        self.hits += 1
+        return content[_HEADER.size:]
+
+    def set(self, key, data):
+        """
+        エントリを書き込む。
+
+        Args:
+            key (str): キャッシュキー
+            data (bytes): 保存するデータ
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 同じキーを上書きする場合は、置き換えたエントリの分を合計から除く
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+
+        # 一時ファイルに書き込んでからアトミックに置き換える
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_HEADER.pack(time.time()))
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+        self._evict(_HEADER.size + len(data) - replaced)
+
+    def stats(self):
+        """
+        ヒット・ミスの回数を返す。
+
+        Returns:
+            dict: {hits, misses, hit_rate}
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def _evict(self, added):
+        """
+        合計サイズが上限を超えていれば、古いエントリから削除する。
+
+        見積もりが上限以下なら走査しない。他のプロセスが書き込んだ分は見積もりに含まれないため、
+        走査したときに実際の合計サイズで見積もりを置き換える。
+
+        Args:
+            added (int): 書き込みで増えたサイズ [byte]
+        """
+        if self._total is not None:
+            self._total += added
+            if self._total <= self.max_bytes:
+                return
+
+        entries = []
+        total = 0
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                self._remove(path)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+        self._total = total
+
+    @staticmethod
+    def _remove(path):
+        # 他のプロセスが先に削除している場合もある
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -5,9 +5,23 @@ Excelファイルの複雑な構造を解析し、「どの図形が、どのテ
 注意: macOS版xlwingsではシェイプのテキスト取得に制限があるため、
 XML解析を使用してシェイプの情報を取得する。
 """
+import functools
+import json
+import os
+import posixpath
 import zipfile
+import zlib
 import xml.etree.ElementTree as ET
 
+import profiler
+from disk_cache import file_digest, make_key
+from sheet_geometry import DEFAULT_GEOMETRY, EMU_PER_POINT, SheetGeometry
+from shape_table import SHAPE_TYPES, ShapeTable
+from spatial_index import GridIndex, suggest_cell_size
+
+
+# 解析結果の形式・内容が変わったら更新する（解析キャッシュのキーに含める）
+PARSER_VERSION = '4'
 
 # Excel DrawingML名前空間
 NAMESPACES = {
@@ -15,8 +29,37 @@ NAMESPACES = {
     'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'
 }
 
+# ワークブック・リレーションシップの名前空間
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+WORKBOOK_PART = 'xl/workbook.xml'
+
+# ShapeTable内のシェイプタイプ番号
+TEXT_BOX_CODE = SHAPE_TYPES.index('text_box')
+CONNECTOR_CODE = SHAPE_TYPES.index('connector')
+
+# アンカー要素とシェイプ要素のタグ（iterparseで使う完全修飾名）
+ANCHOR_TAGS = {
+    f"{{{NAMESPACES['xdr']}}}{name}"
+    for name in ('twoCellAnchor', 'oneCellAnchor', 'absoluteAnchor')
+}
+SHAPE_TAGS = {
+    f"{{{NAMESPACES['xdr']}}}{name}"
+    for name in ('sp', 'txSp', 'cxnSp')
+}
+
+# 線として扱う prstGeom（sp で描かれた線もコネクタとして扱い、コンテナにしない）
+LINE_GEOMETRIES = {
+    'line', 'straightConnector1',
+    'bentConnector2', 'bentConnector3', 'bentConnector4', 'bentConnector5',
+    'curvedConnector2', 'curvedConnector3', 'curvedConnector4', 'curvedConnector5',
+}
+
 
-def parse_excel_shapes(file_path, sheet_name):
+def parse_excel_shapes(file_path, sheet_name, streaming=True, mapping_backend='python',
+                       compact=False, debug=False, cache=None):
     """
     指定されたExcelファイルの指定シートから、すべてのシェイプ情報を抽出し、
     座標ベースで「コンテナ図形」と「テキスト」を紐付ける。
@@ -24,71 +67,463 @@ def parse_excel_shapes(file_path, sheet_name):
     Args:
         file_path (str): Excelファイルのパス
         sheet_name (str): 処理対象のシート名
+        streaming (bool): Trueの場合、drawing XMLを逐次解析する（メモリ使用量が一定）
+        mapping_backend (str): 座標マッピングの実装 ('python': 空間索引, 'numpy': NumPyによる一括判定)
+        compact (bool): Trueの場合、結果を辞書のリストではなく ShapeTable で返す（大量処理向け）
+        debug (bool): Trueの場合、各シェイプのXML要素を保持する
+        cache (DiskCache): 解析結果のキャッシュ。ファイル内容・シート名・パーサーのバージョンが
+            同じであれば、Excelファイルを展開せずにキャッシュから結果を返す（debug時は使わない）
 
     Returns:
-        list: テキスト情報がマッピングされたコンテナ図形のリスト
+        list | ShapeTable: テキスト情報がマッピングされたコンテナ図形のリスト
     """
+    if cache is not None and not debug:
+        # マッピングの実装は結果に影響しないため、キーには含めない
+        key = make_key('parse', PARSER_VERSION, file_digest(file_path), sheet_name, streaming)
+        data = cache.get(key)
+        if data is not None:
+            table = _deserialize_containers(data)
+            return table if compact else table.records()
+
+        mapped_containers = parse_excel_shapes(
+            file_path, sheet_name, streaming, mapping_backend, compact=True
+        )
+        cache.set(key, _serialize_containers(mapped_containers))
+        return mapped_containers if compact else mapped_containers.records()
+
     # XMLから全シェイプ情報を取得
-    all_shapes = _get_all_shapes_from_xml(file_path)
+    with profiler.span("parse.xml") as span:
+        all_shapes = _get_all_shapes_from_xml(
+            file_path, sheet_name, streaming=streaming, compact=compact, debug=debug
+        )
+        span["shapes"] = len(all_shapes)
+
+    if compact:
+        # テーブルのまま分類・マッピングし、コンテナの行だけを取り出す
+        with profiler.span("parse.classify") as span:
+            container_rows, text_rows = _classify_shape_table(all_shapes)
+            span.update(containers=len(container_rows), texts=len(text_rows))
+        with profiler.span("parse.map_text", backend=mapping_backend):
+            _map_text_in_table(all_shapes, container_rows, text_rows, mapping_backend)
+        return all_shapes.select(container_rows)
 
     # シェイプを役割ごとに分類
-    container_shapes, text_shapes = _classify_shapes(all_shapes)
+    with profiler.span("parse.classify") as span:
+        container_shapes, text_shapes = _classify_shapes(all_shapes)
+        span.update(containers=len(container_shapes), texts=len(text_shapes))
 
     # 座標マッピングを実行
-    mapped_containers = _map_text_to_containers(container_shapes, text_shapes)
+    with profiler.span("parse.map_text", backend=mapping_backend):
+        mapped_containers = _map_text_to_containers(container_shapes, text_shapes, mapping_backend)
 
     return mapped_containers
 
 
-def _get_all_shapes_from_xml(file_path):
+def list_sheets_with_drawings(file_path):
+    """
+    drawing（図形）を持つシートの名前を、ブック内の並び順で返す。
+
+    Args:
+        file_path (str): Excelファイルのパス
+
+    Returns:
+        list: シート名のリスト
+    """
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        members = set(zip_ref.namelist())
+        workbook = ET.fromstring(zip_ref.read(WORKBOOK_PART))
+        relationships = _read_relationships(zip_ref, WORKBOOK_PART)
+
+        sheet_names = []
+        for sheet in workbook.iter(f'{{{NS_MAIN}}}sheet'):
+            rel_id = sheet.get(f'{{{NS_R}}}id')
+            if rel_id not in relationships:
+                continue
+            sheet_part = relationships[rel_id][1]
+            if sheet_part not in members:
+                continue
+            if any(part in members for part in _resolve_sheet_drawings(zip_ref, sheet_part)):
+                sheet_names.append(sheet.get('name'))
+
+    return sheet_names
+
+
+def parse_sheet_drawing(file_path, sheet_name):
+    """
+    指定シートのdrawingから、描画に必要な全シェイプのジオメトリをドキュメント順（重なり順）に抽出する。
+
+    コンテナ・テキストの紐付けは行わない。ヘッドレス描画（headless_renderer）で使う。
+    index はシート内の連番で、parse_excel_shapes の temp_id の番号と同じシェイプを指す
+    （シートに複数のdrawingがある場合も、drawingをまたいで通し番号にする）。
+
+    Args:
+        file_path (str): Excelファイルのパス
+        sheet_name (str): シート名
+
+    Returns:
+        list: シェイプ情報の辞書のリスト
+            {index, id, name, shape_type, text, position, geometry, adjust, rotation,
+             flip_h, flip_v, line_width, head_end, tail_end, start_id, end_id}
+    """
+    shapes = []
+
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        sheet_part = _resolve_sheet_part(zip_ref, sheet_name)
+        drawing_files = _resolve_sheet_drawings(zip_ref, sheet_part)
+        geometry = _load_sheet_geometry(zip_ref, sheet_part) if drawing_files else None
+
+        for drawing_file in drawing_files:
+            with zip_ref.open(drawing_file) as stream:
+                for shape_elem, position in _iter_drawing_streaming(stream, geometry):
+                    record = {"index": len(shapes)}
+                    record.update(_extract_geometry_from_shape(shape_elem))
+                    record["shape_type"] = _determine_shape_type(shape_elem)
+                    record["text"] = _extract_text_from_shape(shape_elem)
+                    record["position"] = position
+                    shapes.append(record)
+
+    return shapes
+
+
+def _serialize_containers(table):
+    """
+    マッピング済みのコンテナ図形をキャッシュ用のバイト列に変換する（列ごとのJSONをzlib圧縮）。
+
+    Args:
+        table (ShapeTable): コンテナ図形のテーブル
+
+    Returns:
+        bytes: シリアライズしたデータ
+    """
+    columns = {
+        "ids": table.ids.tolist(),
+        "texts": table.texts,
+        "types": [table.shape_type(row) for row in range(len(table))],
+        "left": table.left.tolist(),
+        "top": table.top.tolist(),
+        "width": table.width.tolist(),
+        "height": table.height.tolist()
+    }
+    return zlib.compress(json.dumps(columns, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _deserialize_containers(data):
+    """
+    _serialize_containers で変換したバイト列からテーブルを復元する。
+
+    Args:
+        data (bytes): シリアライズしたデータ
+
+    Returns:
+        ShapeTable: コンテナ図形のテーブル
+    """
+    columns = json.loads(zlib.decompress(data).decode('utf-8'))
+
+    table = ShapeTable()
+    for row, shape_index in enumerate(columns["ids"]):
+        table.append(shape_index, columns["texts"][row], columns["types"][row], {
+            "left": columns["left"][row],
+            "top": columns["top"][row],
+            "width": columns["width"][row],
+            "height": columns["height"][row]
+        })
+    return table
+
+
+def _get_all_shapes_from_xml(file_path, sheet_name=None, streaming=True, compact=False, debug=False):
     """
     ExcelファイルのXMLから全シェイプをループ処理し、必要な情報を抽出する。
 
     Args:
         file_path (str): Excelファイルのパス
+        sheet_name (str): 対象シート名。指定した場合はそのシートのdrawingだけを読み込み、
+            Noneの場合はパッケージ内の全drawingを読み込む
+        streaming (bool): Trueの場合はiterparseでアンカー単位に逐次解析し、
+            Falseの場合はdrawing XML全体をツリーとして読み込む
+        compact (bool): Trueの場合、辞書のリストの代わりに ShapeTable を返す
+        debug (bool): Trueの場合、各シェイプのXML要素を "_xml_element" として保持する
+            （要素を残すためツリー解析を使う）
 
     Returns:
-        list: 全シェイプの情報を含む辞書のリスト
+        list | ShapeTable: 全シェイプの情報
     """
-    all_shapes = []
+    all_shapes = ShapeTable(keep_elements=debug) if compact else []
+
+    # 逐次解析では要素を解析直後に破棄するため、要素を保持する場合はツリー解析を使う
+    if debug:
+        streaming = False
 
     with zipfile.ZipFile(file_path, 'r') as zip_ref:
         # drawingファイルを取得
-        drawing_files = [name for name in zip_ref.namelist()
-                        if 'xl/drawings/drawing' in name and name.endswith('.xml')]
+        if sheet_name is not None:
+            sheet_part = _resolve_sheet_part(zip_ref, sheet_name)
+            drawing_files = _resolve_sheet_drawings(zip_ref, sheet_part)
+            geometry = _load_sheet_geometry(zip_ref, sheet_part) if drawing_files else None
+        else:
+            drawing_files = [name for name in zip_ref.namelist()
+                            if 'xl/drawings/drawing' in name and name.endswith('.xml')]
+            geometry = DEFAULT_GEOMETRY
 
         for drawing_file in drawing_files:
-            content = zip_ref.read(drawing_file)
-            root = ET.fromstring(content)
-
-            # シェイプ要素を抽出 (sp: shape, txSp: text shape, cxnSp: connector shape)
-            shape_elements = (
-                root.findall('.//xdr:sp', NAMESPACES) +
-                root.findall('.//xdr:txSp', NAMESPACES) +
-                root.findall('.//xdr:cxnSp', NAMESPACES)
-            )
+            if streaming:
+                with zip_ref.open(drawing_file) as stream:
+                    _collect_shapes(_iter_drawing_streaming(stream, geometry), all_shapes, debug)
+            else:
+                content = zip_ref.read(drawing_file)
+                _collect_shapes(_iter_drawing_tree(content, geometry), all_shapes, debug)
 
-            for idx, shape_elem in enumerate(shape_elements):
-                temp_id = f"temp_{idx:03d}"
+    return all_shapes
 
-                # テキスト情報を取得
-                text = _extract_text_from_shape(shape_elem)
 
-                # 座標情報を取得
-                position = _extract_position_from_shape(shape_elem, root)
+def _resolve_sheet_part(zip_ref, sheet_name):
+    """
+    xl/workbook.xml と xl/_rels/workbook.xml.rels をたどり、シート名からワークシートのパートを特定する。
 
-                # シェイプタイプを判定
-                shape_type = _determine_shape_type(shape_elem)
+    Args:
+        zip_ref (zipfile.ZipFile): Excelファイル
+        sheet_name (str): シート名
 
-                all_shapes.append({
-                    "temp_id": temp_id,
-                    "text": text,
-                    "position": position,
-                    "shape_type": shape_type,
-                    "_xml_element": shape_elem  # デバッグ用
-                })
+    Returns:
+        str: ワークシートのパート名 (例: xl/worksheets/sheet1.xml)
+    """
+    workbook = ET.fromstring(zip_ref.read(WORKBOOK_PART))
+    relationships = _read_relationships(zip_ref, WORKBOOK_PART)
+
+    sheet_names = []
+    for sheet in workbook.iter(f'{{{NS_MAIN}}}sheet'):
+        name = sheet.get('name')
+        sheet_names.append(name)
+        if name != sheet_name:
+            continue
 
-    return all_shapes
+        rel_id = sheet.get(f'{{{NS_R}}}id')
+        if rel_id not in relationships:
+            raise ValueError(f"Relationship '{rel_id}' for sheet '{sheet_name}' not found")
+        return relationships[rel_id][1]
+
+    raise ValueError(
+        f"Sheet '{sheet_name}' not found. Available sheets: {', '.join(sheet_names)}"
+    )
+
+
+def _resolve_sheet_drawings(zip_ref, sheet_part):
+    """
+    ワークシートのリレーションシップから、そのシートに属するdrawingパートを特定する。
+
+    Args:
+        zip_ref (zipfile.ZipFile): Excelファイル
+        sheet_part (str): ワークシートのパート名
+
+    Returns:
+        list: drawingパート名のリスト（drawingを持たないシートでは空）
+    """
+    relationships = _read_relationships(zip_ref, sheet_part)
+
+    return [
+        target for rel_type, target in relationships.values()
+        if rel_type.endswith('/drawing')
+    ]
+
+
+def _read_relationships(zip_ref, source_part):
+    """
+    パートに対応する .rels ファイルを読み込む。
+
+    Args:
+        zip_ref (zipfile.ZipFile): Excelファイル
+        source_part (str): リレーションシップの起点となるパート名
+
+    Returns:
+        dict: リレーションシップIDをキー、(Type, 解決済みのパート名) を値とする辞書
+    """
+    directory, filename = posixpath.split(source_part)
+    rels_part = posixpath.join(directory, '_rels', f'{filename}.rels')
+
+    try:
+        root = ET.fromstring(zip_ref.read(rels_part))
+    except KeyError:
+        # .rels が存在しないパートはリレーションシップを持たない
+        return {}
+
+    relationships = {}
+    for rel in root.iter(f'{{{NS_PKG_REL}}}Relationship'):
+        if rel.get('TargetMode') == 'External':
+            continue
+        relationships[rel.get('Id')] = (
+            rel.get('Type', ''),
+            _resolve_part_path(source_part, rel.get('Target', ''))
+        )
+
+    return relationships
+
+
+def _resolve_part_path(source_part, target):
+    """
+    リレーションシップのTargetをパッケージ内のパート名に解決する。
+
+    Args:
+        source_part (str): 起点となるパート名
+        target (str): Target属性（相対パスまたは "/" 始まりの絶対パス）
+
+    Returns:
+        str: パート名
+    """
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def _load_sheet_geometry(zip_ref, sheet_part):
+    """
+    ワークシートの列幅・行高を読み込む。
+
+    同じファイル（パス・更新日時・サイズが同一）の同じシートは、プロセス内で1回だけ読み込む。
+
+    Args:
+        zip_ref (zipfile.ZipFile): Excelファイル
+        sheet_part (str): ワークシートのパート名
+
+    Returns:
+        SheetGeometry: シートのジオメトリ
+    """
+    file_path = zip_ref.filename
+    if file_path is None:
+        return _read_sheet_geometry(zip_ref, sheet_part)
+
+    stat = os.stat(file_path)
+    return _cached_sheet_geometry(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, sheet_part)
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_sheet_geometry(file_path, mtime_ns, size, sheet_part):
+    """ファイルの同一性をキーにしてジオメトリをキャッシュする"""
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        return _read_sheet_geometry(zip_ref, sheet_part)
+
+
+def _read_sheet_geometry(zip_ref, sheet_part):
+    """ワークシートXMLを逐次解析してジオメトリを構築する"""
+    try:
+        with zip_ref.open(sheet_part) as stream:
+            return SheetGeometry.from_stream(stream)
+    except KeyError:
+        return DEFAULT_GEOMETRY
+
+
+def _iter_drawing_tree(content, geometry=DEFAULT_GEOMETRY):
+    """
+    drawing XML全体をツリーとして読み込み、シェイプ要素と座標情報を順に返す。
+
+    シェイプは逐次解析（_iter_drawing_streaming）と同じドキュメント順（重なり順）に出力するため、
+    どちらの解析でも temp_id の連番と、テキストの紐付けで同じ距離の候補から選ばれるコンテナは同じになる。
+
+    Args:
+        content (bytes): drawing XMLの内容
+        geometry (SheetGeometry): シートのジオメトリ
+
+    Yields:
+        tuple: (シェイプ要素, 座標情報)
+    """
+    root = ET.fromstring(content)
+
+    # シェイプ要素をドキュメント順に抽出 (sp: shape, txSp: text shape, cxnSp: connector shape)
+    shape_elements = [elem for elem in root.iter() if elem.tag in SHAPE_TAGS]
+
+    # シェイプ→座標の索引を1回だけ構築する
+    anchor_index = _build_anchor_index(root, geometry)
+
+    for shape_elem in shape_elements:
+        # 座標情報を取得
+        yield shape_elem, _extract_position_from_shape(shape_elem, anchor_index)
+
+
+def _iter_drawing_streaming(stream, geometry=DEFAULT_GEOMETRY):
+    """
+    drawing XMLをiterparseで1パス解析し、アンカー単位でシェイプ要素と座標情報を返す。
+
+    処理済みのアンカーは次の要素を読む前に破棄するため、図形数に関わらずメモリ使用量は
+    アンカー1つ分に収まる。シェイプはドキュメント順（重なり順）に出力される。
+    返されたシェイプ要素は、次のシェイプを取り出すまでの間だけ有効。
+
+    Args:
+        stream: drawing XMLのファイルオブジェクト
+        geometry (SheetGeometry): シートのジオメトリ
+
+    Yields:
+        tuple: (シェイプ要素, 座標情報)
+    """
+    root = None
+    depth = 0
+
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+
+        if elem.tag in ANCHOR_TAGS:
+            position = _extract_position_from_anchor(elem, geometry)
+            for shape_elem in elem.iter():
+                if shape_elem.tag in SHAPE_TAGS:
+                    yield shape_elem, dict(position)
+
+        # ルート直下の要素（アンカーやmc:AlternateContent）を処理し終えたら破棄
+        if depth == 1:
+            root.clear()
+
+
+def _collect_shapes(shape_iter, all_shapes, debug=False):
+    """
+    シェイプ要素と座標情報から、連番を振ったシェイプ情報を追加する。
+
+    連番は追加先の件数から続けるため、シートに複数のdrawingがあってもシート内で重複しない
+    （parse_sheet_drawing の index と同じ番号になる）。
+
+    Args:
+        shape_iter: (シェイプ要素, 座標情報) のイテレータ
+        all_shapes (list | ShapeTable): 追加先
+        debug (bool): XML要素を保持するかどうか
+    """
+    compact = isinstance(all_shapes, ShapeTable)
+
+    for idx, (shape_elem, position) in enumerate(shape_iter, len(all_shapes)):
+        if compact:
+            all_shapes.append(
+                idx,
+                _extract_text_from_shape(shape_elem),
+                _determine_shape_type(shape_elem),
+                position,
+                shape_elem if debug else None
+            )
+        else:
+            all_shapes.append(_build_shape_record(idx, shape_elem, position, debug))
+
+
+def _build_shape_record(idx, shape_elem, position, debug=False):
+    """
+    シェイプ要素から1件分のシェイプ情報を組み立てる。
+
+    Args:
+        idx (int): シート内での連番
+        shape_elem: XMLシェイプ要素
+        position (dict): 座標情報
+        debug (bool): XML要素を保持するかどうか
+
+    Returns:
+        dict: シェイプ情報
+    """
+    record = {
+        "temp_id": f"temp_{idx:03d}",
+        "text": _extract_text_from_shape(shape_elem),
+        "position": position,
+        "shape_type": _determine_shape_type(shape_elem)
+    }
+    if debug:
+        record["_xml_element"] = shape_elem  # デバッグ用
+    return record
 
 
 def _extract_text_from_shape(shape_elem):
@@ -111,90 +546,170 @@ def _extract_text_from_shape(shape_elem):
     return ''.join(text_parts)
 
 
-def _extract_position_from_shape(shape_elem, root):
+def _extract_geometry_from_shape(shape_elem):
     """
-    シェイプ要素から座標情報を抽出する。
+    シェイプ要素から形状・変形・線の情報を抽出する。
 
     Args:
         shape_elem: XMLシェイプ要素
+
+    Returns:
+        dict: {id, name, geometry, adjust, rotation, flip_h, flip_v, line_width, head_end, tail_end,
+               start_id, end_id}
+            （角度は度、線幅はポイント。start_id / end_id はコネクタの接続先の cNvPr id。指定がない項目は None）
+    """
+    c_nv_pr = shape_elem.find('./*/xdr:cNvPr', NAMESPACES)
+    c_nv_cxn_sp_pr = shape_elem.find('xdr:nvCxnSpPr/xdr:cNvCxnSpPr', NAMESPACES)
+    sp_pr = shape_elem.find('xdr:spPr', NAMESPACES)
+
+    record = {
+        "id": None,
+        "name": "",
+        "geometry": None,
+        "adjust": {},
+        "rotation": 0.0,
+        "flip_h": False,
+        "flip_v": False,
+        "line_width": None,
+        "head_end": None,
+        "tail_end": None,
+        "start_id": None,
+        "end_id": None
+    }
+
+    if c_nv_pr is not None:
+        record["id"] = _parse_shape_id(c_nv_pr.get('id'))
+        record["name"] = c_nv_pr.get('name', '')
+
+    if c_nv_cxn_sp_pr is not None:
+        # コネクタが図形に接続されている場合の接続先（a:stCxn / a:endCxn）
+        for key, tag in (("start_id", 'a:stCxn'), ("end_id", 'a:endCxn')):
+            connection = c_nv_cxn_sp_pr.find(tag, NAMESPACES)
+            if connection is not None:
+                record[key] = _parse_shape_id(connection.get('id'))
+
+    if sp_pr is None:
+        return record
+
+    xfrm = sp_pr.find('a:xfrm', NAMESPACES)
+    if xfrm is not None:
+        # rot は 1/60000 度単位
+        record["rotation"] = int(xfrm.get('rot', '0')) / 60000
+        record["flip_h"] = xfrm.get('flipH') in ('1', 'true')
+        record["flip_v"] = xfrm.get('flipV') in ('1', 'true')
+
+    prst_geom = sp_pr.find('a:prstGeom', NAMESPACES)
+    if prst_geom is not None:
+        record["geometry"] = prst_geom.get('prst')
+        for guide in prst_geom.iterfind('a:avLst/a:gd', NAMESPACES):
+            formula = guide.get('fmla', '').split()
+            if len(formula) == 2 and formula[0] == 'val':
+                record["adjust"][guide.get('name')] = int(formula[1])
+
+    line = sp_pr.find('a:ln', NAMESPACES)
+    if line is not None:
+        if line.get('w'):
+            record["line_width"] = int(line.get('w')) / EMU_PER_POINT
+        for key, tag in (("head_end", 'a:headEnd'), ("tail_end", 'a:tailEnd')):
+            end = line.find(tag, NAMESPACES)
+            if end is not None and end.get('type', 'none') != 'none':
+                record[key] = end.get('type')
+
+    return record
+
+
+def _parse_shape_id(value):
+    """cNvPr id などの図形IDを整数に変換する（不正な値は None）"""
+    return int(value) if value and value.isdigit() else None
+
+
+def _build_anchor_index(root, geometry=DEFAULT_GEOMETRY):
+    """
+    drawing内の全アンカーを上から順に走査し、シェイプ要素から座標情報への索引を作成する。
+
+    アンカーごとに座標を1回だけ計算するため、全体の処理量はdrawingのサイズに比例する。
+
+    Args:
         root: XMLルート要素
+        geometry (SheetGeometry): シートのジオメトリ
+
+    Returns:
+        dict: シェイプ要素をキー、座標情報 {top, left, width, height} を値とする辞書
+    """
+    anchor_index = {}
+
+    for anchor in root.iter():
+        if anchor.tag not in ANCHOR_TAGS:
+            continue
+
+        position = _extract_position_from_anchor(anchor, geometry)
+        for shape_elem in anchor.iter():
+            if shape_elem.tag in SHAPE_TAGS:
+                anchor_index[shape_elem] = position
+
+    return anchor_index
+
+
+def _extract_position_from_shape(shape_elem, anchor_index):
+    """
+    シェイプ要素から座標情報を抽出する。
+
+    Args:
+        shape_elem: XMLシェイプ要素
+        anchor_index (dict): _build_anchor_index で作成した索引
 
     Returns:
         dict: 座標情報 {top, left, width, height}
     """
-    # シェイプの親要素を探す (アンカー情報を含む)
-    parent = None
-    for anchor_type in ['xdr:twoCellAnchor', 'xdr:oneCellAnchor', 'xdr:absoluteAnchor']:
-        for anchor in root.findall(f'.//{anchor_type}', NAMESPACES):
-            if shape_elem in list(anchor.iter()):
-                parent = anchor
-                break
-        if parent is not None:
-            break
-
-    if parent is None:
+    position = anchor_index.get(shape_elem)
+
+    if position is None:
         return {"top": 0, "left": 0, "width": 0, "height": 0}
 
-    # twoCellAnchorの場合
-    from_elem = parent.find('.//xdr:from', NAMESPACES)
-    to_elem = parent.find('.//xdr:to', NAMESPACES)
+    # 同じアンカー内のシェイプで辞書を共有しないようにコピーを返す
+    return dict(position)
 
-    if from_elem is not None and to_elem is not None:
-        # 開始位置
-        from_col = int(from_elem.findtext('xdr:col', '0', NAMESPACES))
-        from_col_off = int(from_elem.findtext('xdr:colOff', '0', NAMESPACES))
-        from_row = int(from_elem.findtext('xdr:row', '0', NAMESPACES))
-        from_row_off = int(from_elem.findtext('xdr:rowOff', '0', NAMESPACES))
 
-        # 終了位置
-        to_col = int(to_elem.findtext('xdr:col', '0', NAMESPACES))
-        to_col_off = int(to_elem.findtext('xdr:colOff', '0', NAMESPACES))
-        to_row = int(to_elem.findtext('xdr:row', '0', NAMESPACES))
-        to_row_off = int(to_elem.findtext('xdr:rowOff', '0', NAMESPACES))
+def _extract_position_from_anchor(parent, geometry=DEFAULT_GEOMETRY):
+    """
+    アンカー要素（twoCellAnchor / oneCellAnchor / absoluteAnchor）から座標情報を抽出する。
 
-        # EMU (English Metric Units) をポイントに変換
-        # 1 EMU = 1/914400 inch, 1 point = 1/72 inch
-        # よって、1 point = 12700 EMU
-        EMU_PER_POINT = 12700
+    Args:
+        parent: XMLアンカー要素
+        geometry (SheetGeometry): セル位置をポイントに変換するシートのジオメトリ
 
-        # 概算の座標計算（セル幅/高さは仮に72ポイントとする簡易計算）
-        CELL_WIDTH = 72  # ポイント
-        CELL_HEIGHT = 18  # ポイント
+    Returns:
+        dict: 座標情報 {top, left, width, height}
+    """
+    from_elem = parent.find('xdr:from', NAMESPACES)
+    to_elem = parent.find('xdr:to', NAMESPACES)
 
-        left = from_col * CELL_WIDTH + from_col_off / EMU_PER_POINT
-        top = from_row * CELL_HEIGHT + from_row_off / EMU_PER_POINT
-        width = (to_col - from_col) * CELL_WIDTH + (to_col_off - from_col_off) / EMU_PER_POINT
-        height = (to_row - from_row) * CELL_HEIGHT + (to_row_off - from_row_off) / EMU_PER_POINT
+    # twoCellAnchorの場合
+    if from_elem is not None and to_elem is not None:
+        left, top = _marker_to_point(from_elem, geometry)
+        right, bottom = _marker_to_point(to_elem, geometry)
 
         return {
             "top": top,
             "left": left,
-            "width": width,
-            "height": height
+            "width": right - left,
+            "height": bottom - top
         }
 
     # oneCellAnchor or absoluteAnchorの場合
-    ext_elem = parent.find('.//xdr:ext', NAMESPACES)
+    ext_elem = parent.find('xdr:ext', NAMESPACES)
     if ext_elem is not None:
-        cx = int(ext_elem.get('cx', '0'))
-        cy = int(ext_elem.get('cy', '0'))
-
-        EMU_PER_POINT = 12700
-        width = cx / EMU_PER_POINT
-        height = cy / EMU_PER_POINT
+        # EMU (English Metric Units) をポイントに変換
+        width = int(ext_elem.get('cx', '0')) / EMU_PER_POINT
+        height = int(ext_elem.get('cy', '0')) / EMU_PER_POINT
 
         # 開始位置
+        pos_elem = parent.find('xdr:pos', NAMESPACES)
         if from_elem is not None:
-            from_col = int(from_elem.findtext('xdr:col', '0', NAMESPACES))
-            from_col_off = int(from_elem.findtext('xdr:colOff', '0', NAMESPACES))
-            from_row = int(from_elem.findtext('xdr:row', '0', NAMESPACES))
-            from_row_off = int(from_elem.findtext('xdr:rowOff', '0', NAMESPACES))
-
-            CELL_WIDTH = 72
-            CELL_HEIGHT = 18
-
-            left = from_col * CELL_WIDTH + from_col_off / EMU_PER_POINT
-            top = from_row * CELL_HEIGHT + from_row_off / EMU_PER_POINT
+            left, top = _marker_to_point(from_elem, geometry)
+        elif pos_elem is not None:
+            left = int(pos_elem.get('x', '0')) / EMU_PER_POINT
+            top = int(pos_elem.get('y', '0')) / EMU_PER_POINT
         else:
             left = 0
             top = 0
@@ -209,6 +724,25 @@ def _extract_position_from_shape(shape_elem, root):
     return {"top": 0, "left": 0, "width": 0, "height": 0}
 
 
+def _marker_to_point(marker_elem, geometry):
+    """
+    xdr:from / xdr:to 要素のセル位置をポイント座標に変換する。
+
+    Args:
+        marker_elem: xdr:from または xdr:to 要素
+        geometry (SheetGeometry): シートのジオメトリ
+
+    Returns:
+        tuple: (x, y) [point]
+    """
+    col = int(marker_elem.findtext('xdr:col', '0', NAMESPACES))
+    col_off = int(marker_elem.findtext('xdr:colOff', '0', NAMESPACES))
+    row = int(marker_elem.findtext('xdr:row', '0', NAMESPACES))
+    row_off = int(marker_elem.findtext('xdr:rowOff', '0', NAMESPACES))
+
+    return geometry.x(col, col_off), geometry.y(row, row_off)
+
+
 def _determine_shape_type(shape_elem):
     """
     シェイプ要素からタイプを判定する。
@@ -217,12 +751,15 @@ def _determine_shape_type(shape_elem):
         shape_elem: XMLシェイプ要素
 
     Returns:
-        str: シェイプタイプ
+        str: シェイプタイプ（線の prstGeom を持つ sp は 'connector'）
     """
     # XMLタグ名からタイプを判定
     tag = shape_elem.tag.split('}')[-1] if '}' in shape_elem.tag else shape_elem.tag
 
     if tag == 'sp':
+        prst_geom = shape_elem.find('xdr:spPr/a:prstGeom', NAMESPACES)
+        if prst_geom is not None and prst_geom.get('prst') in LINE_GEOMETRIES:
+            return 'connector'
         return 'auto_shape'
     elif tag == 'txSp':
         return 'text_box'
@@ -259,54 +796,258 @@ def _classify_shapes(all_shapes):
     return container_shapes, text_shapes
 
 
-def _map_text_to_containers(container_shapes, text_shapes):
+def _classify_shape_table(table):
+    """
+    ShapeTable の行を「コンテナ図形」と「テキスト図形」に分類する。
+    分類の規則は _classify_shapes と同じ。
+
+    Args:
+        table (ShapeTable): 全シェイプのテーブル
+
+    Returns:
+        tuple: (container_rows, text_rows) 行番号のリスト
+    """
+    container_rows = []
+    text_rows = []
+
+    for row in range(len(table)):
+        type_code = table.type_codes[row]
+
+        # コネクタ（矢印）とテキストボックスは除外し、それ以外をコンテナとする
+        if type_code != TEXT_BOX_CODE and type_code != CONNECTOR_CODE:
+            container_rows.append(row)
+
+        # テキストを持つ、またはテキストボックスのシェイプをtext_rowsに追加
+        if table.texts[row].strip() != "" or type_code == TEXT_BOX_CODE:
+            text_rows.append(row)
+
+    return container_rows, text_rows
+
+
+def _map_text_to_containers(container_shapes, text_shapes, backend='python'):
     """
     座標マッピング処理：コンテナ図形とテキスト図形を座標で紐付ける。
 
     Args:
         container_shapes (list): コンテナ図形のリスト
         text_shapes (list): テキスト図形のリスト
+        backend (str): 'python'（空間索引）または 'numpy'（NumPyによる一括判定）
 
     Returns:
         list: テキストがマッピングされたコンテナ図形のリスト
     """
-    # テキストシェイプのコピーを作成（重複防止のため）
-    remaining_text_shapes = text_shapes.copy()
+    # 座標を列ごとの配列に展開（先頭にコンテナ、後ろにテキスト図形を並べる）
+    table = ShapeTable.from_records(container_shapes + text_shapes)
+    offset = len(container_shapes)
+    text_rows = range(offset, offset + len(text_shapes))
+
+    for container_row, text_row in _match_texts(table, range(offset), text_rows, backend):
+        # 紐付け：コンテナのテキストを更新
+        container_shapes[container_row]["text"] = text_shapes[text_row - offset]["text"]
+
+    return container_shapes
+
+
+def _map_text_in_table(table, container_rows, text_rows, backend='python'):
+    """
+    座標マッピング処理の ShapeTable 版。コンテナ行のテキストをテーブル上で更新する。
+
+    Args:
+        table (ShapeTable): 全シェイプのテーブル
+        container_rows (list): コンテナ図形の行番号のリスト
+        text_rows (list): テキスト図形の行番号のリスト
+        backend (str): 'python'（空間索引）または 'numpy'（NumPyによる一括判定）
+    """
+    for container_row, text_row in _match_texts(table, container_rows, text_rows, backend):
+        table.texts[container_row] = table.texts[text_row]
+
+
+def _match_texts(table, container_rows, text_rows, backend='python'):
+    """
+    コンテナ図形ごとに、中心座標が範囲内にあるテキスト図形を1つ選ぶ。
+
+    テキスト図形の中心座標を空間索引に登録し、各コンテナは自身の範囲に重なる候補だけを調べる。
+    候補のうち text_rows で最も前にあるものを採用し（最初にマッチしたものを採用）、
+    使用済みのテキスト図形は以降の検索対象から除外する。
+
+    Args:
+        table (ShapeTable): シェイプのテーブル
+        container_rows (list): コンテナ図形の行番号（処理順）
+        text_rows (list): テキスト図形の行番号（優先順）
+        backend (str): 'python'（空間索引）または 'numpy'（NumPyによる一括判定）
+
+    Returns:
+        list: (コンテナの行番号, テキストの行番号) のリスト
+    """
+    if backend == 'numpy':
+        return _match_texts_numpy(table, container_rows, text_rows)
+    if backend != 'python':
+        raise ValueError(f"Unknown mapping backend: {backend}")
+
+    ids, texts = table.ids, table.texts
+    left, top, width, height = table.left, table.top, table.width, table.height
+    text_rows = list(text_rows)
+
+    # テキストシェイプの中心座標を計算
+    centers = [(left[row] + width[row] / 2, top[row] + height[row] / 2) for row in text_rows]
 
-    for container in container_shapes:
+    # 中心座標の空間索引を作成
+    index = GridIndex(suggest_cell_size((width[row], height[row]) for row in container_rows))
+    for text_idx, (center_x, center_y) in enumerate(centers):
+        index.insert(text_idx, center_x, center_y)
+
+    # 使用済みのテキストシェイプ（重複防止）
+    used = [False] * len(text_rows)
+    matches = []
+
+    for container_row in container_rows:
         # ロジックA: 自己テキスト優先
         # コンテナ自身が有効なテキストを持っているか確認
-        if container["text"].strip() != "":
+        if texts[container_row].strip() != "":
             # 既にテキストを持っている場合はスキップ
             continue
 
         # ロジックB: 包含判定
         # コンテナの座標範囲を計算
-        parent_x1 = container["position"]["left"]
-        parent_y1 = container["position"]["top"]
-        parent_x2 = parent_x1 + container["position"]["width"]
-        parent_y2 = parent_y1 + container["position"]["height"]
+        parent_x1 = left[container_row]
+        parent_y1 = top[container_row]
+        parent_x2 = parent_x1 + width[container_row]
+        parent_y2 = parent_y1 + height[container_row]
+
+        matched_idx = None
+        for text_idx in index.query(parent_x1, parent_y1, parent_x2, parent_y2):
+            # 使用済み、または既に見つかった候補より後ろのものはスキップ
+            if used[text_idx] or (matched_idx is not None and text_idx > matched_idx):
+                continue
 
-        # テキストシェイプを走査
-        for text_shape in remaining_text_shapes[:]:  # コピーをループ
             # 自分自身はスキップ
-            if text_shape["temp_id"] == container["temp_id"]:
+            if ids[text_rows[text_idx]] == ids[container_row]:
                 continue
 
-            # テキストシェイプの中心座標を計算
-            child_center_x = text_shape["position"]["left"] + text_shape["position"]["width"] / 2
-            child_center_y = text_shape["position"]["top"] + text_shape["position"]["height"] / 2
-
             # 包含判定：子の中心が親の範囲内にあるか
+            child_center_x, child_center_y = centers[text_idx]
             if (parent_x1 < child_center_x < parent_x2 and
                 parent_y1 < child_center_y < parent_y2):
-                # 紐付け：コンテナのテキストを更新
-                container["text"] = text_shape["text"]
-                # 使用済みテキストシェイプを除外（重複防止）
-                remaining_text_shapes.remove(text_shape)
-                break  # 最初にマッチしたものを採用
+                matched_idx = text_idx
 
-    return container_shapes
+        if matched_idx is not None:
+            # 使用済みテキストシェイプを除外（重複防止）
+            used[matched_idx] = True
+            matches.append((container_row, text_rows[matched_idx]))
+
+    return matches
+
+
+def _match_texts_numpy(table, container_rows, text_rows, block_size=256):
+    """
+    _match_texts のNumPy版。同じ結果を返す。
+
+    ShapeTable の座標列をコピーせずに配列として参照し、空間的に近いコンテナのブロックごとに
+    「コンテナ × 候補テキスト」の包含判定をブール行列で一括計算する。
+    得られた候補ペアを（コンテナの順序, テキストの順序）で並べ替え、
+    先頭から順に未使用のテキストを割り当てることで、従来と同じ優先順位を保つ。
+
+    Args:
+        table (ShapeTable): シェイプのテーブル
+        container_rows (list): コンテナ図形の行番号（処理順）
+        text_rows (list): テキスト図形の行番号（優先順）
+        block_size (int): 1回の行列計算で扱うコンテナ数
+
+    Returns:
+        list: (コンテナの行番号, テキストの行番号) のリスト
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError(
+            "NumPy is required for mapping_backend='numpy'. "
+            "Install it with: pip install numpy"
+        )
+
+    # テキストを必要とするコンテナ（ロジックA: 自己テキストを持つものは対象外）
+    targets = np.array(
+        [row for row in container_rows if table.texts[row].strip() == ""], dtype=np.int64
+    )
+    text_rows = np.asarray(text_rows, dtype=np.int64)
+    if len(targets) == 0 or len(text_rows) == 0:
+        return []
+
+    # 座標列を連続した配列として参照
+    left = np.frombuffer(table.left, dtype=np.float64)
+    top = np.frombuffer(table.top, dtype=np.float64)
+    width = np.frombuffer(table.width, dtype=np.float64)
+    height = np.frombuffer(table.height, dtype=np.float64)
+    ids = np.frombuffer(table.ids, dtype=np.dtype(f'i{table.ids.itemsize}'))
+
+    center_x = left[text_rows] + width[text_rows] / 2
+    center_y = top[text_rows] + height[text_rows] / 2
+
+    cont_left = left[targets]
+    cont_top = top[targets]
+    cont_right = cont_left + width[targets]
+    cont_bottom = cont_top + height[targets]
+
+    # テキストをY座標順に並べ、ブロックの範囲に入る候補を二分探索で絞り込む
+    order_y = np.argsort(center_y, kind='stable')
+    sorted_center_y = center_y[order_y]
+
+    # 空間的に近いコンテナが同じブロックに入るよう、行帯→X座標の順に並べる
+    cell_size = suggest_cell_size(zip(width[targets].tolist(), height[targets].tolist()))
+    spatial_order = np.lexsort((cont_left, np.floor(cont_top / cell_size)))
+
+    pair_containers = []
+    pair_texts = []
+    for block_start in range(0, len(spatial_order), block_size):
+        block = spatial_order[block_start:block_start + block_size]
+        x1, y1 = cont_left[block], cont_top[block]
+        x2, y2 = cont_right[block], cont_bottom[block]
+
+        lo = np.searchsorted(sorted_center_y, y1.min(), side='right')
+        hi = np.searchsorted(sorted_center_y, y2.max(), side='left')
+        candidates = order_y[lo:hi]
+        candidates = candidates[(center_x[candidates] > x1.min()) & (center_x[candidates] < x2.max())]
+        if len(candidates) == 0:
+            continue
+
+        # 包含判定：子の中心が親の範囲内にあるか（ブロック × 候補のブール行列）
+        cx = center_x[candidates]
+        cy = center_y[candidates]
+        inside = (
+            (x1[:, None] < cx) & (cx < x2[:, None]) &
+            (y1[:, None] < cy) & (cy < y2[:, None])
+        )
+        rows, cols = np.nonzero(inside)
+        pair_containers.append(block[rows])
+        pair_texts.append(candidates[cols])
+
+    if not pair_containers:
+        return []
+
+    pair_containers = np.concatenate(pair_containers)
+    pair_texts = np.concatenate(pair_texts)
+
+    # 自分自身はスキップ
+    keep = ids[targets[pair_containers]] != ids[text_rows[pair_texts]]
+    pair_containers = pair_containers[keep]
+    pair_texts = pair_texts[keep]
+
+    # コンテナの順序 → テキストの順序で並べ替え、先頭から未使用のものを割り当てる
+    order = np.lexsort((pair_texts, pair_containers))
+    pair_containers = pair_containers[order].tolist()
+    pair_texts = pair_texts[order].tolist()
+
+    used = set()
+    matches = []
+    current = -1
+    for target_pos, text_idx in zip(pair_containers, pair_texts):
+        if target_pos == current or text_idx in used:
+            continue
+        # 使用済みテキストを除外（重複防止）
+        used.add(text_idx)
+        matches.append((int(targets[target_pos]), int(text_rows[text_idx])))
+        current = target_pos
+
+    return matches
 
 
 if __name__ == "__main__":
@@ -0,0 +1,440 @@
+"""
+フローグラフモジュール
+drawing XMLのコネクタの接続情報（a:stCxn / a:endCxn）と矢印（headEnd / tailEnd）から、
+図形間のつながりを表すグラフ（中間表現）を組み立て、Mermaid記法をローカルで生成する。
+すべてのコネクタが図形に接続されていれば、AIに画像を読み取らせる必要はない。
+"""
+import json
+import math
+
+import excel_parser
+import headless_renderer
+from disk_cache import file_digest, make_key
+from shape_table import ShapeTable
+from spatial_index import GridIndex, suggest_cell_size
+
+
+# グラフの形式・組み立て方が変わったら更新する（キャッシュのキーに含める）
+FLOW_GRAPH_VERSION = '4'
+
+# 接続されていない線の端点を吸着させる、図形の枠からの最大距離 [point]
+SNAP_TOLERANCE = 9.0
+
+# ローカルで変換するエッジの信頼度の下限（これ未満のエッジがあればAIで読み取る）
+MIN_CONFIDENCE = 0.5
+
+# 分岐ラベル（Yes / No などのテキストボックス）の中心から線までの最大距離 [point]
+LABEL_TOLERANCE = 24.0
+
+# 図形として描かれた矢印（接続情報を持たないため、ローカルではつながりを判定できない）
+BLOCK_ARROW_GEOMETRIES = {
+    'rightArrow', 'leftArrow', 'upArrow', 'downArrow', 'leftRightArrow', 'upDownArrow',
+    'bentArrow', 'uturnArrow', 'curvedRightArrow', 'curvedLeftArrow', 'curvedUpArrow',
+    'curvedDownArrow', 'stripedRightArrow', 'notchedRightArrow', 'chevron', 'homePlate',
+}
+
+# prstGeom ごとのMermaidのノード形状（開き括弧, 閉じ括弧）
+NODE_SHAPES = {
+    'flowChartDecision': ('{', '}'),
+    'diamond': ('{', '}'),
+    'flowChartTerminator': ('([', '])'),
+    'roundRect': ('(', ')'),
+    'flowChartAlternateProcess': ('(', ')'),
+    'ellipse': ('((', '))'),
+    'flowChartConnector': ('((', '))'),
+    'flowChartInputOutput': ('[/', '/]'),
+    'parallelogram': ('[/', '/]'),
+    'flowChartPredefinedProcess': ('[[', ']]'),
+    'flowChartMagneticDisk': ('[(', ')]'),
+    'can': ('[(', ')]'),
+    'hexagon': ('{{', '}}'),
+    'flowChartPreparation': ('{{', '}}'),
+    'flowChartManualOperation': ('[\\', '/]'),
+    'flowChartMerge': ('[\\', '/]'),
+}
+DEFAULT_NODE_SHAPE = ('[', ']')
+
+
+def build_sheet_graph(file_path, sheet_name, mapped_containers, cache=None):
+    """
+    指定シートのフローグラフを組み立てる。
+
+    Args:
+        file_path (str): Excelファイルのパス
+        sheet_name (str): シート名
+        mapped_containers (list | ShapeTable): excel_parser.parse_excel_shapes の結果
+        cache (DiskCache): グラフのキャッシュ（Noneの場合は使わない）
+
+    Returns:
+        dict: フローグラフ（build_flow_graph を参照）
+    """
+    if cache is not None:
+        key = make_key('graph', FLOW_GRAPH_VERSION, excel_parser.PARSER_VERSION,
+                       file_digest(file_path), sheet_name)
+        data = cache.get(key)
+        if data is not None:
+            return json.loads(data.decode('utf-8'))
+
+        graph = build_sheet_graph(file_path, sheet_name, mapped_containers)
+        cache.set(key, json.dumps(graph, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return graph
+
+    shapes = excel_parser.parse_sheet_drawing(file_path, sheet_name)
+    return build_flow_graph(shapes, mapped_containers)
+
+
+def build_flow_graph(shapes, mapped_containers, snap_tolerance=SNAP_TOLERANCE):
+    """
+    drawingの全シェイプとマッピング済みのコンテナ図形から、フローグラフを組み立てる。
+
+    ノードはコンテナ図形で、IDはJSON指示書と同じ node_XXX を振る（図形は cNvPr id で参照する）。
+    エッジはコネクタの接続先から向きを決める（tailEnd の矢印は始点→終点、headEnd だけなら逆向き）。
+    接続されていない端点は、アンカーと反転から求めた座標を最も近い図形の枠に吸着させ、
+    距離と紛らわしさから信頼度（0〜1、接続済みの端点は 1.0）を付ける。
+    どのノードにも属さないテキストは、中心から最も近い線のエッジにラベルとして割り当てる。
+
+    Args:
+        shapes (list): excel_parser.parse_sheet_drawing の結果
+        mapped_containers (list | ShapeTable): excel_parser.parse_excel_shapes の結果
+        snap_tolerance (float): 端点を吸着させる図形の枠からの最大距離 [point]
+
+    Returns:
+        dict: {
+            nodes: [{id, shape_id, text, geometry, position}],
+            edges: [{source, target, arrow, label, label_id, connector_id, confidence}],
+            unbound: [接続先を特定できなかったコネクタの cNvPr id],
+            labels: [どのノードにもエッジにも割り当てられなかったテキストの cNvPr id],
+            block_arrows: [図形として描かれた矢印の cNvPr id]
+        }
+    """
+    nodes = []
+    node_by_shape = {}
+
+    # コンテナ図形は temp_id の番号（parse_sheet_drawing の index）で参照する
+    shape_by_index = {shape["index"]: shape for shape in shapes}
+    for idx, (shape_index, text) in enumerate(_container_entries(mapped_containers), 1):
+        shape = shape_by_index[shape_index]
+        node = {
+            "id": f"node_{idx:03d}",
+            "shape_id": shape["id"],
+            "text": text,
+            "geometry": shape["geometry"],
+            "position": shape["position"]
+        }
+        nodes.append(node)
+        if shape["id"] is not None:
+            node_by_shape[shape["id"]] = node["id"]
+
+    # テキストボックスなど、コンテナの内側にある図形はそのコンテナのノードとして扱う
+    index = _node_index(nodes)
+    shape_by_id = {shape["id"]: shape for shape in shapes if shape["id"] is not None}
+
+    edges = []
+    paths = []
+    unbound = []
+    label_shapes = []
+    block_arrows = []
+
+    for shape in shapes:
+        # 図形の矢印はコンテナとしてノードにもなるため、先に判定する
+        if shape["geometry"] in BLOCK_ARROW_GEOMETRIES:
+            block_arrows.append(shape["id"])
+            continue
+        if shape["id"] in node_by_shape:
+            continue
+
+        if is_line(shape):
+            path = headless_renderer.connector_points(shape)
+            start_point, end_point = path[0], path[-1]
+            source, source_confidence = _attach_endpoint(
+                shape["start_id"], start_point, node_by_shape, shape_by_id, nodes, index, snap_tolerance
+            )
+            target, target_confidence = _attach_endpoint(
+                shape["end_id"], end_point, node_by_shape, shape_by_id, nodes, index, snap_tolerance
+            )
+            snapped = source_confidence < 1.0 or target_confidence < 1.0
+            if source is None or target is None or (snapped and source == target):
+                unbound.append(shape["id"])
+                continue
+            edges.append(_make_edge(shape, source, target, min(source_confidence, target_confidence)))
+            paths.append(path)
+        elif shape["text"].strip() and _containing_node(shape, nodes, index) is None:
+            label_shapes.append(shape)
+
+    labels = _assign_labels(label_shapes, edges, paths, LABEL_TOLERANCE)
+
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "unbound": unbound,
+        "labels": labels,
+        "block_arrows": block_arrows
+    }
+
+
+def is_line(shape):
+    """シェイプが線（コネクタ、または線として描かれた図形）かどうか"""
+    return shape["shape_type"] == 'connector' or shape["geometry"] in excel_parser.LINE_GEOMETRIES
+
+
+def is_resolved(graph, min_confidence=MIN_CONFIDENCE):
+    """
+    グラフだけでフローチャートを表現できるかどうか（AIを呼び出す必要がないか）を判定する。
+
+    すべての線の両端がノードに接続（または吸着）されて信頼度が下限以上であり、
+    分岐ラベルの候補や図形の矢印が残っていないこと。
+    線が1本もない場合は、ノードが1つ以下のときだけ解決済みとみなす。
+
+    Args:
+        graph (dict): フローグラフ
+        min_confidence (float): エッジの信頼度の下限
+
+    Returns:
+        bool: 解決済みであれば True
+    """
+    if graph["unbound"] or graph["labels"] or graph["block_arrows"]:
+        return False
+    if any(edge["confidence"] < min_confidence for edge in graph["edges"]):
+        return False
+    return bool(graph["edges"]) or len(graph["nodes"]) <= 1
+
+
+def connector_endpoints(shape):
+    """
+    線の始点・終点のシート座標[pt]を返す。
+
+    コネクタの経路は枠の左上（始点）から右下（終点）に向かい、flipH / flipV で反転し、
+    回転は枠の中心を軸に適用される（headless_renderer の描画と同じ規則）。
+
+    Args:
+        shape (dict): excel_parser.parse_sheet_drawing のシェイプ
+
+    Returns:
+        tuple: ((始点x, 始点y), (終点x, 終点y))
+    """
+    points = headless_renderer.connector_points(shape)
+    return points[0], points[-1]
+
+
+def to_mermaid(graph):
+    """
+    フローグラフからMermaid記法（graph TD）のコードを生成する。
+
+    Args:
+        graph (dict): フローグラフ
+
+    Returns:
+        str: Mermaidコード
+    """
+    lines = ["graph TD"]
+
+    for node in graph["nodes"]:
+        opening, closing = NODE_SHAPES.get(node["geometry"], DEFAULT_NODE_SHAPE)
+        lines.append(f'    {node["id"]}{opening}"{escape_text(node["text"])}"{closing}')
+
+    for edge in graph["edges"]:
+        label = f'|"{escape_text(edge["label"])}"|' if edge["label"] else ''
+        lines.append(f'    {edge["source"]} {edge["arrow"]}{label} {edge["target"]}')
+
+    return '\n'.join(lines)
+
+
+def escape_text(text):
+    """Mermaidの引用符付きテキスト用にエスケープする"""
+    return text.replace('"', '#quot;').replace('\n', '<br/>')
+
+
+def _container_entries(mapped_containers):
+    """コンテナ図形ごとに (シート内の連番, テキスト) を返す"""
+    if isinstance(mapped_containers, ShapeTable):
+        return [(mapped_containers.ids[row], mapped_containers.texts[row])
+                for row in range(len(mapped_containers))]
+    return [(int(container["temp_id"].split('_')[-1]), container["text"])
+            for container in mapped_containers]
+
+
+def _node_index(nodes):
+    """ノードの矩形の空間索引を作成する"""
+    index = GridIndex(suggest_cell_size(
+        (node["position"]["width"], node["position"]["height"]) for node in nodes
+    ))
+    for idx, node in enumerate(nodes):
+        pos = node["position"]
+        index.insert(idx, pos["left"], pos["top"], pos["left"] + pos["width"], pos["top"] + pos["height"])
+    return index
+
+
+def _containing_node(shape, nodes, index):
+    """シェイプの中心を含むノードのうち、最も小さいもののIDを返す（なければ None）"""
+    pos = shape["position"]
+    center_x = pos["left"] + pos["width"] / 2
+    center_y = pos["top"] + pos["height"] / 2
+
+    best = None
+    for idx in index.query(center_x, center_y, center_x, center_y):
+        node_pos = nodes[idx]["position"]
+        if (node_pos["left"] < center_x < node_pos["left"] + node_pos["width"] and
+                node_pos["top"] < center_y < node_pos["top"] + node_pos["height"]):
+            area = node_pos["width"] * node_pos["height"]
+            if best is None or area < best[0] or (area == best[0] and idx < best[1]):
+                best = (area, idx)
+
+    return nodes[best[1]]["id"] if best is not None else None
+
+
+def _resolve_node(shape_id, node_by_shape, shape_by_id, nodes, index):
+    """コネクタの接続先の cNvPr id をノードIDに変換する（コンテナ内のテキストボックスはコンテナに読み替える）"""
+    if shape_id is None:
+        return None
+    if shape_id in node_by_shape:
+        return node_by_shape[shape_id]
+    shape = shape_by_id.get(shape_id)
+    if shape is None:
+        return None
+    return _containing_node(shape, nodes, index)
+
+
+def _attach_endpoint(shape_id, point, node_by_shape, shape_by_id, nodes, index, tolerance):
+    """線の端点をノードに対応付け、(ノードID, 信頼度) を返す（対応付けられなければ (None, 0.0)）"""
+    node_id = _resolve_node(shape_id, node_by_shape, shape_by_id, nodes, index)
+    if node_id is not None:
+        return node_id, 1.0
+    return _snap_endpoint(point, nodes, index, tolerance)
+
+
+def _snap_endpoint(point, nodes, index, tolerance):
+    """
+    端点を許容距離内で最も近いノードの枠に吸着させる（信頼度は _confidence を参照）。
+    """
+    if tolerance <= 0:
+        return None, 0.0
+
+    x, y = point
+    candidates = []
+    for idx in index.query(x - tolerance, y - tolerance, x + tolerance, y + tolerance):
+        pos = nodes[idx]["position"]
+        distance = _box_distance(pos, x, y)
+        if distance <= tolerance:
+            candidates.append((distance, pos["width"] * pos["height"], idx))
+
+    if not candidates:
+        return None, 0.0
+
+    candidates.sort()
+    distance = candidates[0][0]
+    runner_up = candidates[1][0] if len(candidates) > 1 else None
+    # 吸着させた端点は、接続済みの端点（1.0）と区別する
+    return nodes[candidates[0][2]]["id"], round(min(_confidence(distance, runner_up, tolerance), 0.99), 3)
+
+
+def _assign_labels(label_shapes, edges, paths, tolerance):
+    """
+    テキストを、中心から最も近い線（折れ線の各線分までの距離）のエッジにラベルとして割り当てる。
+
+    同じエッジに複数のテキストが近い場合は最も近いものだけを割り当て、割り当てたラベルの
+    紛らわしさ（2番目に近い線との距離の差）はエッジの信頼度に反映する。
+
+    Returns:
+        list: 割り当てられなかったテキストの cNvPr id
+    """
+    if not label_shapes:
+        return []
+    if not edges:
+        return [shape["id"] for shape in label_shapes]
+
+    segments = [(edge_idx, a, b) for edge_idx, path in enumerate(paths) for a, b in zip(path, path[1:])]
+    index = GridIndex(suggest_cell_size(
+        (abs(b[0] - a[0]), abs(b[1] - a[1])) for _, a, b in segments
+    ))
+    for seg_idx, (_, a, b) in enumerate(segments):
+        index.insert(seg_idx, min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1]))
+
+    best_by_edge = {}
+    unassigned = []
+    for shape in label_shapes:
+        pos = shape["position"]
+        x = pos["left"] + pos["width"] / 2
+        y = pos["top"] + pos["height"] / 2
+
+        # 線ごとに最も近い線分までの距離
+        distances = {}
+        for seg_idx in index.query(x - tolerance, y - tolerance, x + tolerance, y + tolerance):
+            edge_idx, a, b = segments[seg_idx]
+            distance = _segment_distance(x, y, a, b)
+            if distance <= tolerance and distance < distances.get(edge_idx, math.inf):
+                distances[edge_idx] = distance
+
+        if not distances:
+            unassigned.append(shape["id"])
+            continue
+
+        ranked = sorted((distance, edge_idx) for edge_idx, distance in distances.items())
+        distance, edge_idx = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else None
+        candidate = (distance, shape, _confidence(distance, runner_up, tolerance))
+
+        current = best_by_edge.get(edge_idx)
+        if current is None or distance < current[0]:
+            if current is not None:
+                unassigned.append(current[1]["id"])
+            best_by_edge[edge_idx] = candidate
+        else:
+            unassigned.append(shape["id"])
+
+    for edge_idx, (_, shape, confidence) in best_by_edge.items():
+        edge = edges[edge_idx]
+        edge["label"] = shape["text"].strip()
+        edge["label_id"] = shape["id"]
+        edge["confidence"] = round(min(edge["confidence"], confidence), 3)
+
+    # ドキュメント順を保つ
+    order = {shape["id"]: idx for idx, shape in enumerate(label_shapes)}
+    return sorted(unassigned, key=order.get)
+
+
+def _confidence(distance, runner_up, tolerance):
+    """
+    対応付けの信頼度を返す。
+
+    距離が遠いほど（許容距離で0.5まで）、2番目の候補との距離の差が小さいほど（差が0で0.0まで）下がる。
+    """
+    confidence = 1.0 - 0.5 * distance / tolerance
+    if runner_up is not None:
+        confidence = min(confidence, (runner_up - distance) / tolerance)
+    return confidence
+
+
+def _segment_distance(x, y, a, b):
+    """点から線分 a-b までの距離"""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = dx * dx + dy * dy
+    if length == 0:
+        return math.hypot(x - a[0], y - a[1])
+    t = max(0.0, min(1.0, ((x - a[0]) * dx + (y - a[1]) * dy) / length))
+    return math.hypot(x - (a[0] + t * dx), y - (a[1] + t * dy))
+
+
+def _box_distance(pos, x, y):
+    """点から矩形の枠までの距離（内側の点は0）"""
+    dx = max(pos["left"] - x, 0, x - (pos["left"] + pos["width"]))
+    dy = max(pos["top"] - y, 0, y - (pos["top"] + pos["height"]))
+    return math.hypot(dx, dy)
+
+
+def _make_edge(shape, start, end, confidence):
+    """コネクタの矢印の向きからエッジを作成する"""
+    head, tail = shape["head_end"], shape["tail_end"]
+    if head and not tail:
+        # 始点側にだけ矢印がある場合は、終点から始点へのつながり
+        start, end = end, start
+    arrow = '<-->' if head and tail else '---' if not head and not tail else '-->'
+
+    return {
+        "source": start,
+        "target": end,
+        "arrow": arrow,
+        "label": "",
+        "label_id": None,
+        "connector_id": shape["id"],
+        "confidence": confidence
+    }
@@ -0,0 +1,399 @@
+"""
+ヘッドレス描画モジュール
+drawing XMLから解析した図形のジオメトリ（prstGeom・コネクタ・矢印・テキスト）をPILのキャンバスに直接描画し、
+スクリーンショットの代わりとなる画像を生成する。
+画面やExcelを必要としないため、Linuxのバッチ環境でもプロセスプールから並列に実行できる。
+"""
+import functools
+import math
+
+from PIL import Image, ImageDraw, ImageFont
+
+import excel_parser
+from settings import DEFAULT_DPI
+
+
+POINTS_PER_INCH = 72
+
+# 描画範囲の周囲の余白[pt]と、キャンバスの長辺の上限[px]（超える場合は解像度を下げる）
+CANVAS_MARGIN = 16
+MAX_CANVAS_EDGE = 16384
+
+# 線幅の既定値[pt]と、矢印の最小の長さ[pt]
+DEFAULT_LINE_WIDTH = 0.75
+ARROW_LENGTH = 6
+
+# テキストの既定のフォントサイズ[pt]と、縮小する場合の下限[px]
+FONT_SIZE = 11
+MIN_FONT_PIXELS = 6
+
+# 曲線コネクタを折れ線で近似する際の分割数
+CURVE_STEPS = 16
+
+SHAPE_FILL = "white"
+SHAPE_OUTLINE = (64, 64, 64)
+LINE_COLOR = "black"
+TEXT_COLOR = "black"
+
+# 日本語を表示できるフォントを優先して探す
+FONT_PATHS = (
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/opentype/ipafont-gothic/ipagp.ttf",
+    "C:/Windows/Fonts/meiryo.ttc",
+    "/System/Library/Fonts/Helvetica.ttc",
+    "DejaVuSans.ttf",
+    "arial.ttf",
+)
+
+
+def render_sheet(file_path, sheet_name, dpi=DEFAULT_DPI):
+    """
+    指定シートの図形を描画する。
+
+    Args:
+        file_path (str): Excelファイルのパス
+        sheet_name (str): シート名
+        dpi (int): 解像度
+
+    Returns:
+        tuple: (image, transform) 描画した画像（PIL.Image）と、
+            シート座標[pt]から画像のピクセル座標への変換 (scale, origin_x, origin_y)
+    """
+    return render_shapes(excel_parser.parse_sheet_drawing(file_path, sheet_name), dpi)
+
+
+def render_shapes(shapes, dpi=DEFAULT_DPI):
+    """
+    excel_parser.parse_sheet_drawing の結果を、重なり順に描画する。
+
+    キャンバスは全図形の外接矩形（余白つき）の範囲だけを確保する。
+
+    Args:
+        shapes (list): シェイプ情報の辞書のリスト
+        dpi (int): 解像度
+
+    Returns:
+        tuple: (image, transform)
+    """
+    left, top, right, bottom = _drawing_bounds(shapes)
+    left, top = left - CANVAS_MARGIN, top - CANVAS_MARGIN
+    right, bottom = right + CANVAS_MARGIN, bottom + CANVAS_MARGIN
+
+    scale = dpi / POINTS_PER_INCH
+    longest = max(right - left, bottom - top)
+    if longest * scale > MAX_CANVAS_EDGE:
+        scale = MAX_CANVAS_EDGE / longest
+
+    transform = (scale, left, top)
+    size = (max(1, math.ceil((right - left) * scale)), max(1, math.ceil((bottom - top) * scale)))
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+
+    for shape in shapes:
+        # sp で描かれた線（prstGeom が line など）も、枠ではなく線と矢印として描く
+        if shape["shape_type"] == 'connector' or shape["geometry"] in excel_parser.LINE_GEOMETRIES:
+            _draw_connector(draw, shape, transform)
+        else:
+            _draw_shape(draw, shape, transform)
+
+    return image, transform
+
+
+def connector_points(shape):
+    """
+    コネクタ（線）の経路を、始点から終点へのシート座標[pt]の点列で返す
+
+    Args:
+        shape (dict): excel_parser.parse_sheet_drawing のシェイプ
+
+    Returns:
+        list: (x, y) のリスト（曲線コネクタは折れ線で近似する）
+    """
+    pos = shape["position"]
+    path = _connector_path(shape["geometry"], shape["adjust"], pos["width"], pos["height"])
+    return _place(path, shape)
+
+
+def _drawing_bounds(shapes):
+    """全図形（回転を含む）の外接矩形 (left, top, right, bottom) [pt] を返す"""
+    if not shapes:
+        return 0, 0, 0, 0
+
+    xs, ys = [], []
+    for shape in shapes:
+        pos = shape["position"]
+        corners = [(0, 0), (pos["width"], 0), (pos["width"], pos["height"]), (0, pos["height"])]
+        for x, y in _place(corners, shape):
+            xs.append(x)
+            ys.append(y)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _draw_shape(draw, shape, transform):
+    """図形の輪郭（prstGeom）とテキストを描画する"""
+    pos = shape["position"]
+    scale = transform[0]
+    outline = _shape_outline(shape["geometry"], shape["adjust"], pos["width"], pos["height"])
+    points = _to_pixels(_place(outline, shape), transform)
+
+    # テキストボックスは枠線なしが既定
+    is_text_box = shape["shape_type"] == 'text_box'
+    if len(points) >= 3:
+        draw.polygon(
+            points, fill=SHAPE_FILL,
+            outline=None if is_text_box else SHAPE_OUTLINE,
+            width=_line_pixels(shape, scale)
+        )
+
+    if shape["text"]:
+        box = _to_pixels(
+            [(pos["left"], pos["top"]), (pos["left"] + pos["width"], pos["top"] + pos["height"])],
+            transform
+        )
+        _draw_text(draw, shape["text"], box, scale)
+
+
+def _draw_connector(draw, shape, transform):
+    """コネクタ（線）と始点・終点の矢印を描画する"""
+    points = _to_pixels(connector_points(shape), transform)
+
+    width = _line_pixels(shape, transform[0])
+    draw.line(points, fill=LINE_COLOR, width=width, joint="curve")
+
+    line_width = shape["line_width"] or DEFAULT_LINE_WIDTH
+    length = max(ARROW_LENGTH, line_width * 4) * transform[0]
+    if shape["head_end"]:
+        _draw_arrowhead(draw, shape["head_end"], points, length, width)
+    if shape["tail_end"]:
+        _draw_arrowhead(draw, shape["tail_end"], points[::-1], length, width)
+
+
+def _draw_arrowhead(draw, arrow_type, points, length, width):
+    """
+    points[0] に向かう矢印を描画する
+
+    Args:
+        arrow_type (str): headEnd / tailEnd の type（triangle / stealth / arrow / diamond / oval）
+        points (list): 線のピクセル座標（矢印を付ける端が先頭）
+        length (float): 矢印の長さ[px]
+        width (int): 線幅[px]
+    """
+    tip = points[0]
+    # 長さのない区間を飛ばして、線の向きを求める
+    base = next((point for point in points[1:] if point != tip), None)
+    if base is None:
+        return
+
+    dx, dy = tip[0] - base[0], tip[1] - base[1]
+    norm = math.hypot(dx, dy)
+    ux, uy = dx / norm, dy / norm
+    # 矢印の根元と、線に垂直な方向の半幅
+    back = (tip[0] - ux * length, tip[1] - uy * length)
+    half = length / 2
+    side = (-uy * half, ux * half)
+
+    if arrow_type == 'arrow':
+        draw.line([(back[0] + side[0], back[1] + side[1]), tip,
+                   (back[0] - side[0], back[1] - side[1])], fill=LINE_COLOR, width=width, joint="curve")
+    elif arrow_type == 'diamond':
+        middle = (tip[0] - ux * length / 2, tip[1] - uy * length / 2)
+        draw.polygon([tip, (middle[0] + side[0], middle[1] + side[1]), back,
+                      (middle[0] - side[0], middle[1] - side[1])], fill=LINE_COLOR)
+    elif arrow_type == 'oval':
+        middle = (tip[0] - ux * length / 2, tip[1] - uy * length / 2)
+        draw.ellipse([middle[0] - half, middle[1] - half, middle[0] + half, middle[1] + half],
+                     fill=LINE_COLOR)
+    else:
+        # triangle / stealth
+        draw.polygon([tip, (back[0] + side[0], back[1] + side[1]),
+                      (back[0] - side[0], back[1] - side[1])], fill=LINE_COLOR)
+
+
+def _draw_text(draw, text, box, scale):
+    """テキストを枠の中央に描画する（枠に収まらない場合はフォントを縮小する）"""
+    (x1, y1), (x2, y2) = box
+    size = round(FONT_SIZE * scale)
+    font = _font(size)
+    text_box = draw.multiline_textbbox((0, 0), text, font=font)
+    text_width = text_box[2] - text_box[0]
+
+    available = (x2 - x1) * 0.9
+    if text_width > available > 0:
+        size = max(MIN_FONT_PIXELS, int(size * available / text_width))
+        font = _font(size)
+        text_box = draw.multiline_textbbox((0, 0), text, font=font)
+
+    draw.multiline_text(
+        ((x1 + x2 - (text_box[2] - text_box[0])) / 2 - text_box[0],
+         (y1 + y2 - (text_box[3] - text_box[1])) / 2 - text_box[1]),
+        text, fill=TEXT_COLOR, font=font, align="center"
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _font(size):
+    """指定サイズ[px]のフォントを読み込む（見つからない場合はPILの既定のフォント）"""
+    for path in FONT_PATHS:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # サイズ指定に対応していない古いPIL
+        return ImageFont.load_default()
+
+
+def _shape_outline(geometry, adjust, width, height):
+    """
+    prstGeom の輪郭を、図形の枠の左上を原点とする点列[pt]で返す（未対応の形状は四角形）
+
+    Args:
+        geometry (str): prstGeom の prst
+        adjust (dict): 調整値（avLst の gd）
+        width (float): 幅[pt]
+        height (float): 高さ[pt]
+
+    Returns:
+        list: (x, y) のリスト
+    """
+    w, h = width, height
+    short = min(w, h)
+
+    if geometry in ('ellipse', 'flowChartConnector'):
+        return [(w / 2 + w / 2 * math.cos(2 * math.pi * step / 32),
+                 h / 2 + h / 2 * math.sin(2 * math.pi * step / 32)) for step in range(32)]
+    if geometry in ('diamond', 'flowChartDecision'):
+        return [(w / 2, 0), (w, h / 2), (w / 2, h), (0, h / 2)]
+    if geometry in ('roundRect', 'flowChartAlternateProcess'):
+        return _rounded_rect(w, h, short * adjust.get('adj', 16667) / 100000)
+    if geometry == 'flowChartTerminator':
+        return _rounded_rect(w, h, short / 2)
+    if geometry == 'parallelogram':
+        offset = short * adjust.get('adj', 25000) / 100000
+        return [(offset, 0), (w, 0), (w - offset, h), (0, h)]
+    if geometry == 'flowChartInputOutput':
+        return [(w / 5, 0), (w, 0), (w * 4 / 5, h), (0, h)]
+    if geometry == 'hexagon':
+        offset = short * adjust.get('adj', 25000) / 100000
+        return [(offset, 0), (w - offset, 0), (w, h / 2), (w - offset, h), (offset, h), (0, h / 2)]
+    if geometry == 'flowChartPreparation':
+        return [(w / 5, 0), (w * 4 / 5, 0), (w, h / 2), (w * 4 / 5, h), (w / 5, h), (0, h / 2)]
+    if geometry in ('triangle', 'flowChartExtract'):
+        apex = w * adjust.get('adj', 50000) / 100000
+        return [(apex, 0), (w, h), (0, h)]
+    if geometry == 'flowChartMerge':
+        return [(0, 0), (w, 0), (w / 2, h)]
+    if geometry == 'flowChartManualInput':
+        return [(0, h / 5), (w, 0), (w, h), (0, h)]
+    if geometry == 'flowChartManualOperation':
+        return [(0, 0), (w, 0), (w * 4 / 5, h), (w / 5, h)]
+    if geometry == 'flowChartDocument':
+        # 下辺は波線
+        wave = [(w * step / CURVE_STEPS,
+                 h * 0.9 + h * 0.08 * math.sin(2 * math.pi * step / CURVE_STEPS))
+                for step in range(CURVE_STEPS, -1, -1)]
+        return [(0, 0), (w, 0)] + wave
+    return [(0, 0), (w, 0), (w, h), (0, h)]
+
+
+def _rounded_rect(width, height, radius):
+    """角の丸い四角形の点列を返す"""
+    radius = min(radius, width / 2, height / 2)
+    corners = [
+        (width - radius, radius, -90), (width - radius, height - radius, 0),
+        (radius, height - radius, 90), (radius, radius, 180),
+    ]
+    points = []
+    for cx, cy, start in corners:
+        for step in range(5):
+            angle = math.radians(start + 90 * step / 4)
+            points.append((cx + radius * math.cos(angle), cy + radius * math.sin(angle)))
+    return points
+
+
+def _connector_path(geometry, adjust, width, height):
+    """
+    コネクタの経路を、枠の左上（始点）から右下（終点）への点列[pt]で返す
+
+    反転・回転は _place で適用する。曲線コネクタは折れ線の経路を制御点とするベジェ曲線で近似する。
+
+    Args:
+        geometry (str): prstGeom の prst
+        adjust (dict): 調整値（avLst の gd）
+        width (float): 幅[pt]
+        height (float): 高さ[pt]
+
+    Returns:
+        list: (x, y) のリスト
+    """
+    w, h = width, height
+    x1 = w * adjust.get('adj1', 50000) / 100000
+    y2 = h * adjust.get('adj2', 50000) / 100000
+    x3 = w * adjust.get('adj3', 50000) / 100000
+
+    kind = (geometry or 'straightConnector1').rstrip('0123456789')
+    segments = (geometry or '')[len(kind):]
+
+    if kind in ('bentConnector', 'curvedConnector'):
+        if segments == '2':
+            path = [(0, 0), (w, 0), (w, h)]
+        elif segments == '4':
+            path = [(0, 0), (x1, 0), (x1, y2), (w, y2), (w, h)]
+        elif segments == '5':
+            path = [(0, 0), (x1, 0), (x1, y2), (x3, y2), (x3, h), (w, h)]
+        else:
+            path = [(0, 0), (x1, 0), (x1, h), (w, h)]
+        return _bezier(path) if kind == 'curvedConnector' else path
+
+    return [(0, 0), (w, h)]
+
+
+def _bezier(control_points):
+    """制御点からベジェ曲線を折れ線で近似する（de Casteljau法）"""
+    points = []
+    for step in range(CURVE_STEPS + 1):
+        t = step / CURVE_STEPS
+        current = list(control_points)
+        while len(current) > 1:
+            current = [
+                (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+                for a, b in zip(current, current[1:])
+            ]
+        points.append(current[0])
+    return points
+
+
+def _place(points, shape):
+    """枠内の点列に反転・回転を適用し、シート座標[pt]に変換する"""
+    pos = shape["position"]
+    w, h = pos["width"], pos["height"]
+    cx, cy = w / 2, h / 2
+    angle = math.radians(shape["rotation"])
+    cos, sin = math.cos(angle), math.sin(angle)
+
+    placed = []
+    for x, y in points:
+        if shape["flip_h"]:
+            x = w - x
+        if shape["flip_v"]:
+            y = h - y
+        if angle:
+            dx, dy = x - cx, y - cy
+            x, y = cx + dx * cos - dy * sin, cy + dx * sin + dy * cos
+        placed.append((pos["left"] + x, pos["top"] + y))
+    return placed
+
+
+def _to_pixels(points, transform):
+    """シート座標[pt]の点列を画像のピクセル座標に変換する"""
+    scale, origin_x, origin_y = transform
+    return [((x - origin_x) * scale, (y - origin_y) * scale) for x, y in points]
+
+
+def _line_pixels(shape, scale):
+    """線幅[px]を返す（最低1px）"""
+    return max(1, round((shape["line_width"] or DEFAULT_LINE_WIDTH) * scale))
@@ -0,0 +1,295 @@
+"""
+増分変換モジュール
+シートごとに前回の変換結果（図形のスナップショットとMermaidコード）を保存し、次回の変換では
+図形とコネクタの差分だけを処理する。
+
+図形は drawing の cNvPr id で同定するため、図形の追加・削除で node_XXX の連番がずれても、
+前回のMermaidコードのノードIDを付け替えて再利用できる。
+テキストだけの変更はノードの定義をローカルで書き換え、配置・つながりの変更は、変更のあった
+ノードとその近傍だけを切り抜いたリクエストでAIに問い合わせ、前回の結果とつなぎ合わせる。
+"""
+import json
+import os
+import re
+
+import excel_parser
+import flow_graph
+import partitioner
+from disk_cache import file_digest, make_key
+
+
+# スナップショットの形式・差分の取り方が変わったら更新する（キャッシュのキーに含める）
+INCREMENTAL_VERSION = '2'
+
+# 保存したMermaidコードの生成元
+#   local: コネクタの接続情報からローカルで生成した
+#   ai   : AIで生成した（一部だけを問い合わせ直した結果を含む）
+SOURCES = ("local", "ai")
+
+# 問い合わせ直すノードがこの割合を超える場合は、シート全体を変換し直す
+MAX_CHANGED_RATIO = 0.5
+
+# 変更のあった線・テキストの外接矩形を広げる幅 [point]（重なるノードを変更の近傍とみなす）
+CHANGE_MARGIN = flow_graph.LABEL_TOLERANCE
+
+_NODE_ID = re.compile(r'\bnode_\d+\b')
+_QUOTED = re.compile(r'"[^"]*"')
+
+
+def take_snapshot(file_path, sheet_name, graph, cache=None):
+    """
+    シートの図形のスナップショットを作る。
+
+    ノード（コンテナ図形）はテキストと配置を分けて記録し、それ以外のシェイプ（線・ラベル・
+    コンテナ内のテキストボックスなど）は外接矩形と内容のハッシュを記録する。
+    コンテナ内のテキストはノードのテキストに含まれるため、ハッシュには含めない。
+
+    Args:
+        file_path (str): Excelファイルのパス
+        sheet_name (str): シート名
+        graph (dict): flow_graph.build_sheet_graph の結果
+        cache (DiskCache): スナップショットのキャッシュ（Noneの場合は使わない）。
+            ファイルの内容が同じであれば、drawing を解析し直さずにキャッシュから返す
+
+    Returns:
+        dict: {version, digest, nodes: [{id, shape_id, text, layout, box}], shapes: {cNvPr id: {hash, box}}}
+    """
+    if cache is not None:
+        key = make_key('snapshot', INCREMENTAL_VERSION, excel_parser.PARSER_VERSION,
+                       flow_graph.FLOW_GRAPH_VERSION, file_digest(file_path), sheet_name)
+        data = cache.get(key)
+        if data is not None:
+            return json.loads(data.decode('utf-8'))
+
+        snapshot = take_snapshot(file_path, sheet_name, graph)
+        cache.set(key, json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return snapshot
+
+    node_shapes = {node["shape_id"] for node in graph["nodes"]}
+    labels = set(graph["labels"]) | {edge["label_id"] for edge in graph["edges"]}
+
+    shapes = {}
+    for shape in excel_parser.parse_sheet_drawing(file_path, sheet_name):
+        if shape["id"] is None or shape["id"] in node_shapes:
+            continue
+        # index は前の図形の追加・削除でずれるため、内容のハッシュには含めない
+        record = {key: value for key, value in shape.items()
+                  if key not in ("index", "text", "position", "name")}
+        record["box"] = _box(shape["position"])
+        if shape["id"] in labels:
+            record["text"] = shape["text"]
+        shapes[str(shape["id"])] = {
+            "hash": make_key(json.dumps(record, ensure_ascii=False, sort_keys=True))[:16],
+            "box": record["box"]
+        }
+
+    nodes = []
+    for node in graph["nodes"]:
+        box = _box(node["position"])
+        nodes.append({
+            "id": node["id"],
+            "shape_id": node["shape_id"],
+            "text": node["text"],
+            "layout": make_key(node["geometry"], *box)[:16],
+            "box": box
+        })
+
+    return {
+        "version": INCREMENTAL_VERSION,
+        "digest": file_digest(file_path),
+        "nodes": nodes,
+        "shapes": shapes
+    }
+
+
+def load_state(cache, file_path, sheet_name):
+    """
+    前回の変換結果を読み込む。
+
+    Args:
+        cache (DiskCache): 変換結果の保存先
+        file_path (str): Excelファイルのパス
+        sheet_name (str): シート名
+
+    Returns:
+        dict: save_state で保存したスナップショット（mermaid を含む）。なければ None
+    """
+    data = cache.get(_state_key(file_path, sheet_name))
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+def save_state(cache, file_path, sheet_name, snapshot, mermaid_code, source="ai", settings=None):
+    """
+    変換結果を次回の増分変換のために保存する。
+
+    Args:
+        cache (DiskCache): 変換結果の保存先
+        file_path (str): Excelファイルのパス
+        sheet_name (str): シート名
+        snapshot (dict): take_snapshot の結果
+        mermaid_code (str): 変換したMermaidコード
+        source (str): Mermaidコードの生成元（SOURCES のいずれか）
+        settings (dict): 結果に影響する変換の設定（プロンプトの形式・モデルなど。plan_update で比べる）
+    """
+    state = dict(snapshot, mermaid=mermaid_code, source=source, settings=settings or {})
+    cache.set(_state_key(file_path, sheet_name),
+              json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def plan_update(previous, snapshot, settings=None, allow_local=True, max_changed_ratio=MAX_CHANGED_RATIO):
+    """
+    前回の変換結果と現在のスナップショットを比べ、変換の方法を決める。
+
+    - same: ノード・線に変更がない（前回のMermaidコードをそのまま使う）
+    - text: ノードのテキストだけが変わった（ノードの定義を書き換える）
+    - partial: 配置・つながりが変わった（changed のノードだけをAIに問い合わせ、base とつなぎ合わせる）
+    - full: 前回の結果がない、または変更が大きい（シート全体を変換する）
+
+    配置の変わったノード、追加されたノード、変更のあった線・ラベルの近くのノードに加えて、
+    前回の矢印でそれら（と削除されたノード）につながっていたノードも問い合わせ直す。
+    変換の設定が前回と異なる場合や、ローカルで生成した結果を使えない場合（AIでの変換を強制する場合）は、
+    前回の結果を使わずに full にする。
+
+    Args:
+        previous (dict): load_state の結果（Noneの場合は full）
+        snapshot (dict): take_snapshot の結果
+        settings (dict): 今回の変換の設定（save_state で保存したものと一致する場合だけ再利用する）
+        allow_local (bool): Falseの場合、ローカルで生成した前回の結果は再利用しない
+        max_changed_ratio (float): 問い合わせ直すノードの割合の上限（超える場合は full）
+
+    Returns:
+        dict: {mode, mermaid, source, changed, base}
+            （mermaid は same / text の場合のMermaidコード、source はその生成元、
+            changed は問い合わせ直すノードID、base は partial の場合に再利用する {mermaid, owned}）
+    """
+    full = {"mode": "full", "mermaid": None, "source": None, "changed": [], "base": None}
+    if previous is None or previous.get("version") != INCREMENTAL_VERSION:
+        return full
+    if previous["settings"] != (settings or {}) or (previous["source"] == "local" and not allow_local):
+        return full
+    if previous["digest"] == snapshot["digest"]:
+        return {"mode": "same", "mermaid": previous["mermaid"], "source": previous["source"],
+                "changed": [], "base": None}
+
+    old_nodes = {node["shape_id"]: node for node in previous["nodes"]}
+    new_nodes = {node["shape_id"]: node for node in snapshot["nodes"]}
+    if (None in old_nodes or None in new_nodes or len(old_nodes) != len(previous["nodes"])
+            or len(new_nodes) != len(snapshot["nodes"])):
+        # cNvPr id で同定できない図形がある
+        return full
+
+    # 前回のノードID → 今回のノードID（削除されたノードは含まない）
+    renamed = {node["id"]: new_nodes[shape_id]["id"]
+               for shape_id, node in old_nodes.items() if shape_id in new_nodes}
+    removed = {node["id"] for shape_id, node in old_nodes.items() if shape_id not in new_nodes}
+
+    changed = set()
+    edited = []
+    for shape_id, node in new_nodes.items():
+        old = old_nodes.get(shape_id)
+        if old is None or old["layout"] != node["layout"]:
+            changed.add(node["id"])
+        elif old["text"] != node["text"]:
+            edited.append(node)
+
+    # 変更のあった線・ラベルなどの前後の位置に重なるノード
+    boxes = []
+    for shape_id in set(previous["shapes"]) | set(snapshot["shapes"]):
+        old = previous["shapes"].get(shape_id)
+        new = snapshot["shapes"].get(shape_id)
+        if old is None or new is None or old["hash"] != new["hash"]:
+            boxes.extend(entry["box"] for entry in (old, new) if entry is not None)
+    for box in boxes:
+        left, top, right, bottom = (box[0] - CHANGE_MARGIN, box[1] - CHANGE_MARGIN,
+                                    box[2] + CHANGE_MARGIN, box[3] + CHANGE_MARGIN)
+        for node in snapshot["nodes"]:
+            node_left, node_top, node_right, node_bottom = node["box"]
+            if node_left <= right and node_right >= left and node_top <= bottom and node_bottom >= top:
+                changed.add(node["id"])
+
+    # 前回の矢印のうち、変更のあったノードにつながるものは相手のノードも問い合わせ直す（1段だけ）
+    seeds = set(changed)
+    for source, target in partitioner.edge_endpoints(previous["mermaid"]):
+        for node_id, other in ((source, target), (target, source)):
+            if (node_id in removed or renamed.get(node_id) in seeds) and other in renamed:
+                changed.add(renamed[other])
+
+    base = rename_nodes(previous["mermaid"], renamed)
+    for node in edited:
+        if node["id"] in changed:
+            continue
+        patched = replace_node_text(base, node["id"], node["text"])
+        if patched is None:
+            # 定義の行が見つからない（矢印の行で定義されている）場合は問い合わせ直す
+            changed.add(node["id"])
+        else:
+            base = patched
+
+    if not changed:
+        return {"mode": "text" if edited else "same", "mermaid": base, "source": previous["source"],
+                "changed": [], "base": None}
+    if len(changed) > max_changed_ratio * len(snapshot["nodes"]):
+        return full
+
+    owned = [node["id"] for node in snapshot["nodes"] if node["id"] not in changed]
+    return {
+        "mode": "partial",
+        "mermaid": None,
+        "source": None,
+        "changed": sorted(changed),
+        "base": {"mermaid": base, "owned": owned}
+    }
+
+
+def rename_nodes(mermaid_code, renamed):
+    """
+    MermaidコードのノードID（node_XXX）を付け替える。付け替え先のないノードを含む行は削除する。
+
+    Args:
+        mermaid_code (str): Mermaidコード
+        renamed (dict): 前回のノードID → 今回のノードID
+
+    Returns:
+        str: 付け替えたMermaidコード
+    """
+    lines = []
+    for line in mermaid_code.splitlines():
+        if any(node_id not in renamed for node_id in _NODE_ID.findall(line)):
+            continue
+        lines.append(_NODE_ID.sub(lambda match: renamed[match.group(0)], line))
+    return '\n'.join(lines)
+
+
+def replace_node_text(mermaid_code, node_id, text):
+    """
+    ノードの定義の行（node_XXX["テキスト"] など）の引用符付きテキストを書き換える。
+
+    Args:
+        mermaid_code (str): Mermaidコード
+        node_id (str): ノードID
+        text (str): 新しいテキスト
+
+    Returns:
+        str: 書き換えたMermaidコード（定義の行が見つからない場合は None）
+    """
+    definition = re.compile(rf'^\s*{re.escape(node_id)}\s*[\[\(\{{>]')
+    quoted = '"' + flow_graph.escape_text(text) + '"'
+    lines = mermaid_code.splitlines()
+    for idx, line in enumerate(lines):
+        if definition.match(line) and not partitioner.edge_endpoints(line) and _QUOTED.search(line):
+            lines[idx] = _QUOTED.sub(lambda _: quoted, line, count=1)
+            return '\n'.join(lines)
+    return None
+
+
+def _state_key(file_path, sheet_name):
+    """シートごとの変換結果のキー（ファイルの内容ではなくパスで引く）"""
+    return make_key('incremental', INCREMENTAL_VERSION, os.path.abspath(file_path), sheet_name)
+
+
+def _box(position):
+    """位置情報の矩形 [left, top, right, bottom]（小数第2位で丸める）"""
+    return [round(position["left"], 2), round(position["top"], 2),
+            round(position["left"] + position["width"], 2), round(position["top"] + position["height"], 2)]
@@ -1,15 +1,32 @@
 """
 メイン処理
 ExcelフローチャートをMermaid記法に変換するツールのエントリーポイント
+
+シェルのループから繰り返し呼び出しても速く起動するよう、各段階のモジュール（PIL・requests などを
+読み込むもの）は実行する段階になってから読み込む。引数の解析には settings の既定値だけを使う。
 """
 import argparse
+import functools
+import json
 import os
 import sys
 
-# 自作モジュールをインポート
-import excel_parser
-import asset_generator
-import ai_connector
+# 自作モジュールをインポート（段階のモジュールは使う関数の中で読み込む）
+import settings
+from disk_cache import DiskCache
+
+# 既定のキャッシュディレクトリ
+DEFAULT_CACHE_DIR = ".cache"
+
+# バッチモードの既定の出力先
+DEFAULT_BATCH_OUTPUT_DIR = os.path.join("output", "batch")
+
+# --stage で実行できる段階（後の段階は前の段階を含む）
+#   parse  : Excel解析（解析した図形）
+#   assets : 資材生成まで（JSON指示書・推定トークン数・画像のサイズ）
+#   ai     : AI連携まで（Mermaidコード。Markdownは書き出さない）
+#   all    : Markdownの保存まで
+STAGES = ("parse", "assets", "ai", "all")
 
 
 def main():
@@ -20,12 +37,10 @@ def main():
     )
     parser.add_argument(
         "--file",
-        required=True,
         help="Path to Excel file (*.xlsx)"
     )
     parser.add_argument(
         "--sheet",
-        required=True,
         help="Sheet name to process"
     )
     parser.add_argument(
@@ -38,14 +53,178 @@ def main():
         action="store_true",
         help="Keep intermediate files (JSON and anchor image)"
     )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory for cached parse results and AI responses (default: {DEFAULT_CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the parse result and AI response caches"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached AI responses and the previous conversion, and call the API again "
+             "(the new results are cached)"
+    )
+    parser.add_argument(
+        "--no-incremental",
+        action="store_true",
+        help="Always convert the whole sheet instead of reusing the previous conversion for unchanged shapes"
+    )
+    parser.add_argument(
+        "--image-format",
+        choices=settings.IMAGE_FORMATS,
+        default=settings.DEFAULT_IMAGE_FORMAT,
+        help=f"Encoding of the anchor image sent to the AI (default: {settings.DEFAULT_IMAGE_FORMAT})"
+    )
+    parser.add_argument(
+        "--image-max-edge",
+        type=int,
+        default=settings.DEFAULT_MAX_EDGE,
+        help="Downscale the anchor image so its longer edge is at most this many pixels; "
+             f"0 keeps the cropped size (default: {settings.DEFAULT_MAX_EDGE})"
+    )
+    parser.add_argument(
+        "--render",
+        choices=settings.RENDER_MODES,
+        default=settings.DEFAULT_RENDER,
+        help="How to obtain the sheet image: 'screen' captures Excel shown full-screen, "
+             f"'headless' draws the shapes from the drawing XML (default: {settings.DEFAULT_RENDER})"
+    )
+    parser.add_argument(
+        "--dpi",
+        type=int,
+        default=settings.DEFAULT_DPI,
+        help=f"Resolution of the headless rendering (default: {settings.DEFAULT_DPI})"
+    )
+    parser.add_argument(
+        "--force-ai",
+        action="store_true",
+        help="Call the AI even when every connector is bound to shapes "
+             "(by default such sheets are converted locally)"
+    )
+    parser.add_argument(
+        "--partition-nodes",
+        type=int,
+        default=settings.DEFAULT_PARTITION_NODES,
+        help="Split sheets with more nodes than this into regions converted by concurrent AI requests "
+             f"(default: {settings.DEFAULT_PARTITION_NODES}, 0: never split)"
+    )
+    parser.add_argument(
+        "--prompt-format",
+        choices=settings.PROMPT_FORMATS,
+        default=settings.DEFAULT_PROMPT_FORMAT,
+        help=f"Encoding of the shape data in the prompt (default: {settings.DEFAULT_PROMPT_FORMAT})"
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=settings.DEFAULT_TOKEN_BUDGET,
+        help="Maximum estimated input tokens per AI request; larger sheets are split further, "
+             f"or refused with --partition-nodes 0 (default: {settings.DEFAULT_TOKEN_BUDGET}, 0: no limit)"
+    )
+    parser.add_argument(
+        "--stage",
+        choices=STAGES,
+        help="Run the conversion of --file / --sheet up to this stage and print the result as JSON to stdout "
+             "(progress goes to stderr): 'parse' the parsed shapes, 'assets' the JSON instructions and "
+             "request sizes, 'ai' the Mermaid code, 'all' also saves --output. "
+             "Only the modules of the stages that run are imported"
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Record wall/CPU time, peak memory and counts of every stage, and write a summary with "
+             "a Chrome trace (chrome://tracing, Perfetto) to this JSON file"
+    )
+    parser.add_argument(
+        "--batch",
+        nargs="+",
+        metavar="PATH",
+        help="Convert every sheet with drawings in the given files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes in batch mode, or worker threads with --serve (default: CPU count)"
+    )
+    parser.add_argument(
+        "--ai-concurrency",
+        type=int,
+        default=settings.DEFAULT_CONCURRENCY,
+        help=f"Maximum concurrent AI requests in batch mode (default: {settings.DEFAULT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=DEFAULT_BATCH_OUTPUT_DIR,
+        help=f"Output directory in batch mode (default: {DEFAULT_BATCH_OUTPUT_DIR})"
+    )
+
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a long-lived conversion server with a local HTTP/JSON API "
+             "(POST /convert, GET /jobs/<id>, GET /health); renders headless unless a request says otherwise"
+    )
+    parser.add_argument(
+        "--host",
+        default=settings.DEFAULT_HOST,
+        help=f"Address the server listens on (default: {settings.DEFAULT_HOST})"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=settings.DEFAULT_PORT,
+        help=f"Port the server listens on (default: {settings.DEFAULT_PORT})"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=settings.DEFAULT_QUEUE_SIZE,
+        help=f"Jobs the server queues before answering 429 (default: {settings.DEFAULT_QUEUE_SIZE})"
+    )
 
     args = parser.parse_args()
 
+    if args.image_max_edge < 0:
+        parser.error("--image-max-edge must be 0 or more")
+    if args.dpi < 1:
+        parser.error("--dpi must be 1 or more")
+    if args.partition_nodes < 0:
+        parser.error("--partition-nodes must be 0 or more")
+    if args.token_budget < 0:
+        parser.error("--token-budget must be 0 or more")
+    if args.stage and (args.batch or args.serve):
+        parser.error("--stage cannot be combined with --batch or --serve")
+
+    if args.serve:
+        _run_server(args)
+        return
+
+    if args.batch:
+        _run_batch(args)
+        return
+
+    if not args.file or not args.sheet:
+        parser.error("--file and --sheet are required unless --batch is given")
+
     # ファイルの存在確認
     if not os.path.exists(args.file):
-        print(f"✗ Error: File not found: {args.file}")
+        print(f"✗ Error: File not found: {args.file}", file=sys.stderr if args.stage else sys.stdout)
         sys.exit(1)
 
+    if args.stage:
+        _run_stage(args)
+        return
+
+    import ai_connector
+    import pipeline
+    import profiler
+
     print("=" * 70)
     print("Excel to Mermaid Converter")
     print("=" * 70)
@@ -54,76 +233,44 @@ def main():
     print(f"Output file: {args.output}")
     print("=" * 70)
 
-    # 中間ファイルの保存先
+    # 中間ファイルの保存先（--keep-intermediate 指定時のみ書き出す）
     intermediate_dir = "output"
-    os.makedirs(intermediate_dir, exist_ok=True)
 
-    json_path = os.path.join(intermediate_dir, "instructions.json")
-    image_path = os.path.join(intermediate_dir, "anchor_image.png")
+    # 解析結果・AI応答のキャッシュ
+    if args.no_cache:
+        parse_cache = ai_cache = state_cache = None
+    else:
+        parse_cache = DiskCache(os.path.join(args.cache_dir, "parse"))
+        ai_cache = ai_connector.ResponseCache(os.path.join(args.cache_dir, "ai"))
+        # 前回の変換結果（増分変換用）
+        state_cache = None if args.no_incremental else DiskCache(os.path.join(args.cache_dir, "state"))
+
+    # 各段階の計測（--profile 指定時のみ）
+    profile = profiler.Profiler() if args.profile else None
 
     try:
-        # ステップ1: Excel解析
-        print("\n[Step 1/4] Parsing Excel shapes...")
-        mapped_containers = excel_parser.parse_excel_shapes(args.file, args.sheet)
-        print(f"✓ Parsed {len(mapped_containers)} shapes")
-
-        # ステップ2: 資材生成
-        print("\n[Step 2/4] Generating AI input assets...")
-        json_data, _ = asset_generator.generate_assets(
-            mapped_containers,
-            args.file,
-            args.sheet,
-            json_path,
-            image_path
-        )
-        print(f"✓ Generated JSON: {json_path}")
-        print(f"✓ Generated image: {image_path}")
-
-        # ステップ3: AI連携
-        print("\n[Step 3/4] Calling AI to generate Mermaid code...")
-        print("Note: This requires GOOGLE_API_KEY in .env file")
-
-        # APIキーの確認
-        if not os.environ.get('GOOGLE_API_KEY'):
-            print("\n⚠ Warning: GOOGLE_API_KEY not found!")
-            print("Please create a .env file with your Google Gemini API key.")
-            print("Example: cp .env.example .env")
-            print("\nFor now, skipping AI generation step.")
-            print("You can manually use the generated files:")
-            print(f"  - JSON: {json_path}")
-            print(f"  - Image: {image_path}")
-
-            # ダミーのMermaidコードを生成
-            mermaid_code = _generate_dummy_mermaid(json_data)
-            print("\n✓ Generated dummy Mermaid code (without AI)")
-
-        else:
-            mermaid_code = ai_connector.generate_mermaid_code(json_path, image_path)
-            print("✓ Mermaid code generated successfully")
-
-        # ステップ4: Markdownファイルに保存
-        print("\n[Step 4/4] Saving to output file...")
-        with open(args.output, 'w', encoding='utf-8') as f:
-            f.write("# Flowchart (Generated from Excel)\n\n")
-            f.write("```mermaid\n")
-            f.write(mermaid_code)
-            f.write("\n```\n")
-
-        print(f"✓ Saved to: {args.output}")
-
-        # 中間ファイルの削除（オプション）
-        if not args.keep_intermediate:
-            print("\nCleaning up intermediate files...")
-            if os.path.exists(json_path):
-                os.remove(json_path)
-                print(f"  - Removed: {json_path}")
-            if os.path.exists(image_path):
-                os.remove(image_path)
-                print(f"  - Removed: {image_path}")
-        else:
-            print("\nIntermediate files kept:")
-            print(f"  - JSON: {json_path}")
-            print(f"  - Image: {image_path}")
+        with (profiler.enabled(profile),
+              profiler.span("convert_sheet", category="sheet", file=args.file, sheet=args.sheet)):
+            pipeline.convert_sheet(
+                args.file,
+                args.sheet,
+                args.output,
+                intermediate_dir,
+                keep_intermediate=args.keep_intermediate,
+                parse_cache=parse_cache,
+                ai_cache=ai_cache,
+                refresh=args.refresh,
+                image_format=args.image_format,
+                max_edge=args.image_max_edge,
+                render=args.render,
+                dpi=args.dpi,
+                local_graph=not args.force_ai,
+                partition_nodes=args.partition_nodes,
+                prompt_format=args.prompt_format,
+                token_budget=args.token_budget,
+                state_cache=state_cache,
+                log=print
+            )
 
         # 完了
         print("\n" + "=" * 70)
@@ -140,31 +287,229 @@ def main():
         traceback.print_exc()
         sys.exit(1)
 
+    finally:
+        if profile is not None:
+            _write_profile(profile, args)
 
-def _generate_dummy_mermaid(json_data):
-    """
-    APIキーがない場合のダミーMermaidコード生成
 
-    Args:
-        json_data (list): JSON指示書データ
+def _run_stage(args):
+    """
+    --stage の段階まで変換し、結果をJSONで標準出力に書き出す（進捗・エラーは標準エラー出力）
 
-    Returns:
-        str: ダミーのMermaidコード
+    parse は excel_parser だけを読み込む。資材生成の画像やAI連携のモジュールは、
+    その段階を実行する場合だけ読み込む。
     """
-    lines = ["graph TD"]
+    import profiler
+
+    log = functools.partial(print, file=sys.stderr)
+    profile = profiler.Profiler() if args.profile else None
+    parse_cache = None if args.no_cache else DiskCache(os.path.join(args.cache_dir, "parse"))
+
+    try:
+        with (profiler.enabled(profile),
+              profiler.span("convert_sheet", category="sheet", file=args.file, sheet=args.sheet,
+                            stage=args.stage)):
+            if args.stage == "parse":
+                result = _parse_stage(args, parse_cache)
+            elif args.stage == "assets":
+                result = _assets_stage(args, parse_cache, log)
+            else:
+                result = _convert_stage(args, parse_cache, log)
+    except Exception as e:
+        log(f"✗ Error: {e}")
+        sys.exit(1)
+    finally:
+        if profile is not None:
+            _write_profile(profile, args, log=log)
+
+    json.dump(dict(result, stage=args.stage), sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+
+
+def _parse_stage(args, parse_cache):
+    """--stage parse: 解析した図形（コンテナとテキスト）"""
+    import excel_parser
+    import profiler
+
+    with profiler.span("parse") as span:
+        containers = excel_parser.parse_excel_shapes(args.file, args.sheet, cache=parse_cache)
+        span["containers"] = len(containers)
+    return {"file": args.file, "sheet": args.sheet, "shapes": len(containers), "containers": containers}
+
+
+def _assets_stage(args, parse_cache, log):
+    """--stage assets: JSON指示書と、AIへのリクエストの推定トークン数・画像のサイズ（画像そのものは含めない）"""
+    import pipeline
+
+    state_cache = None
+    if not args.no_cache and not args.no_incremental:
+        state_cache = DiskCache(os.path.join(args.cache_dir, "state"))
+    assets = pipeline.prepare_assets(
+        args.file, args.sheet, parse_cache,
+        intermediate_dir="output" if args.keep_intermediate else None,
+        image_format=args.image_format, max_edge=args.image_max_edge, render=args.render, dpi=args.dpi,
+        local_graph=not args.force_ai, partition_nodes=args.partition_nodes,
+        prompt_format=args.prompt_format, token_budget=args.token_budget, state_cache=state_cache,
+        refresh=args.refresh, log=log
+    )
+    partitions = None
+    if assets["partitions"] is not None:
+        partitions = [{"nodes": len(partition["json_data"]), "owned": partition["owned"],
+                       "image_bytes": len(partition["image_bytes"]), "tokens": partition["tokens"]}
+                      for partition in assets["partitions"]]
+    return {
+        "file": args.file,
+        "sheet": args.sheet,
+        "shapes": assets["shapes"],
+        "local": assets["local_mermaid"] is not None,
+        "mermaid": assets["local_mermaid"],
+        "incremental": assets["incremental"],
+        "prompt_format": assets["prompt_format"],
+        "tokens": assets["tokens"],
+        "image_bytes": len(assets["image_bytes"]) if assets["image_bytes"] is not None else None,
+        "partitions": partitions,
+        "nodes": assets["json_data"],
+        "intermediate": assets["intermediate"]
+    }
+
+
+def _convert_stage(args, parse_cache, log):
+    """--stage ai / all: pipeline.convert_sheet の結果（all の場合は --output にも保存する）"""
+    import ai_connector
+    import pipeline
+
+    ai_cache = state_cache = None
+    if not args.no_cache:
+        ai_cache = ai_connector.ResponseCache(os.path.join(args.cache_dir, "ai"))
+        if not args.no_incremental:
+            state_cache = DiskCache(os.path.join(args.cache_dir, "state"))
+    return pipeline.convert_sheet(
+        args.file,
+        args.sheet,
+        args.output if args.stage == "all" else None,
+        "output",
+        keep_intermediate=args.keep_intermediate,
+        parse_cache=parse_cache,
+        ai_cache=ai_cache,
+        refresh=args.refresh,
+        image_format=args.image_format,
+        max_edge=args.image_max_edge,
+        render=args.render,
+        dpi=args.dpi,
+        local_graph=not args.force_ai,
+        partition_nodes=args.partition_nodes,
+        prompt_format=args.prompt_format,
+        token_budget=args.token_budget,
+        state_cache=state_cache,
+        log=log
+    )
+
+
+def _run_batch(args):
+    """バッチモードの実行"""
+    if args.jobs is not None and args.jobs < 1:
+        print("✗ Error: --jobs must be 1 or more")
+        sys.exit(1)
+    if args.ai_concurrency < 1:
+        print("✗ Error: --ai-concurrency must be 1 or more")
+        sys.exit(1)
+
+    import batch_runner
+    import profiler
+
+    print("=" * 70)
+    print("Excel to Mermaid Converter (batch)")
+    print("=" * 70)
+    print(f"Inputs: {', '.join(args.batch)}")
+    print(f"Output directory: {args.output_dir}")
+    print("=" * 70)
+
+    profile = profiler.Profiler() if args.profile else None
+    manifest = batch_runner.run_batch(
+        args.batch,
+        args.output_dir,
+        jobs=args.jobs,
+        keep_intermediate=args.keep_intermediate,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        ai_concurrency=args.ai_concurrency,
+        refresh=args.refresh,
+        image_format=args.image_format,
+        max_edge=args.image_max_edge,
+        render=args.render,
+        dpi=args.dpi,
+        local_graph=not args.force_ai,
+        partition_nodes=args.partition_nodes,
+        prompt_format=args.prompt_format,
+        token_budget=args.token_budget,
+        reuse_previous=not args.no_incremental,
+        profile=profile
+    )
+
+    print("\n" + "=" * 70)
+    print(f"✓ Converted {manifest['succeeded']} sheet(s), {manifest['failed']} failure(s) "
+          f"in {manifest['seconds']:.1f}s")
+    print(f"  Converted locally without AI: {manifest['local']} sheet(s)")
+    print(f"  Reused previous conversions: {manifest['incremental']} sheet(s)")
+    print(f"  Estimated input tokens: {manifest['tokens']}")
+    if manifest["ai_cache"] is not None:
+        stats = manifest["ai_cache"]
+        print(f"  AI cache: {stats['hits']} hit(s), {stats['misses']} miss(es) "
+              f"({stats['hit_rate']:.0%}), {stats['latency_saved']:.1f}s saved")
+    print("=" * 70)
+
+    if profile is not None:
+        _write_profile(profile, args)
+
+    if manifest["failed"]:
+        sys.exit(1)
 
-    for node in json_data:
-        node_id = node["id"]
-        text = node["text"]
 
-        # シンプルなノード定義（四角形のみ）
-        lines.append(f'    {node_id}["{text}"]')
+def _run_server(args):
+    """サーバーモードの実行"""
+    if args.jobs is not None and args.jobs < 1:
+        print("✗ Error: --jobs must be 1 or more")
+        sys.exit(1)
+    if args.queue_size < 1:
+        print("✗ Error: --queue-size must be 1 or more")
+        sys.exit(1)
+
+    import server
+
+    print("=" * 70)
+    print("Excel to Mermaid Converter (server)")
+    print("=" * 70)
+
+    # --render を除くコマンドラインの設定を、リクエストで指定がない場合の既定値にする
+    server.serve(
+        args.host,
+        args.port,
+        workers=args.jobs,
+        queue_size=args.queue_size,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        reuse_previous=not args.no_incremental,
+        defaults={
+            "dpi": args.dpi,
+            "image_format": args.image_format,
+            "image_max_edge": args.image_max_edge,
+            "force_ai": args.force_ai,
+            "partition_nodes": args.partition_nodes,
+            "prompt_format": args.prompt_format,
+            "token_budget": args.token_budget,
+            "refresh": args.refresh
+        }
+    )
+
 
-    # 順番に接続（ダミー）
-    for i in range(len(json_data) - 1):
-        lines.append(f'    {json_data[i]["id"]} --> {json_data[i+1]["id"]}')
+def _write_profile(profile, args, log=print):
+    """計測結果を --profile のファイルに書き出し、段階ごとの集計を表示する"""
+    import profiler
 
-    return '\n'.join(lines)
+    profile.write(args.profile, metadata={"argv": sys.argv[1:], "options": vars(args)})
+    summary = profile.summary()
+    log(f"\nProfile ({summary['wall_seconds']:.3f}s, {summary['processes']} process(es)):")
+    for line in profiler.summary_lines(summary):
+        log(line)
+    log(f"✓ Profile saved: {args.profile}")
 
 
 if __name__ == "__main__":
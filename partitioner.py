@@ -0,0 +1,261 @@
+"""
+分割変換モジュール
+図形の多いシートを、重なりを持たせた空間的な領域に分割し、領域ごとのJSON指示書と切り抜いた
+IDアンカー画像でAIに並行して問い合わせ、部分的なMermaidコードをノードIDで重複を除いてつなぎ合わせる。
+1回のリクエストの大きさ（画像の解像度・トークン数）と待ち時間は、シート全体ではなく最大の領域で決まる。
+"""
+import asyncio
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import ai_connector
+from settings import DEFAULT_PARTITION_NODES
+from spatial_index import GridIndex, suggest_cell_size
+
+
+# 領域の外側に含める重なりの幅 [point]（境界をまたぐ矢印の両端を同じ画像に収めるため）
+PARTITION_OVERLAP = 72.0
+
+_HEADER = re.compile(r'^(graph|flowchart)\b')
+_EDGE = re.compile(
+    r'^(?P<source>[A-Za-z_]\w*)\b.*?(?:<-->|-->|---|-\.->|==>)\s*(?:\|[^|]*\|\s*)?(?P<target>[A-Za-z_]\w*)'
+)
+_NODE = re.compile(r'^(?P<id>[A-Za-z_]\w*)\s*[\[\(\{>]')
+
+
+def partition_nodes(json_data, max_nodes=DEFAULT_PARTITION_NODES, overlap=PARTITION_OVERLAP):
+    """
+    JSON指示書のノードを、1領域あたり max_nodes 件以下の空間的な領域に分割する。
+
+    ノードの中心座標を、広がりの大きい方の軸で件数が均等になるように再帰的に二分する。
+    各領域には、担当するノード（owned）の外接矩形を overlap だけ広げた範囲に重なる
+    隣の領域のノードも含める。
+
+    Args:
+        json_data (list): JSON指示書データ
+        max_nodes (int): 1領域が担当するノード数の上限（0以下の場合は分割しない）
+        overlap (float): 重なりの幅 [point]
+
+    Returns:
+        list: 領域 {nodes: [JSON指示書のノード（ドキュメント順）], owned: [担当するノードID]} のリスト
+    """
+    if max_nodes <= 0 or len(json_data) <= max_nodes:
+        return [{"nodes": list(json_data), "owned": [node["id"] for node in json_data]}]
+
+    index = _node_index(json_data)
+    return [_region(json_data, index, owned, overlap)
+            for owned in _bisect(list(range(len(json_data))), json_data, max_nodes)]
+
+
+def region_around(json_data, node_ids, overlap=PARTITION_OVERLAP):
+    """
+    指定したノードを担当する1つの領域を作る（増分変換で、変更のあったノードだけを問い合わせる場合など）。
+
+    Args:
+        json_data (list): JSON指示書データ
+        node_ids (iterable): 担当するノードID
+        overlap (float): 重なりの幅 [point]
+
+    Returns:
+        dict: 領域 {nodes, owned}（partition_nodes と同じ形式）
+    """
+    wanted = set(node_ids)
+    owned = [idx for idx, node in enumerate(json_data) if node["id"] in wanted]
+    if not owned:
+        return {"nodes": [], "owned": []}
+
+    index = _node_index(json_data)
+    return _region(json_data, index, owned, overlap)
+
+
+def edge_endpoints(mermaid_code):
+    """
+    Mermaidコードの矢印の (始点のノードID, 終点のノードID) を列挙する（stitch_mermaid と同じ規則で読む）。
+
+    Args:
+        mermaid_code (str): Mermaidコード
+
+    Returns:
+        list: (始点, 終点) のリスト
+    """
+    endpoints = []
+    for line in mermaid_code.splitlines():
+        edge = _EDGE.match(line.strip())
+        if edge:
+            endpoints.append((edge.group('source'), edge.group('target')))
+    return endpoints
+
+
+def stitch_mermaid(partial_codes, partitions):
+    """
+    領域ごとのMermaidコードを1つの graph TD につなぎ合わせる。
+
+    ノードの定義はノードIDごとに1つにまとめ、担当する領域の定義を優先する。
+    矢印は少なくとも一方の端のノードを担当する領域のものだけを採用し（重なりの部分は画像の端で
+    切れているため）、同じ矢印は1つにまとめる。
+
+    Args:
+        partial_codes (list): 領域ごとのMermaidコード
+        partitions (list): partition_nodes の結果（owned を参照する）
+
+    Returns:
+        str: つなぎ合わせたMermaidコード
+    """
+    owner = {node_id: idx for idx, partition in enumerate(partitions) for node_id in partition["owned"]}
+    node_lines = {}
+    edge_lines = []
+    other_lines = []
+    seen = set()
+
+    for idx, code in enumerate(partial_codes):
+        for line in code.splitlines():
+            stripped = line.strip()
+            if not stripped or _HEADER.match(stripped):
+                continue
+
+            edge = _EDGE.match(stripped)
+            if edge:
+                if owner.get(edge.group('source')) != idx and owner.get(edge.group('target')) != idx:
+                    continue
+                key = ' '.join(stripped.split())
+                if key not in seen:
+                    seen.add(key)
+                    edge_lines.append(stripped)
+                continue
+
+            node = _NODE.match(stripped)
+            if node:
+                node_id = node.group('id')
+                current = node_lines.get(node_id)
+                if current is None or (owner.get(node_id) == idx and current[0] != idx):
+                    node_lines[node_id] = (idx, stripped)
+                continue
+
+            key = ' '.join(stripped.split())
+            if key not in seen:
+                seen.add(key)
+                other_lines.append(stripped)
+
+    lines = ["graph TD"]
+    lines.extend(f"    {node_lines[node_id][1]}" for node_id in sorted(node_lines))
+    lines.extend(f"    {line}" for line in edge_lines + other_lines)
+    return '\n'.join(lines)
+
+
+async def generate_partitioned_async(partitions, timeout=ai_connector.DEFAULT_TIMEOUT, limiter=None,
+                                     executor=None, cache=None, refresh=False,
+                                     prompt_format=ai_connector.DEFAULT_PROMPT_FORMAT, base=None):
+    """
+    領域ごとのリクエストを並行して送信し、結果をつなぎ合わせる
+
+    Args:
+        partitions (list): 領域 {json_data, image_bytes, owned} のリスト（pipeline.prepare_assets の結果）
+        base (dict): 再利用する前回のMermaidコード {mermaid, owned}（増分変換の場合。
+            owned のノードの定義と矢印は問い合わせずにこちらを使う）
+        その他の引数は ai_connector.generate_mermaid_code_from_data_async と同じ
+
+    Returns:
+        str: つなぎ合わせたMermaidコード
+    """
+    codes = await asyncio.gather(*(
+        ai_connector.generate_mermaid_code_from_data_async(
+            partition["json_data"], partition["image_bytes"], timeout, limiter, executor, cache, refresh,
+            prompt_format
+        )
+        for partition in partitions
+    ))
+    if base is not None:
+        return stitch_mermaid([base["mermaid"]] + list(codes), [base] + list(partitions))
+    return stitch_mermaid(codes, partitions)
+
+
+def generate_partitioned(partitions, concurrency=ai_connector.DEFAULT_CONCURRENCY,
+                         timeout=ai_connector.DEFAULT_TIMEOUT, cache=None, refresh=False,
+                         prompt_format=ai_connector.DEFAULT_PROMPT_FORMAT, base=None):
+    """
+    generate_partitioned_async の同期版（イベントループの外から呼び出す場合）
+
+    Args:
+        partitions (list): 領域 {json_data, image_bytes, owned} のリスト
+        concurrency (int): 同時に送信するリクエスト数の上限
+        timeout (float): 1リクエストあたりのタイムアウト [秒]
+        cache (ResponseCache): AI応答のキャッシュ（Noneの場合は使わない）
+        refresh (bool): Trueの場合、キャッシュを読まずにAPIを呼び出す
+        prompt_format (str): プロンプト中の図形データの形式
+        base (dict): 再利用する前回のMermaidコード {mermaid, owned}（Noneの場合は使わない）
+
+    Returns:
+        str: つなぎ合わせたMermaidコード
+    """
+    async def run():
+        limiter = asyncio.Semaphore(concurrency)
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            return await generate_partitioned_async(
+                partitions, timeout, limiter, executor, cache, refresh, prompt_format, base
+            )
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return asyncio.run(run())
+
+
+def _node_index(json_data):
+    """ノードの矩形の空間索引を作成する"""
+    index = GridIndex(suggest_cell_size(
+        (node["position"]["width"], node["position"]["height"]) for node in json_data
+    ))
+    for idx, node in enumerate(json_data):
+        left, top, right, bottom = _box(node)
+        index.insert(idx, left, top, right, bottom)
+    return index
+
+
+def _region(json_data, index, owned, overlap):
+    """担当するノードのインデックスから、外接矩形を overlap だけ広げた範囲のノードを含む領域を作る"""
+    boxes = [_box(json_data[idx]) for idx in owned]
+    left = min(box[0] for box in boxes) - overlap
+    top = min(box[1] for box in boxes) - overlap
+    right = max(box[2] for box in boxes) + overlap
+    bottom = max(box[3] for box in boxes) + overlap
+
+    members = set(owned)
+    for idx in index.query(left, top, right, bottom):
+        node_left, node_top, node_right, node_bottom = _box(json_data[idx])
+        if node_left <= right and node_right >= left and node_top <= bottom and node_bottom >= top:
+            members.add(idx)
+
+    return {
+        "nodes": [json_data[idx] for idx in sorted(members)],
+        "owned": [json_data[idx]["id"] for idx in sorted(owned)]
+    }
+
+
+def _bisect(indices, json_data, max_nodes):
+    """ノードを中心座標で再帰的に分割し、担当するノードのインデックスのリストを返す"""
+    count = math.ceil(len(indices) / max_nodes)
+    if count <= 1:
+        return [indices]
+
+    centers = {idx: _center(json_data[idx]) for idx in indices}
+    xs = [centers[idx][0] for idx in indices]
+    ys = [centers[idx][1] for idx in indices]
+    axis = 0 if max(xs) - min(xs) >= max(ys) - min(ys) else 1
+    ordered = sorted(indices, key=lambda idx: (centers[idx][axis], centers[idx][1 - axis], idx))
+
+    # 分割後の領域数が左右で均等になるように切る
+    cut = round(len(ordered) * (count // 2) / count)
+    return _bisect(ordered[:cut], json_data, max_nodes) + _bisect(ordered[cut:], json_data, max_nodes)
+
+
+def _box(node):
+    """ノードの矩形 (left, top, right, bottom) を返す"""
+    pos = node["position"]
+    return pos["left"], pos["top"], pos["left"] + pos["width"], pos["top"] + pos["height"]
+
+
+def _center(node):
+    """ノードの中心座標を返す"""
+    left, top, right, bottom = _box(node)
+    return (left + right) / 2, (top + bottom) / 2
@@ -0,0 +1,443 @@
+"""
+変換パイプラインモジュール
+1つのシートを「Excel解析 → 資材生成 → AI連携 → Markdown保存」の順に変換する。
+JSON指示書とIDアンカー画像はメモリ上で受け渡し、ファイルには中間ファイルを残す指定がある場合だけ書き出す。
+グローバルな状態や固定のファイルパスを使わないため、スレッドプール・プロセスプールから並行して呼び出せる。
+"""
+import json
+import os
+
+import excel_parser
+import asset_generator
+import ai_connector
+import flow_graph
+import headless_renderer
+import incremental
+import partitioner
+import profiler
+from settings import DEFAULT_TOKEN_BUDGET
+
+
+def _quiet(*args, **kwargs):
+    """進捗を出力しない場合のログ関数"""
+
+
+def convert_sheet(file_path, sheet_name, output_path=None, intermediate_dir=None,
+                  keep_intermediate=False, parse_cache=None, compact=False,
+                  ai_cache=None, refresh=False, image_format=asset_generator.DEFAULT_IMAGE_FORMAT,
+                  max_edge=asset_generator.DEFAULT_MAX_EDGE, render=asset_generator.DEFAULT_RENDER,
+                  dpi=headless_renderer.DEFAULT_DPI, local_graph=True,
+                  partition_nodes=partitioner.DEFAULT_PARTITION_NODES,
+                  prompt_format=ai_connector.DEFAULT_PROMPT_FORMAT,
+                  token_budget=DEFAULT_TOKEN_BUDGET, state_cache=None, log=_quiet):
+    """
+    1つのシートをMermaid記法に変換する。
+
+    すべてのコネクタが図形に接続されているシートは、AIを呼び出さずにローカルでMermaidコードを生成する。
+    図形の多いシートは領域に分割し、領域ごとのリクエストを並行して送信する。
+    state_cache を指定した場合は変換結果を保存し、次回は前回からの変更部分だけを変換する。
+
+    Args:
+        file_path (str): Excelファイルのパス
+        sheet_name (str): シート名
+        output_path (str): 出力するMarkdownファイルのパス（Noneの場合は書き出さない）
+        intermediate_dir (str): 中間ファイル（JSON指示書・IDアンカー画像）の保存先
+        keep_intermediate (bool): Trueの場合、中間ファイルを intermediate_dir に書き出す
+        parse_cache (DiskCache): 解析結果のキャッシュ（Noneの場合は使わない）
+        compact (bool): Trueの場合、解析結果を ShapeTable で受け取る（大量処理向け）
+        ai_cache (ai_connector.ResponseCache): AI応答のキャッシュ（Noneの場合は使わない）
+        refresh (bool): Trueの場合、AI応答のキャッシュを読まずにAPIを呼び出す
+        image_format (str): アップロードする画像の形式（asset_generator.IMAGE_FORMATS のいずれか）
+        max_edge (int): アップロードする画像の長辺の最大ピクセル数（0またはNoneの場合は縮小しない）
+        render (str): 元画像の取得方法（'screen': スクリーンショット, 'headless': drawingから直接描画）
+        dpi (int): headless の場合の解像度
+        local_graph (bool): Falseの場合、コネクタの接続情報によらず常にAIを呼び出す
+        partition_nodes (int): 1リクエストあたりのノード数の上限（0の場合は分割しない）
+        prompt_format (str): プロンプト中の図形データの形式（ai_connector.PROMPT_FORMATS のいずれか）
+        token_budget (int): 1リクエストあたりの推定トークン数の上限（0の場合は制限しない）
+        state_cache (DiskCache): 増分変換のための前回の変換結果の保存先（Noneの場合は毎回全体を変換する）
+        log (callable): 進捗の出力先（既定では出力しない）
+
+    Returns:
+        dict: 変換結果 {file, sheet, output, shapes, ai, local, incremental, mermaid, tokens, intermediate}
+            （incremental は増分変換の方法。incremental.plan_update を参照。使わない場合は None）
+    """
+    assets = prepare_assets(
+        file_path, sheet_name, parse_cache, compact,
+        intermediate_dir if keep_intermediate else None,
+        image_format=image_format, max_edge=max_edge, render=render, dpi=dpi,
+        local_graph=local_graph, partition_nodes=partition_nodes, prompt_format=prompt_format,
+        token_budget=token_budget, state_cache=state_cache, refresh=refresh, log=log
+    )
+
+    use_ai = False
+    ai_connector.load_environment()
+    if assets["local_mermaid"] is not None:
+        # ステップ3: グラフからローカルで生成（AI連携は不要）
+        log("\n[Step 3/4] Generating Mermaid code from connector bindings (AI skipped)...")
+        mermaid_code = assets["local_mermaid"]
+        log("✓ Mermaid code generated locally")
+
+    elif not os.environ.get('GOOGLE_API_KEY'):
+        # ステップ3: AI連携（APIキーがない場合）
+        log("\n[Step 3/4] Calling AI to generate Mermaid code...")
+        log("Note: This requires GOOGLE_API_KEY in .env file")
+        log("\n⚠ Warning: GOOGLE_API_KEY not found!")
+        log("Please create a .env file with your Google Gemini API key.")
+        log("Example: cp .env.example .env")
+        log("\nFor now, skipping AI generation step.")
+        if assets["intermediate"]:
+            log("You can manually use the generated files:")
+            for path in assets["intermediate"]:
+                log(f"  - {path}")
+        else:
+            log("Use --keep-intermediate to save the JSON and image for manual use.")
+
+        # ダミーのMermaidコードを生成
+        mermaid_code = generate_dummy_mermaid(assets["json_data"])
+        log("\n✓ Generated dummy Mermaid code (without AI)")
+
+    else:
+        # ステップ3: AI連携
+        log("\n[Step 3/4] Calling AI to generate Mermaid code...")
+        use_ai = True
+        requests = len(assets["partitions"]) if assets["partitions"] is not None else 1
+        with profiler.span("ai", category="ai", requests=requests):
+            if assets["partitions"] is not None:
+                mermaid_code = partitioner.generate_partitioned(
+                    assets["partitions"], cache=ai_cache, refresh=refresh, prompt_format=prompt_format,
+                    base=assets["base"]
+                )
+            else:
+                mermaid_code = ai_connector.generate_mermaid_code_from_data(
+                    assets["json_data"], assets["image_bytes"], cache=ai_cache, refresh=refresh,
+                    prompt_format=prompt_format
+                )
+        if assets["partitions"] is None:
+            log("✓ Mermaid code generated successfully")
+        elif assets["base"] is not None:
+            log(f"✓ Mermaid code stitched from the previous result and "
+                f"{len(assets['partitions'])} partial request(s)")
+        else:
+            log(f"✓ Mermaid code stitched from {len(assets['partitions'])} partition(s)")
+        if ai_cache is not None:
+            stats = ai_cache.stats()
+            log(f"  AI cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+                f"{stats['latency_saved']:.1f}s saved")
+
+    if assets["snapshot"] is not None and (use_ai or assets["local_mermaid"] is not None):
+        # 次回の増分変換のために保存する（ダミーのコードは保存しない）
+        incremental.save_state(state_cache, file_path, sheet_name, assets["snapshot"], mermaid_code,
+                               assets["source"], assets["state_settings"])
+
+    # ステップ4: Markdownファイルに保存
+    if output_path is not None:
+        log("\n[Step 4/4] Saving to output file...")
+        with profiler.span("write_markdown"):
+            write_markdown(output_path, mermaid_code)
+        log(f"✓ Saved to: {output_path}")
+
+    if assets["intermediate"]:
+        log("\nIntermediate files kept:")
+        for path in assets["intermediate"]:
+            log(f"  - {path}")
+
+    return {
+        "file": file_path,
+        "sheet": sheet_name,
+        "output": output_path,
+        "shapes": assets["shapes"],
+        "ai": use_ai,
+        "local": assets["local_mermaid"] is not None,
+        "incremental": assets["incremental"],
+        "mermaid": mermaid_code,
+        "tokens": assets["tokens"],
+        "intermediate": assets["intermediate"]
+    }
+
+
+def prepare_assets(file_path, sheet_name, parse_cache=None, compact=False, intermediate_dir=None,
+                   image_format=asset_generator.DEFAULT_IMAGE_FORMAT,
+                   max_edge=asset_generator.DEFAULT_MAX_EDGE, render=asset_generator.DEFAULT_RENDER,
+                   dpi=headless_renderer.DEFAULT_DPI, local_graph=True,
+                   partition_nodes=partitioner.DEFAULT_PARTITION_NODES,
+                   prompt_format=ai_connector.DEFAULT_PROMPT_FORMAT,
+                   token_budget=DEFAULT_TOKEN_BUDGET, state_cache=None, refresh=False,
+                   log=_quiet):
+    """
+    ステップ1・2（Excel解析と資材生成）を実行する。CPU負荷の高い処理はここにまとまっている。
+
+    コネクタの接続情報からフローグラフを組み立て、すべてのつながりが確定した場合は
+    ローカルでMermaidコードを生成し、IDアンカー画像は作らない。
+    それ以外の場合、IDアンカー画像はフローチャートの範囲に切り抜き・縮小したうえで、
+    アップロード用にここで1回だけエンコードする。
+    ノード数が partition_nodes を超える場合は領域に分割し、領域ごとにJSON指示書の一部と
+    その範囲に切り抜いた画像を作る。
+    state_cache に前回の変換結果があれば差分を取り、変更がテキストだけならローカルで書き換え、
+    配置・つながりの変更があればその近傍のノードだけを領域として切り抜く（base に再利用する部分を返す）。
+
+    Args:
+        file_path (str): Excelファイルのパス
+        sheet_name (str): シート名
+        parse_cache (DiskCache): 解析結果のキャッシュ（Noneの場合は使わない）
+        compact (bool): Trueの場合、解析結果を ShapeTable で受け取る
+        intermediate_dir (str): 中間ファイルの保存先（Noneの場合はファイルに書き出さない）
+        image_format (str): アップロードする画像の形式
+        max_edge (int): アップロードする画像の長辺の最大ピクセル数
+        render (str): 元画像の取得方法
+        dpi (int): headless の場合の解像度
+        local_graph (bool): Falseの場合、フローグラフを組み立てずに常にAI用の資材を生成する
+        partition_nodes (int): 1リクエストあたりのノード数の上限（0の場合は分割しない）
+        prompt_format (str): プロンプト中の図形データの形式
+        token_budget (int): 1リクエストあたりの推定トークン数の上限（超える場合は領域を細かくする）
+        state_cache (DiskCache): 前回の変換結果の保存先（Noneの場合は増分変換しない）
+        refresh (bool): Trueの場合、前回の変換結果を読まずに全体を変換する（スナップショットは作る）
+        log (callable): 進捗の出力先
+
+    Returns:
+        dict: {json_data, image_bytes, partitions, prompt_format, tokens, shapes, graph, local_mermaid,
+            snapshot, source, state_settings, incremental, base, intermediate}
+            （tokens はAIへのリクエストの推定トークン数 {prompt, image, total}）
+            （ローカルで生成できた場合、image_bytes は None、local_mermaid はMermaidコード。
+            分割した場合、image_bytes は None、partitions は領域 {json_data, image_bytes, owned} のリスト。
+            増分変換の場合、snapshot は保存するスナップショット、source と state_settings は
+            incremental.save_state に渡す生成元と設定、incremental は変換の方法、
+            base は partitions とつなぎ合わせる前回の結果 {mermaid, owned}）
+    """
+    # ステップ1: Excel解析
+    log("\n[Step 1/4] Parsing Excel shapes...")
+    with profiler.span("parse") as span:
+        hits = parse_cache.hits if parse_cache is not None else 0
+        mapped_containers = excel_parser.parse_excel_shapes(
+            file_path, sheet_name, compact=compact, cache=parse_cache
+        )
+        span["containers"] = len(mapped_containers)
+        if parse_cache is not None:
+            span["cache_hit"] = parse_cache.hits > hits
+    log(f"✓ Parsed {len(mapped_containers)} shapes")
+    if parse_cache is not None:
+        stats = parse_cache.stats()
+        log(f"  Parse cache: {stats['hits']} hit(s), {stats['misses']} miss(es)")
+
+    # コネクタの接続情報からフローグラフを組み立てる
+    graph = None
+    local_mermaid = None
+    if local_graph:
+        with profiler.span("flow_graph") as span:
+            graph = flow_graph.build_sheet_graph(file_path, sheet_name, mapped_containers, cache=parse_cache)
+            snapped = sum(1 for edge in graph["edges"] if edge["confidence"] < 1.0)
+            span.update(nodes=len(graph["nodes"]), connectors=len(graph["edges"]) + len(graph["unbound"]),
+                        snapped=snapped, unbound=len(graph["unbound"]), resolved=flow_graph.is_resolved(graph))
+            if span["resolved"]:
+                local_mermaid = flow_graph.to_mermaid(graph)
+        if local_mermaid is not None:
+            log(f"✓ All {len(graph['edges'])} connector(s) are attached to shapes ({snapped} snapped)")
+        else:
+            low = sum(1 for edge in graph["edges"] if edge["confidence"] < flow_graph.MIN_CONFIDENCE)
+            log(f"  Connectors: {len(graph['edges']) - snapped} bound, {snapped} snapped "
+                f"({low} low confidence), {len(graph['unbound'])} unbound, "
+                f"{len(graph['labels'])} unassigned label(s)")
+
+    # 前回の変換結果との差分を取る（結果に影響する設定が前回と同じ場合だけ再利用する）
+    snapshot = None
+    plan = None
+    source = "local" if local_mermaid is not None else "ai"
+    state_settings = {"prompt_format": prompt_format, "model": ai_connector.model_name()}
+    if state_cache is not None:
+        with profiler.span("incremental") as span:
+            sheet_graph = graph if graph is not None else flow_graph.build_sheet_graph(
+                file_path, sheet_name, mapped_containers, cache=parse_cache
+            )
+            snapshot = incremental.take_snapshot(file_path, sheet_name, sheet_graph, cache=parse_cache)
+            if local_mermaid is None:
+                previous = None if refresh else incremental.load_state(state_cache, file_path, sheet_name)
+                plan = incremental.plan_update(previous, snapshot, state_settings, allow_local=local_graph)
+                span.update(mode=plan["mode"], changed=len(plan["changed"]))
+        if plan is not None:
+            if plan["mode"] in ("same", "text"):
+                local_mermaid = plan["mermaid"]
+                source = plan["source"]
+                log(f"✓ Reused the previous conversion ({plan['mode']}); AI skipped")
+            elif plan["mode"] == "partial":
+                log(f"✓ Incremental update: {len(plan['changed'])} of {len(snapshot['nodes'])} node(s) "
+                    f"changed or adjacent to a change")
+
+    # ステップ2: 資材生成
+    log("\n[Step 2/4] Generating AI input assets...")
+    image_bytes = None
+    partitions = None
+    tokens = None
+    if local_mermaid is not None:
+        # AIを呼び出さないため、画像は作らない
+        with profiler.span("assets.json") as span:
+            json_data = asset_generator.build_json_instructions(mapped_containers)
+            span["nodes"] = len(json_data)
+        log(f"✓ Generated JSON instructions ({len(json_data)} nodes); anchor image not needed")
+    else:
+        json_data, anchor_image, transform = asset_generator.build_assets(
+            mapped_containers, file_path, sheet_name, render=render, dpi=dpi, log=log
+        )
+        log(f"✓ Generated JSON instructions ({len(json_data)} nodes)")
+        if plan is not None and plan["mode"] == "partial":
+            # 変更の近傍だけを切り抜き、担当するノードは変更のあったものに限る
+            changed = set(plan["changed"])
+            region = partitioner.region_around(json_data, changed)
+            requests = _plan_requests(
+                region["nodes"], anchor_image, transform, image_format, max_edge, partition_nodes,
+                prompt_format, token_budget
+            )
+            for request in requests:
+                request["owned"] = [node_id for node_id in request["owned"] if node_id in changed]
+            requests = [request for request in requests if request["owned"]]
+        else:
+            requests = _plan_requests(
+                json_data, anchor_image, transform, image_format, max_edge, partition_nodes,
+                prompt_format, token_budget
+            )
+        tokens = {key: sum(request["tokens"][key] for request in requests)
+                  for key in ("prompt", "image", "total")}
+        if len(requests) > 1 or (plan is not None and plan["mode"] == "partial"):
+            partitions = requests
+            log(f"✓ Split into {len(partitions)} partition(s) of up to "
+                f"{max(len(partition['json_data']) for partition in partitions)} nodes "
+                f"({sum(len(partition['image_bytes']) for partition in partitions)} bytes as {image_format})")
+        else:
+            image_bytes = requests[0]["image_bytes"]
+            log(f"✓ Generated anchor image ({anchor_image.size[0]}x{anchor_image.size[1]}, "
+                f"{len(image_bytes)} bytes as {image_format})")
+        log(f"  Estimated request size: {tokens['total']} tokens "
+            f"(prompt {tokens['prompt']}, image {tokens['image']}, {prompt_format} format)")
+
+    intermediate = []
+    if intermediate_dir is not None:
+        os.makedirs(intermediate_dir, exist_ok=True)
+        json_path = os.path.join(intermediate_dir, "instructions.json")
+        asset_generator.save_json_instructions(json_data, json_path, log=log)
+        intermediate.append(json_path)
+        if image_bytes is not None:
+            image_path = os.path.join(
+                intermediate_dir, f"anchor_image.{asset_generator.IMAGE_EXTENSIONS[image_format]}"
+            )
+            # アップロードするデータをそのまま保存する（再エンコードしない）
+            with open(image_path, 'wb') as f:
+                f.write(image_bytes)
+            intermediate.append(image_path)
+        for number, partition in enumerate(partitions or [], 1):
+            part_json_path = os.path.join(intermediate_dir, f"instructions_part{number:02d}.json")
+            asset_generator.save_json_instructions(partition["json_data"], part_json_path, log=log)
+            part_image_path = os.path.join(
+                intermediate_dir,
+                f"anchor_image_part{number:02d}.{asset_generator.IMAGE_EXTENSIONS[image_format]}"
+            )
+            with open(part_image_path, 'wb') as f:
+                f.write(partition["image_bytes"])
+            intermediate.extend([part_json_path, part_image_path])
+        if graph is not None:
+            # エッジごとの信頼度を確認できるよう、フローグラフも書き出す
+            graph_path = os.path.join(intermediate_dir, "graph.json")
+            with open(graph_path, 'w', encoding='utf-8') as f:
+                json.dump(graph, f, ensure_ascii=False, indent=2)
+            intermediate.append(graph_path)
+
+    return {
+        "json_data": json_data,
+        "image_bytes": image_bytes,
+        "partitions": partitions,
+        "prompt_format": prompt_format,
+        "tokens": tokens,
+        "shapes": len(mapped_containers),
+        "graph": graph,
+        "local_mermaid": local_mermaid,
+        "snapshot": snapshot,
+        "source": source,
+        "state_settings": state_settings,
+        "incremental": plan["mode"] if plan is not None else None,
+        "base": plan["base"] if plan is not None else None,
+        "intermediate": intermediate
+    }
+
+
+def _plan_requests(json_data, anchor_image, transform, image_format, max_edge, partition_nodes,
+                   prompt_format, token_budget):
+    """
+    AIへのリクエスト（領域ごとのJSON指示書と切り抜いた画像）を作り、推定トークン数を見積もる。
+
+    推定トークン数が token_budget を超えるリクエストがあれば、領域を半分の大きさにして作り直す。
+    分割しない指定（partition_nodes=0）の場合や、1ノードでも超える場合は ValueError を送出する。
+
+    Returns:
+        list: リクエスト {json_data, image_bytes, owned, tokens} のリスト
+    """
+    max_nodes = partition_nodes
+    while True:
+        requests = []
+        for region in partitioner.partition_nodes(json_data, max_nodes):
+            # 領域ごとに切り抜くため、縮小による解像度の低下も領域の大きさで決まる
+            with profiler.span("assets.encode", format=image_format, nodes=len(region["nodes"])) as span:
+                region_bytes = asset_generator.encode_anchor_image(
+                    anchor_image, region["nodes"], image_format=image_format, max_edge=max_edge,
+                    transform=transform
+                )
+                span["image_bytes"] = len(region_bytes)
+            requests.append({
+                "json_data": region["nodes"],
+                "image_bytes": region_bytes,
+                "owned": region["owned"],
+                "tokens": ai_connector.estimate_request_tokens(region["nodes"], region_bytes, prompt_format)
+            })
+
+        largest = max(request["tokens"]["total"] for request in requests)
+        if not token_budget or largest <= token_budget:
+            return requests
+
+        largest_region = max(len(request["owned"]) for request in requests)
+        if not partition_nodes or largest_region <= 1:
+            raise ValueError(
+                f"Estimated request size {largest} tokens exceeds the token budget {token_budget}"
+            )
+        max_nodes = max(1, largest_region // 2)
+
+
+def write_markdown(output_path, mermaid_code):
+    """
+    MermaidコードをMarkdownファイルに保存する
+
+    Args:
+        output_path (str): 出力パス
+        mermaid_code (str): Mermaidコード
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write("# Flowchart (Generated from Excel)\n\n")
+        f.write("```mermaid\n")
+        f.write(mermaid_code)
+        f.write("\n```\n")
+
+
+def generate_dummy_mermaid(json_data):
+    """
+    APIキーがない場合のダミーMermaidコード生成
+
+    Args:
+        json_data (list): JSON指示書データ
+
+    Returns:
+        str: ダミーのMermaidコード
+    """
+    lines = ["graph TD"]
+
+    for node in json_data:
+        node_id = node["id"]
+        text = node["text"]
+
+        # シンプルなノード定義（四角形のみ）
+        lines.append(f'    {node_id}["{text}"]')
+
+    # 順番に接続（ダミー）
+    for i in range(len(json_data) - 1):
+        lines.append(f'    {json_data[i]["id"]} --> {json_data[i+1]["id"]}')
+
+    return '\n'.join(lines)
@@ -0,0 +1,331 @@
+"""
+プロファイリングモジュール
+変換の各段階（解析・資材生成・AI連携など）の処理時間・CPU時間・ピークメモリと、シェイプ数・
+リクエストのバイト数・トークン数などの件数を記録する。
+
+記録はスパン（名前の付いた区間）の単位で行い、サマリーと Chrome trace-event 形式の
+トレース（chrome://tracing や Perfetto で表示できる）を1つのJSONに書き出す。
+有効なプロファイラがない場合、span() は何も記録しないため、各モジュールは常に呼び出してよい。
+"""
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+
+# 書き出すJSONの形式が変わったら更新する
+PROFILE_VERSION = '1'
+
+_active = None
+
+
+class Profiler:
+    """
+    スパンの記録先。
+
+    ピークメモリは tracemalloc で計測するため、プロセス全体の値であり、
+    並行して実行されているスパンの割り当ても含む。
+    CPU時間はスパンを実行したスレッドのもの（イベントループ上のスパンは他のタスクの分も含む）。
+    """
+
+    def __init__(self, trace_memory=True):
+        """
+        Args:
+            trace_memory (bool): Trueの場合、tracemalloc でピークメモリを計測する（処理は遅くなる）
+        """
+        self.trace_memory = trace_memory
+        self.pid = os.getpid()
+        self.records = []
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+        # 開いているスパン → [開始時の割り当て量, それ以降のピーク]
+        self._open = {}
+        self._started_tracing = False
+
+    def start(self):
+        """計測を始める（tracemalloc が止まっていれば開始する）"""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        """計測を終える（start で開始した tracemalloc を止める）"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextlib.contextmanager
+    def span(self, name, category="stage", **args):
+        """
+        区間を計測する。with 文の値は記録する引数の辞書で、区間の中で件数などを追加できる。
+
+        Args:
+            name (str): スパンの名前（"parse.xml" のように段階をドットで区切る）
+            category (str): Chrome trace のカテゴリ
+            **args: 記録する引数（数値はサマリーで合計する）
+        """
+        key = next(self._sequence)
+        self._enter(key)
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            wall = time.perf_counter() - started
+            cpu = time.thread_time() - cpu_started
+            memory = self._exit(key)
+            thread = threading.current_thread()
+            record = {
+                "name": name,
+                "category": category,
+                "start": started,
+                "wall": wall,
+                "cpu": cpu,
+                "memory": memory,
+                "pid": os.getpid(),
+                "tid": thread.native_id,
+                "thread": thread.name,
+                "async": _in_event_loop(),
+                "args": args
+            }
+            with self._lock:
+                self.records.append(record)
+
+    def extend(self, records):
+        """他のプロセス（バッチ変換のワーカー）で記録したスパンを加える"""
+        with self._lock:
+            self.records.extend(records)
+
+    def summary(self):
+        """
+        スパンを名前ごとに集計する。
+
+        Returns:
+            dict: {wall_seconds, processes, stages: {名前: {category, calls, wall_seconds, cpu_seconds,
+                memory_peak_bytes, counts}}}（counts は数値の引数の合計）
+        """
+        records = sorted(self.records, key=lambda record: record["start"])
+        stages = {}
+        for record in records:
+            entry = stages.setdefault(record["name"], {
+                "category": record["category"],
+                "calls": 0,
+                "wall_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "memory_peak_bytes": None,
+                "counts": {}
+            })
+            entry["calls"] += 1
+            entry["wall_seconds"] += record["wall"]
+            entry["cpu_seconds"] += record["cpu"]
+            if record["memory"] is not None:
+                entry["memory_peak_bytes"] = max(entry["memory_peak_bytes"] or 0, record["memory"])
+            for key, value in record["args"].items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry["counts"][key] = entry["counts"].get(key, 0) + value
+
+        for entry in stages.values():
+            entry["wall_seconds"] = round(entry["wall_seconds"], 6)
+            entry["cpu_seconds"] = round(entry["cpu_seconds"], 6)
+
+        return {
+            "wall_seconds": round(max((record["start"] + record["wall"] for record in records), default=0.0)
+                                  - min((record["start"] for record in records), default=0.0), 6),
+            "processes": len({record["pid"] for record in records}),
+            "stages": stages
+        }
+
+    def trace_events(self):
+        """
+        Chrome trace-event 形式のイベントを返す。
+
+        スレッド上のスパンは完了イベント（ph: X）、イベントループ上のスパンは並行するタスクが
+        入れ子にならないため非同期イベント（ph: b / e）にする。時刻は最初のスパンからのマイクロ秒。
+
+        Returns:
+            list: traceEvents のリスト
+        """
+        records = sorted(self.records, key=lambda record: record["start"])
+        origin = records[0]["start"] if records else 0.0
+        events = []
+        threads = {}
+        for number, record in enumerate(records, 1):
+            threads[(record["pid"], record["tid"])] = record["thread"]
+            args = dict(record["args"], cpu_ms=round(record["cpu"] * 1000, 3))
+            if record["memory"] is not None:
+                args["memory_peak_bytes"] = record["memory"]
+            common = {"name": record["name"], "cat": record["category"],
+                      "pid": record["pid"], "tid": record["tid"]}
+            start = round((record["start"] - origin) * 1e6, 3)
+            end = round((record["start"] + record["wall"] - origin) * 1e6, 3)
+            if record["async"]:
+                events.append(dict(common, ph="b", id=number, ts=start, args=args))
+                events.append(dict(common, ph="e", id=number, ts=end))
+            else:
+                events.append(dict(common, ph="X", ts=start, dur=round(end - start, 3), args=args))
+
+        for pid in sorted({record["pid"] for record in records}):
+            name = "excel-mermaid" if pid == self.pid else f"worker {pid}"
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": name}})
+        for (pid, tid), name in sorted(threads.items()):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        return events
+
+    def write(self, path, metadata=None):
+        """
+        サマリーとトレースを1つのJSONに書き出す（トレースビューアは summary を無視する）
+
+        Args:
+            path (str): 出力先
+            metadata (dict): 記録する実行条件（コマンドライン引数など）
+        """
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        data = {
+            "version": PROFILE_VERSION,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "metadata": metadata or {},
+            "summary": self.summary(),
+            "traceEvents": self.trace_events(),
+            "displayTimeUnit": "ms"
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+    def _enter(self, key):
+        if not tracemalloc.is_tracing():
+            return
+        with self._lock:
+            current = self._sample()
+            self._open[key] = [current, current]
+
+    def _exit(self, key):
+        if not tracemalloc.is_tracing():
+            return None
+        with self._lock:
+            self._sample()
+            entry = self._open.pop(key, None)
+        if entry is None:
+            return None
+        return max(0, entry[1] - entry[0])
+
+    def _sample(self):
+        """
+        前回の計測からのピークを開いているスパンすべてに反映し、ピークをリセットする。
+
+        スパンの開始・終了のたびに呼ぶため、前回の計測以降は開いているスパンの顔ぶれが変わらず、
+        その間のピークは開いているすべてのスパンの区間に含まれる。
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        for entry in self._open.values():
+            entry[1] = max(entry[1], peak)
+        tracemalloc.reset_peak()
+        return current
+
+
+class _NullSpan:
+    """プロファイラが無効な場合のスパン（引数の辞書を返すだけで何も記録しない）"""
+
+    __slots__ = ("args",)
+
+    def __init__(self, args):
+        self.args = args
+
+    def __enter__(self):
+        return self.args
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+def current():
+    """
+    有効なプロファイラを返す。
+
+    fork したプロセスが親から引き継いだプロファイラは、記録しても親に届かないため返さない。
+
+    Returns:
+        Profiler: 有効なプロファイラ（なければ None）
+    """
+    profiler = _active
+    if profiler is None or profiler.pid != os.getpid():
+        return None
+    return profiler
+
+
+@contextlib.contextmanager
+def enabled(profiler):
+    """
+    with 文の間、profiler をプロセス全体で有効にする（スレッドプールのスレッドからも記録される）
+
+    Args:
+        profiler (Profiler): 有効にするプロファイラ（Noneの場合は何もしない）
+    """
+    global _active
+    if profiler is None:
+        yield None
+        return
+    previous = _active
+    _active = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active = previous
+
+
+def span(name, category="stage", **args):
+    """
+    有効なプロファイラで区間を計測する（Profiler.span を参照）。プロファイラがなければ何もしない。
+
+    Returns:
+        contextmanager: with 文の値は記録する引数の辞書
+    """
+    profiler = current()
+    if profiler is None:
+        return _NullSpan(args)
+    return profiler.span(name, category, **args)
+
+
+def summary_lines(summary):
+    """
+    サマリーを表示用の行にする
+
+    Args:
+        summary (dict): Profiler.summary の結果
+
+    Returns:
+        list: 段階ごとの行（処理時間の合計の降順）
+    """
+    header = f"  {'stage':<24} {'calls':>6} {'wall [s]':>10} {'cpu [s]':>10} {'peak [MiB]':>11}"
+    lines = [header]
+    stages = sorted(summary["stages"].items(), key=lambda item: item[1]["wall_seconds"], reverse=True)
+    for name, entry in stages:
+        peak = entry["memory_peak_bytes"]
+        peak_text = f"{peak / 1024 / 1024:.2f}" if peak is not None else "-"
+        lines.append(f"  {name:<24} {entry['calls']:>6} {entry['wall_seconds']:>10.3f} "
+                     f"{entry['cpu_seconds']:>10.3f} {peak_text:>11}")
+    return lines
+
+
+def _in_event_loop():
+    """このスレッドでイベントループが実行中か"""
+    # 起動を速くするため asyncio は読み込まない（読み込まれていなければイベントループもない）
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
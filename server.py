@@ -0,0 +1,593 @@
+"""
+変換サーバーモジュール
+常駐プロセスでローカルのHTTP/JSON APIを提供し、Excelファイルのパスまたはアップロードされた
+ワークブックを1シートずつ変換する。
+
+モジュールの読み込み・フォント・HTTPセッション・解析結果とAI応答のキャッシュをプロセス内に
+保持したまま、ジョブをワーカースレッドで順に処理するため、起動のコストは最初の1回だけになる。
+待ち行列が上限に達した場合は 429 を返し、呼び出し側に再送を促す（バックプレッシャー）。
+
+エンドポイント:
+    POST /convert     変換ジョブを登録する（wait=true の場合は結果を待って返す）
+    GET  /jobs/<id>   ジョブの状態と結果を返す
+    GET  /health      待ち行列・ワーカー・キャッシュの状態を返す
+"""
+import json
+import math
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import ai_connector
+import asset_generator
+import headless_renderer
+import partitioner
+import pipeline
+import synthetic_workbook
+from disk_cache import DiskCache
+from settings import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_QUEUE_SIZE, DEFAULT_TOKEN_BUDGET
+
+
+# wait=true の場合に結果を待つ最大時間 [秒]（超えた場合は 202 でジョブIDを返す）
+DEFAULT_WAIT_TIMEOUT = 300
+
+# リクエストで指定できる待ち時間の上限 [秒]
+MAX_WAIT_TIMEOUT = 3600
+
+# アップロードできるワークブックの最大サイズ [byte]
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+# JSONのリクエストの最大サイズ [byte]（パスと変換の設定だけのため小さくてよい）
+MAX_JSON_BYTES = 1024 * 1024
+
+# 結果を保持する終了済みジョブの数（古いものから削除する）
+MAX_FINISHED_JOBS = 1000
+
+# 429 で返す再送までの待ち時間 [秒]
+RETRY_AFTER = 1
+
+# リクエストで指定できる変換の設定（main.py のオプション名と同じ）と、その型
+OPTION_TYPES = {
+    "render": str,
+    "dpi": int,
+    "image_format": str,
+    "image_max_edge": int,
+    "force_ai": bool,
+    "partition_nodes": int,
+    "prompt_format": str,
+    "token_budget": int,
+    "refresh": bool,
+}
+
+DEFAULT_OPTIONS = {
+    "render": "headless",
+    "dpi": headless_renderer.DEFAULT_DPI,
+    "image_format": asset_generator.DEFAULT_IMAGE_FORMAT,
+    "image_max_edge": asset_generator.DEFAULT_MAX_EDGE,
+    "force_ai": False,
+    "partition_nodes": partitioner.DEFAULT_PARTITION_NODES,
+    "prompt_format": ai_connector.DEFAULT_PROMPT_FORMAT,
+    "token_budget": DEFAULT_TOKEN_BUDGET,
+    "refresh": False,
+}
+
+_CHOICES = {
+    "render": asset_generator.RENDER_MODES,
+    "image_format": asset_generator.IMAGE_FORMATS,
+    "prompt_format": ai_connector.PROMPT_FORMATS,
+}
+
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off", "")
+
+
+class ConversionService:
+    """
+    変換ジョブの待ち行列とワーカースレッド。
+
+    ワーカーはプロセスの終了まで同じスレッドで動き続けるため、スレッドごとのHTTPセッション
+    （ai_connector）も使い回される。ジョブは辞書で管理し、状態は queued → running → done / error と変わる。
+    """
+
+    def __init__(self, workers=None, queue_size=DEFAULT_QUEUE_SIZE, cache_dir=None, reuse_previous=True,
+                 defaults=None):
+        """
+        Args:
+            workers (int): ワーカースレッド数（Noneの場合はCPU数）
+            queue_size (int): 待ち行列の上限
+            cache_dir (str): 解析結果・AI応答・前回の変換結果の保存先（Noneの場合は使わない）
+            reuse_previous (bool): Trueの場合、パスで指定されたファイルは前回の変換結果から変更部分だけを変換する
+            defaults (dict): リクエストで指定されなかった変換の設定（OPTION_TYPES のキー）
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.defaults = dict(DEFAULT_OPTIONS, **(defaults or {}))
+        _validate_options(self.defaults)
+        if cache_dir:
+            self.parse_cache = DiskCache(os.path.join(cache_dir, "parse"))
+            self.ai_cache = ai_connector.ResponseCache(os.path.join(cache_dir, "ai"))
+            self.state_cache = DiskCache(os.path.join(cache_dir, "state")) if reuse_previous else None
+        else:
+            self.parse_cache = self.ai_cache = self.state_cache = None
+
+        self.upload_dir = tempfile.mkdtemp(prefix="excel-mermaid-")
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = OrderedDict()
+        self._done = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        """ワーカースレッドを起動する"""
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"convert-{number + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self):
+        """実行中のジョブの終了を待ってワーカーを止め、アップロードされたファイルを削除する"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+    def warm_up(self):
+        """
+        小さな合成ワークブックを解析・描画・エンコードし、フォントなどの読み込みを済ませておく
+
+        AIは呼び出さず、キャッシュにも書き込まない。既定の描画方法が headless の場合だけ行う
+        （screen は画面のスクリーンショットを撮ってしまうため）。
+        """
+        if self.defaults["render"] != "headless":
+            return
+        path = os.path.join(self.upload_dir, "warm_up.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.complex_chart_shapes())])
+        try:
+            pipeline.prepare_assets(
+                path, "Sheet1", compact=True, image_format=self.defaults["image_format"],
+                max_edge=self.defaults["image_max_edge"], render="headless", dpi=self.defaults["dpi"],
+                local_graph=False, prompt_format=self.defaults["prompt_format"], token_budget=0
+            )
+        finally:
+            os.remove(path)
+
+    def submit(self, file_path, sheet_name, options=None, upload=False, name=None):
+        """
+        変換ジョブを待ち行列に登録する
+
+        Args:
+            file_path (str): Excelファイルのパス
+            sheet_name (str): シート名
+            options (dict): 変換の設定（OPTION_TYPES のキー。指定のないものは defaults を使う）
+            upload (bool): Trueの場合、file_path はアップロードされた一時ファイル（変換後に削除する）
+            name (str): 結果に記録するファイル名（アップロードの場合）
+
+        Returns:
+            dict: 登録したジョブの状態（job を参照）
+
+        Raises:
+            ValueError: 設定が不正な場合
+            queue.Full: 待ち行列が上限に達している場合
+        """
+        settings = dict(self.defaults, **(options or {}))
+        _validate_options(settings)
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "file": name or file_path,
+            "sheet": sheet_name,
+            "path": file_path,
+            "upload": upload,
+            "options": settings,
+            "created": time.perf_counter(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._done[job["id"]] = threading.Event()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job["id"]]
+                del self._done[job["id"]]
+            raise
+        return self.job(job["id"])
+
+    def wait(self, job_id, timeout=DEFAULT_WAIT_TIMEOUT):
+        """
+        ジョブの終了を待つ
+
+        Returns:
+            dict: ジョブの状態（timeout 以内に終わらなければ queued / running のまま）
+        """
+        done = self._done.get(job_id)
+        if done is not None:
+            done.wait(timeout)
+        return self.job(job_id)
+
+    def job(self, job_id):
+        """
+        ジョブの状態を返す
+
+        Returns:
+            dict: {job, status, file, sheet, queued_seconds, seconds, result, error}
+                （result は pipeline.convert_sheet の結果。見つからない場合は None）
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            now = time.perf_counter()
+            started = job["started"] if job["started"] is not None else now
+            finished = job["finished"] if job["finished"] is not None else now
+            return {
+                "job": job["id"],
+                "status": job["status"],
+                "file": job["file"],
+                "sheet": job["sheet"],
+                "queued_seconds": round(started - job["created"], 6),
+                "seconds": round(finished - started, 6) if job["started"] is not None else None,
+                "result": job["result"],
+                "error": job["error"]
+            }
+
+    def status(self):
+        """待ち行列・ワーカー・キャッシュの状態を返す"""
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job["status"] == "running")
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "running": running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "ai_cache": self.ai_cache.stats() if self.ai_cache is not None else None
+        }
+
+    def _work(self):
+        """ワーカー: 待ち行列からジョブを取り出して変換する"""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                job["status"] = "running"
+                job["started"] = time.perf_counter()
+                done = self._done[job["id"]]
+            try:
+                result = self._convert(job)
+                status, error = "done", None
+            except Exception as e:
+                result, status, error = None, "error", f"{type(e).__name__}: {e}"
+            finally:
+                if job["upload"]:
+                    try:
+                        os.remove(job["path"])
+                    except OSError:
+                        pass
+
+            with self._lock:
+                job.update(status=status, result=result, error=error, finished=time.perf_counter())
+                if status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._forget_finished()
+            done.set()
+
+    def _convert(self, job):
+        """1つのジョブを変換する（Markdownファイルは書き出さず、結果にMermaidコードを含める）"""
+        options = job["options"]
+        result = pipeline.convert_sheet(
+            job["path"],
+            job["sheet"],
+            parse_cache=self.parse_cache,
+            compact=True,
+            ai_cache=self.ai_cache,
+            refresh=options["refresh"],
+            image_format=options["image_format"],
+            max_edge=options["image_max_edge"],
+            render=options["render"],
+            dpi=options["dpi"],
+            local_graph=not options["force_ai"],
+            partition_nodes=options["partition_nodes"],
+            prompt_format=options["prompt_format"],
+            token_budget=options["token_budget"],
+            # アップロードは毎回別の一時ファイルになるため、前回の変換結果はパスで引けない
+            state_cache=None if job["upload"] else self.state_cache
+        )
+        result["file"] = job["file"]
+        return result
+
+    def _forget_finished(self):
+        """終了済みのジョブが MAX_FINISHED_JOBS を超えたら、古いものから削除する（ロック内で呼ぶ）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished"] is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            del self._done[job_id]
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """ConversionService をHTTPで公開するサーバー（接続ごとにスレッドで応答する）"""
+
+    daemon_threads = True
+
+    def __init__(self, service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        super().__init__((host, port), _Handler)
+        self.service = service
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    # Keep-Aliveで接続を使い回せるようにする
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に書き込むため、Nagleアルゴリズムで本文の送信が遅れないようにする
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path == "/health":
+            self._send_json(200, service.status())
+        elif url.path.startswith("/jobs/"):
+            job = service.job(url.path[len("/jobs/"):])
+            if job is None:
+                self._send_json(404, {"error": "job not found"})
+            else:
+                self._send_json(200, job)
+        else:
+            self._send_json(404, {"error": f"unknown path: {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/convert":
+            self._discard_body()
+            self._send_json(404, {"error": f"unknown path: {url.path}"})
+            return
+
+        try:
+            request = self._read_request(url)
+        except _RequestError as e:
+            self._send_json(e.status, {"error": str(e)})
+            return
+
+        service = self.server.service
+        try:
+            job = service.submit(request["path"], request["sheet"], request["options"],
+                                 upload=request["upload"], name=request["name"])
+        except ValueError as e:
+            self._remove_upload(request)
+            self._send_json(400, {"error": str(e)})
+            return
+        except queue.Full:
+            self._remove_upload(request)
+            self._send_json(429, {"error": "queue is full", "queued": service.status()["queued"]},
+                            {"Retry-After": str(RETRY_AFTER)})
+            return
+
+        if request["wait"]:
+            job = service.wait(job["job"], request["timeout"])
+        if job["status"] == "done":
+            self._send_json(200, job)
+        elif job["status"] == "error":
+            self._send_json(422, job)
+        else:
+            self._send_json(202, job, {"Location": f"/jobs/{job['job']}"})
+
+    def _read_request(self, url):
+        """
+        リクエストを読み込む。
+
+        Content-Type が application/json の場合は {path, sheet, wait, timeout, 変換の設定} のJSON、
+        それ以外の場合は本文をワークブックとして受け取り、sheet などはクエリで指定する。
+        """
+        query = {key: values[-1] for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+        length = self._content_length()
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip()
+
+        if content_type == "application/json":
+            if length > MAX_JSON_BYTES:
+                self._discard_body(length)
+                raise _RequestError(413, f"JSON request exceeds {MAX_JSON_BYTES} bytes")
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as e:
+                raise _RequestError(400, f"invalid JSON: {e}")
+            if not isinstance(body, dict):
+                raise _RequestError(400, "request body must be a JSON object")
+            params = dict(query, **body)
+            path = params.get("path")
+            if not path:
+                raise _RequestError(400, "path is required (or upload the workbook as the request body)")
+            if not os.path.isfile(path):
+                raise _RequestError(404, f"file not found: {path}")
+            upload, name = False, None
+        else:
+            if length > MAX_UPLOAD_BYTES:
+                self._discard_body(length)
+                raise _RequestError(413, f"workbook exceeds {MAX_UPLOAD_BYTES} bytes")
+            if length == 0:
+                raise _RequestError(400, "request body is empty (send the workbook or a JSON request)")
+            params = query
+            path = os.path.join(self.server.service.upload_dir, f"{uuid.uuid4().hex}.xlsx")
+            with open(path, 'wb') as f:
+                f.write(self.rfile.read(length))
+            upload, name = True, params.get("name") or "upload.xlsx"
+
+        try:
+            return _parse_params(params, path, upload, name)
+        except _RequestError:
+            if upload:
+                os.remove(path)
+            raise
+
+    def _remove_upload(self, request):
+        if request["upload"]:
+            try:
+                os.remove(request["path"])
+            except OSError:
+                pass
+
+    def _content_length(self):
+        """
+        Content-Length を読み込む。
+
+        0以上の整数でなければ、本文を読む前に 400 にする（負の値で rfile.read が接続の終わりまで
+        待ち続けないように）。本文の終わりがわからないため、応答した後は接続を閉じる。
+        """
+        value = (self.headers.get("Content-Length") or "0").strip()
+        if not (value.isascii() and value.isdigit()):
+            self.close_connection = True
+            raise _RequestError(400, f"invalid Content-Length: {value!r}")
+        return int(value)
+
+    def _discard_body(self, length=None):
+        """読まなかった本文を読み捨てる（Keep-Aliveの接続で次のリクエストと混ざらないように）"""
+        if length is None:
+            try:
+                length = self._content_length()
+            except _RequestError:
+                return
+        while length > 0:
+            chunk = self.rfile.read(min(length, 1024 * 1024))
+            if not chunk:
+                break
+            length -= len(chunk)
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _RequestError(Exception):
+    """HTTPのステータスコード付きのリクエストの誤り"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, queue_size=DEFAULT_QUEUE_SIZE, cache_dir=None,
+          reuse_previous=True, defaults=None, log=print):
+    """
+    変換サーバーを起動し、割り込み（Ctrl+C）まで応答する
+
+    Args:
+        host (str): 待ち受けるアドレス
+        port (int): 待ち受けるポート
+        その他の引数は ConversionService と同じ
+        log (callable): 進捗の出力先
+    """
+    service = ConversionService(workers, queue_size, cache_dir, reuse_previous, defaults)
+    service.start()
+    log("Warming up...")
+    service.warm_up()
+    server = ConversionServer(service, host, port)
+    log(f"✓ Listening on {server.url} ({service.workers} worker(s), queue size {queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("\nShutting down...")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def _parse_params(params, path, upload, name):
+    """リクエストのパラメータ（クエリ・JSON）から変換の指定を作る"""
+    if not params.get("sheet"):
+        raise _RequestError(400, "sheet is required")
+    try:
+        options = {key: _parse_option(key, params[key]) for key in OPTION_TYPES if key in params}
+        wait = _parse_option("wait", params.get("wait", True), bool)
+        timeout = _parse_timeout(params.get("timeout", DEFAULT_WAIT_TIMEOUT))
+    except (TypeError, ValueError) as e:
+        raise _RequestError(400, str(e))
+    return {
+        "path": path,
+        "sheet": params["sheet"],
+        "options": options,
+        "wait": wait,
+        "timeout": timeout,
+        "upload": upload,
+        "name": name
+    }
+
+
+def _parse_timeout(value):
+    """待ち時間 [秒] を読み込む（0より大きく MAX_WAIT_TIMEOUT 以下の有限の数）"""
+    if isinstance(value, bool):
+        raise ValueError(f"timeout must be a number: {value}")
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"timeout must be a number: {value}")
+    if not math.isfinite(timeout) or not 0 < timeout <= MAX_WAIT_TIMEOUT:
+        raise ValueError(f"timeout must be more than 0 and at most {MAX_WAIT_TIMEOUT} seconds: {value}")
+    return timeout
+
+
+def _parse_option(key, value, kind=None):
+    """クエリ（文字列）・JSONの値を設定の型に変換する"""
+    kind = kind or OPTION_TYPES[key]
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in _TRUE:
+            return True
+        if str(value).lower() in _FALSE:
+            return False
+        raise ValueError(f"{key} must be true or false: {value}")
+    if kind is int:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError(f"{key} must be an integer: {value}")
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} must be an integer: {value}")
+    return str(value)
+
+
+def _validate_options(options):
+    """変換の設定の値を確認する（main.py のコマンドライン引数と同じ規則）"""
+    unknown = set(options) - set(OPTION_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown option(s): {', '.join(sorted(unknown))}")
+    for key, choices in _CHOICES.items():
+        if options[key] not in choices:
+            raise ValueError(f"{key} must be one of {', '.join(choices)}: {options[key]}")
+    if options["dpi"] < 1:
+        raise ValueError("dpi must be 1 or more")
+    for key in ("image_max_edge", "partition_nodes", "token_budget"):
+        if options[key] < 0:
+            raise ValueError(f"{key} must be 0 or more")
@@ -0,0 +1,52 @@
+"""
+設定の既定値モジュール
+コマンドラインのオプションの選択肢と既定値をまとめる。
+
+各段階のモジュール（asset_generator・headless_renderer・partitioner・ai_connector・server）は
+PIL・requests などの重いライブラリを読み込むため、main.py はこのモジュールだけを参照して引数を解析し、
+段階のモジュールは実行する段階になってから読み込む。標準ライブラリ以外を読み込まないこと。
+"""
+
+
+# 元画像の取得方法
+#   screen   : 画面に表示したExcelのスクリーンショット（従来の方式）
+#   headless : drawing XMLのジオメトリから直接描画（画面・Excelが不要）
+RENDER_MODES = ("screen", "headless")
+DEFAULT_RENDER = "screen"
+
+# アップロード用画像のエンコード形式
+#   png     : フルカラーのPNG（従来の形式）
+#   palette : 減色したパレットPNG（既定。マスクは白黒のため色数が少なくても読み取れる）
+#   gray    : グレースケールのPNG
+#   webp    : 非可逆のWebP
+#   jpeg    : 非可逆のJPEG
+IMAGE_FORMATS = ("png", "palette", "gray", "webp", "jpeg")
+DEFAULT_IMAGE_FORMAT = "palette"
+
+# 長辺の最大ピクセル数（これを超える場合は縮小する。0またはNoneで縮小しない）
+DEFAULT_MAX_EDGE = 1600
+
+# ヘッドレス描画の既定の解像度（Windowsの標準的な画面と同じ 96 DPI）
+DEFAULT_DPI = 96
+
+# 1リクエストあたりのノード数の上限（重なりのノードは含まない）
+DEFAULT_PARTITION_NODES = 60
+
+# プロンプト中の図形データの形式
+#   json: 従来の整形済みJSON（座標を含む）
+#   compact: 番号・図形の種類・テキストだけの表（座標は画像が示すため含めない）
+PROMPT_FORMATS = ("json", "compact")
+DEFAULT_PROMPT_FORMAT = "compact"
+
+# 1リクエストあたりの推定トークン数の上限の既定値（0の場合は制限しない）
+DEFAULT_TOKEN_BUDGET = 16000
+
+# 非同期クライアントで同時に送信するリクエスト数の既定値
+DEFAULT_CONCURRENCY = 8
+
+# 変換サーバーの既定の待ち受けアドレス（ローカルからの接続のみ受け付ける）
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# 変換サーバーの待ち行列の上限（超えたリクエストには 429 を返す）
+DEFAULT_QUEUE_SIZE = 64
@@ -0,0 +1,148 @@
+"""
+シェイプテーブルモジュール
+シェイプ情報を列ごとの配列（struct-of-arrays）で保持し、シェイプ1件あたりのメモリ使用量を抑える。
+"""
+from array import array
+
+
+# シェイプタイプ（テーブル内では番号で保持する）
+SHAPE_TYPES = ('auto_shape', 'text_box', 'connector', 'unknown')
+_TYPE_CODES = {name: code for code, name in enumerate(SHAPE_TYPES)}
+
+
+class ShapeTable:
+    """
+    シェイプ情報の列指向テーブル。
+
+    各列は同じ長さの配列で、行番号でシェイプを参照する。座標は連続した倍精度配列のため、
+    NumPyからはコピーなしで参照できる。XML要素は keep_elements=True の場合のみ保持する。
+    """
+
+    __slots__ = ('ids', 'texts', 'type_codes', 'left', 'top', 'width', 'height', 'elements')
+
+    def __init__(self, keep_elements=False):
+        """
+        Args:
+            keep_elements (bool): デバッグ用にXML要素を保持するかどうか
+        """
+        self.ids = array('i')
+        self.texts = []
+        self.type_codes = array('B')
+        self.left = array('d')
+        self.top = array('d')
+        self.width = array('d')
+        self.height = array('d')
+        self.elements = [] if keep_elements else None
+
+    def __len__(self):
+        return len(self.texts)
+
+    def append(self, shape_index, text, shape_type, position, element=None):
+        """
+        シェイプを1件追加する。
+
+        Args:
+            shape_index (int): シート内での連番（temp_idの番号。parse_sheet_drawing の index）
+            text (str): テキスト
+            shape_type (str): シェイプタイプ
+            position (dict): 座標情報 {top, left, width, height}
+            element: XML要素（keep_elements=True の場合のみ保持）
+        """
+        self.ids.append(shape_index)
+        self.texts.append(text)
+        self.type_codes.append(_TYPE_CODES.get(shape_type, _TYPE_CODES['unknown']))
+        self.left.append(position["left"])
+        self.top.append(position["top"])
+        self.width.append(position["width"])
+        self.height.append(position["height"])
+        if self.elements is not None:
+            self.elements.append(element)
+
+    def temp_id(self, row):
+        """行のtemp_idを返す"""
+        return f"temp_{self.ids[row]:03d}"
+
+    def shape_type(self, row):
+        """行のシェイプタイプを返す"""
+        return SHAPE_TYPES[self.type_codes[row]]
+
+    def position(self, row):
+        """行の座標情報を辞書で返す"""
+        return {
+            "top": self.top[row],
+            "left": self.left[row],
+            "width": self.width[row],
+            "height": self.height[row]
+        }
+
+    def record(self, row):
+        """
+        行を _get_all_shapes_from_xml と同じ形式の辞書に変換する。
+
+        Args:
+            row (int): 行番号
+
+        Returns:
+            dict: シェイプ情報
+        """
+        record = {
+            "temp_id": self.temp_id(row),
+            "text": self.texts[row],
+            "position": self.position(row),
+            "shape_type": self.shape_type(row)
+        }
+        if self.elements is not None:
+            record["_xml_element"] = self.elements[row]  # デバッグ用
+        return record
+
+    def records(self):
+        """全行を辞書のリストに変換する"""
+        return [self.record(row) for row in range(len(self))]
+
+    def select(self, rows):
+        """
+        指定した行だけを持つ新しいテーブルを作成する。
+
+        Args:
+            rows (list): 行番号のリスト
+
+        Returns:
+            ShapeTable: 部分テーブル
+        """
+        table = ShapeTable(keep_elements=self.elements is not None)
+        table.ids = array('i', (self.ids[row] for row in rows))
+        table.texts = [self.texts[row] for row in rows]
+        table.type_codes = array('B', (self.type_codes[row] for row in rows))
+        table.left = array('d', (self.left[row] for row in rows))
+        table.top = array('d', (self.top[row] for row in rows))
+        table.width = array('d', (self.width[row] for row in rows))
+        table.height = array('d', (self.height[row] for row in rows))
+        if self.elements is not None:
+            table.elements = [self.elements[row] for row in rows]
+        return table
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        シェイプ情報の辞書のリストからテーブルを作成する。
+
+        Args:
+            records (list): シェイプ情報の辞書のリスト
+
+        Returns:
+            ShapeTable: テーブル
+        """
+        unknown = _TYPE_CODES['unknown']
+        positions = [record["position"] for record in records]
+
+        # 列ごとにまとめて配列化する
+        table = cls()
+        # temp_id は "temp_XXX" 形式
+        table.ids = array('i', [int(record["temp_id"].rsplit('_', 1)[-1]) for record in records])
+        table.texts = [record["text"] for record in records]
+        table.type_codes = array('B', [_TYPE_CODES.get(record["shape_type"], unknown) for record in records])
+        table.left = array('d', [position["left"] for position in positions])
+        table.top = array('d', [position["top"] for position in positions])
+        table.width = array('d', [position["width"] for position in positions])
+        table.height = array('d', [position["height"] for position in positions])
+        return table
@@ -0,0 +1,222 @@
+"""
+シートジオメトリモジュール
+ワークシートXML (sheetN.xml) の列幅・行高を読み込み、セル位置 (col, colOff, row, rowOff) を
+ポイント座標に変換する。
+"""
+import bisect
+import math
+import xml.etree.ElementTree as ET
+
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+# 1 point = 12700 EMU
+EMU_PER_POINT = 12700
+
+# 1 pixel = 0.75 point (96 DPI)
+POINTS_PER_PIXEL = 0.75
+
+# 標準フォント（Calibri 11pt / 游ゴシック 11pt）の最大数字幅 [pixel]
+MAX_DIGIT_WIDTH = 7
+
+# sheetFormatPr が省略された場合の既定値
+DEFAULT_BASE_COLUMN_WIDTH = 8
+DEFAULT_ROW_HEIGHT = 15.0
+
+
+def column_width_to_points(width, max_digit_width=MAX_DIGIT_WIDTH):
+    """
+    列幅（文字数単位、<col width> の値）をポイントに変換する。
+
+    Args:
+        width (float): 列幅（文字数単位）
+        max_digit_width (int): 最大数字幅 [pixel]
+
+    Returns:
+        float: 列幅 [point]
+    """
+    pixels = math.trunc(((256 * width + math.trunc(128 / max_digit_width)) / 256) * max_digit_width)
+    return pixels * POINTS_PER_PIXEL
+
+
+def default_column_width_points(base_width=DEFAULT_BASE_COLUMN_WIDTH, max_digit_width=MAX_DIGIT_WIDTH):
+    """
+    baseColWidth から既定の列幅を計算する（余白5pixelを加え、8pixel単位に切り上げ）。
+
+    Args:
+        base_width (int): baseColWidth（文字数単位）
+        max_digit_width (int): 最大数字幅 [pixel]
+
+    Returns:
+        float: 列幅 [point]
+    """
+    pixels = math.ceil((base_width * max_digit_width + 5) / 8) * 8
+    return pixels * POINTS_PER_PIXEL
+
+
+class _AxisOffsets:
+    """
+    列または行の軸方向のオフセットを計算する。
+
+    既定サイズと異なる区間だけを保持し、区間ごとの差分の累積和（prefix sum）を
+    二分探索することで、任意のインデックスの開始位置を O(log n) で求める。
+    """
+
+    def __init__(self, default_size, ranges):
+        """
+        Args:
+            default_size (float): 既定のサイズ [point]
+            ranges (list): (開始インデックス, 終了インデックス(含まない), サイズ) のリスト（0始まり）
+        """
+        self.default_size = default_size
+        self._starts = []
+        self._ends = []
+        self._sizes = []
+        self._cumulative = []
+
+        total = 0.0
+        last_end = 0
+        for start, end, size in sorted(ranges):
+            start = max(start, last_end)
+            if end <= start:
+                continue
+            self._starts.append(start)
+            self._ends.append(end)
+            self._sizes.append(size)
+            self._cumulative.append(total)
+            total += (size - default_size) * (end - start)
+            last_end = end
+
+    def offset(self, index):
+        """
+        インデックスの開始位置を返す。
+
+        Args:
+            index (int): 列または行のインデックス（0始まり）
+
+        Returns:
+            float: 開始位置 [point]
+        """
+        base = index * self.default_size
+        pos = bisect.bisect_right(self._starts, index) - 1
+        if pos < 0:
+            return base
+
+        covered = min(index, self._ends[pos]) - self._starts[pos]
+        return base + self._cumulative[pos] + covered * (self._sizes[pos] - self.default_size)
+
+
+class SheetGeometry:
+    """
+    ワークシートの列幅・行高モデル。
+    """
+
+    def __init__(self, default_column_width=None, default_row_height=DEFAULT_ROW_HEIGHT,
+                 column_ranges=(), row_ranges=()):
+        """
+        Args:
+            default_column_width (float): 既定の列幅 [point]（Noneの場合はExcelの既定値）
+            default_row_height (float): 既定の行高 [point]
+            column_ranges (list): (開始列, 終了列(含まない), 幅[point]) のリスト（0始まり）
+            row_ranges (list): (開始行, 終了行(含まない), 高さ[point]) のリスト（0始まり）
+        """
+        if default_column_width is None:
+            default_column_width = default_column_width_points()
+
+        self.columns = _AxisOffsets(default_column_width, column_ranges)
+        self.rows = _AxisOffsets(default_row_height, row_ranges)
+
+    @classmethod
+    def from_stream(cls, stream):
+        """
+        ワークシートXMLを逐次解析してジオメトリを構築する。
+
+        セルデータは行ごとに破棄し、<sheetData> の終了時点で解析を打ち切るため、
+        巨大なシートでもメモリ使用量は1行分に収まる。
+
+        Args:
+            stream: sheetN.xml のファイルオブジェクト
+
+        Returns:
+            SheetGeometry: ジオメトリ
+        """
+        tag_format = f'{{{NS_MAIN}}}sheetFormatPr'
+        tag_col = f'{{{NS_MAIN}}}col'
+        tag_row = f'{{{NS_MAIN}}}row'
+        tag_sheet_data = f'{{{NS_MAIN}}}sheetData'
+
+        default_column_width = None
+        default_row_height = DEFAULT_ROW_HEIGHT
+        column_ranges = []
+        row_ranges = []
+        sheet_data = None
+        row_index = 0
+
+        for event, elem in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == tag_sheet_data:
+                    sheet_data = elem
+                continue
+
+            if elem.tag == tag_format:
+                if elem.get('defaultColWidth') is not None:
+                    default_column_width = column_width_to_points(float(elem.get('defaultColWidth')))
+                else:
+                    base_width = int(elem.get('baseColWidth', DEFAULT_BASE_COLUMN_WIDTH))
+                    default_column_width = default_column_width_points(base_width)
+                default_row_height = float(elem.get('defaultRowHeight', DEFAULT_ROW_HEIGHT))
+
+            elif elem.tag == tag_col:
+                if elem.get('hidden') in ('1', 'true'):
+                    width = 0.0
+                elif elem.get('width') is not None:
+                    width = column_width_to_points(float(elem.get('width')))
+                else:
+                    continue
+                column_ranges.append((int(elem.get('min')) - 1, int(elem.get('max')), width))
+
+            elif elem.tag == tag_row:
+                # r属性が省略された行は直前の行の次とみなす
+                row_index = int(elem.get('r', row_index + 1))
+                if elem.get('hidden') in ('1', 'true'):
+                    row_ranges.append((row_index - 1, row_index, 0.0))
+                elif elem.get('ht') is not None:
+                    row_ranges.append((row_index - 1, row_index, float(elem.get('ht'))))
+                # 処理済みの行（セルデータ）を破棄
+                sheet_data.clear()
+
+            elif elem.tag == tag_sheet_data:
+                # 列幅・行高の情報は <sheetData> までにすべて現れる
+                break
+
+        return cls(default_column_width, default_row_height, column_ranges, row_ranges)
+
+    def x(self, col, col_off=0):
+        """
+        列インデックスと列内オフセットからX座標を求める。
+
+        Args:
+            col (int): 列インデックス（0始まり）
+            col_off (int): 列内オフセット [EMU]
+
+        Returns:
+            float: X座標 [point]
+        """
+        return self.columns.offset(col) + col_off / EMU_PER_POINT
+
+    def y(self, row, row_off=0):
+        """
+        行インデックスと行内オフセットからY座標を求める。
+
+        Args:
+            row (int): 行インデックス（0始まり）
+            row_off (int): 行内オフセット [EMU]
+
+        Returns:
+            float: Y座標 [point]
+        """
+        return self.rows.offset(row) + row_off / EMU_PER_POINT
+
+
+# シート情報がない場合に使う既定のジオメトリ
+DEFAULT_GEOMETRY = SheetGeometry()
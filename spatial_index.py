@@ -0,0 +1,99 @@
+"""
+空間索引モジュール
+座標（点・矩形）を一様グリッドに登録し、矩形範囲に重なる候補だけを高速に取り出す。
+"""
+import math
+
+
+class GridIndex:
+    """
+    一様グリッドによる空間索引。
+
+    各要素は外接矩形が重なるすべてのセルに登録される。検索は矩形範囲が重なるセルだけを
+    走査するため、要素が空間的に分散していれば1回あたりの候補数は全体数に依存しない。
+    """
+
+    def __init__(self, cell_size):
+        """
+        Args:
+            cell_size (float): グリッドのセルの一辺の長さ [point]
+        """
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        self._cells = {}
+
+    def _cell_range(self, x1, y1, x2, y2):
+        """矩形が重なるセルの範囲 (col1, row1, col2, row2) を返す"""
+        size = self.cell_size
+        return (
+            math.floor(min(x1, x2) / size),
+            math.floor(min(y1, y2) / size),
+            math.floor(max(x1, x2) / size),
+            math.floor(max(y1, y2) / size),
+        )
+
+    def insert(self, item, x1, y1, x2=None, y2=None):
+        """
+        要素を登録する。
+
+        Args:
+            item: 登録する要素（通常はリストのインデックス）
+            x1, y1 (float): 点の座標、または矩形の左上座標
+            x2, y2 (float): 矩形の右下座標（点の場合は省略）
+        """
+        if x2 is None:
+            # 点は1つのセルにだけ登録する
+            key = (math.floor(x1 / self.cell_size), math.floor(y1 / self.cell_size))
+            self._cells.setdefault(key, []).append(item)
+            return
+
+        col1, row1, col2, row2 = self._cell_range(x1, y1, x2, y2)
+        for col in range(col1, col2 + 1):
+            for row in range(row1, row2 + 1):
+                self._cells.setdefault((col, row), []).append(item)
+
+    def query(self, x1, y1, x2, y2):
+        """
+        矩形範囲に重なるセルに登録された要素を返す。
+
+        セル単位の粗い判定のため、実際の包含・交差判定は呼び出し側で行う。
+
+        Args:
+            x1, y1 (float): 矩形の左上座標
+            x2, y2 (float): 矩形の右下座標
+
+        Returns:
+            set: 候補となる要素の集合
+        """
+        col1, row1, col2, row2 = self._cell_range(x1, y1, x2, y2)
+        candidates = set()
+
+        # 検索範囲が登録済みのセル数より広い場合は、登録済みのセルだけを調べる
+        if (col2 - col1 + 1) * (row2 - row1 + 1) > len(self._cells):
+            for (col, row), items in self._cells.items():
+                if col1 <= col <= col2 and row1 <= row <= row2:
+                    candidates.update(items)
+            return candidates
+
+        for col in range(col1, col2 + 1):
+            for row in range(row1, row2 + 1):
+                items = self._cells.get((col, row))
+                if items:
+                    candidates.update(items)
+
+        return candidates
+
+
+def suggest_cell_size(boxes):
+    """
+    矩形群の大きさの中央値から、グリッドのセルサイズを決める。
+
+    Args:
+        boxes (list): (width, height) のリスト
+
+    Returns:
+        float: セルサイズ [point]
+    """
+    sizes = sorted(max(width, height) for width, height in boxes if max(width, height) > 0)
+    if not sizes:
+        return 1.0
+    return sizes[len(sizes) // 2]
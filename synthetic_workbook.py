@@ -0,0 +1,511 @@
+"""
+合成ワークブック生成モジュール
+ベンチマークやテスト用に、DrawingMLを直接書き出した .xlsx ファイルを生成する。
+"""
+import argparse
+import random
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from sheet_geometry import EMU_PER_POINT
+
+
+NS_XDR = 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing'
+NS_A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+NS_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+REL_TYPE_BASE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+PRESETS = ("grid", "flowchart", "simple", "complex")
+
+
+def grid_shapes(count, columns=10):
+    """
+    格子状に並んだコンテナ図形（テキスト付き四角形）の定義を生成する。
+
+    Args:
+        count (int): 図形の数
+        columns (int): 1行あたりの図形数
+
+    Returns:
+        list: 図形定義の辞書のリスト
+    """
+    shapes = []
+    for idx in range(count):
+        col = (idx % columns) * 3
+        row = (idx // columns) * 4
+        shapes.append({
+            "kind": "sp",
+            "text": f"処理{idx + 1}",
+            "from": (col, 0, row, 0),
+            "to": (col + 2, 0, row + 2, 0),
+        })
+    return shapes
+
+
+def flowchart_shapes(count, columns=10, branch_density=0.0, unbound_ratio=0.0, labels=True,
+                     overlay_ratio=0.0, seed=0):
+    """
+    格子状に並んだノードを順に矢印でつないだフローチャートの図形定義を生成する。
+
+    ノードは grid_shapes と同じ間隔（2×2セル、間隔1列・2行）で、行ごとに向きを折り返して並べ
+    （偶数行は左から右、奇数行は右から左）、先頭と末尾は端子の形にする。
+    各ノードは次のノードにコネクタでつなぎ、分岐にしたノードは真下のノードへのコネクタも持つ。
+
+    Args:
+        count (int): ノード数
+        columns (int): 1行あたりのノード数
+        branch_density (float): 分岐（ひし形、真下への2本目の矢印）にするノードの割合
+        unbound_ratio (float): 接続先（stCxn / endCxn）を持たないコネクタの割合
+            （端点は図形の枠に接しているため、吸着で解決できる）
+        labels (bool): Trueの場合、分岐の矢印の横に Yes / No のテキストボックスを置く
+        overlay_ratio (float): テキストを図形ではなく、図形に重ねたテキストボックスに持たせるノードの割合
+        seed (int): 乱数のシード（同じ引数からは同じ図形定義を生成する）
+
+    Returns:
+        list: 図形定義の辞書のリスト（先頭の count 件がノード）
+    """
+    def cell(idx):
+        """ノードの左上のセル (列, 行)"""
+        row, slot = divmod(idx, columns)
+        if row % 2:
+            slot = columns - 1 - slot
+        return slot * 3, row * 4
+
+    rng = random.Random(seed)
+    nodes = []
+    overlays = []
+    for idx in range(count):
+        col, row = cell(idx)
+        node = {"kind": "sp", "text": f"処理{idx + 1}", "from": (col, 0, row, 0), "to": (col + 2, 0, row + 2, 0)}
+        if idx in (0, count - 1):
+            node["geometry"] = "flowChartTerminator"
+        if rng.random() < overlay_ratio:
+            overlays.append({"kind": "txSp", "text": node.pop("text"),
+                             "from": (col, 0, row, 0), "to": (col + 2, 0, row + 1, 0)})
+        nodes.append(node)
+
+    label_size = round(7.5 * EMU_PER_POINT)
+    lines = []
+    for idx in range(count - 1):
+        col, row = cell(idx)
+        next_col, _ = cell(idx + 1)
+        if next_col == col:
+            # 行の末尾から真下の次の行の先頭へ
+            lines.append({"kind": "cxnSp", "from": (col + 1, 0, row + 2, 0), "to": (col + 1, 0, row + 4, 0),
+                          "start": idx, "end": idx + 1, "tail_end": "triangle"})
+            continue
+        gap = min(col, next_col) + 2
+        lines.append({"kind": "cxnSp", "from": (gap, 0, row + 1, 0), "to": (gap + 1, 0, row + 1, 0),
+                      "flip_h": next_col < col, "start": idx, "end": idx + 1, "tail_end": "triangle"})
+
+        below = idx + 2 * (columns - idx % columns) - 1
+        if below >= count or rng.random() >= branch_density:
+            continue
+        nodes[idx]["geometry"] = "flowChartDecision"
+        lines.append({"kind": "cxnSp", "from": (col + 1, 0, row + 2, 0), "to": (col + 1, 0, row + 4, 0),
+                      "start": idx, "end": below, "tail_end": "triangle"})
+        if labels:
+            # 横の矢印の上と、縦の矢印の右に置く（線からの距離は7.5pt）
+            lines.append({"kind": "txSp", "text": "Yes",
+                          "from": (gap, 0, row, 0), "to": (gap + 1, 0, row, 2 * label_size)})
+            lines.append({"kind": "txSp", "text": "No", "from": (col + 1, 0, row + 2, label_size),
+                          "to": (col + 1, 2 * label_size, row + 3, 0)})
+
+    for line in lines:
+        if line["kind"] == "cxnSp" and rng.random() < unbound_ratio:
+            line.pop("start")
+            line.pop("end")
+
+    return nodes + overlays + lines
+
+
+def simple_chart_shapes():
+    """
+    test_parser.py などが前提とする test_chart_simple.xlsx の図形定義を生成する。
+
+    角丸四角形「開始」、四角形「処理A」、四角形に重ねたテキストボックス「処理Bのラベル」の
+    3つのコンテナを、上から順に矢印でつなぐ。
+
+    Returns:
+        list: 図形定義の辞書のリスト
+    """
+    return [
+        {"kind": "sp", "text": "開始", "geometry": "roundRect", "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+        {"kind": "sp", "text": "処理A", "from": (1, 0, 5, 0), "to": (3, 0, 7, 0)},
+        {"kind": "sp", "text": "", "from": (1, 0, 9, 0), "to": (3, 0, 11, 0)},
+        {"kind": "txSp", "text": "処理Bのラベル", "from": (1, 0, 9, 0), "to": (3, 0, 10, 0)},
+        {"kind": "cxnSp", "from": (2, 0, 3, 0), "to": (2, 0, 5, 0), "start": 0, "end": 1,
+         "tail_end": "triangle"},
+        {"kind": "cxnSp", "from": (2, 0, 7, 0), "to": (2, 0, 9, 0), "start": 1, "end": 2,
+         "tail_end": "triangle"},
+    ]
+
+
+def complex_chart_shapes():
+    """
+    分岐と Yes / No ラベルを持つフローチャート（test_complex_chart.xlsx）の図形定義を生成する。
+
+    開始 → データ入力 → データ有効？ →（Yes）データ処理 → 終了、（No）エラー表示 → 終了。
+    COMPLEX_CHART_LAYOUT の列幅・行高で配置する。
+
+    Returns:
+        list: 図形定義の辞書のリスト
+    """
+    # B・D列（25文字）のおよその中央と、行高40ptの行の中央
+    center = 60 * EMU_PER_POINT
+    middle = 20 * EMU_PER_POINT
+    return [
+        {"kind": "sp", "text": "開始", "geometry": "flowChartTerminator", "from": (1, 0, 1, 0), "to": (2, 0, 2, 0)},
+        {"kind": "sp", "text": "データ入力", "from": (1, 0, 3, 0), "to": (2, 0, 4, 0)},
+        {"kind": "sp", "text": "データ有効？", "geometry": "flowChartDecision",
+         "from": (1, 0, 5, 0), "to": (2, 0, 6, 0)},
+        {"kind": "sp", "text": "データ処理", "from": (1, 0, 7, 0), "to": (2, 0, 8, 0)},
+        {"kind": "sp", "text": "エラー表示", "from": (3, 0, 7, 0), "to": (4, 0, 8, 0)},
+        {"kind": "sp", "text": "終了", "geometry": "flowChartTerminator", "from": (1, 0, 9, 0), "to": (2, 0, 10, 0)},
+        {"kind": "cxnSp", "from": (1, center, 2, 0), "to": (1, center, 3, 0), "start": 0, "end": 1,
+         "tail_end": "triangle"},
+        {"kind": "cxnSp", "from": (1, center, 4, 0), "to": (1, center, 5, 0), "start": 1, "end": 2,
+         "tail_end": "triangle"},
+        {"kind": "cxnSp", "from": (1, center, 6, 0), "to": (1, center, 7, 0), "start": 2, "end": 3,
+         "tail_end": "triangle"},
+        {"kind": "cxnSp", "from": (2, 0, 5, middle), "to": (3, center, 7, 0), "start": 2, "end": 4,
+         "tail_end": "triangle"},
+        {"kind": "cxnSp", "from": (1, center, 8, 0), "to": (1, center, 9, 0), "start": 3, "end": 5,
+         "tail_end": "triangle"},
+        {"kind": "cxnSp", "from": (2, 0, 8, 0), "to": (3, center, 9, middle), "flip_h": True,
+         "start": 4, "end": 5, "tail_end": "triangle"},
+        {"kind": "txSp", "text": "Yes", "from": (1, center + 4 * EMU_PER_POINT, 6, 0),
+         "to": (1, center + 28 * EMU_PER_POINT, 6, 15 * EMU_PER_POINT)},
+        {"kind": "txSp", "text": "No", "from": (2, 6 * EMU_PER_POINT, 5, 0),
+         "to": (2, 36 * EMU_PER_POINT, 5, 15 * EMU_PER_POINT)},
+    ]
+
+
+# complex_chart_shapes の列幅（文字数）と行高（point）
+COMPLEX_CHART_LAYOUT = {
+    "column_widths": {1: 25, 2: 15, 3: 25, 4: 15},
+    "row_heights": {1: 40, 3: 40, 5: 40, 7: 40, 9: 40},
+}
+
+
+def build_drawing_xml(shapes):
+    """
+    図形定義のリストから drawingN.xml の内容を生成する。
+
+    Args:
+        shapes (list): 図形定義の辞書のリスト
+            kind: 'sp' / 'txSp' / 'cxnSp'
+            text: 図形のテキスト
+            from / to: (col, colOff, row, rowOff) のタプル
+            start / end: cxnSp の接続先の図形のインデックス（図形定義リスト内の位置）
+            id: cNvPr id（省略時は図形定義リスト内の位置 + 2）
+            その他の形状・線の指定は _sp_pr_xml を参照
+
+    Returns:
+        bytes: DrawingMLのXML
+    """
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<xdr:wsDr xmlns:xdr="{NS_XDR}" xmlns:a="{NS_A}">'
+    ]
+
+    ids = [shape.get("id", idx + 2) for idx, shape in enumerate(shapes)]
+    for idx, shape in enumerate(shapes):
+        parts.append('<xdr:twoCellAnchor>')
+        parts.append(_marker_xml('from', shape["from"]))
+        parts.append(_marker_xml('to', shape["to"]))
+        parts.append(_shape_xml(shape, ids[idx], ids))
+        parts.append('<xdr:clientData/></xdr:twoCellAnchor>')
+
+    parts.append('</xdr:wsDr>')
+    return ''.join(parts).encode('utf-8')
+
+
+def write_workbook(file_path, sheets, layouts=None):
+    """
+    シートごとの図形定義から .xlsx ファイルを書き出す。
+
+    Args:
+        file_path (str): 出力先のパス
+        sheets (list): (シート名, 図形定義リスト) のタプルのリスト
+            （図形定義リストが None のシートにはdrawingを作らない）
+        layouts (dict): シート名をキーとするレイアウト定義（省略時はExcelの既定値）
+            column_widths: {列インデックス(0始まり): 列幅(文字数単位)}
+            row_heights: {行インデックス(0始まり): 行高(point)}
+            default_row_height: 既定の行高(point)
+    """
+    layouts = layouts or {}
+
+    with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr('[Content_Types].xml', _content_types_xml(sheets))
+        zip_ref.writestr('_rels/.rels', _relationships_xml([
+            ('rId1', 'officeDocument', 'xl/workbook.xml'),
+        ]))
+        zip_ref.writestr('xl/workbook.xml', _workbook_xml(sheets))
+        zip_ref.writestr('xl/_rels/workbook.xml.rels', _relationships_xml([
+            (f'rId{idx}', 'worksheet', f'worksheets/sheet{idx}.xml')
+            for idx in range(1, len(sheets) + 1)
+        ]))
+
+        for idx, (name, shapes) in enumerate(sheets, 1):
+            has_drawing = shapes is not None
+            zip_ref.writestr(f'xl/worksheets/sheet{idx}.xml',
+                             _sheet_xml(layouts.get(name, {}), has_drawing))
+            if not has_drawing:
+                continue
+            zip_ref.writestr(f'xl/worksheets/_rels/sheet{idx}.xml.rels', _relationships_xml([
+                ('rId1', 'drawing', f'../drawings/drawing{idx}.xml'),
+            ]))
+            zip_ref.writestr(f'xl/drawings/drawing{idx}.xml', build_drawing_xml(shapes))
+
+
+def _marker_xml(name, marker):
+    """アンカーの from / to 要素を生成する"""
+    col, col_off, row, row_off = marker
+    return (
+        f'<xdr:{name}><xdr:col>{col}</xdr:col><xdr:colOff>{col_off}</xdr:colOff>'
+        f'<xdr:row>{row}</xdr:row><xdr:rowOff>{row_off}</xdr:rowOff></xdr:{name}>'
+    )
+
+
+def _shape_xml(shape, shape_id, ids):
+    """sp / txSp / cxnSp 要素を生成する（ids は図形定義リスト内の位置ごとの cNvPr id）"""
+    kind = shape["kind"]
+    name = quoteattr(shape.get("name", f"Shape {shape_id}"))
+
+    if kind == 'cxnSp':
+        # start / end は接続先の図形のインデックス（図形定義リスト内の位置）
+        connections = ''.join(
+            f'<a:{tag} id="{ids[shape[key]]}" idx="0"/>'
+            for key, tag in (("start", "stCxn"), ("end", "endCxn")) if shape.get(key) is not None
+        )
+        return (
+            '<xdr:cxnSp macro="">'
+            f'<xdr:nvCxnSpPr><xdr:cNvPr id="{shape_id}" name={name}/>'
+            f'<xdr:cNvCxnSpPr>{connections}</xdr:cNvCxnSpPr></xdr:nvCxnSpPr>'
+            f'{_sp_pr_xml(shape, "straightConnector1")}'
+            '</xdr:cxnSp>'
+        )
+
+    text = shape.get("text", "")
+    tx_body = (
+        '<xdr:txBody><a:bodyPr/><a:lstStyle/>'
+        f'<a:p><a:r><a:t>{escape(text)}</a:t></a:r></a:p>'
+        '</xdr:txBody>'
+    ) if text else ''
+
+    return (
+        f'<xdr:{kind} macro="" textlink="">'
+        f'<xdr:nvSpPr><xdr:cNvPr id="{shape_id}" name={name}/><xdr:cNvSpPr/></xdr:nvSpPr>'
+        f'{_sp_pr_xml(shape, "rect")}'
+        f'{tx_body}'
+        f'</xdr:{kind}>'
+    )
+
+
+def _sp_pr_xml(shape, default_geometry):
+    """
+    spPr 要素を生成する
+
+    図形定義の任意のキー:
+        geometry: prstGeom の prst（省略時は default_geometry）
+        adjust: {ガイド名: 値} の調整値
+        rotation: 回転角度（度）
+        flip_h / flip_v: 左右・上下の反転
+        head_end / tail_end: 線の始点・終点の矢印の種類（'triangle' など）
+    """
+    xfrm_attrs = ''
+    if shape.get("rotation"):
+        xfrm_attrs += f' rot="{round(shape["rotation"] * 60000)}"'
+    if shape.get("flip_h"):
+        xfrm_attrs += ' flipH="1"'
+    if shape.get("flip_v"):
+        xfrm_attrs += ' flipV="1"'
+
+    guides = ''.join(
+        f'<a:gd name="{name}" fmla="val {value}"/>'
+        for name, value in shape.get("adjust", {}).items()
+    )
+
+    line = ''
+    if shape.get("head_end") or shape.get("tail_end"):
+        line = (
+            '<a:ln w="9525">'
+            + (f'<a:headEnd type="{shape["head_end"]}"/>' if shape.get("head_end") else '')
+            + (f'<a:tailEnd type="{shape["tail_end"]}"/>' if shape.get("tail_end") else '')
+            + '</a:ln>'
+        )
+
+    return (
+        '<xdr:spPr>'
+        f'<a:xfrm{xfrm_attrs}><a:off x="0" y="0"/><a:ext cx="0" cy="0"/></a:xfrm>'
+        f'<a:prstGeom prst="{shape.get("geometry", default_geometry)}"><a:avLst>{guides}</a:avLst></a:prstGeom>'
+        f'{line}'
+        '</xdr:spPr>'
+    )
+
+
+def _content_types_xml(sheets):
+    """[Content_Types].xml を生成する"""
+    overrides = [
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    ]
+    for idx, (_, shapes) in enumerate(sheets, 1):
+        overrides.append(
+            f'<Override PartName="/xl/worksheets/sheet{idx}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        )
+        if shapes is None:
+            continue
+        overrides.append(
+            f'<Override PartName="/xl/drawings/drawing{idx}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.drawing+xml"/>'
+        )
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        + ''.join(overrides) +
+        '</Types>'
+    )
+
+
+def _relationships_xml(relationships):
+    """.rels ファイルを生成する"""
+    items = ''.join(
+        f'<Relationship Id="{rel_id}" Type="{REL_TYPE_BASE}/{rel_type}" Target="{target}"/>'
+        for rel_id, rel_type, target in relationships
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="{NS_PKG_REL}">{items}</Relationships>'
+    )
+
+
+def _workbook_xml(sheets):
+    """xl/workbook.xml を生成する"""
+    items = ''.join(
+        f'<sheet name={quoteattr(name)} sheetId="{idx}" r:id="rId{idx}"/>'
+        for idx, (name, _) in enumerate(sheets, 1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<workbook xmlns="{NS_MAIN}" xmlns:r="{NS_R}"><sheets>{items}</sheets></workbook>'
+    )
+
+
+def _sheet_xml(layout, has_drawing=True):
+    """xl/worksheets/sheetN.xml を生成する"""
+    default_row_height = layout.get("default_row_height", 15)
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<worksheet xmlns="{NS_MAIN}" xmlns:r="{NS_R}">'
+        f'<sheetFormatPr defaultRowHeight="{default_row_height}"/>'
+    ]
+
+    column_widths = layout.get("column_widths", {})
+    if column_widths:
+        parts.append('<cols>')
+        for col in sorted(column_widths):
+            parts.append(
+                f'<col min="{col + 1}" max="{col + 1}" width="{column_widths[col]}" customWidth="1"/>'
+            )
+        parts.append('</cols>')
+
+    row_heights = layout.get("row_heights", {})
+    parts.append('<sheetData>')
+    for row in sorted(row_heights):
+        parts.append(
+            f'<row r="{row + 1}" ht="{row_heights[row]}" customHeight="1">'
+            f'<c r="A{row + 1}" t="inlineStr"><is><t>{row + 1}</t></is></c></row>'
+        )
+    parts.append('</sheetData>')
+    if has_drawing:
+        parts.append('<drawing r:id="rId1"/>')
+    parts.append('</worksheet>')
+
+    return ''.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate an .xlsx file with DrawingML shapes for tests and benchmarks"
+    )
+    parser.add_argument("output", help="Output .xlsx path")
+    parser.add_argument(
+        "count",
+        type=int,
+        nargs="?",
+        default=100,
+        help="Number of nodes per sheet for the grid / flowchart presets (default: 100)"
+    )
+    parser.add_argument(
+        "--preset",
+        choices=PRESETS,
+        default="grid",
+        help="grid: unconnected boxes, flowchart: connected nodes, "
+             "simple / complex: the fixed charts the manual test scripts expect (default: grid)"
+    )
+    parser.add_argument("--columns", type=int, default=10, help="Nodes per row (default: 10)")
+    parser.add_argument(
+        "--branch-density",
+        type=float,
+        default=0.2,
+        help="Share of flowchart nodes that branch to the node below (default: 0.2)"
+    )
+    parser.add_argument(
+        "--unbound-ratio",
+        type=float,
+        default=0.0,
+        help="Share of flowchart connectors without stCxn / endCxn (default: 0.0)"
+    )
+    parser.add_argument(
+        "--overlay-ratio",
+        type=float,
+        default=0.0,
+        help="Share of flowchart nodes whose text is an overlaid text box (default: 0.0)"
+    )
+    parser.add_argument("--no-labels", action="store_true", help="Omit the Yes / No label text boxes")
+    parser.add_argument("--sheets", type=int, default=1, help="Number of sheets (default: 1)")
+    parser.add_argument(
+        "--column-width",
+        type=float,
+        default=None,
+        help="Custom width (in characters) of every column the shapes span (default: Excel default)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    sheets = []
+    layouts = {}
+    for number in range(1, args.sheets + 1):
+        name = f"Sheet{number}"
+        if args.preset == "simple":
+            shapes = simple_chart_shapes()
+        elif args.preset == "complex":
+            shapes = complex_chart_shapes()
+            layouts[name] = COMPLEX_CHART_LAYOUT
+        elif args.preset == "flowchart":
+            shapes = flowchart_shapes(
+                args.count, args.columns, args.branch_density, args.unbound_ratio,
+                labels=not args.no_labels, overlay_ratio=args.overlay_ratio, seed=args.seed + number - 1
+            )
+        else:
+            shapes = grid_shapes(args.count, args.columns)
+        if args.column_width is not None:
+            layouts[name] = dict(layouts.get(name, {}), column_widths={
+                col: args.column_width for col in range(args.columns * 3 + 1)})
+        sheets.append((name, shapes))
+
+    write_workbook(args.output, sheets, layouts)
+    print(f"✓ Generated {args.output} ({args.sheets} sheet(s), "
+          f"{sum(len(shapes) for _, shapes in sheets)} shapes, {args.preset})")
+
+
+if __name__ == "__main__":
+    main()
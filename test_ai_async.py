@@ -0,0 +1,242 @@
+"""
+AI連携モジュールの非同期クライアントのテストスクリプト
+遅延を注入したローカルのスタブサーバーに generateContent を送信する。
+"""
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+import ai_connector
+
+
+# スタブサーバーが usageMetadata で返す入力トークン数（出力トークン数はMermaidコードの文字数）
+USAGE_PROMPT_TOKENS = 1000
+
+
+class StubGeminiServer(ThreadingHTTPServer):
+    """generateContent の応答を遅延付きで返すスタブサーバー"""
+
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, delay=0.0):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.delay = delay
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.paths = []
+        self.connections = set()
+        # 先頭から順に返すエラー応答 (status, Retry-After) のリスト
+        self.failures = []
+        # プロンプトから応答のMermaidコードを作る関数（Noneの場合はシート名のノードを1つ返す）
+        self.respond = None
+        self._lock = threading.Lock()
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1beta"
+
+    def handle_error(self, request, client_address):
+        # タイムアウト・キャンセルでクライアントが切断した場合のエラーは無視する
+        pass
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+
+    # Keep-Aliveで接続を使い回せるようにする
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        with server._lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.paths.append(self.path)
+            server.connections.add(self.client_address)
+            failure = server.failures.pop(0) if server.failures else None
+
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+            if failure is not None:
+                status, retry_after = failure
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header("Retry-After", retry_after)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            time.sleep(server.delay)
+
+            prompt = payload["contents"][0]["parts"][0]["text"]
+            if server.respond is not None:
+                code = server.respond(prompt)
+            else:
+                # プロンプト中のシート名をそのまま返す（応答とリクエストの対応を確認するため）
+                match = re.search(r'sheet_\d+', prompt)
+                label = match.group(0) if match else "ok"
+                code = f'graph TD\n    node_001["{label}"]'
+            body = json.dumps({
+                "candidates": [{"content": {"parts": [{"text": f'```mermaid\n{code}\n```'}]}}],
+                "usageMetadata": {"promptTokenCount": USAGE_PROMPT_TOKENS, "candidatesTokenCount": len(code),
+                                  "totalTokenCount": USAGE_PROMPT_TOKENS + len(code)}
+            }).encode('utf-8')
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server._lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def stub_server(delay=0.0):
+    """スタブサーバーを起動し、APIの接続先をそこに向ける"""
+    server = StubGeminiServer(delay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    saved = {name: os.environ.get(name) for name in ('GOOGLE_API_KEY', 'GEMINI_API_BASE')}
+    os.environ['GOOGLE_API_KEY'] = 'test-key'
+    os.environ['GEMINI_API_BASE'] = server.api_base
+    try:
+        yield server
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        server.shutdown()
+        server.server_close()
+
+
+def write_inputs(temp_dir, count):
+    """シートごとのJSON指示書とIDアンカー画像を作成する"""
+    pairs = []
+    for idx in range(count):
+        json_path = os.path.join(temp_dir, f"instructions_{idx}.json")
+        image_path = os.path.join(temp_dir, f"anchor_{idx}.png")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([{"id": "node_001", "text": f"sheet_{idx}", "shape_type": "auto_shape",
+                        "position": {"top": 0, "left": 0, "width": 10, "height": 10}}], f)
+        Image.new("RGB", (32, 32), "white").save(image_path)
+        pairs.append((json_path, image_path))
+    return pairs
+
+
+def test_requests_run_concurrently():
+    """リクエストが並行して送信され、結果が入力順に返ること"""
+    delay = 0.3
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay) as server:
+        pairs = write_inputs(temp_dir, 8)
+        started = time.perf_counter()
+        results = ai_connector.generate_mermaid_codes(pairs, concurrency=8)
+        elapsed = time.perf_counter() - started
+
+    assert results == [f'graph TD\n    node_001["sheet_{idx}"]' for idx in range(8)]
+    assert server.paths[0] == f"/v1beta/models/{ai_connector.DEFAULT_MODEL}:generateContent?key=test-key"
+    # 直列なら 8 × 0.3 秒かかる
+    assert elapsed < delay * 8 / 2, f"{elapsed:.2f}s"
+
+
+def test_concurrency_limit():
+    """同時に送信されるリクエストが上限以下であること"""
+    delay = 0.1
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay) as server:
+        pairs = write_inputs(temp_dir, 6)
+        started = time.perf_counter()
+        results = ai_connector.generate_mermaid_codes(pairs, concurrency=2)
+        elapsed = time.perf_counter() - started
+
+    assert all(isinstance(result, str) for result in results)
+    assert server.max_in_flight <= 2
+    assert elapsed >= delay * 3
+
+
+def test_timeout_per_request():
+    """タイムアウトしたリクエストは TimeoutError になり、応答を待たずに戻ること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay=1.0):
+        pairs = write_inputs(temp_dir, 3)
+        started = time.perf_counter()
+        results = ai_connector.generate_mermaid_codes(pairs, concurrency=3, timeout=0.2)
+        elapsed = time.perf_counter() - started
+
+    assert all(isinstance(result, TimeoutError) for result in results)
+    assert elapsed < 0.8, f"{elapsed:.2f}s"
+
+
+def test_cancellation():
+    """バッチをキャンセルすると、実行中のリクエストを待たずに戻ること"""
+    async def run(pairs):
+        task = asyncio.create_task(ai_connector.generate_mermaid_codes_async(pairs, concurrency=2))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        started = time.perf_counter()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return time.perf_counter() - started
+        raise AssertionError("task was not cancelled")
+
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay=1.0) as server:
+        pairs = write_inputs(temp_dir, 6)
+        elapsed = asyncio.run(run(pairs))
+
+    assert elapsed < 0.3, f"{elapsed:.2f}s"
+    # 待機中だったリクエストは送信されない
+    assert server.requests <= 2
+
+
+def test_sync_client_uses_same_endpoint():
+    """同期版の generate_mermaid_code も接続先の設定に従うこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        code = ai_connector.generate_mermaid_code(json_path, image_path)
+
+    assert code == 'graph TD\n    node_001["sheet_0"]'
+    assert server.requests == 1
+
+
+def main():
+    print("Testing async AI client...")
+    print("=" * 60)
+
+    test_requests_run_concurrently()
+    print("✓ Requests run concurrently")
+
+    test_concurrency_limit()
+    print("✓ Concurrency limit is respected")
+
+    test_timeout_per_request()
+    print("✓ Per-request timeout is enforced")
+
+    test_cancellation()
+    print("✓ Cancellation stops pending requests")
+
+    test_sync_client_uses_same_endpoint()
+    print("✓ Sync client uses the configured endpoint")
+
+    print("\n" + "=" * 60)
+    print("✓ Async AI client test complete!")
+
+
+if __name__ == "__main__":
+    main()
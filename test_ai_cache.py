@@ -0,0 +1,146 @@
+"""
+AI応答キャッシュ（ResponseCache）のテストスクリプト
+"""
+import json
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+import ai_connector
+from test_ai_async import stub_server, write_inputs
+
+
+def test_second_call_hits_cache():
+    """同じプロンプト・画像の2回目はAPIを呼ばずにキャッシュから返すこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay=0.2) as server:
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        cache = ai_connector.ResponseCache(os.path.join(temp_dir, "ai"))
+
+        first = ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+        started = time.perf_counter()
+        second = ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+        elapsed = time.perf_counter() - started
+
+    assert first == second == 'graph TD\n    node_001["sheet_0"]'
+    assert server.requests == 1
+    assert elapsed < 0.2
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    assert stats["latency_saved"] >= 0.2
+
+
+def test_key_includes_inputs_and_model():
+    """JSON指示書・画像・モデル名のいずれかが変われば別のキーになること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        pairs = write_inputs(temp_dir, 2)
+        cache = ai_connector.ResponseCache(os.path.join(temp_dir, "ai"))
+        json_path, image_path = pairs[0]
+
+        ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+        # JSON指示書が違う
+        ai_connector.generate_mermaid_code(pairs[1][0], image_path, cache=cache)
+        # 画像が違う
+        other_image_path = os.path.join(temp_dir, "other.png")
+        Image.new("RGB", (32, 32), "black").save(other_image_path)
+        ai_connector.generate_mermaid_code(json_path, other_image_path, cache=cache)
+        # モデルが違う
+        os.environ['GEMINI_MODEL'] = 'other-model'
+        try:
+            ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+        finally:
+            del os.environ['GEMINI_MODEL']
+        # すべて同じなのでヒット
+        ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+
+    assert server.requests == 4
+    assert cache.stats()["hits"] == 1
+
+
+def test_refresh_bypasses_cache():
+    """refresh=True の場合はキャッシュを読まずにAPIを呼び、結果を保存し直すこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        cache = ai_connector.ResponseCache(os.path.join(temp_dir, "ai"))
+
+        ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+        ai_connector.generate_mermaid_code(json_path, image_path, cache=cache, refresh=True)
+        ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+
+    assert server.requests == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_expired_entries_are_refetched():
+    """有効期限を過ぎた応答は再取得すること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        cache = ai_connector.ResponseCache(os.path.join(temp_dir, "ai"), max_age=0.05)
+
+        ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+        time.sleep(0.1)
+        ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+
+    assert server.requests == 2
+
+
+def test_entry_keeps_raw_response():
+    """エントリに生の応答と抽出済みのMermaidコードが保存されること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server():
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        cache = ai_connector.ResponseCache(os.path.join(temp_dir, "ai"))
+        ai_connector.generate_mermaid_code(json_path, image_path, cache=cache)
+
+        prompt_text, image_bytes = ai_connector._prepare_request(json_path, image_path)
+        entry = json.loads(cache._cache.get(cache.key(prompt_text, image_bytes)))
+
+    assert entry["raw_response"].startswith("```mermaid")
+    assert entry["mermaid"] == 'graph TD\n    node_001["sheet_0"]'
+    assert entry["model"] == ai_connector.DEFAULT_MODEL
+
+
+def test_async_batch_uses_cache():
+    """非同期の一括生成でもキャッシュが使われること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay=0.1) as server:
+        pairs = write_inputs(temp_dir, 4)
+        cache = ai_connector.ResponseCache(os.path.join(temp_dir, "ai"))
+
+        first = ai_connector.generate_mermaid_codes(pairs, concurrency=4, cache=cache)
+        second = ai_connector.generate_mermaid_codes(pairs, concurrency=4, cache=cache)
+
+    assert first == second
+    assert server.requests == 4
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (4, 4)
+
+
+def main():
+    print("Testing AI response cache...")
+    print("=" * 60)
+
+    test_second_call_hits_cache()
+    print("✓ Repeated request is served from cache")
+
+    test_key_includes_inputs_and_model()
+    print("✓ Key covers prompt, image and model")
+
+    test_refresh_bypasses_cache()
+    print("✓ Refresh bypasses cache")
+
+    test_expired_entries_are_refetched()
+    print("✓ Expired entries are refetched")
+
+    test_entry_keeps_raw_response()
+    print("✓ Raw response and Mermaid code are stored")
+
+    test_async_batch_uses_cache()
+    print("✓ Async batch uses cache")
+
+    print("\n" + "=" * 60)
+    print("✓ AI response cache test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+AI連携モジュールの接続の使い回し・再試行のテストスクリプト
+"""
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+
+import ai_connector
+from test_ai_async import stub_server, write_inputs
+
+
+@contextmanager
+def fast_backoff():
+    """テスト用に再試行の待ち時間を短くする"""
+    saved = ai_connector.BACKOFF_BASE, ai_connector.BACKOFF_MAX
+    ai_connector.BACKOFF_BASE, ai_connector.BACKOFF_MAX = 0.01, 0.05
+    try:
+        yield
+    finally:
+        ai_connector.BACKOFF_BASE, ai_connector.BACKOFF_MAX = saved
+
+
+def test_connection_is_reused():
+    """同じスレッドからのリクエストは1本の接続を使い回すこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        pairs = write_inputs(temp_dir, 5)
+        for json_path, image_path in pairs:
+            ai_connector.generate_mermaid_code(json_path, image_path)
+
+    assert server.requests == 5
+    assert len(server.connections) == 1
+
+
+def test_sessions_are_per_thread():
+    """スレッドごとに別のセッションを使うこと"""
+    sessions = []
+    threads = [
+        threading.Thread(target=lambda: sessions.append(ai_connector._get_session()))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(session) for session in sessions}) == 3
+    assert ai_connector._get_session() is ai_connector._get_session()
+
+
+def test_retries_transient_errors():
+    """429・503 は再試行し、最終的に成功すること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server, fast_backoff():
+        server.failures = [(503, None), (429, None), (502, None)]
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        code = ai_connector.generate_mermaid_code(json_path, image_path)
+
+    assert code == 'graph TD\n    node_001["sheet_0"]'
+    assert server.requests == 4
+
+
+def test_honors_retry_after():
+    """Retry-After で指定された時間は待ってから再試行すること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server, fast_backoff():
+        server.failures = [(429, "1")]
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        started = time.perf_counter()
+        ai_connector.generate_mermaid_code(json_path, image_path)
+        elapsed = time.perf_counter() - started
+
+    assert server.requests == 2
+    assert elapsed >= 1.0, f"{elapsed:.2f}s"
+
+
+def test_gives_up_after_max_retries():
+    """再試行の上限を超えたら RuntimeError になること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server, fast_backoff():
+        server.failures = [(503, None)] * (ai_connector.MAX_RETRIES + 1)
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        try:
+            ai_connector.generate_mermaid_code(json_path, image_path)
+        except RuntimeError as e:
+            assert "503" in str(e)
+        else:
+            raise AssertionError("RuntimeError was not raised")
+
+    assert server.requests == ai_connector.MAX_RETRIES + 1
+
+
+def test_client_errors_are_not_retried():
+    """400 などのクライアントエラーは再試行しないこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server, fast_backoff():
+        server.failures = [(400, None)]
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        try:
+            ai_connector.generate_mermaid_code(json_path, image_path)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("RuntimeError was not raised")
+
+    assert server.requests == 1
+
+
+def test_async_client_retries():
+    """非同期クライアントも一時的なエラーを再試行すること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server, fast_backoff():
+        server.failures = [(429, None), (429, None)]
+        pairs = write_inputs(temp_dir, 3)
+        results = ai_connector.generate_mermaid_codes(pairs, concurrency=3)
+
+    assert results == [f'graph TD\n    node_001["sheet_{idx}"]' for idx in range(3)]
+    assert server.requests == 5
+
+
+def test_backoff_delay():
+    """待ち時間が指数的に伸び、上限とRetry-Afterに従うこと"""
+    for attempt in range(10):
+        delay = ai_connector._backoff_delay(attempt)
+        assert 0 <= delay <= min(ai_connector.BACKOFF_MAX, ai_connector.BACKOFF_BASE * 2 ** attempt)
+
+    delay = ai_connector._backoff_delay(0, retry_after=5)
+    assert 5 <= delay <= 5 + ai_connector.BACKOFF_BASE
+    assert ai_connector._backoff_delay(0, retry_after=10 ** 6) <= (
+        ai_connector.RETRY_AFTER_MAX + ai_connector.BACKOFF_BASE)
+
+
+def test_parse_retry_after():
+    """Retry-After の秒数・HTTP日付を解釈できること"""
+    assert ai_connector._parse_retry_after("7") == 7.0
+    assert ai_connector._parse_retry_after(None) is None
+    assert ai_connector._parse_retry_after("soon") is None
+
+    seconds = ai_connector._parse_retry_after(formatdate(time.time() + 30, usegmt=True))
+    assert 28 <= seconds <= 31
+
+
+def main():
+    print("Testing AI connection pooling and retries...")
+    print("=" * 60)
+
+    test_connection_is_reused()
+    print("✓ Connection is reused across requests")
+
+    test_sessions_are_per_thread()
+    print("✓ Sessions are per thread")
+
+    test_retries_transient_errors()
+    print("✓ Transient errors are retried")
+
+    test_honors_retry_after()
+    print("✓ Retry-After is honored")
+
+    test_gives_up_after_max_retries()
+    print("✓ Retries are bounded")
+
+    test_client_errors_are_not_retried()
+    print("✓ Client errors are not retried")
+
+    test_async_client_retries()
+    print("✓ Async client retries")
+
+    test_backoff_delay()
+    test_parse_retry_after()
+    print("✓ Backoff delay and Retry-After parsing")
+
+    print("\n" + "=" * 60)
+    print("✓ AI retry test complete!")
+
+
+if __name__ == "__main__":
+    main()
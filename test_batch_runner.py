@@ -0,0 +1,257 @@
+"""
+バッチ変換（batch_runner）のテストスクリプト
+"""
+import json
+import os
+import tempfile
+
+from PIL import Image
+
+import asset_generator
+import batch_runner
+import excel_parser
+import synthetic_workbook
+from test_ai_async import stub_server
+
+
+SHAPES = [
+    {"kind": "sp", "text": "開始", "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+    {"kind": "sp", "text": "", "from": (1, 0, 5, 0), "to": (4, 0, 8, 0)},
+    {"kind": "txSp", "text": "処理A", "from": (2, 0, 6, 0), "to": (3, 0, 7, 0)},
+]
+
+
+def _write_workbooks(temp_dir):
+    """2つのディレクトリに同じ名前のブックを作る（片方は図形のないシートを含む）"""
+    paths = []
+    for subdir in ("a", "b"):
+        os.makedirs(os.path.join(temp_dir, subdir))
+        path = os.path.join(temp_dir, subdir, "flow.xlsx")
+        synthetic_workbook.write_workbook(path, [
+            ("Main/1", SHAPES),
+            ("Notes", None),
+            ("Sub", SHAPES[:1]),
+        ])
+        paths.append(path)
+
+    # Excelのロックファイルは対象外
+    with open(os.path.join(temp_dir, "a", "~$flow.xlsx"), 'wb') as f:
+        f.write(b'')
+    return paths
+
+
+def _fake_screenshot(file_path, sheet_name):
+    """画面のない環境用: 白紙の画像をスクリーンショットの代わりに返す"""
+    return Image.new("RGB", (800, 600), "white")
+
+
+def test_list_sheets_with_drawings():
+    """drawingを持つシートだけが列挙されること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write_workbooks(temp_dir)[0]
+        assert excel_parser.list_sheets_with_drawings(path) == ["Main/1", "Sub"]
+
+
+def test_discover_workbooks():
+    """ディレクトリ・globパターンから重複なくブックが見つかること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = _write_workbooks(temp_dir)
+        found = batch_runner.discover_workbooks([
+            temp_dir,
+            os.path.join(temp_dir, "*", "*.xlsx"),
+            paths[0],
+        ])
+        assert found == paths
+
+
+def test_plan_jobs_assigns_unique_paths():
+    """同名のブック・ファイル名に使えないシート名でもジョブごとに別のパスになること"""
+    jobs = batch_runner.plan_jobs([
+        ("a/flow.xlsx", ["Main/1", "Main_1"]),
+        ("b/flow.xlsx", ["Main/1"]),
+    ], "out")
+
+    outputs = [job["output"] for job in jobs]
+    intermediate_dirs = [job["intermediate_dir"] for job in jobs]
+    assert len(set(outputs)) == len(jobs)
+    assert len(set(intermediate_dirs)) == len(jobs)
+    assert outputs[0] == os.path.join("out", "flow", "Main_1.md")
+    assert outputs[1] == os.path.join("out", "flow", "Main_1_2.md")
+    assert outputs[2] == os.path.join("out", "flow_2", "Main_1.md")
+
+
+def test_run_batch_writes_outputs_and_manifest():
+    """シートごとの出力と manifest.json が書き出されること"""
+    original_screenshot = asset_generator._capture_chart_screenshot
+    original_api_key = os.environ.pop('GOOGLE_API_KEY', None)
+    asset_generator._capture_chart_screenshot = _fake_screenshot
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _write_workbooks(temp_dir)
+            output_dir = os.path.join(temp_dir, "out")
+            manifest = batch_runner.run_batch(
+                [temp_dir], output_dir, jobs=1,
+                cache_dir=os.path.join(temp_dir, "cache"), log=lambda *args: None
+            )
+
+            assert manifest["workbooks"] == 2
+            assert manifest["sheets"] == 4
+            assert manifest["succeeded"] == 4
+            assert manifest["failed"] == 0
+
+            for result in manifest["results"]:
+                with open(result["output"], encoding='utf-8') as f:
+                    assert "```mermaid" in f.read()
+                # 中間ファイルは残らない
+                assert not os.path.exists(os.path.splitext(result["output"])[0])
+
+            first = manifest["results"][0]
+            assert first["sheet"] == "Main/1"
+            assert first["shapes"] == 2
+
+            with open(os.path.join(output_dir, "manifest.json"), encoding='utf-8') as f:
+                assert json.load(f)["results"] == manifest["results"]
+    finally:
+        asset_generator._capture_chart_screenshot = original_screenshot
+        if original_api_key is not None:
+            os.environ['GOOGLE_API_KEY'] = original_api_key
+
+
+def test_run_batch_overlaps_ai_requests():
+    """AIへのリクエストが並行して送信されること"""
+    delay = 0.3
+    original_screenshot = asset_generator._capture_chart_screenshot
+    asset_generator._capture_chart_screenshot = _fake_screenshot
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay) as server:
+            _write_workbooks(temp_dir)
+            manifest = batch_runner.run_batch(
+                [temp_dir], os.path.join(temp_dir, "out"), jobs=1, ai_concurrency=4,
+                local_graph=False, log=lambda *args: None
+            )
+            outputs = []
+            for result in manifest["results"]:
+                with open(result["output"], encoding='utf-8') as f:
+                    outputs.append(f.read())
+    finally:
+        asset_generator._capture_chart_screenshot = original_screenshot
+
+    assert manifest["succeeded"] == 4
+    assert manifest["ai_cache"] is None
+    assert all(result["ai"] for result in manifest["results"])
+    assert all('node_001["ok"]' in output for output in outputs)
+    assert server.max_in_flight > 1
+    # 直列なら 4 × 0.3 秒かかる
+    assert manifest["seconds"] < delay * 4, f"{manifest['seconds']:.2f}s"
+
+
+def test_run_batch_reuses_ai_responses():
+    """2回目のバッチ変換ではAI応答のキャッシュが使われること"""
+    original_screenshot = asset_generator._capture_chart_screenshot
+    asset_generator._capture_chart_screenshot = _fake_screenshot
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+            _write_workbooks(temp_dir)
+            cache_dir = os.path.join(temp_dir, "cache")
+            runs = []
+            requests = []
+            for refresh in (False, False, True):
+                runs.append(batch_runner.run_batch(
+                    [temp_dir], os.path.join(temp_dir, "out"), jobs=1, cache_dir=cache_dir,
+                    refresh=refresh, local_graph=False, reuse_previous=False, log=lambda *args: None
+                ))
+                requests.append(server.requests)
+    finally:
+        asset_generator._capture_chart_screenshot = original_screenshot
+
+    # 2回目はAPIを呼ばない
+    assert requests[1] == requests[0]
+    assert runs[1]["ai_cache"]["hits"] == 4
+    assert runs[1]["ai_cache"]["misses"] == 0
+    # refresh 時はすべて呼び直す
+    assert requests[2] - requests[1] == 4
+    assert runs[2]["ai_cache"]["hits"] == 0
+
+
+def test_run_batch_reuses_previous_conversions():
+    """2回目のバッチ変換では、変更のないシートに前回の変換結果が使われること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        _write_workbooks(temp_dir)
+        cache_dir = os.path.join(temp_dir, "cache")
+        runs = []
+        requests = []
+        for _ in range(2):
+            runs.append(batch_runner.run_batch(
+                [temp_dir], os.path.join(temp_dir, "out"), jobs=1, cache_dir=cache_dir,
+                render="headless", local_graph=False, log=lambda *args: None
+            ))
+            requests.append(server.requests)
+
+    # 2回目はAPIもAI応答のキャッシュも使わない
+    assert requests[1] == requests[0]
+    assert runs[0]["incremental"] == 0
+    assert runs[1]["incremental"] == 4 and runs[1]["local"] == 4
+    assert all(result["incremental"] == "same" for result in runs[1]["results"])
+    assert runs[1]["ai_cache"]["hits"] == 0 and runs[1]["ai_cache"]["misses"] == 0
+
+
+def test_run_batch_in_process_pool():
+    """プロセスプールでも全シートが変換され、結果が入力順に並ぶこと（画面のない環境ではヘッドレス描画を使う）"""
+    original_api_key = os.environ.pop('GOOGLE_API_KEY', None)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = _write_workbooks(temp_dir)
+            output_dir = os.path.join(temp_dir, "out")
+            manifest = batch_runner.run_batch(
+                [temp_dir], output_dir, jobs=2, render="headless", log=lambda *args: None
+            )
+            manifest_written = os.path.exists(os.path.join(output_dir, "manifest.json"))
+    finally:
+        if original_api_key is not None:
+            os.environ['GOOGLE_API_KEY'] = original_api_key
+
+
+    results = manifest["results"]
+    assert manifest["workers"] == 2
+    assert [(result["file"], result["sheet"]) for result in results] == [
+        (paths[0], "Main/1"), (paths[0], "Sub"), (paths[1], "Main/1"), (paths[1], "Sub")
+    ]
+    assert len({result["output"] for result in results}) == 4
+    assert manifest["succeeded"] == 4
+    assert manifest_written
+
+
+def main():
+    print("Testing batch runner...")
+    print("=" * 60)
+
+    test_list_sheets_with_drawings()
+    print("✓ Sheets with drawings are listed")
+
+    test_discover_workbooks()
+    print("✓ Workbooks are discovered from directories and globs")
+
+    test_plan_jobs_assigns_unique_paths()
+    print("✓ Each job gets its own output paths")
+
+    test_run_batch_writes_outputs_and_manifest()
+    print("✓ Outputs and manifest are written")
+
+    test_run_batch_overlaps_ai_requests()
+    print("✓ AI requests overlap")
+
+    test_run_batch_reuses_ai_responses()
+    print("✓ AI responses are reused")
+
+    test_run_batch_reuses_previous_conversions()
+    print("✓ Previous conversions are reused")
+
+    test_run_batch_in_process_pool()
+    print("✓ Jobs run in a process pool")
+
+    print("\n" + "=" * 60)
+    print("✓ Batch runner test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+座標マッピングのバックエンド（python / numpy）の一致を確認するテストスクリプト
+"""
+import copy
+import os
+import tempfile
+import time
+
+import excel_parser
+import synthetic_workbook
+from test_text_mapping import make_shapes
+
+
+def test_numpy_backend_matches_python_backend():
+    """NumPy版がPython版と同じ紐付け結果になること"""
+    for seed in range(10):
+        containers, texts = make_shapes(500, seed)
+        expected = excel_parser._map_text_to_containers(
+            copy.deepcopy(containers), copy.deepcopy(texts), backend='python')
+        actual = excel_parser._map_text_to_containers(containers, texts, backend='numpy')
+
+        assert [c["text"] for c in actual] == [c["text"] for c in expected]
+
+
+def test_numpy_backend_skips_self_and_keeps_first_match():
+    """自分自身をスキップし、先に現れたテキストを優先すること"""
+    containers = [
+        {"temp_id": "temp_000", "text": "", "shape_type": "auto_shape",
+         "position": {"left": 0, "top": 0, "width": 100, "height": 100}},
+        {"temp_id": "temp_001", "text": "", "shape_type": "auto_shape",
+         "position": {"left": 10, "top": 10, "width": 80, "height": 80}},
+    ]
+    texts = [
+        {"temp_id": "temp_002", "text": "外側", "shape_type": "text_box",
+         "position": {"left": 40, "top": 40, "width": 20, "height": 20}},
+        {"temp_id": "temp_003", "text": "内側", "shape_type": "text_box",
+         "position": {"left": 30, "top": 30, "width": 10, "height": 10}},
+    ]
+
+    result = excel_parser._map_text_to_containers(containers, texts, backend='numpy')
+
+    assert [c["text"] for c in result] == ["外側", "内側"]
+
+
+def test_parse_excel_shapes_backend_parameter():
+    """parse_excel_shapes でバックエンドを選択できること"""
+    shapes = [
+        {"kind": "sp", "text": "", "from": (1, 0, 1, 0), "to": (4, 0, 5, 0)},
+        {"kind": "txSp", "text": "処理Bのラベル", "from": (2, 0, 2, 0), "to": (3, 0, 3, 0)},
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "backend.xlsx")
+        synthetic_workbook.write_workbook(file_path, [("Sheet1", shapes)])
+
+        for backend in ('python', 'numpy'):
+            result = excel_parser.parse_excel_shapes(file_path, "Sheet1", mapping_backend=backend)
+            assert [c["text"] for c in result] == ["処理Bのラベル"]
+
+
+def main():
+    print("Testing containment backends...")
+    print("=" * 60)
+
+    test_numpy_backend_matches_python_backend()
+    print("✓ NumPy backend matches Python backend")
+
+    test_numpy_backend_skips_self_and_keeps_first_match()
+    print("✓ NumPy backend keeps first-match ordering")
+
+    test_parse_excel_shapes_backend_parameter()
+    print("✓ Backend is selectable on parse_excel_shapes")
+
+    for count in (10000, 100000):
+        for backend in ('python', 'numpy'):
+            containers, texts = make_shapes(count)
+            start = time.perf_counter()
+            excel_parser._map_text_to_containers(containers, texts, backend=backend)
+            print(f"  {count:>6} containers ({backend:>6}): {time.perf_counter() - start:.3f}s")
+
+    print("\n" + "=" * 60)
+    print("✓ Containment backend test complete!")
+
+
+if __name__ == "__main__":
+    main()
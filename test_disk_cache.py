@@ -0,0 +1,194 @@
+"""
+ディスクキャッシュと解析結果キャッシュのテストスクリプト
+"""
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import disk_cache
+import excel_parser
+import synthetic_workbook
+from disk_cache import DiskCache, file_digest, make_key
+
+
+def test_get_set_and_stats():
+    """保存したデータが読み出せ、ヒット・ミスが数えられること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = DiskCache(temp_dir)
+        key = make_key('test', 1)
+
+        assert cache.get(key) is None
+        cache.set(key, b'payload')
+        assert cache.get(key) == b'payload'
+        assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_lru_eviction():
+    """サイズ上限を超えると、最近使われていないエントリから削除されること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = DiskCache(temp_dir, max_bytes=3 * 1100)
+        keys = [make_key('lru', idx) for idx in range(4)]
+
+        for idx, key in enumerate(keys[:3]):
+            cache.set(key, b'x' * 1000)
+            # 更新日時の順序を確定させる
+            os.utime(cache._path(key), (idx, idx))
+
+        # 最初のエントリを使うと、2番目が最も古くなる
+        assert cache.get(keys[0]) is not None
+        cache.set(keys[3], b'x' * 1000)
+
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[2]) is not None
+        assert cache.get(keys[3]) is not None
+
+
+def test_eviction_scans_only_over_the_limit():
+    """合計サイズの見積もりが上限以下の間は、書き込みのたびにディレクトリを走査しないこと"""
+    scans = []
+    original_scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return original_scandir(path)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = DiskCache(temp_dir, max_bytes=10 * 1100)
+        os.scandir = counting_scandir
+        try:
+            for idx in range(10):
+                cache.set(make_key('scan', idx), b'x' * 1000)
+            # 上書きは置き換えたエントリの分を差し引く
+            cache.set(make_key('scan', 0), b'y' * 1000)
+            first_scans = len([path for path in scans if path == temp_dir])
+            cache.set(make_key('scan', 10), b'x' * 1000)
+        finally:
+            os.scandir = original_scandir
+
+        # 最初の書き込みで1回だけ走査し、上限を超えたときにもう1回走査する
+        assert first_scans == 1
+        assert len([path for path in scans if path == temp_dir]) == 2
+        remaining = [idx for idx in range(11) if cache.get(make_key('scan', idx)) is not None]
+        assert len(remaining) == 10
+        assert cache._total <= cache.max_bytes
+
+
+def test_file_digest_without_hashlib_file_digest():
+    """hashlib.file_digest がない環境でも同じダイジェストになること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'data.bin')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(3 * disk_cache._DIGEST_CHUNK_SIZE // 2))
+        expected = file_digest(path)
+
+        original = getattr(disk_cache.hashlib, 'file_digest', None)
+        if original is not None:
+            del disk_cache.hashlib.file_digest
+        try:
+            assert file_digest(path) == expected
+        finally:
+            if original is not None:
+                disk_cache.hashlib.file_digest = original
+
+
+def test_max_age():
+    """有効期限を過ぎたエントリはミスになること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = DiskCache(temp_dir, max_age=0.05)
+        key = make_key('ttl')
+        cache.set(key, b'payload')
+        time.sleep(0.1)
+        assert cache.get(key) is None
+
+
+def _concurrent_worker(args):
+    directory, worker = args
+    cache = DiskCache(directory, max_bytes=64 * 1024)
+    for idx in range(200):
+        key = make_key('shared', idx % 20)
+        data = cache.get(key)
+        if data is not None and data != str(idx % 20).encode() * 500:
+            return False
+        cache.set(key, str(idx % 20).encode() * 500)
+    return True
+
+
+def test_concurrent_processes():
+    """複数プロセスが同じキーを読み書きしても壊れたデータが見えないこと"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(_concurrent_worker, [(temp_dir, n) for n in range(4)]))
+    assert all(results)
+
+
+def test_parse_cache_skips_zip_on_hit():
+    """キャッシュヒット時はExcelファイルを展開せずに同じ結果を返すこと"""
+    shapes = [
+        {"kind": "sp", "text": "", "from": (1, 0, 1, 0), "to": (4, 0, 5, 0)},
+        {"kind": "txSp", "text": "処理Bのラベル", "from": (2, 0, 2, 0), "to": (3, 0, 3, 0)},
+        {"kind": "sp", "text": "開始", "from": (6, 0, 1, 0), "to": (8, 0, 3, 0)},
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "cached.xlsx")
+        synthetic_workbook.write_workbook(file_path, [("Sheet1", shapes)])
+        cache = DiskCache(os.path.join(temp_dir, "cache"))
+
+        expected = excel_parser.parse_excel_shapes(file_path, "Sheet1")
+        first = excel_parser.parse_excel_shapes(file_path, "Sheet1", cache=cache)
+
+        original_zipfile = zipfile.ZipFile
+        zipfile.ZipFile = None  # ヒット時に展開されたらエラーになる
+        try:
+            second = excel_parser.parse_excel_shapes(file_path, "Sheet1", cache=cache)
+            table = excel_parser.parse_excel_shapes(file_path, "Sheet1", cache=cache, compact=True)
+        finally:
+            zipfile.ZipFile = original_zipfile
+
+        assert first == expected
+        assert second == expected
+        assert table.records() == expected
+        assert cache.stats()["hits"] == 2
+
+        # ファイル内容が変われば別のキーになる
+        shapes[0]["text"] = "変更後"
+        synthetic_workbook.write_workbook(file_path, [("Sheet1", shapes)])
+        changed = excel_parser.parse_excel_shapes(file_path, "Sheet1", cache=cache)
+        assert changed[0]["text"] == "変更後"
+        assert cache.stats()["misses"] == 2
+
+
+def main():
+    print("Testing disk cache...")
+    print("=" * 60)
+
+    test_get_set_and_stats()
+    print("✓ Entries are stored and counted")
+
+    test_lru_eviction()
+    print("✓ Least recently used entries are evicted")
+
+    test_eviction_scans_only_over_the_limit()
+    print("✓ Eviction scans only when over the limit")
+
+    test_file_digest_without_hashlib_file_digest()
+    print("✓ File digest works without hashlib.file_digest")
+
+    test_max_age()
+    print("✓ Expired entries are ignored")
+
+    test_concurrent_processes()
+    print("✓ Concurrent processes see consistent entries")
+
+    test_parse_cache_skips_zip_on_hit()
+    print("✓ Parse cache hit skips zip/XML work")
+
+    print("\n" + "=" * 60)
+    print("✓ Disk cache test complete!")
+
+
+if __name__ == "__main__":
+    main()
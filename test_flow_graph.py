@@ -0,0 +1,435 @@
+"""
+フローグラフ（コネクタの接続情報からのMermaid生成）のテストスクリプト
+"""
+import os
+import tempfile
+import time
+import zipfile
+
+import excel_parser
+import flow_graph
+import pipeline
+import synthetic_workbook
+from disk_cache import DiskCache
+from test_ai_async import stub_server
+
+
+# 開始 → 判定 → (処理A / 終了)、処理A → 終了
+BOUND_SHAPES = [
+    {"kind": "sp", "text": "開始", "geometry": "flowChartTerminator",
+     "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+    {"kind": "sp", "text": "", "geometry": "flowChartDecision",
+     "from": (1, 0, 5, 0), "to": (3, 0, 8, 0)},
+    {"kind": "txSp", "text": "在庫あり?", "from": (1, 0, 6, 0), "to": (3, 0, 7, 0)},
+    {"kind": "sp", "text": "出荷", "from": (5, 0, 5, 0), "to": (7, 0, 8, 0)},
+    {"kind": "sp", "text": "終了", "geometry": "flowChartTerminator",
+     "from": (1, 0, 11, 0), "to": (3, 0, 13, 0)},
+    {"kind": "cxnSp", "from": (2, 0, 3, 0), "to": (2, 0, 5, 0), "start": 0, "end": 1,
+     "tail_end": "triangle"},
+    # 判定の中のテキストボックスに接続されていても、判定のノードにつながる
+    {"kind": "cxnSp", "from": (3, 0, 6, 0), "to": (5, 0, 6, 0), "start": 2, "end": 3,
+     "tail_end": "triangle"},
+    # headEnd だけの矢印は終点から始点へのつながり
+    {"kind": "cxnSp", "from": (2, 0, 8, 0), "to": (2, 0, 11, 0), "start": 4, "end": 1,
+     "head_end": "triangle"},
+    {"kind": "cxnSp", "geometry": "bentConnector3", "from": (3, 0, 8, 0), "to": (6, 0, 12, 0),
+     "flip_h": True, "start": 3, "end": 4, "tail_end": "triangle"},
+]
+
+
+def _write(temp_dir, shapes, name="flow.xlsx"):
+    path = os.path.join(temp_dir, name)
+    synthetic_workbook.write_workbook(path, [("Sheet1", shapes)])
+    return path
+
+
+def _graph(path):
+    mapped = excel_parser.parse_excel_shapes(path, "Sheet1")
+    return flow_graph.build_sheet_graph(path, "Sheet1", mapped)
+
+
+def test_bound_connectors_become_edges():
+    """接続済みのコネクタがノード間のエッジになり、グラフが解決済みになること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        graph = _graph(_write(temp_dir, BOUND_SHAPES))
+
+    assert [(node["id"], node["text"]) for node in graph["nodes"]] == [
+        ("node_001", "開始"), ("node_002", "在庫あり?"), ("node_003", "出荷"), ("node_004", "終了")]
+    assert [node["shape_id"] for node in graph["nodes"]] == [2, 3, 5, 6]
+    assert [(edge["source"], edge["arrow"], edge["target"]) for edge in graph["edges"]] == [
+        ("node_001", "-->", "node_002"),
+        ("node_002", "-->", "node_003"),
+        ("node_002", "-->", "node_004"),
+        ("node_003", "-->", "node_004"),
+    ]
+    assert all(edge["confidence"] == 1.0 for edge in graph["edges"])
+    assert flow_graph.is_resolved(graph)
+
+
+def test_to_mermaid_maps_node_shapes():
+    """prstGeom に応じたノード形状でMermaidコードを生成すること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        code = flow_graph.to_mermaid(_graph(_write(temp_dir, BOUND_SHAPES)))
+
+    assert code == "\n".join([
+        'graph TD',
+        '    node_001(["開始"])',
+        '    node_002{"在庫あり?"}',
+        '    node_003["出荷"]',
+        '    node_004(["終了"])',
+        '    node_001 --> node_002',
+        '    node_002 --> node_003',
+        '    node_002 --> node_004',
+        '    node_003 --> node_004',
+    ])
+
+
+def test_arrow_styles_and_escaping():
+    """矢印の有無に応じた線の種類と、テキストのエスケープ"""
+    graph = {
+        "nodes": [
+            {"id": "node_001", "shape_id": 2, "text": 'say "hi"', "geometry": "ellipse", "position": {}},
+            {"id": "node_002", "shape_id": 3, "text": "a\nb", "geometry": None, "position": {}},
+        ],
+        "edges": [
+            {"source": "node_001", "target": "node_002", "arrow": "---", "label": "", "connector_id": 4,
+             "confidence": 1.0},
+            {"source": "node_001", "target": "node_002", "arrow": "<-->", "label": "Yes", "connector_id": 5,
+             "confidence": 1.0},
+        ],
+        "unbound": [], "labels": [], "block_arrows": [],
+    }
+    assert flow_graph.to_mermaid(graph).splitlines()[1:] == [
+        '    node_001(("say #quot;hi#quot;"))',
+        '    node_002["a<br/>b"]',
+        '    node_001 --- node_002',
+        '    node_001 <-->|"Yes"| node_002',
+    ]
+
+
+def test_unresolved_graphs():
+    """接続されていないコネクタ・ラベル・図形の矢印があれば未解決になること"""
+    # 終点が判定の図形から1行（15pt）離れている
+    unbound = BOUND_SHAPES[:5] + [
+        {"kind": "cxnSp", "from": (2, 0, 3, 0), "to": (2, 0, 4, 0), "tail_end": "triangle"}]
+    # どの線からも離れたテキスト
+    label = BOUND_SHAPES + [{"kind": "txSp", "text": "Yes", "from": (9, 0, 1, 0), "to": (10, 0, 2, 0)}]
+    block_arrow = BOUND_SHAPES + [
+        {"kind": "sp", "geometry": "downArrow", "from": (8, 0, 1, 0), "to": (9, 0, 3, 0)}]
+    no_connectors = BOUND_SHAPES[:2]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        graphs = [_graph(_write(temp_dir, shapes, f"{idx}.xlsx"))
+                  for idx, shapes in enumerate([unbound, label, block_arrow, no_connectors])]
+
+    assert graphs[0]["unbound"] == [7]
+    assert len(graphs[1]["labels"]) == 1
+    assert len(graphs[2]["block_arrows"]) == 1
+    assert not any(flow_graph.is_resolved(graph) for graph in graphs)
+
+
+def test_connector_endpoints_follow_flips():
+    """線の端点は反転・回転を反映した座標になること"""
+    shape = {"position": {"left": 10, "top": 20, "width": 100, "height": 40}, "geometry": None,
+             "adjust": {}, "rotation": 0.0, "flip_h": False, "flip_v": False}
+    assert flow_graph.connector_endpoints(shape) == ((10, 20), (110, 60))
+    assert flow_graph.connector_endpoints(dict(shape, flip_h=True)) == ((110, 20), (10, 60))
+    assert flow_graph.connector_endpoints(dict(shape, flip_v=True)) == ((10, 60), (110, 20))
+
+    # 90度回転: 中心 (60, 40) を軸に回す
+    start, end = flow_graph.connector_endpoints(dict(shape, rotation=90.0))
+    assert [round(value, 6) for value in start + end] == [80, -10, 40, 90]
+
+
+def test_unbound_connectors_snap_to_nearest_shape():
+    """接続されていない線も、端点の近くの図形につながるエッジになること"""
+    shapes = [
+        {"kind": "sp", "text": "開始", "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+        {"kind": "sp", "text": "処理", "from": (1, 0, 5, 0), "to": (3, 0, 7, 0)},
+        {"kind": "sp", "text": "終了", "from": (5, 0, 5, 0), "to": (7, 0, 7, 0)},
+        # 枠に接する線
+        {"kind": "cxnSp", "from": (2, 0, 3, 0), "to": (2, 0, 5, 0), "tail_end": "triangle"},
+        # 右から左に引いた線（flipH）、終点は枠の少し手前
+        {"kind": "cxnSp", "from": (3, 38100, 6, 0), "to": (5, 0, 6, 0), "flip_h": True,
+         "head_end": "triangle"},
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        graph = _graph(_write(temp_dir, shapes))
+
+    assert graph["unbound"] == []
+    assert [(edge["source"], edge["target"]) for edge in graph["edges"]] == [
+        ("node_001", "node_002"), ("node_002", "node_003")]
+    first, second = (edge["confidence"] for edge in graph["edges"])
+    assert first == 0.99
+    assert flow_graph.MIN_CONFIDENCE <= second < first
+    assert flow_graph.is_resolved(graph)
+
+
+def test_sp_drawn_arrow_becomes_an_edge():
+    """sp で描かれた線（prstGeom が line）はノードにならず、2つの図形をつなぐエッジになること"""
+    shapes = [
+        {"kind": "sp", "text": "A", "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+        {"kind": "sp", "text": "B", "from": (1, 0, 5, 0), "to": (3, 0, 7, 0)},
+        {"kind": "sp", "geometry": "line", "from": (2, 0, 3, 0), "to": (2, 0, 5, 0), "tail_end": "triangle"},
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write(temp_dir, shapes)
+        graph = _graph(path)
+        compact = excel_parser.parse_excel_shapes(path, "Sheet1", compact=True)
+        compact_graph = flow_graph.build_sheet_graph(path, "Sheet1", compact)
+
+    assert [(node["id"], node["text"]) for node in graph["nodes"]] == [("node_001", "A"), ("node_002", "B")]
+    assert [(edge["source"], edge["arrow"], edge["target"]) for edge in graph["edges"]] == [
+        ("node_001", "-->", "node_002")]
+    assert graph["unbound"] == [] and flow_graph.is_resolved(graph)
+    assert len(compact) == 2 and compact_graph == graph
+
+
+def test_ambiguous_endpoints_have_low_confidence():
+    """2つの図形の間にある端点は信頼度が低く、AIで読み取る対象になること"""
+    shapes = [
+        {"kind": "sp", "text": "開始", "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+        {"kind": "sp", "text": "A", "from": (0, 0, 5, 0), "to": (2, 0, 7, 0)},
+        {"kind": "sp", "text": "B", "from": (2, 76200, 5, 0), "to": (4, 0, 7, 0)},
+        # 終点は A と B の隙間の真上にある
+        {"kind": "cxnSp", "from": (2, 38100, 3, 0), "to": (2, 38100, 5, 0), "tail_end": "triangle"},
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        graph = _graph(_write(temp_dir, shapes))
+
+    assert len(graph["edges"]) == 1
+    assert graph["edges"][0]["confidence"] < flow_graph.MIN_CONFIDENCE
+    assert not flow_graph.is_resolved(graph)
+    assert flow_graph.is_resolved(graph, min_confidence=0.0)
+
+
+def test_snapping_scales_to_thousands_of_connectors():
+    """数千本の接続されていない線も短時間で吸着できること"""
+    columns = 20
+    shapes = synthetic_workbook.grid_shapes(2000, columns=columns)
+    for idx in range(2000 - columns):
+        col = (idx % columns) * 3
+        row = (idx // columns) * 4
+        shapes.append({"kind": "cxnSp", "from": (col + 1, 0, row + 2, 0), "to": (col + 1, 0, row + 4, 0),
+                       "tail_end": "triangle"})
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write(temp_dir, shapes)
+        drawing = excel_parser.parse_sheet_drawing(path, "Sheet1")
+        mapped = excel_parser.parse_excel_shapes(path, "Sheet1")
+
+    started = time.perf_counter()
+    graph = flow_graph.build_flow_graph(drawing, mapped)
+    elapsed = time.perf_counter() - started
+
+    assert len(graph["edges"]) == 2000 - columns
+    assert graph["edges"][0]["source"] == "node_001" and graph["edges"][0]["target"] == "node_021"
+    assert flow_graph.is_resolved(graph)
+    assert elapsed < 2.0, f"{elapsed:.3f}s"
+
+
+# 判定から「Yes」で下、「No」で右に分岐する（ラベルはテキストボックスで、線には接続されていない）
+LABEL_SHAPES = [
+    {"kind": "sp", "text": "在庫あり?", "geometry": "flowChartDecision",
+     "from": (1, 0, 1, 0), "to": (3, 0, 4, 0)},
+    {"kind": "sp", "text": "出荷", "from": (1, 0, 7, 0), "to": (3, 0, 9, 0)},
+    {"kind": "sp", "text": "発注", "from": (6, 0, 1, 0), "to": (8, 0, 4, 0)},
+    {"kind": "cxnSp", "from": (2, 0, 4, 0), "to": (2, 0, 7, 0), "start": 0, "end": 1,
+     "tail_end": "triangle"},
+    {"kind": "cxnSp", "from": (3, 0, 2, 0), "to": (6, 0, 2, 0), "start": 0, "end": 2,
+     "tail_end": "triangle"},
+    {"kind": "txSp", "text": "Yes", "from": (2, 0, 5, 0), "to": (2, 228600, 6, 0)},
+    {"kind": "txSp", "text": "No", "from": (4, 0, 1, 0), "to": (5, 0, 2, 0)},
+]
+
+
+def test_labels_are_assigned_to_nearest_connector():
+    """分岐ラベルのテキストが最も近い線のエッジに割り当てられ、ローカルで変換できること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        path = _write(temp_dir, LABEL_SHAPES)
+        graph = _graph(path)
+        result = pipeline.convert_sheet(path, "Sheet1")
+
+    assert graph["labels"] == []
+    assert [(edge["label"], edge["label_id"]) for edge in graph["edges"]] == [("Yes", 7), ("No", 8)]
+    assert flow_graph.is_resolved(graph)
+    assert flow_graph.to_mermaid(graph).splitlines()[-2:] == [
+        '    node_001 -->|"Yes"| node_002',
+        '    node_001 -->|"No"| node_003',
+    ]
+    assert server.requests == 0
+    assert result["local"] and '-->|"Yes"|' in result["mermaid"]
+
+
+def test_labels_use_connector_path():
+    """折れ線コネクタでは、始点と終点を結ぶ直線ではなく経路からの距離で割り当てること"""
+    shapes = [
+        {"kind": "sp", "text": "A", "from": (0, 0, 19, 0), "to": (1, 0, 21, 0)},
+        {"kind": "sp", "text": "B", "from": (5, 0, 30, 0), "to": (7, 0, 32, 0)},
+        {"kind": "cxnSp", "geometry": "bentConnector2", "from": (1, 0, 20, 0), "to": (6, 0, 30, 0),
+         "start": 0, "end": 1, "tail_end": "triangle"},
+        # 折れ曲がりの角の外側（直線からは100pt以上離れている）
+        {"kind": "txSp", "text": "Yes", "from": (6, 12700, 19, 0), "to": (6, 254000, 20, 0)},
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        graph = _graph(_write(temp_dir, shapes))
+
+    assert graph["edges"][0]["label"] == "Yes"
+    assert flow_graph.is_resolved(graph)
+
+
+def test_competing_labels_are_left_unassigned():
+    """同じ線に複数のラベルが近い場合は、最も近いものだけを割り当ててAIに任せること"""
+    shapes = LABEL_SHAPES + [
+        {"kind": "txSp", "text": "No", "from": (2, 0, 6, 0), "to": (2, 228600, 7, 0)}]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        graph = _graph(_write(temp_dir, shapes))
+
+    assert graph["edges"][0]["label"] == "Yes"
+    assert graph["labels"] == [9]
+    assert not flow_graph.is_resolved(graph)
+
+
+def test_parser_reads_connections():
+    """a:stCxn / a:endCxn の接続先IDが抽出されること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        shapes = excel_parser.parse_sheet_drawing(_write(temp_dir, BOUND_SHAPES), "Sheet1")
+
+    connectors = [shape for shape in shapes if shape["shape_type"] == "connector"]
+    assert [(shape["start_id"], shape["end_id"]) for shape in connectors] == [
+        (2, 3), (4, 5), (6, 3), (5, 6)]
+    assert shapes[0]["start_id"] is None
+
+
+def test_tree_parser_builds_the_same_graph():
+    """ツリー解析（streaming=False）の結果からも、同じ図形・テキストのノードを組み立てること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write(temp_dir, BOUND_SHAPES)
+        graph = _graph(path)
+        for options in ({"streaming": False}, {"streaming": False, "compact": True}):
+            mapped = excel_parser.parse_excel_shapes(path, "Sheet1", **options)
+            assert flow_graph.build_sheet_graph(path, "Sheet1", mapped) == graph, options
+
+
+def test_sheet_with_two_drawings():
+    """2つのdrawingを持つシートでは、temp_id を通し番号にし、各コンテナを自分の図形に対応付けること"""
+    second = [
+        {"kind": "sp", "text": "別図形A", "from": (10, 0, 1, 0), "to": (12, 0, 3, 0)},
+        {"kind": "sp", "text": "別図形B", "geometry": "ellipse", "from": (10, 0, 5, 0), "to": (12, 0, 7, 0)},
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        single = os.path.join(temp_dir, "single.xlsx")
+        synthetic_workbook.write_workbook(single, [("Sheet1", BOUND_SHAPES), ("Other", second)])
+        # Sheet1 から2つ目のdrawingも参照する
+        path = os.path.join(temp_dir, "two_drawings.xlsx")
+        with zipfile.ZipFile(single) as source, zipfile.ZipFile(path, 'w') as target:
+            for item in source.infolist():
+                data = source.read(item.filename)
+                if item.filename == 'xl/worksheets/_rels/sheet1.xml.rels':
+                    data = synthetic_workbook._relationships_xml([
+                        ('rId1', 'drawing', '../drawings/drawing1.xml'),
+                        ('rId2', 'drawing', '../drawings/drawing2.xml'),
+                    ])
+                target.writestr(item, data)
+
+        mapped = excel_parser.parse_excel_shapes(path, "Sheet1")
+        graph = flow_graph.build_sheet_graph(path, "Sheet1", mapped)
+        tree_graph = flow_graph.build_sheet_graph(
+            path, "Sheet1", excel_parser.parse_excel_shapes(path, "Sheet1", streaming=False, compact=True))
+
+    temp_ids = [container["temp_id"] for container in mapped]
+    assert len(set(temp_ids)) == len(temp_ids) == 6
+    assert temp_ids[-2:] == ["temp_009", "temp_010"]
+    nodes = {node["text"]: node for node in graph["nodes"]}
+    assert nodes["別図形B"]["geometry"] == "ellipse" and nodes["出荷"]["geometry"] == "rect"
+    assert nodes["別図形A"]["position"] == mapped[4]["position"]
+    assert nodes["開始"]["position"] == mapped[0]["position"]
+    assert tree_graph == graph
+
+
+def test_graph_is_cached():
+    """グラフは解析キャッシュに保存され、2回目はExcelファイルを読まないこと"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write(temp_dir, BOUND_SHAPES)
+        cache = DiskCache(os.path.join(temp_dir, "cache"))
+        mapped = excel_parser.parse_excel_shapes(path, "Sheet1")
+
+        first = flow_graph.build_sheet_graph(path, "Sheet1", mapped, cache=cache)
+        original = excel_parser.parse_sheet_drawing
+        excel_parser.parse_sheet_drawing = None
+        try:
+            second = flow_graph.build_sheet_graph(path, "Sheet1", mapped, cache=cache)
+        finally:
+            excel_parser.parse_sheet_drawing = original
+
+    assert first == second
+    assert cache.hits == 1
+
+
+def test_pipeline_skips_ai_when_resolved():
+    """すべてのコネクタが接続済みのシートはAIを呼ばず、画像も作らないこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        path = _write(temp_dir, BOUND_SHAPES)
+        result = pipeline.convert_sheet(
+            path, "Sheet1", intermediate_dir=os.path.join(temp_dir, "work"), keep_intermediate=True
+        )
+        forced = pipeline.convert_sheet(path, "Sheet1", render="headless", local_graph=False)
+
+    assert server.requests == 1
+    assert (result["ai"], result["local"]) == (False, True)
+    assert result["mermaid"].startswith('graph TD\n    node_001(["開始"])')
+    assert [os.path.basename(p) for p in result["intermediate"]] == ["instructions.json", "graph.json"]
+    assert (forced["ai"], forced["local"]) == (True, False)
+
+
+def main():
+    print("Testing flow graph...")
+    print("=" * 60)
+
+    test_parser_reads_connections()
+    print("✓ Connector bindings are parsed")
+
+    test_bound_connectors_become_edges()
+    print("✓ Bound connectors become edges")
+
+    test_to_mermaid_maps_node_shapes()
+    test_arrow_styles_and_escaping()
+    print("✓ Mermaid code is generated locally")
+
+    test_unresolved_graphs()
+    print("✓ Unresolved graphs are detected")
+
+    test_connector_endpoints_follow_flips()
+    test_unbound_connectors_snap_to_nearest_shape()
+    print("✓ Unbound connectors snap to nearby shapes")
+
+    test_labels_are_assigned_to_nearest_connector()
+    test_labels_use_connector_path()
+    test_competing_labels_are_left_unassigned()
+    print("✓ Branch labels are assigned to connectors")
+
+    test_sp_drawn_arrow_becomes_an_edge()
+    print("✓ Lines drawn as shapes become edges")
+
+    test_ambiguous_endpoints_have_low_confidence()
+    print("✓ Ambiguous endpoints have low confidence")
+
+    test_snapping_scales_to_thousands_of_connectors()
+    print("✓ Snapping scales to thousands of connectors")
+
+    test_tree_parser_builds_the_same_graph()
+    test_sheet_with_two_drawings()
+    print("✓ Containers are matched to their shapes in every parser mode")
+
+    test_graph_is_cached()
+    print("✓ Graph is cached")
+
+    test_pipeline_skips_ai_when_resolved()
+    print("✓ Pipeline skips the AI call for resolved sheets")
+
+    print("\n" + "=" * 60)
+    print("✓ Flow graph test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+ヘッドレス描画（headless_renderer）のテストスクリプト
+"""
+import os
+import tempfile
+import time
+
+import asset_generator
+import excel_parser
+import headless_renderer
+import pipeline
+import synthetic_workbook
+
+
+SHAPES = [
+    {"kind": "sp", "text": "開始", "geometry": "flowChartTerminator",
+     "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+    {"kind": "sp", "text": "判定", "geometry": "flowChartDecision",
+     "from": (1, 0, 5, 0), "to": (3, 0, 8, 0)},
+    {"kind": "cxnSp", "from": (2, 0, 3, 0), "to": (2, 0, 5, 0), "tail_end": "triangle"},
+    {"kind": "cxnSp", "geometry": "bentConnector3", "from": (4, 0, 6, 0), "to": (6, 0, 12, 0),
+     "flip_h": True, "head_end": "oval", "tail_end": "triangle"},
+    {"kind": "txSp", "text": "Yes", "from": (3, 0, 4, 0), "to": (4, 0, 5, 0)},
+]
+
+
+def _dark(image, point, radius=2):
+    """点の周辺に黒っぽい画素があるかどうか"""
+    x, y = (round(value) for value in point)
+    for dx in range(-radius, radius + 1):
+        for dy in range(-radius, radius + 1):
+            pixel = image.getpixel((min(max(x + dx, 0), image.size[0] - 1),
+                                    min(max(y + dy, 0), image.size[1] - 1)))
+            if sum(pixel) < 200:
+                return True
+    return False
+
+
+def _to_pixel(transform, x, y):
+    scale, origin_x, origin_y = transform
+    return (x - origin_x) * scale, (y - origin_y) * scale
+
+
+def test_parse_sheet_drawing():
+    """形状・反転・矢印・IDがドキュメント順に抽出されること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "flow.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", SHAPES)])
+        shapes = excel_parser.parse_sheet_drawing(path, "Sheet1")
+
+    assert [shape["shape_type"] for shape in shapes] == [
+        "auto_shape", "auto_shape", "connector", "connector", "text_box"]
+    assert [shape["id"] for shape in shapes] == [2, 3, 4, 5, 6]
+    assert shapes[0]["geometry"] == "flowChartTerminator"
+    assert shapes[0]["text"] == "開始"
+
+    bent = shapes[3]
+    assert bent["geometry"] == "bentConnector3"
+    assert (bent["flip_h"], bent["flip_v"]) == (True, False)
+    assert (bent["head_end"], bent["tail_end"]) == ("oval", "triangle")
+    assert bent["line_width"] == 0.75
+    assert shapes[2]["head_end"] is None
+
+
+def test_render_draws_connectors_with_flips():
+    """反転したコネクタが正しい向きに描画され、矢印が終点に付くこと"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "flow.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", SHAPES)])
+        image, transform = headless_renderer.render_sheet(path, "Sheet1", dpi=144)
+        bent = excel_parser.parse_sheet_drawing(path, "Sheet1")[3]["position"]
+
+    assert transform[0] == 2.0
+    left, top = bent["left"], bent["top"]
+    right, bottom = left + bent["width"], top + bent["height"]
+    middle_x = (left + right) / 2
+
+    # flipH: 右上から出て中央で折れ、左下に入る
+    assert _dark(image, _to_pixel(transform, right - 2, top))
+    assert _dark(image, _to_pixel(transform, middle_x, (top + bottom) / 2))
+    assert _dark(image, _to_pixel(transform, left + 2, bottom))
+    assert not _dark(image, _to_pixel(transform, left + 10, top), radius=1)
+    assert not _dark(image, _to_pixel(transform, right - 10, bottom), radius=1)
+
+    # 終点側の矢印（三角形）は線より太い
+    arrow_base = _to_pixel(transform, left + 3, bottom)
+    assert _dark(image, (arrow_base[0], arrow_base[1] - 3), radius=0)
+    assert _dark(image, (arrow_base[0], arrow_base[1] + 3), radius=0)
+
+
+def test_render_draws_sp_lines_as_lines():
+    """sp で描かれた線は枠ではなく、始点から終点への線として描画されること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "flow.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", [
+            {"kind": "sp", "geometry": "line", "from": (1, 0, 1, 0), "to": (4, 0, 6, 0), "tail_end": "triangle"},
+        ])])
+        image, transform = headless_renderer.render_sheet(path, "Sheet1", dpi=144)
+        shape, = excel_parser.parse_sheet_drawing(path, "Sheet1")
+
+    pos = shape["position"]
+    left, top = pos["left"], pos["top"]
+    right, bottom = left + pos["width"], top + pos["height"]
+
+    assert shape["shape_type"] == "connector"
+    assert _dark(image, _to_pixel(transform, (left + right) / 2, (top + bottom) / 2))
+    assert _dark(image, _to_pixel(transform, right - 1, bottom - 1))
+    # 外接矩形の残りの角には何も描かない
+    assert not _dark(image, _to_pixel(transform, right, top), radius=1)
+    assert not _dark(image, _to_pixel(transform, left, bottom), radius=1)
+
+
+def test_render_without_shapes():
+    """図形がなくても小さな白紙の画像を返すこと"""
+    image, transform = headless_renderer.render_shapes([])
+    assert image.size[0] > 0 and image.size[1] > 0
+    assert image.getextrema() == ((255, 255), (255, 255), (255, 255))
+
+
+def test_canvas_is_limited():
+    """キャンバスの長辺は MAX_CANVAS_EDGE を超えないこと"""
+    shape = {
+        "shape_type": "auto_shape", "text": "", "geometry": "rect", "adjust": {},
+        "rotation": 0.0, "flip_h": False, "flip_v": False, "line_width": None,
+        "head_end": None, "tail_end": None,
+        "position": {"left": 0, "top": 0, "width": 100000, "height": 50},
+    }
+    image, transform = headless_renderer.render_shapes([shape], dpi=300)
+    assert max(image.size) <= headless_renderer.MAX_CANVAS_EDGE
+    assert transform[0] < 300 / 72
+
+
+def test_anchor_masks_follow_transform():
+    """IDアンカーのマスクが描画の座標変換に従って配置されること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "flow.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", SHAPES)])
+        mapped = excel_parser.parse_excel_shapes(path, "Sheet1")
+        json_data, image, transform = asset_generator.build_assets(
+            mapped, path, "Sheet1", render="headless", dpi=96
+        )
+
+    assert [node["text"] for node in json_data] == ["開始", "判定"]
+    for node in json_data:
+        x1, y1, x2, y2 = asset_generator._node_box(node["position"], transform)
+        # マスクの枠線は黒、枠のすぐ内側は白
+        assert _dark(image, (x1, (y1 + y2) / 2), radius=1)
+        assert image.getpixel((round(x1) + 4, round(y1) + 4)) == (255, 255, 255)
+
+
+def test_pipeline_runs_headless():
+    """画面のない環境でも --render headless でシートを変換できること"""
+    saved_key = os.environ.pop('GOOGLE_API_KEY', None)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "flow.xlsx")
+            synthetic_workbook.write_workbook(path, [("Sheet1", SHAPES)])
+            result = pipeline.convert_sheet(
+                path, "Sheet1", output_path=os.path.join(temp_dir, "out.md"), render="headless"
+            )
+            with open(result["output"], encoding='utf-8') as f:
+                assert "```mermaid" in f.read()
+    finally:
+        if saved_key is not None:
+            os.environ['GOOGLE_API_KEY'] = saved_key
+
+    assert result["shapes"] == 2
+
+
+def test_render_is_fast():
+    """200図形のシートを十分に短い時間で描画できること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "grid.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.grid_shapes(200))])
+        headless_renderer.render_sheet(path, "Sheet1")
+
+        started = time.perf_counter()
+        for _ in range(5):
+            headless_renderer.render_sheet(path, "Sheet1")
+        per_sheet = (time.perf_counter() - started) / 5
+
+    assert per_sheet < 0.5, f"{per_sheet:.3f}s per sheet"
+
+
+def main():
+    print("Testing headless renderer...")
+    print("=" * 60)
+
+    test_parse_sheet_drawing()
+    print("✓ Drawing geometry is parsed")
+
+    test_render_draws_connectors_with_flips()
+    print("✓ Connectors are drawn with flips and arrowheads")
+
+    test_render_draws_sp_lines_as_lines()
+    print("✓ Lines drawn as shapes are rendered as lines")
+
+    test_render_without_shapes()
+    test_canvas_is_limited()
+    print("✓ Canvas size is bounded")
+
+    test_anchor_masks_follow_transform()
+    print("✓ Anchor masks follow the render transform")
+
+    test_pipeline_runs_headless()
+    print("✓ Pipeline runs without a display")
+
+    test_render_is_fast()
+    print("✓ Rendering is fast")
+
+    print("\n" + "=" * 60)
+    print("✓ Headless renderer test complete!")
+
+
+if __name__ == "__main__":
+    main()
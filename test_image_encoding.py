@@ -0,0 +1,125 @@
+"""
+アップロード用画像のエンコード（切り抜き・縮小・形式）のテストスクリプト
+"""
+import base64
+import io
+
+from PIL import Image
+
+import ai_connector
+import asset_generator
+
+
+def _node(left, top, width, height):
+    return {"id": "node_001", "text": "", "shape_type": "rect",
+            "position": {"left": left, "top": top, "width": width, "height": height}}
+
+
+def _screenshot(size=(3840, 2160)):
+    return Image.new("RGB", size, "white")
+
+
+def test_crops_to_chart_with_margin():
+    """全ノードの外接矩形に余白を加えた範囲に切り抜くこと"""
+    json_data = [_node(1000, 500, 100, 50), _node(1300, 700, 200, 100)]
+    image_bytes = asset_generator.encode_anchor_image(
+        _screenshot(), json_data, image_format="png", max_edge=None, margin=20
+    )
+    assert Image.open(io.BytesIO(image_bytes)).size == (540, 340)
+
+
+def test_crop_is_clipped_to_image():
+    """切り抜き範囲は画像の内側に収まり、図形が画像外なら切り抜かないこと"""
+    bbox = asset_generator._chart_bbox([_node(10, 10, 50, 50)], (200, 100), 32)
+    assert bbox == (0, 0, 92, 92)
+
+    bbox = asset_generator._chart_bbox([_node(500, 500, 50, 50)], (200, 100), 32)
+    assert bbox == (0, 0, 200, 100)
+
+
+def test_downscales_to_max_edge():
+    """長辺が max_edge を超える場合は縦横比を保って縮小すること"""
+    image_bytes = asset_generator.encode_anchor_image(_screenshot(), max_edge=1600)
+    assert Image.open(io.BytesIO(image_bytes)).size == (1600, 900)
+
+    # 小さい画像は拡大しない
+    image_bytes = asset_generator.encode_anchor_image(_screenshot((800, 600)), max_edge=1600)
+    assert Image.open(io.BytesIO(image_bytes)).size == (800, 600)
+
+
+def test_formats_and_mime_types():
+    """各形式でデコードでき、リクエストのMIMEタイプが形式と一致すること"""
+    expected = {
+        "png": ("PNG", "RGB", "image/png"),
+        "palette": ("PNG", "P", "image/png"),
+        "gray": ("PNG", "L", "image/png"),
+        "webp": ("WEBP", "RGB", "image/webp"),
+        "jpeg": ("JPEG", "RGB", "image/jpeg"),
+    }
+    image = asset_generator.draw_anchor_image(_screenshot((640, 480)), [_node(100, 100, 200, 80)])
+    for image_format, (pil_format, mode, mime_type) in expected.items():
+        image_bytes = asset_generator.encode_anchor_image(image, image_format=image_format)
+        decoded = Image.open(io.BytesIO(image_bytes))
+        assert (decoded.format, decoded.mode) == (pil_format, mode), image_format
+
+        inline_data = ai_connector._build_payload("prompt", image_bytes)["contents"][0]["parts"][1]["inline_data"]
+        assert inline_data["mime_type"] == mime_type
+        assert base64.b64decode(inline_data["data"]) == image_bytes
+
+
+def test_png_without_options_matches_previous_encoding():
+    """切り抜き・縮小なしのPNGは従来のエンコード結果と同一であること"""
+    image = asset_generator.draw_anchor_image(_screenshot((640, 480)), [_node(100, 100, 200, 80)])
+    assert asset_generator.encode_anchor_image(image, image_format="png", max_edge=None) == (
+        ai_connector._encode_image_png(image))
+
+
+def test_optimized_payload_is_smaller():
+    """既定の設定では従来の全画面PNGよりもリクエストが小さくなること"""
+    json_data = [_node(200, 300, 160, 60), _node(200, 500, 160, 60)]
+    image = asset_generator.draw_anchor_image(_screenshot(), json_data)
+
+    current = asset_generator.encode_anchor_image(image, image_format="png", max_edge=None)
+    optimized = asset_generator.encode_anchor_image(image, json_data)
+    assert len(optimized) < len(current) / 4
+
+
+def test_unknown_format_is_rejected():
+    """未知の形式は ValueError になること"""
+    try:
+        asset_generator.encode_anchor_image(_screenshot((10, 10)), image_format="bmp")
+    except ValueError as e:
+        assert "bmp" in str(e)
+    else:
+        raise AssertionError("ValueError was not raised")
+
+
+def main():
+    print("Testing anchor image encoding...")
+    print("=" * 60)
+
+    test_crops_to_chart_with_margin()
+    test_crop_is_clipped_to_image()
+    print("✓ Image is cropped to the chart")
+
+    test_downscales_to_max_edge()
+    print("✓ Image is downscaled to the max edge")
+
+    test_formats_and_mime_types()
+    print("✓ Formats decode with matching MIME types")
+
+    test_png_without_options_matches_previous_encoding()
+    print("✓ Plain PNG matches the previous encoding")
+
+    test_optimized_payload_is_smaller()
+    print("✓ Optimized payload is smaller")
+
+    test_unknown_format_is_rejected()
+    print("✓ Unknown formats are rejected")
+
+    print("\n" + "=" * 60)
+    print("✓ Image encoding test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+増分変換（前回の変換結果の再利用）のテストスクリプト
+"""
+import os
+import re
+import tempfile
+
+import excel_parser
+import flow_graph
+import incremental
+import pipeline
+import synthetic_workbook
+from disk_cache import DiskCache
+from test_ai_async import stub_server
+from test_partitioner import _echo_chain
+
+
+def _convert(temp_dir, shapes, state_cache, **kwargs):
+    path = os.path.join(temp_dir, "flow.xlsx")
+    synthetic_workbook.write_workbook(path, [("Sheet1", shapes)])
+    return pipeline.convert_sheet(path, "Sheet1", render="headless", state_cache=state_cache, **kwargs)
+
+
+def _definitions(mermaid_code):
+    return dict(re.findall(r'^    (node_\d+)\["(.*)"\]$', mermaid_code, re.M))
+
+
+def test_rename_and_replace_text():
+    """ノードIDを付け替え、削除されたノードの行を除き、ノードの定義のテキストだけを書き換えること"""
+    code = '\n'.join([
+        'graph TD',
+        '    node_001["A"]',
+        '    node_002{"B"}',
+        '    node_003["C"]',
+        '    node_001 --> node_002',
+        '    node_002 -->|"Yes"| node_003',
+    ])
+    renamed = incremental.rename_nodes(code, {"node_001": "node_001", "node_003": "node_002"})
+    assert renamed == 'graph TD\n    node_001["A"]\n    node_002["C"]'
+
+    patched = incremental.replace_node_text(code, "node_002", 'B "2"')
+    assert '    node_002{"B #quot;2#quot;"}' in patched.splitlines()
+    assert '    node_002 -->|"Yes"| node_003' in patched.splitlines()
+    assert incremental.replace_node_text(code, "node_009", "X") is None
+
+
+def test_snapshot_cache():
+    """同じ内容のファイルのスナップショットは、drawing を解析し直さずにキャッシュから返すこと"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "flow.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.flowchart_shapes(10))])
+        mapped = excel_parser.parse_excel_shapes(path, "Sheet1")
+        graph = flow_graph.build_sheet_graph(path, "Sheet1", mapped)
+        cache = DiskCache(os.path.join(temp_dir, "parse"))
+
+        first = incremental.take_snapshot(path, "Sheet1", graph, cache=cache)
+        again = incremental.take_snapshot(path, "Sheet1", graph, cache=cache)
+        uncached = incremental.take_snapshot(path, "Sheet1", graph)
+
+    assert first == again == uncached
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_unchanged_and_text_edits_skip_ai():
+    """変更のないシートとテキストだけを変えたシートは、AIを呼び出さずに前回の結果から変換すること"""
+    shapes = synthetic_workbook.grid_shapes(30)
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        server.respond = _echo_chain
+        state_cache = DiskCache(os.path.join(temp_dir, "state"))
+
+        first = _convert(temp_dir, shapes, state_cache)
+        assert first["incremental"] == "full" and server.requests == 1
+
+        again = _convert(temp_dir, shapes, state_cache)
+        assert again["incremental"] == "same" and again["local"] and server.requests == 1
+        assert again["mermaid"] == first["mermaid"]
+
+        shapes[4] = dict(shapes[4], text='受付 "至急"')
+        edited = _convert(temp_dir, shapes, state_cache)
+        assert edited["incremental"] == "text" and server.requests == 1
+
+    assert _definitions(edited["mermaid"])["node_005"] == '受付 #quot;至急#quot;'
+    assert edited["mermaid"].replace('受付 #quot;至急#quot;', '処理5') == first["mermaid"]
+
+
+def test_reuse_requires_same_source_and_settings():
+    """ローカルで生成した結果はAIを強制する場合に使わず、プロンプトの形式が変わった場合も問い合わせ直すこと"""
+    def respond(prompt):
+        # json 形式のプロンプトには図形の表がない
+        return _echo_chain(prompt) if "id|shape_type|text" in prompt else 'graph TD\n    node_001["json"]'
+
+    shapes = synthetic_workbook.flowchart_shapes(10)
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        server.respond = respond
+        state_cache = DiskCache(os.path.join(temp_dir, "state"))
+
+        local = _convert(temp_dir, shapes, state_cache)
+        assert local["local"] and not local["ai"] and server.requests == 0
+
+        forced = _convert(temp_dir, shapes, state_cache, local_graph=False)
+        assert forced["ai"] and forced["incremental"] == "full" and server.requests == 1
+
+        again = _convert(temp_dir, shapes, state_cache, local_graph=False)
+        assert again["incremental"] == "same" and server.requests == 1
+        assert again["mermaid"] == forced["mermaid"]
+
+        other_format = _convert(temp_dir, shapes, state_cache, local_graph=False, prompt_format="json")
+        assert other_format["ai"] and other_format["incremental"] == "full" and server.requests == 2
+
+
+def test_moved_shape_sends_only_its_neighborhood():
+    """図形を動かした場合は、その図形と前回つながっていた図形の近傍だけをAIに問い合わせること"""
+    prompts = []
+
+    def respond(prompt):
+        prompts.append(prompt)
+        return _echo_chain(prompt)
+
+    shapes = synthetic_workbook.grid_shapes(30)
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        server.respond = respond
+        state_cache = DiskCache(os.path.join(temp_dir, "state"))
+        first = _convert(temp_dir, shapes, state_cache)
+
+        shapes[11] = dict(shapes[11], **{"from": (3, 0, 40, 0), "to": (5, 0, 42, 0)})
+        moved = _convert(temp_dir, shapes, state_cache)
+
+    assert moved["incremental"] == "partial" and server.requests == 2
+    rows = re.findall(r'^(\d+)\|auto_shape\|', prompts[1], re.M)
+    assert {"11", "12", "13"} <= set(rows) and len(rows) < 30
+    assert moved["tokens"]["total"] < first["tokens"]["total"]
+
+    assert list(_definitions(moved["mermaid"])) == [f"node_{idx:03d}" for idx in range(1, 31)]
+    assert "    node_020 --> node_021" in moved["mermaid"].splitlines()
+
+
+def test_removed_shape_renumbers_previous_result():
+    """図形を削除して node_XXX の連番がずれても、前回の結果を cNvPr id で付け替えて再利用すること"""
+    # Excelと同じく、図形を削除しても他の図形の cNvPr id は変わらない
+    shapes = [dict(shape, id=idx + 2) for idx, shape in enumerate(synthetic_workbook.grid_shapes(30))]
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        server.respond = _echo_chain
+        state_cache = DiskCache(os.path.join(temp_dir, "state"))
+        _convert(temp_dir, shapes, state_cache)
+
+        removed = _convert(temp_dir, shapes[:2] + shapes[3:], state_cache)
+        assert removed["incremental"] == "partial" and server.requests == 2
+
+        refreshed = _convert(temp_dir, shapes[:2] + shapes[3:], state_cache, refresh=True)
+        assert refreshed["incremental"] == "full" and server.requests == 3
+
+    definitions = _definitions(removed["mermaid"])
+    assert len(definitions) == 29 and "処理3" not in definitions.values()
+    assert definitions["node_003"] == "処理4" and definitions["node_029"] == "処理30"
+
+
+def main():
+    print("Testing incremental conversion...")
+    print("=" * 60)
+
+    test_rename_and_replace_text()
+    print("✓ Previous Mermaid code is renumbered and patched")
+
+    test_snapshot_cache()
+    print("✓ Snapshots of unchanged files are cached")
+
+    test_unchanged_and_text_edits_skip_ai()
+    print("✓ Unchanged sheets and text edits skip the AI")
+
+    test_reuse_requires_same_source_and_settings()
+    print("✓ Previous results are reused only with the same source and settings")
+
+    test_moved_shape_sends_only_its_neighborhood()
+    test_removed_shape_renumbers_previous_result()
+    print("✓ Structural edits send only the changed neighborhood")
+
+    print("\n" + "=" * 60)
+    print("✓ Incremental conversion test complete!")
+
+
+if __name__ == "__main__":
+    main()
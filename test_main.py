@@ -0,0 +1,118 @@
+"""
+コマンドライン（main.py）の --stage と起動時間のテストスクリプト
+main.py をサブプロセスで実行し、標準出力のJSONと読み込んだモジュールを確認する。
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import bench_startup
+import synthetic_workbook
+
+
+def _write_flowchart(temp_dir, count=12):
+    path = os.path.join(temp_dir, "flow.xlsx")
+    synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.flowchart_shapes(count))])
+    return path
+
+
+def _run_stage(path, stage, *options, cwd=None):
+    completed = subprocess.run(
+        [sys.executable, bench_startup.MAIN_SCRIPT, "--stage", stage, "--file", path, "--sheet", "Sheet1",
+         *options],
+        capture_output=True, text=True, encoding='utf-8', cwd=cwd
+    )
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout), completed.stderr
+
+
+def test_parse_stage_imports_only_the_parser():
+    """--stage parse は解析した図形をJSONで出力し、後の段階のモジュールを読み込まないこと"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write_flowchart(temp_dir)
+        result, _ = _run_stage(path, "parse", "--cache-dir", os.path.join(temp_dir, "cache"))
+        startup = bench_startup.measure(bench_startup.stage_command(path), repeat=1)
+
+    assert result["stage"] == "parse" and result["shapes"] == 12
+    assert [container["text"] for container in result["containers"]] == [f"処理{idx}" for idx in range(1, 13)]
+    assert "excel_parser" in startup["modules"]
+    assert bench_startup.check(startup, budget_ms=None) == []
+    assert [entry["module"] for entry in startup["imports"]].count("excel_parser") == 1
+
+
+def test_later_stages_output_json():
+    """--stage assets / all は進捗を標準エラー出力に書き、標準出力はJSONだけにすること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write_flowchart(temp_dir)
+        output = os.path.join(temp_dir, "out", "flow.md")
+        common = ("--render", "headless", "--cache-dir", os.path.join(temp_dir, "cache"))
+        assets, assets_log = _run_stage(path, "assets", "--force-ai", *common)
+        converted, _ = _run_stage(path, "all", "--output", output, *common)
+        with open(output, encoding='utf-8') as f:
+            markdown = f.read()
+
+    assert "[Step 2/4]" in assets_log
+    assert not assets["local"] and assets["image_bytes"] > 0 and assets["partitions"] is None
+    assert len(assets["nodes"]) == 12 and assets["tokens"]["total"] > assets["tokens"]["image"]
+    assert converted["stage"] == "all" and converted["local"] and not converted["ai"]
+    assert converted["output"] == output and converted["mermaid"] in markdown
+
+
+def test_kept_intermediate_files_are_logged_to_stderr():
+    """--keep-intermediate の保存の表示も標準エラー出力に書き、標準出力はJSONだけにすること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write_flowchart(temp_dir)
+        assets, assets_log = _run_stage(path, "assets", "--render", "headless", "--keep-intermediate",
+                                        "--no-cache", "--force-ai", cwd=temp_dir)
+        kept = os.path.isfile(os.path.join(temp_dir, "output", "instructions.json"))
+
+    assert len(assets["nodes"]) == 12
+    assert kept and "JSON instructions saved" in assets_log
+
+
+def test_importtime_breakdown():
+    """-X importtime の出力から、スクリプトが直接読み込んだモジュールと予算の違反を求めること"""
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   _abc",
+        "import time:       200 |        300 | site",
+        "import time:      1000 |       1000 |     zlib",
+        "import time:      5000 |       6000 |   PIL.Image",
+        "import time:      2000 |       8000 | asset_generator",
+        "import time:       500 |        500 | settings",
+    ])
+    entries = bench_startup.parse_importtime(stderr)
+    imports = bench_startup.script_imports(entries)
+
+    assert [entry["module"] for entry in imports] == ["asset_generator", "settings"]
+    assert entries[2] == {"module": "zlib", "depth": 2, "self_us": 1000, "cumulative_us": 1000}
+    result = {"import_ms": 8.5, "modules": sorted(entry["module"] for entry in entries)}
+    problems = bench_startup.check(result, budget_ms=5)
+    assert len(problems) == 2
+    assert "PIL.Image" in problems[0] and "asset_generator" in problems[0] and "8.5 ms" in problems[1]
+
+
+def main():
+    print("Testing command line stages...")
+    print("=" * 60)
+
+    test_parse_stage_imports_only_the_parser()
+    print("✓ Parse-only runs import only the parser")
+
+    test_later_stages_output_json()
+    print("✓ Later stages print JSON")
+
+    test_kept_intermediate_files_are_logged_to_stderr()
+    print("✓ Intermediate file messages go to stderr")
+
+    test_importtime_breakdown()
+    print("✓ Import time breakdown is parsed")
+
+    print("\n" + "=" * 60)
+    print("✓ Command line test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -51,7 +51,7 @@ def main():
 
     except FileNotFoundError:
         print(f"\n✗ Error: File '{TEST_FILE}' not found.")
-        print("Please create the test Excel file according to the task specification:")
+        print("Generate the test Excel file with: python create_complex_test.py")
         print("  1. A rounded rectangle with text '開始' inside")
         print("  2. A rectangle with text '処理A' inside")
         print("  3. A rectangle (with border) and a text box '処理Bのラベル' placed on top")
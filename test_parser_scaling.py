@@ -0,0 +1,157 @@
+"""
+Excel解析モジュールのスケーリングテストスクリプト
+シェイプ数を増やしても、1シェイプあたりのメモリ使用量が増えないことを確認する。
+解析時間の比は実行環境の負荷で揺れるため、シェイプ数を100から50,000まで増やして解析時間が
+ほぼ線形に増加することは、スクリプトとして直接実行した場合（python test_parser_scaling.py）だけ確認する。
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+
+import excel_parser
+import synthetic_workbook
+
+
+SIZES = [100, 1000, 10000, 50000]
+
+# 1シェイプあたりの処理時間が基準サイズの何倍までを「ほぼ線形」とみなすか
+MAX_PER_SHAPE_RATIO = 3.0
+BASELINE_SIZE = 1000
+
+# メモリ使用量を計測するシェイプ数（小さい方を基準にする）
+MEMORY_SIZES = [400, 2000]
+
+# 1シェイプあたりのピークメモリが基準サイズの何倍までを「線形」とみなすか
+MAX_MEMORY_RATIO = 1.5
+
+# 逐次解析のピークメモリが、解析結果として残るメモリの何倍までを許容するか
+# （解析済みのXML要素を破棄していれば、ピークは解析結果の大きさに近い）
+MAX_STREAMING_OVERHEAD = 1.5
+
+
+def _time_parse(file_path, streaming, repeat=3):
+    """解析時間の最小値を返す"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        excel_parser._get_all_shapes_from_xml(file_path, streaming=streaming)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_scaling(streaming):
+    """
+    各サイズの1シェイプあたりの解析時間を計測する。
+
+    Args:
+        streaming (bool): 逐次解析を使うかどうか
+
+    Returns:
+        dict: シェイプ数をキー、1シェイプあたりの処理時間[秒]を値とする辞書
+    """
+    per_shape = {}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in SIZES:
+            file_path = os.path.join(temp_dir, f"scaling_{size}.xlsx")
+            synthetic_workbook.write_workbook(
+                file_path, [("Sheet1", synthetic_workbook.grid_shapes(size))]
+            )
+            repeat = 1 if size >= 10000 else 3
+            per_shape[size] = _time_parse(file_path, streaming, repeat) / size
+
+    return per_shape
+
+
+def measure_memory(streaming):
+    """
+    各サイズの解析のピークメモリと、解析結果として残るメモリを1シェイプあたりで計測する。
+
+    Args:
+        streaming (bool): 逐次解析を使うかどうか
+
+    Returns:
+        dict: シェイプ数をキー、(ピーク, 解析結果) [byte/シェイプ] を値とする辞書
+    """
+    per_shape = {}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in MEMORY_SIZES:
+            file_path = os.path.join(temp_dir, f"memory_{size}.xlsx")
+            synthetic_workbook.write_workbook(
+                file_path, [("Sheet1", synthetic_workbook.grid_shapes(size))]
+            )
+            tracemalloc.start()
+            try:
+                shapes = excel_parser._get_all_shapes_from_xml(file_path, streaming=streaming)
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            assert len(shapes) == size
+            per_shape[size] = (peak / size, current / size)
+
+    return per_shape
+
+
+def _assert_memory_linear(per_shape):
+    baseline = per_shape[MEMORY_SIZES[0]][0]
+    for size in MEMORY_SIZES[1:]:
+        ratio = per_shape[size][0] / baseline
+        assert ratio < MAX_MEMORY_RATIO, (
+            f"{size} shapes: per-shape peak memory is {ratio:.1f}x of {MEMORY_SIZES[0]} shapes"
+        )
+
+
+def _assert_near_linear(per_shape):
+    baseline = per_shape[BASELINE_SIZE]
+    for size in SIZES:
+        if size <= BASELINE_SIZE:
+            continue
+        ratio = per_shape[size] / baseline
+        assert ratio < MAX_PER_SHAPE_RATIO, (
+            f"{size} shapes: per-shape time is {ratio:.1f}x of {BASELINE_SIZE} shapes"
+        )
+
+
+def test_tree_parser_memory_scales_linearly():
+    """ツリー解析の1シェイプあたりのメモリ使用量が、シェイプ数によらないこと"""
+    _assert_memory_linear(measure_memory(streaming=False))
+
+
+def test_streaming_parser_discards_elements():
+    """逐次解析は解析済みのXML要素を破棄し、ピークメモリが解析結果の大きさに近いこと"""
+    per_shape = measure_memory(streaming=True)
+    _assert_memory_linear(per_shape)
+
+    peak, current = per_shape[MEMORY_SIZES[-1]]
+    assert peak < current * MAX_STREAMING_OVERHEAD, (
+        f"streaming peak is {peak / current:.1f}x of the parsed shapes"
+    )
+
+
+def main():
+    print("Testing excel_parser scaling...")
+    print("=" * 60)
+
+    test_tree_parser_memory_scales_linearly()
+    print("✓ tree parser memory scales linearly")
+
+    test_streaming_parser_discards_elements()
+    print("✓ streaming parser discards parsed elements")
+
+    for streaming in (False, True):
+        mode = "streaming" if streaming else "tree"
+        per_shape = measure_scaling(streaming)
+        for size in SIZES:
+            print(f"  {mode:>9} {size:>6} shapes: {per_shape[size] * 1e6:8.1f} us/shape")
+        _assert_near_linear(per_shape)
+        print(f"✓ {mode} parser scales near-linearly")
+
+    print("\n" + "=" * 60)
+    print("✓ Scaling test complete!")
+
+
+if __name__ == "__main__":
+    main()
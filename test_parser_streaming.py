@@ -0,0 +1,74 @@
+"""
+Excel解析モジュール（逐次解析モード）のテストスクリプト
+"""
+import os
+import tempfile
+
+import excel_parser
+import synthetic_workbook
+
+
+def test_streaming_matches_tree_parser():
+    """逐次解析とツリー解析で、同じシェイプが同じ順序・同じ temp_id で得られること"""
+    shapes = synthetic_workbook.grid_shapes(30) + [
+        {"kind": "txSp", "text": "ラベル", "from": (0, 0, 0, 0), "to": (2, 0, 2, 0)},
+        {"kind": "cxnSp", "from": (2, 0, 1, 0), "to": (3, 0, 1, 0)},
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "streaming.xlsx")
+        synthetic_workbook.write_workbook(file_path, [("Sheet1", shapes)])
+
+        tree_shapes = excel_parser._get_all_shapes_from_xml(file_path, streaming=False)
+        stream_shapes = excel_parser._get_all_shapes_from_xml(file_path, streaming=True)
+
+    assert len(stream_shapes) == len(shapes)
+    assert tree_shapes == stream_shapes
+
+    # デバッグ時以外はXML要素を保持しない
+    assert all("_xml_element" not in shape for shape in tree_shapes + stream_shapes)
+
+
+def test_shapes_are_numbered_in_document_order():
+    """種類によらず、drawing に書かれた順（重なり順）に temp_id を振ること"""
+    shapes = [
+        {"kind": "cxnSp", "from": (2, 0, 1, 0), "to": (3, 0, 1, 0)},
+        {"kind": "sp", "text": "処理A", "from": (0, 0, 0, 0), "to": (2, 0, 2, 0)},
+        {"kind": "txSp", "text": "ラベル", "from": (4, 0, 0, 0), "to": (5, 0, 1, 0)},
+        {"kind": "sp", "text": "処理B", "from": (0, 0, 4, 0), "to": (2, 0, 6, 0)},
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "order.xlsx")
+        synthetic_workbook.write_workbook(file_path, [("Sheet1", shapes)])
+        parsed = {streaming: excel_parser._get_all_shapes_from_xml(file_path, "Sheet1", streaming=streaming)
+                  for streaming in (True, False)}
+        mapped = excel_parser.parse_excel_shapes(file_path, "Sheet1", streaming=False)
+
+    for all_shapes in parsed.values():
+        assert [(shape["temp_id"], shape["shape_type"], shape["text"]) for shape in all_shapes] == [
+            ("temp_000", "connector", ""),
+            ("temp_001", "auto_shape", "処理A"),
+            ("temp_002", "text_box", "ラベル"),
+            ("temp_003", "auto_shape", "処理B"),
+        ]
+    assert [(container["temp_id"], container["text"]) for container in mapped] == [
+        ("temp_001", "処理A"), ("temp_003", "処理B")]
+
+
+def main():
+    print("Testing streaming drawing parser...")
+    print("=" * 60)
+
+    test_streaming_matches_tree_parser()
+    print("✓ Streaming parser matches tree parser")
+
+    test_shapes_are_numbered_in_document_order()
+    print("✓ Shapes are numbered in document order")
+
+    print("\n" + "=" * 60)
+    print("✓ Streaming parser test complete!")
+
+
+if __name__ == "__main__":
+    main()
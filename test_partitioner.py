@@ -0,0 +1,140 @@
+"""
+大きなフローチャートの分割変換（partitioner）のテストスクリプト
+"""
+import json
+import os
+import re
+import tempfile
+
+import partitioner
+import pipeline
+import synthetic_workbook
+from test_ai_async import stub_server
+
+
+def _grid_nodes(count, columns=10):
+    """格子状に並んだJSON指示書のノード（100pt × 40pt、間隔 40pt）"""
+    return [{
+        "id": f"node_{idx + 1:03d}", "text": f"処理{idx + 1}", "shape_type": "auto_shape",
+        "position": {"left": (idx % columns) * 140, "top": (idx // columns) * 80, "width": 100, "height": 40}
+    } for idx in range(count)]
+
+
+def _echo_chain(prompt):
+    """プロンプトの図形データの表のノードを定義し、隣り合うIDを矢印でつなぐ応答を作る"""
+    rows = re.search(r'```\nid\|shape_type\|text\n(.*?)\n```', prompt, re.S).group(1).splitlines()
+    nodes = []
+    for row in rows:
+        short_id, _, text = row.split('|', 2)
+        nodes.append({"id": f"node_{int(short_id):03d}", "text": json.loads(text)})
+    ids = [node["id"] for node in nodes]
+    lines = ["graph TD"] + [f'    {node["id"]}["{node["text"]}"]' for node in nodes]
+    lines += [f"    {source} --> {target}" for source, target in zip(ids, ids[1:])]
+    return '\n'.join(lines)
+
+
+def test_small_chart_is_not_split():
+    """ノード数が上限以下なら1つの領域にすること"""
+    nodes = _grid_nodes(20)
+    assert partitioner.partition_nodes(nodes, max_nodes=20) == [
+        {"nodes": nodes, "owned": [node["id"] for node in nodes]}]
+    assert len(partitioner.partition_nodes(nodes, max_nodes=0)) == 1
+
+
+def test_partitions_cover_nodes_with_overlap():
+    """各ノードをちょうど1つの領域が担当し、境界付近のノードは隣の領域にも含まれること"""
+    nodes = _grid_nodes(200)
+    partitions = partitioner.partition_nodes(nodes, max_nodes=50)
+
+    assert len(partitions) == 4
+    owned = [node_id for partition in partitions for node_id in partition["owned"]]
+    assert sorted(owned) == [node["id"] for node in nodes]
+    assert all(len(partition["owned"]) == 50 for partition in partitions)
+
+    for partition in partitions:
+        ids = [node["id"] for node in partition["nodes"]]
+        assert ids == sorted(ids)
+        assert set(partition["owned"]) < set(ids)
+        # 重なりは境界の1行・1列分だけ
+        assert len(ids) <= 50 + 20
+
+
+def test_stitch_deduplicates_nodes_and_edges():
+    """ノードの定義と矢印の重複を除き、担当外の領域どうしの矢印は採用しないこと"""
+    partitions = [{"owned": ["node_001", "node_002"]}, {"owned": ["node_003", "node_004"]}]
+    codes = [
+        'graph TD\n    node_001["A"]\n    node_002["B"]\n    node_003["C (partial)"]\n'
+        '    node_001 --> node_002\n    node_002 -->|"Yes"| node_003',
+        'graph TD\n    node_002["B"]\n    node_003["C"]\n    node_004(["D"])\n'
+        '    node_002  -->|"Yes"|  node_003\n    node_003 --> node_004\n'
+        '    node_001 --> node_002\n    node_001 --> node_004',
+    ]
+    assert partitioner.stitch_mermaid(codes, partitions) == '\n'.join([
+        'graph TD',
+        '    node_001["A"]',
+        '    node_002["B"]',
+        '    node_003["C"]',
+        '    node_004(["D"])',
+        '    node_001 --> node_002',
+        '    node_002 -->|"Yes"| node_003',
+        '    node_003 --> node_004',
+        '    node_001 --> node_004',
+    ])
+
+
+def test_large_sheet_is_converted_by_concurrent_requests():
+    """大きなシートは領域ごとのリクエストを並行して送信し、全ノードを1回ずつ含む結果にまとめること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay=0.3) as server:
+        server.respond = _echo_chain
+        path = os.path.join(temp_dir, "large.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.grid_shapes(200))])
+
+        result = pipeline.convert_sheet(
+            path, "Sheet1", intermediate_dir=os.path.join(temp_dir, "work"), keep_intermediate=True,
+            render="headless", partition_nodes=50
+        )
+
+    assert server.requests == 4
+    assert server.max_in_flight == 4
+    definitions = re.findall(r'^    (node_\d+)\[', result["mermaid"], re.M)
+    assert definitions == [f"node_{idx:03d}" for idx in range(1, 201)]
+    edges = re.findall(r'^    .* --> .*$', result["mermaid"], re.M)
+    assert len(edges) == len(set(edges))
+
+    names = [os.path.basename(path) for path in result["intermediate"]]
+    assert "instructions_part04.json" in names and "anchor_image_part04.png" in names
+    assert "anchor_image.png" not in names
+
+
+def test_partitioning_can_be_disabled():
+    """partition_nodes=0 の場合は1回のリクエストで変換すること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        server.respond = _echo_chain
+        path = os.path.join(temp_dir, "large.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.grid_shapes(120))])
+        pipeline.convert_sheet(path, "Sheet1", render="headless", partition_nodes=0)
+
+    assert server.requests == 1
+
+
+def main():
+    print("Testing partitioned conversion...")
+    print("=" * 60)
+
+    test_small_chart_is_not_split()
+    test_partitions_cover_nodes_with_overlap()
+    print("✓ Nodes are partitioned with overlap")
+
+    test_stitch_deduplicates_nodes_and_edges()
+    print("✓ Partial graphs are stitched without duplicates")
+
+    test_large_sheet_is_converted_by_concurrent_requests()
+    test_partitioning_can_be_disabled()
+    print("✓ Large sheets are converted by concurrent requests")
+
+    print("\n" + "=" * 60)
+    print("✓ Partitioned conversion test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+変換パイプライン（メモリ上での受け渡し）のテストスクリプト
+"""
+import base64
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from PIL import Image
+
+import ai_connector
+import asset_generator
+import pipeline
+import synthetic_workbook
+from test_ai_async import stub_server, write_inputs
+
+
+@contextmanager
+def fake_screenshot():
+    """画面のない環境用に、スクリーンショットを白紙の画像に置き換える"""
+    original = asset_generator._capture_chart_screenshot
+    asset_generator._capture_chart_screenshot = (
+        lambda file_path, sheet_name: Image.new("RGB", (400, 300), "white")
+    )
+    try:
+        yield
+    finally:
+        asset_generator._capture_chart_screenshot = original
+
+
+def _write_workbook(temp_dir, name, label):
+    path = os.path.join(temp_dir, f"{name}.xlsx")
+    synthetic_workbook.write_workbook(path, [("Sheet1", [
+        {"kind": "sp", "text": label, "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+        {"kind": "sp", "text": "終了", "from": (1, 0, 5, 0), "to": (3, 0, 7, 0)},
+    ])])
+    return path
+
+
+def _list_files(directory):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), directory)
+        for root, _, names in os.walk(directory) for name in names
+    )
+
+
+def test_no_files_without_keep_intermediate():
+    """中間ファイルを残す指定がなければ、Excel以外のファイルを読み書きしないこと"""
+    saved_key = os.environ.pop('GOOGLE_API_KEY', None)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir, fake_screenshot():
+            file_path = _write_workbook(temp_dir, "flow", "開始")
+            before = _list_files(temp_dir)
+            result = pipeline.convert_sheet(
+                file_path, "Sheet1", intermediate_dir=os.path.join(temp_dir, "work")
+            )
+            after = _list_files(temp_dir)
+    finally:
+        if saved_key is not None:
+            os.environ['GOOGLE_API_KEY'] = saved_key
+
+    assert before == after
+    assert result["intermediate"] == []
+    assert result["output"] is None
+    assert 'node_001["開始"]' in result["mermaid"]
+
+
+def test_keep_intermediate_writes_uploaded_bytes():
+    """中間ファイルの画像はアップロードしたデータと同一であること"""
+    with tempfile.TemporaryDirectory() as temp_dir, fake_screenshot(), stub_server() as server:
+        file_path = _write_workbook(temp_dir, "flow", "開始")
+        uploads = []
+        original_send = ai_connector._send_generate_content
+
+        def record_send(payload, timeout=ai_connector.DEFAULT_TIMEOUT):
+            uploads.append(payload["contents"][0]["parts"][1]["inline_data"]["data"])
+            return original_send(payload, timeout)
+
+        ai_connector._send_generate_content = record_send
+        try:
+            result = pipeline.convert_sheet(
+                file_path, "Sheet1",
+                output_path=os.path.join(temp_dir, "out.md"),
+                intermediate_dir=os.path.join(temp_dir, "work"),
+                keep_intermediate=True
+            )
+        finally:
+            ai_connector._send_generate_content = original_send
+
+        json_path, image_path, graph_path = result["intermediate"]
+        with open(image_path, 'rb') as f:
+            saved_image = f.read()
+        with open(json_path, encoding='utf-8') as f:
+            saved_json = json.load(f)
+
+    assert server.requests == 1
+    assert base64.b64decode(uploads[0]) == saved_image
+    assert [node["text"] for node in saved_json] == ["開始", "終了"]
+    assert os.path.basename(graph_path) == "graph.json"
+    assert result["ai"] is True
+
+
+def test_data_and_file_inputs_send_same_request():
+    """メモリ上のデータからの生成とファイルからの生成で、同じリクエストになること"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server():
+        json_path, image_path = write_inputs(temp_dir, 1)[0]
+        with open(json_path, encoding='utf-8') as f:
+            json_data = json.load(f)
+        image = Image.open(image_path)
+
+        from_files = ai_connector._prepare_request(json_path, image_path)
+        from_data = (ai_connector.build_prompt_text(json_data), ai_connector._image_bytes(image))
+        code = ai_connector.generate_mermaid_code_from_data(json_data, image)
+
+    assert from_files == from_data
+    assert code == 'graph TD\n    node_001["sheet_0"]'
+
+
+def test_convert_sheet_is_reentrant():
+    """スレッドプールから並行して呼び出しても、直列実行と同じ結果になること"""
+    with tempfile.TemporaryDirectory() as temp_dir, fake_screenshot(), stub_server(delay=0.05):
+        paths = [_write_workbook(temp_dir, f"flow_{idx}", f"sheet_{idx}") for idx in range(12)]
+
+        sequential = [pipeline.convert_sheet(path, "Sheet1")["mermaid"] for path in paths]
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            parallel = list(executor.map(
+                lambda path: pipeline.convert_sheet(path, "Sheet1")["mermaid"], paths
+            ))
+
+    assert parallel == sequential
+    assert sequential == [f'graph TD\n    node_001["sheet_{idx}"]' for idx in range(12)]
+
+
+def main():
+    print("Testing in-memory pipeline...")
+    print("=" * 60)
+
+    test_no_files_without_keep_intermediate()
+    print("✓ No intermediate files are written by default")
+
+    test_keep_intermediate_writes_uploaded_bytes()
+    print("✓ Kept intermediate image matches the uploaded bytes")
+
+    test_data_and_file_inputs_send_same_request()
+    print("✓ Data and file inputs build the same request")
+
+    test_convert_sheet_is_reentrant()
+    print("✓ convert_sheet is reentrant")
+
+    print("\n" + "=" * 60)
+    print("✓ Pipeline test complete!")
+
+
+if __name__ == "__main__":
+    main()
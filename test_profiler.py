@@ -0,0 +1,134 @@
+"""
+各段階の計測（profiler）のテストスクリプト
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+import batch_runner
+import pipeline
+import profiler
+import synthetic_workbook
+from test_ai_async import USAGE_PROMPT_TOKENS, stub_server
+from test_partitioner import _echo_chain
+
+
+def test_spans_and_trace_events():
+    """スパンが入れ子で記録され、サマリーでは件数を合計し、トレースは Chrome trace-event 形式になること"""
+    profile = profiler.Profiler()
+
+    async def wait():
+        with profiler.span("wait", category="ai", requests=1):
+            await asyncio.sleep(0.01)
+
+    with profiler.enabled(profile):
+        with profiler.span("outer", category="sheet", sheet="Sheet1"):
+            for _ in range(2):
+                with profiler.span("inner", shapes=5) as span:
+                    data = [bytearray(1024 * 1024)]
+                    span["bytes"] = len(data[0])
+            asyncio.run(wait())
+    # 無効な場合は何も記録しない
+    with profiler.span("ignored") as span:
+        span["shapes"] = 1
+
+    summary = profile.summary()
+    assert set(summary["stages"]) == {"outer", "inner", "wait"} and summary["processes"] == 1
+    inner = summary["stages"]["inner"]
+    assert inner["calls"] == 2 and inner["counts"] == {"shapes": 10, "bytes": 2 * 1024 * 1024}
+    assert inner["memory_peak_bytes"] >= 1024 * 1024
+    assert summary["stages"]["outer"]["memory_peak_bytes"] >= inner["memory_peak_bytes"]
+    assert summary["stages"]["outer"]["wall_seconds"] >= summary["stages"]["wait"]["wall_seconds"] >= 0.01
+
+    events = profile.trace_events()
+    complete = [event for event in events if event["ph"] == "X"]
+    assert [event["name"] for event in complete] == ["outer", "inner", "inner"]
+    outer = complete[0]
+    assert outer["ts"] == 0 and outer["args"]["sheet"] == "Sheet1"
+    assert all(outer["ts"] <= event["ts"] and event["ts"] + event["dur"] <= outer["ts"] + outer["dur"]
+               for event in complete[1:])
+    # イベントループ上のスパンは非同期イベントになる
+    assert [event["ph"] for event in events if event["name"] == "wait"] == ["b", "e"]
+    assert {event["name"] for event in events if event["ph"] == "M"} == {"process_name", "thread_name"}
+    assert not profiler.current()
+
+
+def test_convert_sheet_records_ai_requests():
+    """変換の各段階と、AIへのリクエストのバイト数・usageMetadata のトークン数を記録すること"""
+    profile = profiler.Profiler()
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        server.respond = _echo_chain
+        path = os.path.join(temp_dir, "flow.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.grid_shapes(12))])
+        with profiler.enabled(profile):
+            pipeline.convert_sheet(path, "Sheet1", render="headless", local_graph=False)
+
+        profile_path = os.path.join(temp_dir, "profile", "profile.json")
+        profile.write(profile_path, metadata={"sheet": "Sheet1"})
+        with open(profile_path, encoding='utf-8') as f:
+            written = json.load(f)
+
+    stages = profile.summary()["stages"]
+    for name in ("parse", "parse.xml", "parse.classify", "parse.map_text", "assets.json", "assets.render",
+                 "assets.anchor", "assets.encode", "ai", "ai.prompt", "ai.request"):
+        assert name in stages, name
+    assert stages["parse.xml"]["counts"]["shapes"] == 12
+    request = stages["ai.request"]["counts"]
+    assert request["request_bytes"] > stages["assets.encode"]["counts"]["image_bytes"]
+    assert request["response_bytes"] > 0
+    assert request["prompt_tokens"] == USAGE_PROMPT_TOKENS
+    assert request["total_tokens"] == USAGE_PROMPT_TOKENS + request["output_tokens"]
+    request_event = next(event for event in written["traceEvents"] if event["name"] == "ai.request")
+    assert request_event["ph"] == "X" and request_event["cat"] == "http"
+    assert request_event["args"]["status"] == "200"
+    assert written["summary"]["stages"].keys() == stages.keys() and written["metadata"] == {"sheet": "Sheet1"}
+
+
+def test_batch_merges_worker_profiles():
+    """プロセスプールのワーカーで計測したスパンが、プロセスごとにまとめて記録されること"""
+    profile = profiler.Profiler()
+    original_api_key = os.environ.pop('GOOGLE_API_KEY', None)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "flow.xlsx")
+            synthetic_workbook.write_workbook(path, [
+                (f"Sheet{idx}", synthetic_workbook.grid_shapes(5)) for idx in range(1, 5)
+            ])
+            manifest = batch_runner.run_batch(
+                [path], os.path.join(temp_dir, "out"), jobs=2, render="headless", profile=profile,
+                log=lambda *args: None
+            )
+    finally:
+        if original_api_key is not None:
+            os.environ['GOOGLE_API_KEY'] = original_api_key
+
+    assert manifest["succeeded"] == 4
+    assert all("profile" not in result for result in manifest["results"])
+    summary = profile.summary()
+    assert summary["stages"]["prepare_job"]["calls"] == 4
+    assert summary["stages"]["parse.xml"]["counts"]["shapes"] == 20
+    assert summary["stages"]["write_markdown"]["calls"] == 4
+    workers = {record["pid"] for record in profile.records if record["name"] == "prepare_job"}
+    assert os.getpid() not in workers and summary["processes"] == len(workers) + 1
+
+
+def main():
+    print("Testing profiler...")
+    print("=" * 60)
+
+    test_spans_and_trace_events()
+    print("✓ Spans are summarized and written as trace events")
+
+    test_convert_sheet_records_ai_requests()
+    print("✓ Conversion stages and AI requests are recorded")
+
+    test_batch_merges_worker_profiles()
+    print("✓ Worker profiles are merged in batch mode")
+
+    print("\n" + "=" * 60)
+    print("✓ Profiler test complete!")
+
+
+if __name__ == "__main__":
+    main()
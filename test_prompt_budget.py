@@ -0,0 +1,152 @@
+"""
+プロンプトの表形式（compact）とトークン数の見積もり・上限のテストスクリプト
+"""
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+import ai_connector
+import pipeline
+import synthetic_workbook
+from test_ai_async import stub_server
+
+
+def _nodes(count):
+    return [{
+        "id": f"node_{idx + 1:03d}", "text": f"処理{idx + 1}", "shape_type": "auto_shape",
+        "position": {"left": idx * 10.25, "top": 20.5, "width": 100.125, "height": 40.0}
+    } for idx in range(count)]
+
+
+def _png(size):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_compact_table():
+    """表形式は短いID・図形の種類・JSON文字列のテキストだけを含むこと"""
+    json_data = _nodes(2) + [{"id": "node_010", "text": 'a|"b"\nc', "shape_type": "text_box",
+                              "position": {"left": 0, "top": 0, "width": 1, "height": 1}}]
+    assert ai_connector.compact_shape_table(json_data) == '\n'.join([
+        'id|shape_type|text',
+        '1|auto_shape|"処理1"',
+        '2|auto_shape|"処理2"',
+        '10|text_box|"a|\\"b\\"\\nc"',
+    ])
+
+    prompt = ai_connector.build_prompt_text(json_data)
+    assert "position" not in prompt and "100.125" not in prompt
+    assert "node_XXX" in prompt
+
+
+def test_json_format_is_kept():
+    """json 形式では従来どおり座標付きのJSONを埋め込み、未知の形式はエラーになること"""
+    prompt = ai_connector.build_prompt_text(_nodes(1), prompt_format="json")
+    assert '"id": "node_001"' in prompt and '"width": 100.125' in prompt
+
+    try:
+        ai_connector.build_prompt_text(_nodes(1), prompt_format="yaml")
+    except ValueError as e:
+        assert "yaml" in str(e)
+    else:
+        raise AssertionError("ValueError was not raised")
+
+
+def test_compact_prompt_is_smaller():
+    """図形の多いシートでは表形式のプロンプトがJSON形式の3分の1以下になること"""
+    json_data = _nodes(200)
+    compact = ai_connector.estimate_tokens(ai_connector.build_prompt_text(json_data, "compact"))
+    full = ai_connector.estimate_tokens(ai_connector.build_prompt_text(json_data, "json"))
+    assert compact < full / 3, (compact, full)
+
+
+def test_token_estimates():
+    """ASCIIは4文字で1トークン、それ以外は1文字1トークン、画像はタイル数で見積もること"""
+    assert ai_connector.estimate_tokens("") == 0
+    assert ai_connector.estimate_tokens("abcdefgh") == 2
+    assert ai_connector.estimate_tokens("abcde") == 2
+    assert ai_connector.estimate_tokens("開始ab") == 3
+
+    assert ai_connector.estimate_image_tokens(_png((300, 200))) == 258
+    assert ai_connector.estimate_image_tokens(_png((1600, 900))) == 3 * 2 * 258
+
+    tokens = ai_connector.estimate_request_tokens(_nodes(3), _png((100, 100)))
+    assert tokens["image"] == 258
+    assert tokens["total"] == tokens["prompt"] + tokens["image"]
+
+
+def test_budget_splits_or_refuses():
+    """推定トークン数が上限を超える場合は領域を細かくし、分割しない指定では送信しないこと"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "large.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.grid_shapes(120))])
+
+        unlimited = pipeline.prepare_assets(path, "Sheet1", render="headless", token_budget=0,
+                                            partition_nodes=0)
+        budget = unlimited["tokens"]["total"] // 2
+        assert unlimited["partitions"] is None
+
+        assets = pipeline.prepare_assets(path, "Sheet1", render="headless", token_budget=budget,
+                                         partition_nodes=200)
+        assert len(assets["partitions"]) >= 2
+        assert all(partition["tokens"]["total"] <= budget for partition in assets["partitions"])
+        assert assets["tokens"]["total"] == sum(
+            partition["tokens"]["total"] for partition in assets["partitions"])
+
+        try:
+            pipeline.prepare_assets(path, "Sheet1", render="headless", token_budget=budget, partition_nodes=0)
+        except ValueError as e:
+            assert "token budget" in str(e)
+        else:
+            raise AssertionError("ValueError was not raised")
+
+
+def test_convert_reports_tokens():
+    """変換結果に推定トークン数が含まれ、指定した形式のプロンプトが送信されること"""
+    prompts = []
+
+    def respond(prompt):
+        prompts.append(prompt)
+        return 'graph TD\n    node_001["ok"]'
+
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server() as server:
+        server.respond = respond
+        path = os.path.join(temp_dir, "flow.xlsx")
+        synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.grid_shapes(3))])
+        compact = pipeline.convert_sheet(path, "Sheet1", render="headless")
+        full = pipeline.convert_sheet(path, "Sheet1", render="headless", prompt_format="json")
+
+    assert "id|shape_type|text" in prompts[0] and '"position"' in prompts[1]
+    assert compact["tokens"]["prompt"] == ai_connector.estimate_tokens(prompts[0])
+    assert full["tokens"]["prompt"] == ai_connector.estimate_tokens(prompts[1])
+
+
+def main():
+    print("Testing compact prompts and token budget...")
+    print("=" * 60)
+
+    test_compact_table()
+    test_json_format_is_kept()
+    print("✓ Compact shape table is generated")
+
+    test_compact_prompt_is_smaller()
+    print("✓ Compact prompt is smaller")
+
+    test_token_estimates()
+    print("✓ Tokens are estimated locally")
+
+    test_budget_splits_or_refuses()
+    print("✓ Token budget splits or refuses large requests")
+
+    test_convert_reports_tokens()
+    print("✓ Conversion reports estimated tokens")
+
+    print("\n" + "=" * 60)
+    print("✓ Prompt budget test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+変換サーバー（server）のテストスクリプト
+ポート0で起動したサーバーにHTTPでリクエストを送る。
+"""
+import http.client
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+import server
+import synthetic_workbook
+from test_ai_async import stub_server
+
+
+@contextmanager
+def running_server(**kwargs):
+    """変換サーバーを起動し、URLを返す"""
+    service = server.ConversionService(**kwargs)
+    service.start()
+    httpd = server.ConversionServer(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield httpd.url, service
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        service.shutdown()
+
+
+def _write_flowchart(temp_dir, count=20):
+    path = os.path.join(temp_dir, "flow.xlsx")
+    synthetic_workbook.write_workbook(path, [("Sheet1", synthetic_workbook.flowchart_shapes(count))])
+    return path
+
+
+def test_convert_path_synchronously():
+    """パスで指定したシートを変換して結果を返し、2回目以降はキャッシュから数ミリ秒で返すこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, \
+            running_server(workers=2, cache_dir=os.path.join(temp_dir, "cache")) as (url, service):
+        path = _write_flowchart(temp_dir)
+        session = requests.Session()
+        first = session.post(f"{url}/convert", json={"path": path, "sheet": "Sheet1"})
+        assert first.status_code == 200, first.text
+        job = first.json()
+        assert job["status"] == "done" and job["result"]["local"]
+        assert job["result"]["mermaid"].startswith("graph TD")
+        assert "    node_001 --> node_002" in job["result"]["mermaid"].splitlines()
+
+        latencies = []
+        for _ in range(20):
+            started = time.perf_counter()
+            response = session.post(f"{url}/convert", json={"path": path, "sheet": "Sheet1"})
+            latencies.append(time.perf_counter() - started)
+            assert response.json()["result"]["mermaid"] == job["result"]["mermaid"]
+        health = session.get(f"{url}/health").json()
+
+    assert statistics.median(latencies) < 0.1, latencies
+    assert health["completed"] == 21 and health["failed"] == 0 and health["workers"] == 2
+
+
+def test_upload_and_poll():
+    """アップロードしたワークブックを非同期に変換し、ジョブIDで結果を取得できること"""
+    with tempfile.TemporaryDirectory() as temp_dir, running_server(workers=1) as (url, service):
+        with open(_write_flowchart(temp_dir), 'rb') as f:
+            data = f.read()
+        response = requests.post(f"{url}/convert", params={"sheet": "Sheet1", "wait": "false", "name": "flow.xlsx"},
+                                 data=data, headers={"Content-Type": "application/octet-stream"})
+        assert response.status_code == 202, response.text
+        assert response.headers["Location"] == f"/jobs/{response.json()['job']}"
+
+        deadline = time.monotonic() + 30
+        while True:
+            job = requests.get(f"{url}{response.headers['Location']}").json()
+            if job["status"] not in ("queued", "running") or time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        uploads = os.listdir(service.upload_dir)
+
+    assert job["status"] == "done" and job["file"] == "flow.xlsx" and job["result"]["file"] == "flow.xlsx"
+    assert job["result"]["shapes"] == 20 and job["seconds"] is not None
+    # 変換の終わったアップロードは削除される
+    assert uploads == []
+
+
+def test_queue_full_returns_429():
+    """待ち行列が上限に達した場合、ジョブを登録せずに 429 と Retry-After を返すこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, stub_server(delay=0.5), \
+            running_server(workers=1, queue_size=1) as (url, service):
+        path = _write_flowchart(temp_dir, 5)
+        request = {"path": path, "sheet": "Sheet1", "force_ai": True, "wait": False}
+        running = requests.post(f"{url}/convert", json=request).json()
+        while service.job(running["job"])["status"] == "queued":
+            time.sleep(0.01)
+        queued = requests.post(f"{url}/convert", json=request)
+        rejected = requests.post(f"{url}/convert", json=request)
+        waited = service.wait(queued.json()["job"], timeout=30)
+
+    assert queued.status_code == 202
+    assert rejected.status_code == 429 and rejected.headers["Retry-After"] == str(server.RETRY_AFTER)
+    assert waited["status"] == "done" and waited["result"]["ai"]
+
+
+def test_invalid_requests():
+    """不正なリクエストには 4xx を返し、変換に失敗したジョブは 422 とエラーを返すこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, running_server(workers=1) as (url, service):
+        path = _write_flowchart(temp_dir, 3)
+        missing_sheet = requests.post(f"{url}/convert", json={"path": path})
+        missing_file = requests.post(f"{url}/convert", json={"path": os.path.join(temp_dir, "none.xlsx"),
+                                                             "sheet": "Sheet1"})
+        bad_option = requests.post(f"{url}/convert", json={"path": path, "sheet": "Sheet1", "dpi": 0})
+        unknown_format = requests.post(f"{url}/convert", params={"sheet": "Sheet1", "image_format": "bmp"},
+                                       data=b"PK", headers={"Content-Type": "application/octet-stream"})
+        failed = requests.post(f"{url}/convert", json={"path": path, "sheet": "NoSuchSheet"})
+        unknown_job = requests.get(f"{url}/jobs/0")
+        uploads = os.listdir(service.upload_dir)
+
+    assert missing_sheet.status_code == 400 and "sheet" in missing_sheet.json()["error"]
+    assert missing_file.status_code == 404
+    assert bad_option.status_code == 400 and "dpi" in bad_option.json()["error"]
+    assert unknown_format.status_code == 400 and uploads == []
+    assert failed.status_code == 422 and failed.json()["status"] == "error"
+    assert "NoSuchSheet" in failed.json()["error"]
+    assert unknown_job.status_code == 404
+
+
+def _post_with_content_length(url, path, value):
+    """Content-Length を指定した値のままPOSTし、(ステータス, JSON) を返す"""
+    host, port = url.split("//", 1)[1].split(":")
+    connection = http.client.HTTPConnection(host, int(port), timeout=10)
+    try:
+        connection.putrequest("POST", path)
+        connection.putheader("Content-Type", "application/octet-stream")
+        connection.putheader("Content-Length", value)
+        connection.endheaders(b"PK")
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_json_size_and_timeout_limits():
+    """大きすぎるJSONのリクエストには 413、範囲外の timeout には 400 を返すこと"""
+    with tempfile.TemporaryDirectory() as temp_dir, running_server(workers=1) as (url, service):
+        path = _write_flowchart(temp_dir, 3)
+        oversized = requests.post(f"{url}/convert", data=b" " * (server.MAX_JSON_BYTES + 1),
+                                  headers={"Content-Type": "application/json"})
+        timeouts = {
+            value: requests.post(f"{url}/convert", json={"path": path, "sheet": "Sheet1", "timeout": value})
+            for value in (-1, 0, "nan", "inf", server.MAX_WAIT_TIMEOUT + 1, True)
+        }
+        accepted = requests.post(f"{url}/convert", json={"path": path, "sheet": "Sheet1", "timeout": 30})
+
+    assert oversized.status_code == 413 and "exceeds" in oversized.json()["error"]
+    for value, response in timeouts.items():
+        assert response.status_code == 400 and "timeout" in response.json()["error"], value
+    assert accepted.status_code == 200
+
+
+def test_invalid_content_length():
+    """負の値や整数でない Content-Length には、本文を読まずに 400 を返すこと"""
+    with running_server(workers=1) as (url, service):
+        results = {value: _post_with_content_length(url, "/convert?sheet=Sheet1", value)
+                   for value in ("-1", "abc", "1.5", "")}
+        not_found = _post_with_content_length(url, "/unknown", "-1")
+        uploads = os.listdir(service.upload_dir)
+
+    for value in ("-1", "abc", "1.5"):
+        status, body = results[value]
+        assert status == 400 and "Content-Length" in body["error"], (value, status, body)
+    # 空の Content-Length は 0 とみなし、本文が空のエラーになる
+    assert results[""][0] == 400 and "empty" in results[""][1]["error"]
+    assert not_found[0] == 404
+    assert uploads == []
+
+
+def main():
+    print("Testing conversion server...")
+    print("=" * 60)
+
+    test_convert_path_synchronously()
+    print("✓ Paths are converted synchronously and cached results are fast")
+
+    test_upload_and_poll()
+    print("✓ Uploaded workbooks are converted and polled")
+
+    test_queue_full_returns_429()
+    print("✓ A full queue answers 429")
+
+    test_invalid_requests()
+    print("✓ Invalid requests are rejected")
+
+    test_json_size_and_timeout_limits()
+    print("✓ JSON size and timeout are limited")
+
+    test_invalid_content_length()
+    print("✓ Malformed Content-Length is rejected")
+
+    print("\n" + "=" * 60)
+    print("✓ Conversion server test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+シェイプテーブル（ShapeTable）のテストスクリプト
+"""
+import os
+import tempfile
+import tracemalloc
+
+import asset_generator
+import excel_parser
+import synthetic_workbook
+from shape_table import ShapeTable
+
+
+# メモリ使用量を比較するシェイプ数（1件あたりのメモリの比は件数によらない）
+MEMORY_SHAPES = 2000
+
+
+def _write_test_workbook(temp_dir, count, with_text=True):
+    shapes = synthetic_workbook.grid_shapes(count)
+    if not with_text:
+        # テキスト本体を除いた、シェイプ1件あたりの構造のメモリを測る
+        for shape in shapes:
+            shape["text"] = ""
+    shapes += [
+        {"kind": "sp", "text": "", "from": (40, 0, 1, 0), "to": (44, 0, 5, 0)},
+        {"kind": "txSp", "text": "処理Bのラベル", "from": (41, 0, 2, 0), "to": (43, 0, 3, 0)},
+        {"kind": "cxnSp", "from": (2, 0, 2, 0), "to": (3, 0, 2, 0)},
+    ]
+    file_path = os.path.join(temp_dir, "table.xlsx")
+    synthetic_workbook.write_workbook(file_path, [("Sheet1", shapes)])
+    return file_path
+
+
+def test_compact_result_matches_dict_result():
+    """ShapeTable での解析結果が辞書のリストと同じ内容になること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = _write_test_workbook(temp_dir, 50)
+
+        for backend in ('python', 'numpy'):
+            records = excel_parser.parse_excel_shapes(file_path, "Sheet1", mapping_backend=backend)
+            table = excel_parser.parse_excel_shapes(
+                file_path, "Sheet1", mapping_backend=backend, compact=True)
+
+            assert isinstance(table, ShapeTable)
+            assert table.records() == records
+            assert records[-1]["text"] == "処理Bのラベル"
+
+
+def test_json_instructions_from_table():
+    """generate_json_instructions が ShapeTable をそのまま受け取れること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = _write_test_workbook(temp_dir, 5)
+        records = excel_parser.parse_excel_shapes(file_path, "Sheet1")
+        table = excel_parser.parse_excel_shapes(file_path, "Sheet1", compact=True)
+
+        from_records = asset_generator.generate_json_instructions(
+            records, os.path.join(temp_dir, "records.json"))
+        from_table = asset_generator.generate_json_instructions(
+            table, os.path.join(temp_dir, "table.json"))
+
+    assert from_table == from_records
+
+
+def test_debug_keeps_xml_elements():
+    """debug=True の場合だけXML要素を保持すること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = _write_test_workbook(temp_dir, 5)
+
+        shapes = excel_parser._get_all_shapes_from_xml(file_path, "Sheet1", debug=True)
+        table = excel_parser._get_all_shapes_from_xml(file_path, "Sheet1", compact=True, debug=True)
+        plain = excel_parser._get_all_shapes_from_xml(file_path, "Sheet1", compact=True)
+
+    assert all(shape["_xml_element"] is not None for shape in shapes)
+    assert all(element is not None for element in table.elements)
+    assert plain.elements is None
+
+
+def measure_bytes_per_shape(file_path, compact):
+    """解析結果が保持するメモリ量をシェイプ1件あたりで返す"""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    shapes = excel_parser._get_all_shapes_from_xml(file_path, "Sheet1", compact=compact)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - before) / len(shapes)
+
+
+def test_table_memory_is_compact():
+    """テキスト本体を除いたシェイプ1件あたりのメモリが辞書の1/8以下であること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = _write_test_workbook(temp_dir, MEMORY_SHAPES, with_text=False)
+        dict_bytes = measure_bytes_per_shape(file_path, compact=False)
+        table_bytes = measure_bytes_per_shape(file_path, compact=True)
+
+    assert table_bytes * 8 < dict_bytes, f"dict: {dict_bytes:.0f} B, table: {table_bytes:.0f} B"
+
+
+def main():
+    print("Testing ShapeTable...")
+    print("=" * 60)
+
+    test_compact_result_matches_dict_result()
+    print("✓ Compact result matches dict result")
+
+    test_json_instructions_from_table()
+    print("✓ JSON instructions are generated from ShapeTable")
+
+    test_debug_keeps_xml_elements()
+    print("✓ XML elements are kept only in debug mode")
+
+    test_table_memory_is_compact()
+    print("✓ ShapeTable is compact")
+
+    print("\n" + "=" * 60)
+    print("✓ ShapeTable test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+シートジオメトリ（列幅・行高によるセル座標変換）のテストスクリプト
+"""
+import io
+import os
+import tempfile
+import tracemalloc
+
+import excel_parser
+import synthetic_workbook
+from sheet_geometry import SheetGeometry, column_width_to_points
+
+
+def _sheet_xml(body):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        f'{body}</worksheet>'
+    ).encode('utf-8')
+
+
+def test_default_geometry():
+    """既定の列幅 (64px = 48pt) と行高 (15pt) が使われること"""
+    geometry = SheetGeometry.from_stream(io.BytesIO(_sheet_xml('<sheetData/>')))
+
+    assert geometry.x(3) == 144.0
+    assert geometry.y(4) == 60.0
+    assert geometry.x(1, 12700) == 49.0
+
+
+def test_custom_columns_and_rows():
+    """<cols> の範囲指定・非表示列と <row ht> が反映されること"""
+    body = (
+        '<sheetFormatPr defaultRowHeight="18"/>'
+        '<cols>'
+        '<col min="2" max="3" width="20" customWidth="1"/>'
+        '<col min="5" max="5" width="9" hidden="1"/>'
+        '</cols>'
+        '<sheetData>'
+        '<row r="2" ht="30" customHeight="1"><c r="A2"><v>1</v></c></row>'
+        '<row><c r="A3"><v>2</v></c></row>'
+        '<row r="10" hidden="1"/>'
+        '</sheetData>'
+    )
+    geometry = SheetGeometry.from_stream(io.BytesIO(_sheet_xml(body)))
+    wide = column_width_to_points(20)
+
+    assert wide == 105.0
+    assert geometry.x(1) == 48.0
+    assert geometry.x(3) == 48.0 + 2 * wide
+    assert geometry.x(5) == 48.0 + 2 * wide + 48.0  # E列は非表示
+    assert geometry.x(6) == geometry.x(5) + 48.0
+
+    assert geometry.y(1) == 18.0
+    assert geometry.y(2) == 18.0 + 30.0
+    assert geometry.y(10) == 18.0 * 9 + 12.0  # 10行目は非表示
+    assert geometry.y(11) == geometry.y(10) + 18.0
+
+
+def test_parser_uses_sheet_geometry():
+    """解析結果の座標にシートの列幅・行高が反映されること"""
+    shapes = [{"kind": "sp", "text": "処理A", "from": (1, 0, 2, 0), "to": (3, 0, 4, 0)}]
+    layouts = {"Sheet1": {"column_widths": {1: 20, 2: 20}, "row_heights": {2: 40}}}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "geometry.xlsx")
+        synthetic_workbook.write_workbook(file_path, [("Sheet1", shapes)], layouts)
+
+        for streaming in (True, False):
+            container = excel_parser.parse_excel_shapes(file_path, "Sheet1", streaming=streaming)[0]
+            assert container["position"] == {
+                "left": 48.0, "top": 30.0, "width": 210.0, "height": 55.0
+            }
+
+
+def test_large_sheet_is_streamed():
+    """セルデータの多い巨大なシートでもメモリ使用量が増えないこと"""
+    rows = ''.join(
+        f'<row r="{r}"><c r="A{r}"><v>{r}</v></c><c r="B{r}"><v>{r}</v></c></row>'
+        for r in range(1, 200001)
+    )
+    stream = io.BytesIO(_sheet_xml(f'<sheetData>{rows}</sheetData>'))
+    del rows
+
+    tracemalloc.start()
+    geometry = SheetGeometry.from_stream(stream)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert geometry.y(200000) == 15.0 * 200000
+    assert peak < 2 * 1024 * 1024, f"peak {peak / 1024 / 1024:.1f} MiB"
+
+
+def main():
+    print("Testing sheet geometry...")
+    print("=" * 60)
+
+    test_default_geometry()
+    print("✓ Default column width and row height")
+
+    test_custom_columns_and_rows()
+    print("✓ Custom column widths and row heights")
+
+    test_parser_uses_sheet_geometry()
+    print("✓ Parser positions use sheet geometry")
+
+    test_large_sheet_is_streamed()
+    print("✓ Large sheet XML is streamed")
+
+    print("\n" + "=" * 60)
+    print("✓ Sheet geometry test complete!")
+
+
+if __name__ == "__main__":
+    main()
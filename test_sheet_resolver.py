@@ -0,0 +1,94 @@
+"""
+シート単位の解析（workbook/リレーションシップ解決）のテストスクリプト
+"""
+import os
+import tempfile
+import zipfile
+
+import excel_parser
+import synthetic_workbook
+
+
+def _write_multi_sheet_workbook(file_path):
+    """3シート構成のワークブックに、無関係なメディアファイルを加えて書き出す"""
+    synthetic_workbook.write_workbook(file_path, [
+        ("概要", synthetic_workbook.grid_shapes(2)),
+        ("業務フロー", [
+            {"kind": "sp", "text": "開始", "from": (1, 0, 1, 0), "to": (3, 0, 3, 0)},
+            {"kind": "sp", "text": "終了", "from": (1, 0, 5, 0), "to": (3, 0, 7, 0)},
+        ]),
+        ("Sheet3", synthetic_workbook.grid_shapes(50)),
+    ])
+    with zipfile.ZipFile(file_path, 'a') as zip_ref:
+        zip_ref.writestr('xl/media/image1.png', b'\x89PNG dummy')
+
+
+def test_parses_only_requested_sheet():
+    """指定シートのdrawingだけを読み込み、他シートのシェイプが混入しないこと"""
+    opened = []
+    original_open = zipfile.ZipFile.open
+
+    def recording_open(self, name, *args, **kwargs):
+        opened.append(name if isinstance(name, str) else name.filename)
+        return original_open(self, name, *args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "multi.xlsx")
+        _write_multi_sheet_workbook(file_path)
+
+        zipfile.ZipFile.open = recording_open
+        try:
+            containers = excel_parser.parse_excel_shapes(file_path, "業務フロー")
+        finally:
+            zipfile.ZipFile.open = original_open
+
+    assert [c["text"] for c in containers] == ["開始", "終了"]
+    assert 'xl/drawings/drawing2.xml' in opened
+    assert 'xl/drawings/drawing1.xml' not in opened
+    assert 'xl/drawings/drawing3.xml' not in opened
+    assert not any(name.startswith('xl/media/') for name in opened)
+
+
+def test_unknown_sheet_raises():
+    """存在しないシート名はValueErrorになること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "multi.xlsx")
+        _write_multi_sheet_workbook(file_path)
+
+        try:
+            excel_parser.parse_excel_shapes(file_path, "NoSuchSheet")
+        except ValueError as e:
+            assert "業務フロー" in str(e)
+        else:
+            raise AssertionError("ValueError was not raised")
+
+
+def test_resolve_part_path():
+    """相対パス・絶対パスのTargetが正しく解決されること"""
+    assert excel_parser._resolve_part_path(
+        'xl/worksheets/sheet1.xml', '../drawings/drawing1.xml') == 'xl/drawings/drawing1.xml'
+    assert excel_parser._resolve_part_path(
+        'xl/workbook.xml', 'worksheets/sheet2.xml') == 'xl/worksheets/sheet2.xml'
+    assert excel_parser._resolve_part_path(
+        'xl/workbook.xml', '/xl/worksheets/sheet3.xml') == 'xl/worksheets/sheet3.xml'
+
+
+def main():
+    print("Testing sheet resolver...")
+    print("=" * 60)
+
+    test_parses_only_requested_sheet()
+    print("✓ Only the requested sheet's drawing is parsed")
+
+    test_unknown_sheet_raises()
+    print("✓ Unknown sheet name raises ValueError")
+
+    test_resolve_part_path()
+    print("✓ Relationship targets are resolved")
+
+    print("\n" + "=" * 60)
+    print("✓ Sheet resolver test complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+合成ワークブック生成（synthetic_workbook）のテストスクリプト
+"""
+import os
+import tempfile
+
+import bench_stages
+import excel_parser
+import flow_graph
+import synthetic_workbook
+
+
+def _parse(temp_dir, sheets, layouts=None):
+    path = os.path.join(temp_dir, "synthetic.xlsx")
+    synthetic_workbook.write_workbook(path, sheets, layouts)
+    return path
+
+
+def test_flowchart_is_connected():
+    """生成したフローチャートのノードが順につながり、分岐には Yes / No のラベルが付くこと"""
+    shapes = synthetic_workbook.flowchart_shapes(45, branch_density=0.3, seed=1)
+    assert shapes == synthetic_workbook.flowchart_shapes(45, branch_density=0.3, seed=1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _parse(temp_dir, [("Sheet1", shapes)])
+        mapped = excel_parser.parse_excel_shapes(path, "Sheet1")
+        graph = flow_graph.build_sheet_graph(path, "Sheet1", mapped)
+
+    branches = sum(1 for shape in shapes if shape.get("geometry") == "flowChartDecision")
+    assert branches > 0
+    assert [container["text"] for container in mapped] == [f"処理{idx}" for idx in range(1, 46)]
+    assert flow_graph.is_resolved(graph)
+    assert len(graph["edges"]) == 44 + branches
+    # 次のノードへの矢印は必ずある
+    pairs = {(edge["source"], edge["target"]) for edge in graph["edges"]}
+    assert all((f"node_{idx:03d}", f"node_{idx + 1:03d}") in pairs for idx in range(1, 45))
+    assert sorted(edge["label"] for edge in graph["edges"] if edge["label"]) == ["No"] * branches + ["Yes"] * branches
+
+
+def test_unbound_connectors_and_overlays():
+    """接続先のないコネクタは吸着で、重ねたテキストボックスは座標マッピングで解決できること"""
+    shapes = synthetic_workbook.flowchart_shapes(30, branch_density=0.5, unbound_ratio=1.0,
+                                                 overlay_ratio=1.0, labels=False)
+    assert not any("start" in shape for shape in shapes)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _parse(temp_dir, [("Sheet1", shapes)])
+        mapped = excel_parser.parse_excel_shapes(path, "Sheet1")
+        graph = flow_graph.build_sheet_graph(path, "Sheet1", mapped)
+
+    assert [container["text"] for container in mapped] == [f"処理{idx}" for idx in range(1, 31)]
+    assert flow_graph.is_resolved(graph)
+    assert all(edge["confidence"] < 1.0 for edge in graph["edges"])
+
+
+def test_fixed_charts_and_layouts():
+    """手動テスト用の固定のフローチャートと、列幅を変えた複数シートを生成できること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _parse(temp_dir, [
+            ("Simple", synthetic_workbook.simple_chart_shapes()),
+            ("Complex", synthetic_workbook.complex_chart_shapes()),
+        ], {"Complex": synthetic_workbook.COMPLEX_CHART_LAYOUT})
+
+        assert excel_parser.list_sheets_with_drawings(path) == ["Simple", "Complex"]
+        simple = excel_parser.parse_excel_shapes(path, "Simple")
+        complex_chart = excel_parser.parse_excel_shapes(path, "Complex")
+        graph = flow_graph.build_sheet_graph(path, "Complex", complex_chart)
+
+    assert [container["text"] for container in simple] == ["開始", "処理A", "処理Bのラベル"]
+    # B列は25文字幅なので、既定の列幅より広い
+    assert complex_chart[0]["position"]["width"] > 100
+    assert flow_graph.is_resolved(graph)
+    assert [(edge["source"], edge["label"], edge["target"]) for edge in graph["edges"] if edge["label"]] == [
+        ("node_003", "Yes", "node_004"), ("node_003", "No", "node_005")]
+
+
+def test_bench_compare_detects_regressions():
+    """ベンチマークの比較で、しきい値を超えた段階だけを劣化とみなすこと"""
+    baseline = {"results": [
+        {"nodes": 100, "stage": "parse_xml", "seconds": 0.010, "peak_bytes": 1000},
+        {"nodes": 100, "stage": "classify", "seconds": 0.001, "peak_bytes": 1000},
+        {"nodes": 100, "stage": "render_anchor", "seconds": None, "peak_bytes": None},
+    ]}
+    current = {"results": [
+        {"nodes": 100, "stage": "parse_xml", "seconds": 0.020, "peak_bytes": 1000},
+        {"nodes": 100, "stage": "classify", "seconds": 0.003, "peak_bytes": 1100},
+        {"nodes": 100, "stage": "render_anchor", "seconds": 0.5, "peak_bytes": 1000},
+        {"nodes": 1000, "stage": "parse_xml", "seconds": 0.1, "peak_bytes": 1000},
+    ]}
+    rows = bench_stages.compare(current, baseline, threshold=1.25)
+
+    # 誤差の大きい短い処理時間と、以前に計測していない段階は劣化とみなさない
+    assert [(row["stage"], row["regression"]) for row in rows] == [("parse_xml", True), ("classify", False)]
+    assert rows[0]["time_ratio"] == 2.0 and rows[0]["memory_ratio"] == 1.0
+
+
+def main():
+    print("Testing synthetic workbooks...")
+    print("=" * 60)
+
+    test_flowchart_is_connected()
+    test_unbound_connectors_and_overlays()
+    print("✓ Synthetic flowcharts are connected")
+
+    test_fixed_charts_and_layouts()
+    print("✓ Fixed charts and layouts are generated")
+
+    test_bench_compare_detects_regressions()
+    print("✓ Benchmark comparison detects regressions")
+
+    print("\n" + "=" * 60)
+    print("✓ Synthetic workbook test complete!")
+
+
+if __name__ == "__main__":
+    main()
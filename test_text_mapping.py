@@ -0,0 +1,130 @@
+"""
+座標マッピング（_map_text_to_containers）のテストスクリプト
+"""
+import copy
+import random
+import time
+
+import excel_parser
+
+
+def _reference_mapping(container_shapes, text_shapes):
+    """空間索引を使わない従来の総当たり実装（比較用）"""
+    remaining_text_shapes = text_shapes.copy()
+
+    for container in container_shapes:
+        if container["text"].strip() != "":
+            continue
+
+        parent_x1 = container["position"]["left"]
+        parent_y1 = container["position"]["top"]
+        parent_x2 = parent_x1 + container["position"]["width"]
+        parent_y2 = parent_y1 + container["position"]["height"]
+
+        for text_shape in remaining_text_shapes[:]:
+            if text_shape["temp_id"] == container["temp_id"]:
+                continue
+
+            child_center_x = text_shape["position"]["left"] + text_shape["position"]["width"] / 2
+            child_center_y = text_shape["position"]["top"] + text_shape["position"]["height"] / 2
+
+            if (parent_x1 < child_center_x < parent_x2 and
+                parent_y1 < child_center_y < parent_y2):
+                container["text"] = text_shape["text"]
+                remaining_text_shapes.remove(text_shape)
+                break
+
+    return container_shapes
+
+
+def make_shapes(container_count, seed=0):
+    """
+    ランダムに配置したコンテナ図形とラベルを生成し、分類済みのリストを返す。
+
+    Args:
+        container_count (int): コンテナ図形の数
+        seed (int): 乱数シード
+
+    Returns:
+        tuple: (container_shapes, text_shapes)
+    """
+    rng = random.Random(seed)
+    columns = max(1, int(container_count ** 0.5))
+    all_shapes = []
+
+    for idx in range(container_count):
+        left = (idx % columns) * 150 + rng.uniform(-20, 20)
+        top = (idx // columns) * 80 + rng.uniform(-10, 10)
+        width = rng.uniform(60, 160)
+        height = rng.uniform(30, 70)
+        has_text = rng.random() < 0.3
+        all_shapes.append({
+            "temp_id": f"temp_{len(all_shapes):03d}",
+            "text": f"処理{idx}" if has_text else "",
+            "position": {"left": left, "top": top, "width": width, "height": height},
+            "shape_type": "auto_shape",
+        })
+
+        # 空のコンテナの上に1〜2個のラベルを重ねる（重なり・取り合いも発生する）
+        if not has_text:
+            for label_idx in range(rng.choice([1, 1, 2])):
+                all_shapes.append({
+                    "temp_id": f"temp_{len(all_shapes):03d}",
+                    "text": f"ラベル{idx}-{label_idx}",
+                    "position": {
+                        "left": left + rng.uniform(-40, width),
+                        "top": top + rng.uniform(-20, height),
+                        "width": rng.uniform(20, 80),
+                        "height": 14,
+                    },
+                    "shape_type": "text_box",
+                })
+
+    rng.shuffle(all_shapes)
+    return excel_parser._classify_shapes(all_shapes)
+
+
+def test_matches_reference_mapping():
+    """空間索引版が従来実装と同じ紐付け結果になること"""
+    for seed in range(5):
+        containers, texts = make_shapes(400, seed)
+        expected = _reference_mapping(copy.deepcopy(containers), copy.deepcopy(texts))
+        actual = excel_parser._map_text_to_containers(containers, texts)
+
+        assert [c["text"] for c in actual] == [c["text"] for c in expected]
+
+
+def measure_mapping(container_count):
+    """マッピングの処理時間を計測する"""
+    containers, texts = make_shapes(container_count)
+    start = time.perf_counter()
+    excel_parser._map_text_to_containers(containers, texts)
+    return time.perf_counter() - start
+
+
+def test_mapping_is_subquadratic():
+    """10倍のシェイプ数で処理時間が100倍（二乗）に近づかないこと"""
+    small = measure_mapping(10000)
+    large = measure_mapping(100000)
+
+    assert large / small < 30, f"10k: {small:.3f}s, 100k: {large:.3f}s"
+
+
+def main():
+    print("Testing text-to-container mapping...")
+    print("=" * 60)
+
+    test_matches_reference_mapping()
+    print("✓ Grid-indexed mapping matches reference mapping")
+
+    for count in (1000, 10000, 100000):
+        print(f"  {count:>6} containers: {measure_mapping(count):.3f}s")
+    test_mapping_is_subquadratic()
+    print("✓ Mapping is sub-quadratic")
+
+    print("\n" + "=" * 60)
+    print("✓ Text mapping test complete!")
+
+
+if __name__ == "__main__":
+    main()